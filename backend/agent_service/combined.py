@@ -0,0 +1,24 @@
+"""
+Agent Service + Django 同进程部署
+--------------------------------
+FastAPI 的 Agent 路由（/parse-task 等）与 Django ASGI 应用（/api/v1/、/admin/ 等）
+挂在同一个 ASGI 应用上，Agent 调用后端时使用 in-process 传输，直接调用 Django 视图。
+
+运行示例（在 backend 目录下）：
+  uvicorn agent_service.combined:app --host 0.0.0.0 --port 8000
+
+传输方式仍可通过 JARVIS_TRANSPORT=http 切回网络调用。
+"""
+
+import os
+
+os.environ.setdefault("JARVIS_TRANSPORT", "inprocess")
+
+from .main import app, setup_django  # noqa: E402
+
+setup_django()
+
+from jarvis_backend.asgi import application as django_application  # noqa: E402
+
+# Agent 自身的路由先匹配，其余请求交给 Django
+app.mount("/", django_application)
@@ -7,14 +7,27 @@ Jarvis Agent Service
   - POST /parse-event
   - POST /generate-reminders
 
+鉴权：
+  前端调用本服务时携带自己的 `Authorization: Bearer <token>`，
+  本服务原样转发给 Jarvis 后端，因此每个用户以自己的账号访问后端，
+  上下文 / 提醒 / LLM 缓存也按用户分区（各自有内存配额）。
+  JARVIS_TOKEN 仅作为兜底：请求未携带 token 时使用（单用户部署兼容）。
+
 运行示例：
   export JARVIS_API_BASE="http://localhost:8000/api/v1"
-  export JARVIS_TOKEN="<后端登录获得的 Bearer token>"
+  export JARVIS_TOKEN="<可选，后端登录获得的 Bearer token>"
   export OPENAI_API_BASE="https://xiaoai.plus/v1"    
   export OPENAI_API_KEY="<你的 key>"
   export OPENWEATHER_API_KEY="<你的 openweather key>"
+  export OPENWEATHER_API_BASE="https://api.openweathermap.org"   # 可选，压测时指向本地桩服务
   uvicorn backend.agent_service.main:app --host 0.0.0.0 --port 8001
 
+同进程部署（Agent 与 Django 运行在同一进程，后端调用不走网络）：
+  cd backend
+  uvicorn agent_service.combined:app --host 0.0.0.0 --port 8000
+  前端把 VITE_AGENT_SERVICE_BASE 指向同一端口即可。
+  也可单独设置 JARVIS_TRANSPORT=inprocess 让独立运行的 Agent 直接调用本机 Django 视图。
+
 Bear token 获得方式：
 curl -X POST http://localhost:8000/api/v1/auth/login \
   -H "Content-Type: application/json" \
@@ -29,14 +42,22 @@ curl -X POST http://localhost:8000/api/v1/auth/login \
   pip install -r backend/agent_service/requirements.txt
 """
 
+import hashlib
+import io
 import json
 import os
+import sys
+import threading
+import time
+from collections import OrderedDict
 from datetime import datetime, timedelta, timezone
 import logging
-from typing import List, Optional
+from pathlib import Path
+from typing import Any, List, Optional
+from urllib.parse import urlencode, urlsplit
 
 import requests
-from fastapi import FastAPI, HTTPException
+from fastapi import Depends, FastAPI, Header, HTTPException
 from openai import OpenAI, APIError
 from pydantic import BaseModel
 from fastapi.middleware.cors import CORSMiddleware
@@ -44,11 +65,25 @@ from fastapi.middleware.cors import CORSMiddleware
 
 # ========= 环境配置 =========
 JARVIS_API_BASE = os.getenv("JARVIS_API_BASE", "http://localhost:8000/api/v1")
+# 调用后端的方式：http（默认，走网络）| inprocess（同进程直接调用 Django 视图）
+JARVIS_TRANSPORT = os.getenv("JARVIS_TRANSPORT", "http").lower()
 JARVIS_TOKEN = os.getenv("JARVIS_TOKEN", "")
 OPENAI_API_BASE = os.getenv("OPENAI_API_BASE", "https://xiaoai.plus/v1")
 OPENAI_API_KEY = os.getenv("OPENAI_API_KEY", "")
 OPENAI_MODEL = os.getenv("OPENAI_MODEL", "gpt-4o-mini")
 OPENWEATHER_API_KEY = os.getenv("OPENWEATHER_API_KEY")
+OPENWEATHER_API_BASE = os.getenv("OPENWEATHER_API_BASE", "https://api.openweathermap.org")
+
+# 缓存配置：TTL（秒）、每个用户的内存配额（字节）、最多保留的用户分区数
+CONTEXT_CACHE_TTL = int(os.getenv("AGENT_CONTEXT_CACHE_TTL", "30"))
+REMINDER_CACHE_TTL = int(os.getenv("AGENT_REMINDER_CACHE_TTL", "120"))
+LLM_CACHE_TTL = int(os.getenv("AGENT_LLM_CACHE_TTL", "600"))
+CACHE_USER_QUOTA_BYTES = int(os.getenv("AGENT_CACHE_USER_QUOTA_BYTES", str(256 * 1024)))
+CACHE_MAX_USERS = int(os.getenv("AGENT_CACHE_MAX_USERS", "1024"))
+
+# 未给出时间的任务/事件：安排的时长（分钟）与优先的开始时间（之后的第一个空闲时段）
+FREE_SLOT_MINUTES = int(os.getenv("AGENT_FREE_SLOT_MINUTES", "60"))
+FREE_SLOT_PREFERRED_START = os.getenv("AGENT_FREE_SLOT_PREFERRED_START", "18:00")
 
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger("agent_service")
@@ -89,11 +124,141 @@ class ReminderPayload(BaseModel):
     reminders: List[ReminderItem]
 
 
-# ========= 工具函数 =========
-def jarvis_request(path: str, *, method: str = "GET", payload: Optional[dict] = None):
-    """调用 Jarvis 后端，自动附带 Bearer Token。"""
+# ========= 按用户分区的缓存 =========
+class UserPartitionedCache:
+    """
+    按用户分区的 TTL + LRU 缓存。
+    - 每个用户一个独立分区，互不可见，避免多用户共用一个全局缓存时串数据
+    - 每个分区按序列化后的字节数计算占用，超过配额时淘汰该用户最久未用的条目
+    - 分区数超过 max_users 时整体淘汰最久未活跃的用户
+    值以 JSON 字符串存储，读取时重新解析，调用方修改返回值不会污染缓存。
+    """
+
+    def __init__(self, name: str, ttl: int, quota_bytes: int, max_users: int):
+        self.name = name
+        self.ttl = ttl
+        self.quota_bytes = quota_bytes
+        self.max_users = max_users
+        self._partitions: "OrderedDict[str, OrderedDict[str, tuple]]" = OrderedDict()
+        self._usage = {}
+        self._lock = threading.Lock()
+
+    def get(self, user_key: str, key: str) -> Optional[Any]:
+        if self.ttl <= 0:
+            return None
+        with self._lock:
+            part = self._partitions.get(user_key)
+            if part is None:
+                return None
+            entry = part.get(key)
+            if entry is None:
+                return None
+            expires_at, raw = entry
+            if expires_at < time.monotonic():
+                self._drop(user_key, part, key)
+                return None
+            part.move_to_end(key)
+            self._partitions.move_to_end(user_key)
+        return json.loads(raw)
+
+    def set(self, user_key: str, key: str, value: Any) -> None:
+        if self.ttl <= 0:
+            return
+        raw = json.dumps(value, ensure_ascii=False)
+        size = len(raw.encode("utf-8"))
+        if size > self.quota_bytes:
+            # 单条就超过配额，不缓存
+            return
+        with self._lock:
+            part = self._partitions.get(user_key)
+            if part is None:
+                part = OrderedDict()
+                self._partitions[user_key] = part
+                self._usage[user_key] = 0
+                while len(self._partitions) > self.max_users:
+                    old_user, _ = self._partitions.popitem(last=False)
+                    self._usage.pop(old_user, None)
+            if key in part:
+                self._drop(user_key, part, key)
+            part[key] = (time.monotonic() + self.ttl, raw)
+            self._usage[user_key] += size
+            self._partitions.move_to_end(user_key)
+            while self._usage[user_key] > self.quota_bytes and part:
+                self._drop(user_key, part, next(iter(part)))
+
+    def invalidate(self, user_key: str, key: Optional[str] = None) -> None:
+        """删除某用户的一个条目；key 为空时清空该用户整个分区。"""
+        with self._lock:
+            if key is None:
+                self._partitions.pop(user_key, None)
+                self._usage.pop(user_key, None)
+                return
+            part = self._partitions.get(user_key)
+            if part is not None and key in part:
+                self._drop(user_key, part, key)
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {
+                "users": len(self._partitions),
+                "entries": sum(len(p) for p in self._partitions.values()),
+                "bytes": sum(self._usage.values()),
+            }
+
+    def _drop(self, user_key: str, part: "OrderedDict[str, tuple]", key: str) -> None:
+        _, raw = part.pop(key)
+        self._usage[user_key] -= len(raw.encode("utf-8"))
+
+
+context_cache = UserPartitionedCache("context", CONTEXT_CACHE_TTL, CACHE_USER_QUOTA_BYTES, CACHE_MAX_USERS)
+reminder_cache = UserPartitionedCache("reminder", REMINDER_CACHE_TTL, CACHE_USER_QUOTA_BYTES, CACHE_MAX_USERS)
+llm_cache = UserPartitionedCache("llm", LLM_CACHE_TTL, CACHE_USER_QUOTA_BYTES, CACHE_MAX_USERS)
+
+
+def caller_token(authorization: Optional[str] = Header(None)) -> str:
+    """提取调用方的 Bearer token；未携带时回退到 JARVIS_TOKEN。"""
+    if authorization:
+        scheme, _, token = authorization.partition(" ")
+        token = token.strip()
+        if scheme.lower() == "bearer" and token:
+            return token
+    if JARVIS_TOKEN:
+        return JARVIS_TOKEN
+    raise HTTPException(status_code=401, detail="缺少 Authorization: Bearer <token>")
+
+
+def user_cache_key(token: str) -> str:
+    """缓存分区键：token 的摘要，避免在内存中以明文 token 作为键。"""
+    return hashlib.sha256(token.encode("utf-8")).hexdigest()
+
+
+# ========= 后端调用 =========
+_django_ready = False
+_django_lock = threading.Lock()
+
+
+def setup_django() -> None:
+    """同进程模式：把 backend/ 加入 sys.path 并初始化 Django（只执行一次）。"""
+    global _django_ready
+    if _django_ready:
+        return
+    with _django_lock:
+        if _django_ready:
+            return
+        backend_dir = str(Path(__file__).resolve().parent.parent)
+        if backend_dir not in sys.path:
+            sys.path.insert(0, backend_dir)
+        os.environ.setdefault("DJANGO_SETTINGS_MODULE", "jarvis_backend.settings")
+        import django
+
+        django.setup()
+        _django_ready = True
+
+
+def _http_request(path: str, *, token: str, method: str, payload: Optional[dict]):
+    """通过 HTTP 调用后端，返回完整响应体。"""
     headers = {
-        "Authorization": f"Bearer {JARVIS_TOKEN}",
+        "Authorization": f"Bearer {token}",
         "Content-Type": "application/json",
     }
     url = f"{JARVIS_API_BASE}{path}"
@@ -106,17 +271,103 @@ def jarvis_request(path: str, *, method: str = "GET", payload: Optional[dict] =
         # 把后端返回体一起带出去，便于调试
         raise HTTPException(status_code=resp.status_code, detail=resp.text)
     try:
-        body = resp.json()
+        return resp.json()
     except Exception as exc:  # noqa: BLE001
         raise HTTPException(status_code=502, detail=f"后端返回非JSON: {resp.text}") from exc
 
+
+def _inprocess_request(path: str, *, token: str, method: str, payload: Optional[dict]):
+    """
+    同进程调用后端：按 URLconf 解析路径后直接调用 Django 视图，
+    不经过套接字、HTTP 解析和中间件，也不渲染响应（直接读取 DRF Response.data）。
+    鉴权仍由视图上的 TokenAuthentication 完成，保证按用户隔离。
+    """
+    setup_django()
+    from django.core.handlers.wsgi import WSGIRequest
+    from django.db import close_old_connections
+    from django.urls import Resolver404, resolve
+
+    path_only, _, query = path.partition("?")
+    path_info = urlsplit(JARVIS_API_BASE).path.rstrip("/") + path_only
+    body = json.dumps(payload).encode("utf-8") if payload is not None else b""
+    environ = {
+        "REQUEST_METHOD": method.upper(),
+        "PATH_INFO": path_info,
+        "SCRIPT_NAME": "",
+        "QUERY_STRING": query,
+        "SERVER_NAME": "localhost",
+        "SERVER_PORT": "80",
+        "wsgi.url_scheme": "http",
+        "wsgi.input": io.BytesIO(body),
+        "CONTENT_TYPE": "application/json",
+        "CONTENT_LENGTH": str(len(body)),
+        "HTTP_AUTHORIZATION": f"Bearer {token}",
+    }
+    # 与 Django 请求处理器一致：请求前后清理失效/超龄的数据库连接
+    close_old_connections()
+    try:
+        try:
+            match = resolve(path_info)
+        except Resolver404 as exc:
+            raise HTTPException(status_code=404, detail=f"后端路径不存在: {path_info}") from exc
+        # ASGI 部署下读接口是异步视图，同进程调用时使用其同步版本
+        view = getattr(match.func, "sync_view", match.func)
+        response = view(WSGIRequest(environ), *match.args, **match.kwargs)
+    finally:
+        close_old_connections()
+
+    data = getattr(response, "data", None)
+    if data is None:
+        # 大范围的列表响应是流式的（StreamingHttpResponse），拼接各块后解析
+        content = b"".join(response.streaming_content) if response.streaming else response.content
+        try:
+            data = json.loads(content or b"null")
+        except Exception as exc:  # noqa: BLE001
+            raise HTTPException(status_code=502, detail="后端返回非JSON") from exc
+    if response.status_code >= 400:
+        raise HTTPException(
+            status_code=response.status_code,
+            detail=json.dumps(data, ensure_ascii=False, default=str),
+        )
+    return data
+
+
+def jarvis_request(path: str, *, token: str, method: str = "GET", payload: Optional[dict] = None):
+    """调用 Jarvis 后端，附带调用方自己的 Bearer Token。传输方式由 JARVIS_TRANSPORT 决定。"""
+    if JARVIS_TRANSPORT == "inprocess":
+        body = _inprocess_request(path, token=token, method=method, payload=payload)
+    else:
+        body = _http_request(path, token=token, method=method, payload=payload)
+
     if "data" in body:
         return body["data"]
     return body
 
 
-def llm_json(prompt: str) -> dict:
-    """调用 LLM，要求返回 JSON 对象。"""
+# ========= 工具函数 =========
+
+
+def fetch_context(path: str, user_input: str, *, token: str) -> dict:
+    """
+    阶段1：获取解析所需的上下文（可用类型/颜色、当前日期）。
+    上下文只与用户和日期有关，按用户缓存，键中带上北京日期以便跨天自动失效。
+    """
+    user_key = user_cache_key(token)
+    key = f"{path}:{beijing_now().date().isoformat()}"
+    ctx = context_cache.get(user_key, key)
+    if ctx is None:
+        ctx = jarvis_request(path, token=token, method="POST", payload={"user_input": user_input})
+        context_cache.set(user_key, key, ctx)
+    return ctx
+
+
+def llm_json(prompt: str, *, user_key: Optional[str] = None) -> dict:
+    """调用 LLM，要求返回 JSON 对象。传入 user_key 时按用户缓存相同 prompt 的结果。"""
+    cache_key = hashlib.sha256(prompt.encode("utf-8")).hexdigest()
+    if user_key:
+        cached = llm_cache.get(user_key, cache_key)
+        if cached is not None:
+            return cached
     try:
         res = client.chat.completions.create(
             model=OPENAI_MODEL,
@@ -128,9 +379,12 @@ def llm_json(prompt: str) -> dict:
         raise HTTPException(status_code=502, detail=f"LLM 调用失败: {exc}") from exc
     content = res.choices[0].message.content
     try:
-        return json.loads(content)
+        parsed = json.loads(content)
     except Exception as exc:  # noqa: BLE001
         raise HTTPException(status_code=502, detail=f"LLM JSON 解析失败: {content}") from exc
+    if user_key:
+        llm_cache.set(user_key, cache_key, parsed)
+    return parsed
 
 
 def safe_pick_type(type_id: Optional[str], available: List[dict]) -> str:
@@ -149,7 +403,7 @@ def get_weather_summary(location: Optional[dict]) -> str:
     if lat is None or lon is None:
         return "定位信息不完整，无法查询天气"
     params = {"lat": lat, "lon": lon, "appid": OPENWEATHER_API_KEY, "units": "metric", "lang": "zh_cn"}
-    url = "https://api.openweathermap.org/data/2.5/weather"
+    url = f"{OPENWEATHER_API_BASE}/data/2.5/weather"
     try:
         resp = requests.get(url, params=params, timeout=8)
         data = resp.json()
@@ -182,13 +436,16 @@ def get_weather_summary(location: Optional[dict]) -> str:
         return "天气查询失败"
 
 
-def get_commute_summary() -> str:
+COMMUTE_MODE_NAMES = {"walking": "步行", "cycling": "骑行", "transit": "公共交通", "driving": "驾车"}
+
+
+def get_commute_summary(data: Optional[dict]) -> str:
     """
-    调用后端占位通勤接口，返回简要通勤信息。
-    后端暂时返回固定路线，如失败则提供兜底。
+    根据 reminder-context 中附带的通勤估算（后端离线计算）生成简要通勤信息，
+    不再单独请求 /location/commute。缺失时提供兜底。
     """
     try:
-        data = jarvis_request("/location/commute", method="GET")
+        data = data or {}
         origin = data.get("from", {})
         dest = data.get("to", {})
         routes = data.get("routes") or []
@@ -196,7 +453,7 @@ def get_commute_summary() -> str:
             r0 = routes[0]
             dur = r0.get("duration_minutes")
             dist = r0.get("distance_km")
-            traffic = r0.get("traffic_status") or ""
+            mode = COMMUTE_MODE_NAMES.get(r0.get("mode"), "")
             o_addr = origin.get("address") or origin.get("type") or "出发地"
             d_addr = dest.get("address") or dest.get("type") or "目的地"
             parts = []
@@ -204,8 +461,8 @@ def get_commute_summary() -> str:
                 parts.append(f"{dist:.1f}km")
             if dur:
                 parts.append(f"{dur}分钟")
-            if traffic:
-                parts.append(f"路况{traffic}")
+            if mode:
+                parts.append(mode)
             detail = " / ".join(parts) if parts else "路况信息暂无"
             return f"{o_addr} → {d_addr}，约 {detail}"
     except Exception:
@@ -216,7 +473,11 @@ def get_commute_summary() -> str:
 # ========= 路由 =========
 @app.get("/health")
 def health():
-    return {"status": "ok", "time": beijing_now().isoformat()}
+    return {
+        "status": "ok",
+        "time": beijing_now().isoformat(),
+        "caches": {c.name: c.stats() for c in (context_cache, reminder_cache, llm_cache)},
+    }
 
 # 显式处理预检请求，避免 405
 @app.options("/{full_path:path}")
@@ -356,11 +617,32 @@ def _keyword_fallback(user_input: str):
     return None, None
 
 
+def _free_slot(day: str, *, token: str):
+    """
+    未给出时间的任务/事件放在哪里：优先当天晚上（18:00 起）的第一个空闲时段，晚上排满则取当天任意空闲时段，
+    都没有（或日期不合法）时退回 18:00-19:00。空闲时段由后端 /schedule/free-slots 一次扫描得出。
+    """
+    for preferred in (FREE_SLOT_PREFERRED_START, None):
+        query = {"duration": FREE_SLOT_MINUTES, "start": day, "end": day}
+        if preferred:
+            query["day_start"] = preferred
+        try:
+            slots = jarvis_request(f"/schedule/free-slots?{urlencode(query)}", token=token)["slots"]
+        except HTTPException as exc:
+            logger.warning("[free_slot] day=%s 查询空闲时段失败: %s", day, exc.detail)
+            break
+        if slots:
+            start = datetime.strptime(slots[0]["start"], "%H:%M")
+            return slots[0]["start"], (start + timedelta(minutes=FREE_SLOT_MINUTES)).strftime("%H:%M")
+    return "18:00", "19:00"
+
+
 @app.post("/parse-task")
-def parse_task(body: TextInput):
+def parse_task(body: TextInput, token: str = Depends(caller_token)):
     user_input = body.user_input
+    user_key = user_cache_key(token)
     # 阶段1：获取上下文
-    ctx = jarvis_request("/agent/parse-task", method="POST", payload={"user_input": user_input})
+    ctx = fetch_context("/agent/parse-task", user_input, token=token)
     available_types = ctx["available_types"]
     type_opts = ", ".join(f'{t["id"]}({t["name"]})' for t in available_types)
 
@@ -378,7 +660,7 @@ type_id 必须从: {type_opts}
   "type_id": "可选项中的id"
 }}
 """
-    parsed = llm_json(prompt)
+    parsed = llm_json(prompt, user_key=user_key)
     parsed["type_id"] = safe_pick_type(parsed.get("type_id"), available_types)
 
     # 无论 LLM 是否返回时间，都尝试从原文本再解析一遍，若解析到则覆盖/补全
@@ -394,20 +676,22 @@ type_id 必须从: {type_opts}
         if end:
             parsed["end_time"] = end
     else:
-        # 最终兜底：仍未解析出时间时，按关键词或默认 18:00-19:00
-        ks, ke = _keyword_fallback(user_input)
+        # 最终兜底：仍未解析出时间时，放进今天的第一个空闲时段
         parsed["is_all_day"] = False
-        parsed["start_time"] = ks or "18:00"
-        parsed["end_time"] = ke or "19:00"
+        parsed["start_time"], parsed["end_time"] = _free_slot(beijing_now().date().isoformat(), token=token)
 
     logger.info("[parse_task] user_input=%s parsed=%s", user_input, parsed)
-    return jarvis_request("/agent/parse-task", method="POST", payload=parsed)
+    result = jarvis_request("/agent/parse-task", token=token, method="POST", payload=parsed)
+    # 新建了今天的任务，提醒中的行程摘要需要重新生成
+    reminder_cache.invalidate(user_key)
+    return result
 
 
 @app.post("/parse-calendar-type")
-def parse_calendar_type(body: TextInput):
+def parse_calendar_type(body: TextInput, token: str = Depends(caller_token)):
     user_input = body.user_input
-    ctx = jarvis_request("/agent/parse-calendar-type", method="POST", payload={"user_input": user_input})
+    user_key = user_cache_key(token)
+    ctx = fetch_context("/agent/parse-calendar-type", user_input, token=token)
     colors = [c["value"].upper() for c in ctx["available_colors"]]
     # 名称/值/中文关键词 → 规范色值
     name_to_value = {c["name"].lower(): c["value"].upper() for c in ctx["available_colors"]}
@@ -441,7 +725,7 @@ color 必须精确从列表选择: {", ".join(colors)}
 输出 JSON:
 {{"name": "类型名称", "color": "#HEX"}}
 """
-    parsed = llm_json(prompt)
+    parsed = llm_json(prompt, user_key=user_key)
     color_raw = parsed.get("color", "")
     color_upper = color_raw.upper()
 
@@ -464,13 +748,17 @@ color 必须精确从列表选择: {", ".join(colors)}
     color = pick_color()
     body = {"name": parsed.get("name", "默认类型"), "color": color}
     logger.info("[parse_calendar_type] user_input=%s parsed=%s final=%s", user_input, parsed, body)
-    return jarvis_request("/agent/parse-calendar-type", method="POST", payload=body)
+    result = jarvis_request("/agent/parse-calendar-type", token=token, method="POST", payload=body)
+    # 上下文中的可用类型已过期，之后的 parse-task / parse-event 需要看到新类型
+    context_cache.invalidate(user_key)
+    return result
 
 
 @app.post("/parse-event")
-def parse_event(body: TextInput):
+def parse_event(body: TextInput, token: str = Depends(caller_token)):
     user_input = body.user_input
-    ctx = jarvis_request("/agent/parse-event", method="POST", payload={"user_input": user_input})
+    user_key = user_cache_key(token)
+    ctx = fetch_context("/agent/parse-event", user_input, token=token)
     available_types = ctx["available_types"]
     current_date = ctx.get("current_date")
     type_opts = ", ".join(f'{t["id"]}({t["name"]})' for t in available_types)
@@ -490,7 +778,7 @@ type_id 必须从: {type_opts}
   "type_id": "可选项中的id"
 }}
 """
-    parsed = llm_json(prompt)
+    parsed = llm_json(prompt, user_key=user_key)
     parsed["type_id"] = safe_pick_type(parsed.get("type_id"), available_types)
     # 默认日期：如果未给出，则使用 current_date
     if not parsed.get("date"):
@@ -508,22 +796,28 @@ type_id 必须从: {type_opts}
         if end:
             parsed["end_time"] = end
     else:
-        # 最终兜底：仍未解析出时间时，按关键词或默认 18:00-19:00
-        ks, ke = _keyword_fallback(user_input)
+        # 最终兜底：仍未解析出时间时，放进当天的第一个空闲时段
         parsed["is_all_day"] = False
-        parsed["start_time"] = ks or "18:00"
-        parsed["end_time"] = ke or "19:00"
+        parsed["start_time"], parsed["end_time"] = _free_slot(parsed["date"], token=token)
     logger.info("[parse_event] user_input=%s parsed=%s", user_input, parsed)
-    return jarvis_request("/agent/parse-event", method="POST", payload=parsed)
+    result = jarvis_request("/agent/parse-event", token=token, method="POST", payload=parsed)
+    # 新建的事件可能落在提醒覆盖的日程内，同 parse_task
+    reminder_cache.invalidate(user_key)
+    return result
 
 
 @app.post("/generate-reminders")
-def generate_reminders():
-    ctx = jarvis_request("/agent/reminder-context")
+def generate_reminders(token: str = Depends(caller_token)):
+    user_key = user_cache_key(token)
+    cached = reminder_cache.get(user_key, "reminders")
+    if cached is not None:
+        return cached
+
+    ctx = jarvis_request("/agent/reminder-context", token=token)
     location = ctx.get("current_location")
     events = ctx.get("events", [])
     weather_text = get_weather_summary(location)
-    commute_text = get_commute_summary()
+    commute_text = get_commute_summary(ctx.get("commute"))
     important_text = "未来10天暂无行程"
 
     def summarize_events(evts: list) -> str:
@@ -634,6 +928,8 @@ def generate_reminders():
             },
         ]
     }
-    return jarvis_request("/agent/generate-reminders", method="POST", payload=payload)
+    result = jarvis_request("/agent/generate-reminders", token=token, method="POST", payload=payload)
+    reminder_cache.set(user_key, "reminders", result)
+    return result
 
 
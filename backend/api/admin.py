@@ -1,10 +1,11 @@
 from django.contrib import admin
-from .models import User, UserLocation, AccessToken, CalendarType, Event, EventLink, UploadedFile
+from .models import User, UserLocation, GazetteerPlace, AccessToken, RevokedToken, CalendarType, Event, EventLink, EventOccurrence, FileBlob, FileDeletion, UploadedFile
 
 
 @admin.register(User)
 class UserAdmin(admin.ModelAdmin):
-    list_display = ['account_id', 'home_address', 'school_address', 'created_at']
+    list_display = ['account_id', 'home_address', 'school_address', 'shard', 'created_at']
+    list_filter = ['shard']
     search_fields = ['account_id']
     readonly_fields = ['id', 'created_at', 'updated_at']
 
@@ -16,6 +17,13 @@ class UserLocationAdmin(admin.ModelAdmin):
     readonly_fields = ['id', 'timestamp']
 
 
+@admin.register(GazetteerPlace)
+class GazetteerPlaceAdmin(admin.ModelAdmin):
+    list_display = ['name', 'latitude', 'longitude', 'radius_m']
+    search_fields = ['name']
+    readonly_fields = ['id']
+
+
 @admin.register(AccessToken)
 class AccessTokenAdmin(admin.ModelAdmin):
     list_display = ['user', 'token', 'is_active', 'created_at', 'expires_at']
@@ -23,6 +31,12 @@ class AccessTokenAdmin(admin.ModelAdmin):
     readonly_fields = ['id', 'created_at']
 
 
+@admin.register(RevokedToken)
+class RevokedTokenAdmin(admin.ModelAdmin):
+    list_display = ['jti', 'user', 'issued_before', 'expires_at', 'created_at']
+    readonly_fields = ['id', 'created_at']
+
+
 @admin.register(CalendarType)
 class CalendarTypeAdmin(admin.ModelAdmin):
     list_display = ['user', 'type_id', 'name', 'color', 'is_visible', 'is_deletable']
@@ -33,7 +47,7 @@ class CalendarTypeAdmin(admin.ModelAdmin):
 
 @admin.register(Event)
 class EventAdmin(admin.ModelAdmin):
-    list_display = ['user', 'title', 'date', 'is_all_day', 'start_time', 'completed', 'calendar_type']
+    list_display = ['user', 'title', 'date', 'is_all_day', 'start_time', 'recurrence', 'completed', 'calendar_type']
     list_filter = ['user', 'date', 'completed', 'is_all_day', 'calendar_type']
     search_fields = ['title', 'user__account_id']
     readonly_fields = ['id', 'created_at', 'updated_at']
@@ -47,9 +61,31 @@ class EventLinkAdmin(admin.ModelAdmin):
     readonly_fields = ['id', 'created_at']
 
 
+@admin.register(EventOccurrence)
+class EventOccurrenceAdmin(admin.ModelAdmin):
+    list_display = ['event', 'date', 'cancelled', 'completed', 'completed_at']
+    list_filter = ['cancelled', 'completed']
+    search_fields = ['event__title']
+    readonly_fields = ['id', 'updated_at']
+
+
+@admin.register(FileBlob)
+class FileBlobAdmin(admin.ModelAdmin):
+    list_display = ['sha256', 'size', 'ref_count', 'created_at']
+    search_fields = ['sha256']
+    readonly_fields = ['sha256', 'created_at']
+
+
 @admin.register(UploadedFile)
 class UploadedFileAdmin(admin.ModelAdmin):
     list_display = ['user', 'original_name', 'size', 'mime_type', 'created_at']
     list_filter = ['user', 'mime_type']
     search_fields = ['original_name', 'user__account_id']
     readonly_fields = ['id', 'created_at']
+
+
+@admin.register(FileDeletion)
+class FileDeletionAdmin(admin.ModelAdmin):
+    list_display = ['name', 'attempts', 'last_error', 'created_at']
+    search_fields = ['name']
+    readonly_fields = ['id', 'created_at']
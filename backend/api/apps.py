@@ -4,3 +4,19 @@ from django.apps import AppConfig
 class ApiConfig(AppConfig):
     default_auto_field = "django.db.models.BigAutoField"
     name = "api"
+
+    def ready(self):
+        from django.db.backends.signals import connection_created
+        from django.db.models.signals import post_delete, post_migrate, post_save
+        from . import commute, metrics, realtime, search
+        from .models import GazetteerPlace
+
+        # 地名表变化时清空通勤估算的进程内缓存
+        post_save.connect(commute.invalidate, sender=GazetteerPlace, dispatch_uid='commute_invalidate_save')
+        post_delete.connect(commute.invalidate, sender=GazetteerPlace, dispatch_uid='commute_invalidate_delete')
+        # 事件、日历类型的写入在事务提交后推送到实时变更通道
+        realtime.connect_signals()
+        # 抽样请求的查询计数与耗时（见 api/metrics.py）
+        connection_created.connect(metrics.instrument_connection, dispatch_uid='metrics_instrument_connection')
+        # 迁移重建事件表后重新安装全文索引的触发器（见 api/search.py）
+        post_migrate.connect(search.restore_triggers, sender=self, dispatch_uid='search_restore_triggers')
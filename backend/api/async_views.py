@@ -0,0 +1,214 @@
+"""
+读多写少端点的异步实现（ASGI 部署使用）
+
+在 ASGI 服务器下，同步的 DRF 视图每个请求都要桥接到线程池执行；这里的视图用
+Django 异步 ORM 读取数据，鉴权逻辑与 TokenAuthentication 相同，响应格式与
+make_response 完全一致。GET 以外的方法交回原有的同步视图处理。
+
+是否启用由 settings.ASYNC_READ_VIEWS 决定（asgi.py 默认开启），见 api/urls.py。
+"""
+from functools import wraps
+from datetime import timedelta
+
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.core.handlers.asgi import ASGIRequest
+from django.http import HttpResponse, StreamingHttpResponse
+from django.utils import timezone
+from django.views.decorators.csrf import csrf_exempt
+from rest_framework import exceptions
+
+from . import commute, realtime, recurrence, streaming, views
+from .authentication import TokenAuthentication
+from .models import Event
+from .replicas import replica_reads
+from .serializers import CalendarTypeSerializer, EventSerializer
+
+
+def json_response(payload, status_code=200):
+    """与 DRF JSONRenderer 相同的编码方式（紧凑、不转义中文、转义 U+2028 / U+2029），与流式输出共用编码器"""
+    return HttpResponse(streaming.dumps(payload), status=status_code, content_type='application/json')
+
+
+def make_async_response(data=None, message=None, success=True, status_code=200):
+    """统一响应格式（同 views.make_response）"""
+    response = {
+        'success': success,
+        'server_time': timezone.now().isoformat()
+    }
+    if data is not None:
+        response['data'] = data
+    if message:
+        response['message'] = message
+    return json_response(response, status_code)
+
+
+async def authenticate(request):
+    """
+    与 TokenAuthentication + IsAuthenticated 相同的鉴权。
+    成功时设置 request.user / request.auth 并返回None，失败时返回401响应。
+    """
+    authenticator = TokenAuthentication()
+    try:
+        result = await authenticator.aauthenticate(request)
+        if result is None:
+            raise exceptions.NotAuthenticated()
+    except exceptions.APIException as exc:
+        response = json_response({'detail': exc.detail}, status_code=401)
+        response['WWW-Authenticate'] = authenticator.authenticate_header(request)
+        return response
+    request.user, request.auth = result
+    return None
+
+
+async def loaded_user(request):
+    """签名 token 鉴权得到的用户只带 id 与分片；需要读取用户其他字段的异步视图先在线程中加载"""
+    user = request.user
+    deferred = user.get_deferred_fields()
+    if deferred:
+        await user.arefresh_from_db(fields=list(deferred))
+    return user
+
+
+def async_read_view(sync_view, authenticated=True):
+    """
+    把异步函数包装为视图：GET 走异步实现，其余方法交给 sync_view。
+    sync_view 挂在返回的视图上，同进程调用方（agent_service）可直接调用同步版本。
+    """
+    def decorator(func):
+        @csrf_exempt
+        @wraps(func)
+        async def view(request, *args, **kwargs):
+            if request.method != 'GET':
+                return await sync_to_async(sync_view)(request, *args, **kwargs)
+            if authenticated:
+                error = await authenticate(request)
+                if error is not None:
+                    return error
+            return await func(request, *args, **kwargs)
+
+        view.sync_view = sync_view
+        return view
+    return decorator
+
+
+async def aiter_occurrences(events, start_date, end_date, completed=None):
+    """views.iter_occurrences 的异步版本：单次事件用 aiterator 分块读取"""
+    merger = recurrence.OccurrenceMerger([e async for e in events.exclude(recurrence='')], start_date, end_date)
+    singles = events.filter(recurrence='').order_by('date', 'start_time')
+    async for event in singles.aiterator(chunk_size=settings.STREAM_CHUNK_SIZE):
+        for item in merger.before(recurrence.sort_key(event)):
+            if completed is None or item.completed == completed:
+                yield item
+        yield event
+    for item in merger.before(None):
+        if completed is None or item.completed == completed:
+            yield item
+
+
+# ==================== TIME ====================
+
+@async_read_view(views.get_server_time, authenticated=False)
+async def get_server_time(request):
+    """获取服务器时间"""
+    return make_async_response(views.server_time_data())
+
+
+# ==================== CALENDAR TYPES ====================
+
+@async_read_view(views.calendar_types_list)
+@replica_reads
+async def calendar_types_list(request):
+    """获取日历类型（POST 由同步视图处理）"""
+    types = [t async for t in views.calendar_types_with_counts(request.user)]
+    return make_async_response(CalendarTypeSerializer(types, many=True).data)
+
+
+# ==================== EVENTS ====================
+
+@async_read_view(views.events_list)
+@replica_reads
+async def events_list(request):
+    """获取事件列表（POST 由同步视图处理）"""
+    params = request.GET
+    events = Event.objects.filter(user=request.user).select_related('calendar_type', 'attachment').prefetch_related('links', 'attachment__blob')
+    events = views.filter_events(events, params)
+    if views.wants_stream(params, *views.events_list_range(params)):
+        start_date, end_date = views.event_window(params)
+        items = aiter_occurrences(events.using(views.stream_db()), start_date, end_date, views.completed_filter(params))
+        return streaming.astream_response(views.events_stream(request), items)
+    events = views.list_occurrences([e async for e in events], params)
+
+    serializer = EventSerializer(events, many=True, context={'request': request})
+    return make_async_response({
+        'events': serializer.data,
+        'total': len(events)
+    })
+
+
+# ==================== AGENT API ====================
+
+@async_read_view(views.agent_info)
+@replica_reads
+async def agent_info(request):
+    """为AI Agent提供完整的用户和日程信息"""
+    user = await loaded_user(request)
+
+    calendar_types = [t async for t in views.calendar_types_with_counts(user)]
+    start_date, end_date = views.agent_info_date_range(request.GET)
+    if views.wants_stream(request.GET, start_date, end_date):
+        events = views.agent_info_events(user, start_date, end_date).using(views.stream_db())
+        return streaming.astream_response(
+            views.agent_info_stream(user, calendar_types, start_date, end_date),
+            aiter_occurrences(events, start_date, end_date)
+        )
+    events = [e async for e in views.agent_info_events(user, start_date, end_date)]
+    events = recurrence.expand(events, start_date, end_date)
+
+    return make_async_response(views.build_agent_info(user, calendar_types, events, start_date, end_date))
+
+
+@async_read_view(views.agent_reminder_context)
+@replica_reads
+async def agent_reminder_context(request):
+    """为AI Reminder提供上下文数据"""
+    user = await loaded_user(request)
+
+    today = views.beijing_today()
+    end_date = today + timedelta(days=10)
+    events = [e async for e in views.reminder_context_events(user, today, end_date)]
+    events = recurrence.expand(events, today, end_date)
+    # 通勤估算首次使用时需从数据库加载地名表，之后常驻内存
+    await sync_to_async(commute.load_places)()
+
+    return make_async_response(views.build_reminder_context(user, events, today, end_date))
+
+
+# ==================== CHANGES ====================
+
+@csrf_exempt
+async def changes(request):
+    """
+    实时变更通道（SSE，见 api/realtime.py）。浏览器的 EventSource 不能设置请求头，
+    token 也可以放在 ?access_token= 中。只在 ASGI 下可用：WSGI 下长连接会一直占用一个工作线程
+    """
+    if request.method != 'GET':
+        return json_response({'detail': f'Method "{request.method}" not allowed.'}, status_code=405)
+    if not isinstance(request, ASGIRequest):
+        return json_response({
+            'success': False,
+            'error': {'code': 'NOT_SUPPORTED', 'message': 'The change channel requires the ASGI server'},
+            'server_time': timezone.now().isoformat()
+        }, status_code=501)
+    token = request.GET.get('access_token')
+    if token and 'HTTP_AUTHORIZATION' not in request.META:
+        request.META['HTTP_AUTHORIZATION'] = f'Bearer {token}'
+    error = await authenticate(request)
+    if error is not None:
+        return error
+
+    response = StreamingHttpResponse(realtime.sse_events(request.user.pk), content_type='text/event-stream')
+    response['Cache-Control'] = 'no-cache'
+    # 让 nginx 等反向代理不缓冲
+    response['X-Accel-Buffering'] = 'no'
+    return response
@@ -0,0 +1,330 @@
+"""
+附件存储：按内容寻址（sha256）去重
+
+- HashingUploadHandler 在接收上传数据时逐块计算 sha256 并写入临时文件，
+  不在内存中缓存整个文件，超过大小上限时立即跳过剩余数据
+- 相同内容只保存一份 FileBlob，多个 UploadedFile 通过 ref_count 共享
+- 删除 UploadedFile 时引用数减一，最后一个引用消失后才删除 blob；磁盘文件写入删除队列
+  （FileDeletion，与记录删除同一事务），由后台线程删除，请求不等待文件系统操作
+- 分块续传（UploadSession）：每块按偏移直接写入同一个 .part 文件，完成时计算哈希后
+  重命名为 blob，不再组装或复制数据
+"""
+import hashlib
+import logging
+import os
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from datetime import timedelta
+
+from django.conf import settings
+from django.core.files import uploadedfile
+from django.core.files.uploadedfile import TemporaryUploadedFile
+from django.core.files.uploadhandler import FileUploadHandler, SkipFile
+from django.db import IntegrityError, close_old_connections, transaction
+from django.db.models import F
+from django.utils import timezone
+
+from . import sharding
+from .models import FileBlob, FileDeletion, UploadedFile, UploadSession
+from .previews import schedule_preview
+
+logger = logging.getLogger(__name__)
+
+_deletion_executor = None
+_deletion_lock = threading.Lock()
+_drain_pending = False
+
+
+class HashingUploadHandler(FileUploadHandler):
+    """边接收边计算 sha256，数据直接写入临时文件"""
+
+    def new_file(self, *args, **kwargs):
+        super().new_file(*args, **kwargs)
+        self.file = TemporaryUploadedFile(self.file_name, self.content_type, 0, self.charset, self.content_type_extra)
+        self.hasher = hashlib.sha256()
+        self.received = 0
+
+    def receive_data_chunk(self, raw_data, start):
+        self.received += len(raw_data)
+        if self.received > settings.ATTACHMENT_MAX_BYTES:
+            # 标记超限，由视图返回413；SkipFile 让解析器丢弃该文件剩余的数据
+            self.request.upload_too_large = True
+            self.file.close()
+            raise SkipFile()
+        self.hasher.update(raw_data)
+        self.file.write(raw_data)
+
+    def file_complete(self, file_size):
+        self.file.seek(0)
+        self.file.size = file_size
+        self.file.sha256 = self.hasher.hexdigest()
+        return self.file
+
+
+def content_hash(uploaded_file):
+    """上传文件的 sha256；经由 HashingUploadHandler 的文件已在接收时算好"""
+    digest = getattr(uploaded_file, 'sha256', None)
+    if digest:
+        return digest
+    hasher = hashlib.sha256()
+    for chunk in uploaded_file.chunks():
+        hasher.update(chunk)
+    uploaded_file.seek(0)
+    return hasher.hexdigest()
+
+
+def blob_name(digest, original_name):
+    """blob 存储路径：attachments/<前两位>/<sha256><扩展名>"""
+    ext = os.path.splitext(original_name or '')[1].lower()[:16]
+    return f'{digest[:2]}/{digest}{ext}'
+
+
+def acquire_blob(uploaded_file):
+    """
+    取得与上传内容相同的 blob 并增加引用；不存在则保存为新 blob。
+    返回 (blob, created)
+    """
+    digest = content_hash(uploaded_file)
+    if FileBlob.objects.filter(sha256=digest).update(ref_count=F('ref_count') + 1):
+        return FileBlob.objects.get(sha256=digest), False
+
+    blob = FileBlob(sha256=digest, size=uploaded_file.size, ref_count=1)
+    # 临时文件通过重命名移入存储目录，不再复制数据
+    blob.file.save(blob_name(digest, uploaded_file.name), uploaded_file, save=False)
+    try:
+        with transaction.atomic():
+            blob.save(force_insert=True)
+    except IntegrityError:
+        # 并发上传了相同内容：保留先写入的 blob，丢弃本次文件
+        blob.file.delete(save=False)
+        FileBlob.objects.filter(sha256=digest).update(ref_count=F('ref_count') + 1)
+        return FileBlob.objects.get(sha256=digest), False
+    return blob, True
+
+
+def store_upload(user, uploaded_file):
+    """保存上传的附件（内容去重），新内容在后台生成预览图，返回 UploadedFile"""
+    # 引用数与 UploadedFile 记录在同一事务中提交，gc_attachments 校正引用数时不会看到中间状态
+    # （启用分片时记录在用户的分片中，分片事务先于主库事务提交）
+    with sharding.atomic(using=sharding.user_db(user), central=True):
+        blob, created = acquire_blob(uploaded_file)
+        if created:
+            schedule_preview(blob)
+        return UploadedFile.objects.create(
+            user=user,
+            blob=blob,
+            file=blob.file.name,
+            original_name=uploaded_file.name,
+            size=uploaded_file.size,
+            mime_type=uploaded_file.content_type or 'application/octet-stream'
+        )
+
+
+def blob_file_names(blob):
+    return [n for n in (blob.file.name, blob.preview.name) if n]
+
+
+def release_blob(blob_id):
+    """引用数减一；归零时删除 blob 记录，磁盘文件写入删除队列"""
+    with transaction.atomic():
+        FileBlob.objects.filter(pk=blob_id).update(ref_count=F('ref_count') - 1)
+        blob = FileBlob.objects.filter(pk=blob_id, ref_count__lte=0).first()
+        if blob is None:
+            return
+        names = blob_file_names(blob)
+        blob.delete()
+        enqueue_deletion(names)
+
+
+def delete_uploaded_file(file_obj):
+    """删除附件记录并释放其内容（去重之前上传的文件直接进入删除队列）"""
+    with sharding.atomic(using=file_obj._state.db, central=True):
+        blob_id = file_obj.blob_id
+        legacy_name = file_obj.file.name if not blob_id else None
+        file_obj.delete()
+        if blob_id:
+            release_blob(blob_id)
+        elif legacy_name:
+            enqueue_deletion([legacy_name])
+
+
+# ==================== 删除队列 ====================
+
+def enqueue_deletion(names):
+    """把存储中的文件加入删除队列（随当前事务提交），提交后唤醒后台线程"""
+    if not names:
+        return
+    FileDeletion.objects.bulk_create([FileDeletion(name=name) for name in names])
+    transaction.on_commit(kick_deletions)
+
+
+def drain_deletions(limit=None):
+    """
+    删除队列中的文件，返回 (已删除数, 失败数)。失败的条目保留并记录错误，下次重试；
+    名称已被新的记录使用时（例如同名文件被重新上传）只移除队列条目，不删除文件
+    """
+    storage = FileBlob._meta.get_field('file').storage
+    queue = FileDeletion.objects.all()
+    if limit:
+        queue = queue[:limit]
+    done = []
+    failed = 0
+    for entry in list(queue):
+        in_use = (
+            FileBlob.objects.filter(file=entry.name).exists()
+            or FileBlob.objects.filter(preview=entry.name).exists()
+            or any(
+                UploadedFile.objects.using(alias).filter(blob__isnull=True, file=entry.name).exists()
+                for alias in sharding.data_databases()
+            )
+        )
+        try:
+            if not in_use:
+                storage.delete(entry.name)
+        except OSError as e:
+            logger.warning('Failed to delete file %s: %s', entry.name, e)
+            FileDeletion.objects.filter(pk=entry.pk).update(attempts=F('attempts') + 1, last_error=str(e)[:255])
+            failed += 1
+            continue
+        done.append(entry.pk)
+    FileDeletion.objects.filter(pk__in=done).delete()
+    return len(done), failed
+
+
+def _drain_in_background():
+    global _drain_pending
+    with _deletion_lock:
+        _drain_pending = False
+    try:
+        drain_deletions()
+    except Exception:
+        logger.exception('File deletion worker failed')
+    finally:
+        close_old_connections()
+
+
+def kick_deletions():
+    """唤醒删除线程；已有尚未开始的任务时不重复提交"""
+    global _deletion_executor, _drain_pending
+    if settings.FILE_DELETION_WORKERS <= 0:
+        return
+    with _deletion_lock:
+        if _drain_pending:
+            return
+        if _deletion_executor is None:
+            _deletion_executor = ThreadPoolExecutor(
+                max_workers=settings.FILE_DELETION_WORKERS, thread_name_prefix='file-deletion'
+            )
+        _drain_pending = True
+        _deletion_executor.submit(_drain_in_background)
+
+
+# ==================== 分块续传 ====================
+
+class AssembledUpload(uploadedfile.UploadedFile):
+    """
+    续传完成的 .part 文件。提供 temporary_file_path，
+    FileSystemStorage 保存时直接重命名，不复制数据。
+    """
+
+    def __init__(self, path, name, content_type, size, sha256):
+        super().__init__(open(path, 'rb'), name, content_type, size)
+        self.path = path
+        self.sha256 = sha256
+
+    def temporary_file_path(self):
+        return self.path
+
+
+def session_part_path(session):
+    return os.path.join(settings.UPLOAD_SESSION_DIR, f'{session.id}.part')
+
+
+def session_expiry():
+    return timezone.now() + timedelta(hours=settings.UPLOAD_SESSION_TTL_HOURS)
+
+
+def create_session(user, name, size, mime_type):
+    """创建续传会话并建立空的 .part 文件"""
+    os.makedirs(settings.UPLOAD_SESSION_DIR, exist_ok=True)
+    session = UploadSession.objects.create(
+        user=user,
+        original_name=name,
+        mime_type=mime_type or 'application/octet-stream',
+        size=size,
+        expires_at=session_expiry()
+    )
+    open(session_part_path(session), 'wb').close()
+    return session
+
+
+def write_chunk(session, stream, start, end=None):
+    """
+    把请求体从 start 偏移处写入 .part 文件，边读边写（每次 UPLOAD_CHUNK_BUFFER_BYTES），
+    最多写到 end（含；默认为文件末尾），不会越过客户端声明的范围。连接中断时已写入的部分仍然有效。
+    返回本次写入的字节数，新的连续偏移见 session.received。
+    """
+    last = session.size - 1 if end is None else end
+    limit = last - start + 1
+    written = 0
+    with open(session_part_path(session), 'r+b') as f:
+        f.seek(start)
+        while written < limit and stream is not None:
+            data = stream.read(min(settings.UPLOAD_CHUNK_BUFFER_BYTES, limit - written))
+            if not data:
+                break
+            f.write(data)
+            written += len(data)
+    stop = start + written
+    # 只在本块与已接收部分相接时推进偏移（并发重传同一块时取较大值）
+    UploadSession.objects.filter(pk=session.pk, received__gte=start, received__lt=stop).update(
+        received=stop, expires_at=session_expiry()
+    )
+    session.refresh_from_db(fields=['received', 'expires_at'])
+    return written
+
+
+def finalize_session(session):
+    """数据全部写入后把 .part 文件转为附件（内容去重），删除会话，返回 UploadedFile"""
+    path = session_part_path(session)
+    hasher = hashlib.sha256()
+    with open(path, 'rb') as f:
+        for chunk in iter(lambda: f.read(1024 * 1024), b''):
+            hasher.update(chunk)
+
+    upload = AssembledUpload(path, session.original_name, session.mime_type, session.size, hasher.hexdigest())
+    try:
+        file_obj = store_upload(session.user, upload)
+    finally:
+        upload.close()
+    session.delete()
+    # 内容已存在（去重命中）时 .part 未被移走，直接删除
+    _remove_part(path)
+    return file_obj
+
+
+def discard_session(session):
+    path = session_part_path(session)
+    session.delete()
+    _remove_part(path)
+
+
+def purge_expired_sessions(now=None):
+    """删除过期的续传会话及其 .part 文件，返回删除的会话数"""
+    now = now or timezone.now()
+    count = 0
+    for alias in sharding.data_databases():
+        expired = list(UploadSession.objects.using(alias).filter(expires_at__lt=now))
+        for session in expired:
+            discard_session(session)
+        count += len(expired)
+    return count
+
+
+def _remove_part(path):
+    try:
+        os.remove(path)
+    except FileNotFoundError:
+        pass
+    except OSError as e:
+        logger.warning('Failed to delete upload part %s: %s', path, e)
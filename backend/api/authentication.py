@@ -1,41 +1,150 @@
+import uuid
+from datetime import timedelta
+
+from asgiref.sync import sync_to_async
 from rest_framework import authentication
 from rest_framework import exceptions
+from django.conf import settings
+from django.db.models import Subquery
 from django.utils import timezone
-from .models import AccessToken
+from . import sharding, signed_tokens
+from .models import AccessToken, RevokedToken
+
+
+def get_bearer_token(request):
+    """从 Authorization 头中取出 Bearer token，不是 Bearer 方案时返回None"""
+    auth_header = request.META.get('HTTP_AUTHORIZATION', '')
+
+    if not auth_header:
+        return None
+
+    try:
+        auth_type, token = auth_header.split(' ', 1)
+        if auth_type.lower() != 'bearer':
+            return None
+    except ValueError:
+        return None
+    return token
 
 
 class TokenAuthentication(authentication.BaseAuthentication):
-    """自定义Token认证"""
-    
+    """自定义Token认证：随机 token 查询 access_tokens，签名 token（jv1.…）在内存中校验"""
+
     def authenticate(self, request):
-        auth_header = request.META.get('HTTP_AUTHORIZATION', '')
-        
-        if not auth_header:
+        token = get_bearer_token(request)
+        if token is None:
             return None
-        
+
+        if signed_tokens.is_signed(token):
+            return self.authenticate_signed(token, refresh=True)
+
         try:
-            auth_type, token = auth_header.split(' ', 1)
-            if auth_type.lower() != 'bearer':
-                return None
-        except ValueError:
+            access_token = AccessToken.objects.select_related('user').get(
+                token=token,
+                is_active=True
+            )
+        except AccessToken.DoesNotExist:
+            raise exceptions.AuthenticationFailed('Invalid token')
+
+        # 检查是否过期（不在请求中写库，过期的 token 由 purge_tokens 批量删除）
+        if access_token.expires_at < timezone.now():
+            raise exceptions.AuthenticationFailed('Token expired')
+
+        # 之后的分片表查询路由到该用户的分片
+        sharding.activate(access_token.user)
+        return (access_token.user, access_token)
+
+    async def aauthenticate(self, request):
+        """authenticate 的异步版本，供 ASGI 下的异步视图使用"""
+        token = get_bearer_token(request)
+        if token is None:
             return None
-        
+
+        if signed_tokens.is_signed(token):
+            if signed_tokens.refresh_due():
+                await sync_to_async(signed_tokens.refresh_revocations)()
+            return self.authenticate_signed(token, refresh=False)
+
         try:
-            access_token = AccessToken.objects.select_related('user').get(
+            access_token = await AccessToken.objects.select_related('user').aget(
                 token=token,
                 is_active=True
             )
         except AccessToken.DoesNotExist:
             raise exceptions.AuthenticationFailed('Invalid token')
-        
-        # 检查是否过期
+
         if access_token.expires_at < timezone.now():
-            access_token.is_active = False
-            access_token.save()
             raise exceptions.AuthenticationFailed('Token expired')
-        
+
+        sharding.activate(access_token.user)
         return (access_token.user, access_token)
-    
+
+    @staticmethod
+    def authenticate_signed(token, refresh):
+        try:
+            signed = signed_tokens.verify(token, refresh=refresh)
+        except signed_tokens.InvalidToken as e:
+            raise exceptions.AuthenticationFailed(str(e))
+        user = signed_tokens.token_user(signed)
+        sharding.activate(user)
+        return (user, signed)
+
     def authenticate_header(self, request):
         return 'Bearer'
 
+
+def issue_token(user, device_id=''):
+    """
+    登录时签发 token，返回 AccessToken（ACCESS_TOKEN_FORMAT=signed 时返回 SignedToken，不写库）。
+    带 device_id 时同一设备只保留一行：剩余有效期足够长时直接复用（不写库），否则原地轮换为新 token
+    （旧 token 随之失效）；不带 device_id 的客户端每次新建一行
+    """
+    if settings.ACCESS_TOKEN_FORMAT == 'signed':
+        return signed_tokens.issue(user)
+    now = timezone.now()
+    expires_at = now + timedelta(seconds=settings.ACCESS_TOKEN_TTL_SECONDS)
+    current = None
+    if device_id:
+        current = AccessToken.objects.filter(user=user, device_id=device_id).order_by('-expires_at').first()
+    if current is None:
+        return AccessToken.objects.create(user=user, device_id=device_id, token=str(uuid.uuid4()), expires_at=expires_at)
+
+    if current.is_active and (current.expires_at - now).total_seconds() > settings.ACCESS_TOKEN_REUSE_MIN_SECONDS:
+        return current
+    current.token = str(uuid.uuid4())
+    current.expires_at = expires_at
+    current.is_active = True
+    current.save(update_fields=['token', 'expires_at', 'is_active'])
+    return current
+
+
+def revoke_token(auth):
+    """注销：签名 token 加入撤销集合，随机 token 标记为过期（由 purge_tokens 按过期时间索引删除）"""
+    if isinstance(auth, signed_tokens.SignedToken):
+        signed_tokens.revoke(auth)
+        return
+    auth.is_active = False
+    auth.expires_at = timezone.now()
+    auth.save(update_fields=['is_active', 'expires_at'])
+
+
+def purge_tokens(now=None, batch_size=None):
+    """
+    删除已过期或已注销的 token 以及过期的撤销记录，返回删除数。
+    每批一条 DELETE ... WHERE id IN (SELECT ... LIMIT n)，单个写事务很短，不长时间占用写锁
+    """
+    now = now or timezone.now()
+    batch_size = batch_size or settings.ACCESS_TOKEN_PURGE_BATCH_SIZE
+    total = 0
+    for stale in (
+        AccessToken.objects.filter(expires_at__lt=now),
+        AccessToken.objects.filter(is_active=False),
+        RevokedToken.objects.filter(expires_at__lt=now),
+    ):
+        while True:
+            batch = stale.values('pk')[:batch_size]
+            deleted, _ = stale.model.objects.filter(pk__in=Subquery(batch)).delete()
+            total += deleted
+            if deleted < batch_size:
+                break
+    return total
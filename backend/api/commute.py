@@ -0,0 +1,218 @@
+"""
+离线通勤估算
+
+地址通过本地地名表（GazetteerPlace）解析为坐标，距离用球面距离乘以各出行方式的绕行系数，
+时长按方式的平均速度加固定等候/停车时间估算，不依赖任何外部地图服务。
+
+两级进程内缓存：
+  - 地址 -> 坐标：以规范化后的地址文本为键，地址一改键就变，旧结果自然失效
+  - 起点格子 -> 终点格子 -> 路线：坐标按 COMMUTE_CELL_DECIMALS 位小数取整，同一格子内的请求共用结果
+地名表有增删改时两级缓存整体清空（见 apps.ApiConfig.ready 中注册的信号）。
+"""
+import re
+import threading
+from collections import OrderedDict
+
+from django.conf import settings
+
+from .geo import haversine_m
+from .models import GazetteerPlace
+
+# 出行方式参数：平均速度（km/h）、道路绕行系数、固定开销（分钟，等车/找车位等）
+MODE_PROFILES = {
+    'walking': {'speed_kmh': 4.8, 'detour': 1.25, 'overhead_min': 0},
+    'cycling': {'speed_kmh': 14.0, 'detour': 1.3, 'overhead_min': 2},
+    'transit': {'speed_kmh': 28.0, 'detour': 1.35, 'overhead_min': 8},
+    'driving': {'speed_kmh': 32.0, 'detour': 1.3, 'overhead_min': 4},
+}
+
+# 超过该直线距离（km）不再给出步行/骑行方案
+MODE_MAX_KM = {'walking': 3.0, 'cycling': 15.0}
+
+_COORDINATES_RE = re.compile(r'^\s*(-?\d+(?:\.\d+)?)\s*,\s*(-?\d+(?:\.\d+)?)\s*$')
+
+
+class _LRU:
+    """线程安全的定长 LRU 字典"""
+
+    def __init__(self, maxsize):
+        self.maxsize = maxsize
+        self._data = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key, default=None):
+        with self._lock:
+            if key not in self._data:
+                return default
+            self._data.move_to_end(key)
+            return self._data[key]
+
+    def set(self, key, value):
+        with self._lock:
+            self._data[key] = value
+            self._data.move_to_end(key)
+            while len(self._data) > self.maxsize:
+                self._data.popitem(last=False)
+
+    def clear(self):
+        with self._lock:
+            self._data.clear()
+
+    def __len__(self):
+        return len(self._data)
+
+
+_MISSING = object()
+_places = None
+_places_lock = threading.Lock()
+_geocode_cache = _LRU(settings.COMMUTE_CACHE_SIZE)
+_route_cache = _LRU(settings.COMMUTE_CACHE_SIZE)
+
+
+def normalize_address(text):
+    """小写、标点替换为空格、合并空白"""
+    return ' '.join(re.sub(r'[^\w]+', ' ', (text or '').lower()).split())
+
+
+def load_places():
+    """
+    地名表常驻内存，按覆盖范围升序、名称长度降序排列：
+    地址同时包含多个地名时取最具体的那个（范围相同则取更长的名称）
+    """
+    global _places
+    places = _places
+    if places is None:
+        with _places_lock:
+            if _places is None:
+                rows = GazetteerPlace.objects.values_list('name', 'latitude', 'longitude', 'radius_m')
+                _places = [
+                    (normalize_address(name), name, lat, lng)
+                    for name, lat, lng, radius in sorted(rows, key=lambda r: (r[3], -len(r[0])))
+                ]
+            places = _places
+    return places
+
+
+def invalidate(**kwargs):
+    """地名表变化时清空所有缓存（作为信号接收函数使用）"""
+    global _places
+    with _places_lock:
+        _places = None
+    _geocode_cache.clear()
+    _route_cache.clear()
+
+
+def geocode(address):
+    """地址 -> (lat, lng)；无法识别时返回None"""
+    key = normalize_address(address)
+    if not key:
+        return None
+    cached = _geocode_cache.get(key, _MISSING)
+    if cached is not _MISSING:
+        return cached
+
+    result = None
+    padded = f' {key} '
+    for name, _, lat, lng in load_places():
+        if name and f' {name} ' in padded:
+            result = (lat, lng)
+            break
+    if result is None:
+        # 中文地址没有空格分词，退化为子串匹配
+        for name, _, lat, lng in load_places():
+            if name and not name.isascii() and name in key:
+                result = (lat, lng)
+                break
+    _geocode_cache.set(key, result)
+    return result
+
+
+def nearest_place_name(lat, lng):
+    """离坐标最近的地名（用于给当前位置一个可读的标签）"""
+    places = load_places()
+    if not places:
+        return ''
+    _, name, _, _ = min(places, key=lambda p: haversine_m(lat, lng, p[2], p[3]))
+    return name
+
+
+def _cell(coords):
+    digits = settings.COMMUTE_CELL_DECIMALS
+    return (round(coords[0], digits), round(coords[1], digits))
+
+
+def estimate_routes(origin, destination):
+    """两个坐标之间各出行方式的距离与时长，按时长升序；同一对格子只计算一次"""
+    key = (_cell(origin), _cell(destination))
+    routes = _route_cache.get(key)
+    if routes is not None:
+        return routes
+
+    straight_km = haversine_m(key[0][0], key[0][1], key[1][0], key[1][1]) / 1000
+    routes = []
+    for mode, profile in MODE_PROFILES.items():
+        if straight_km > MODE_MAX_KM.get(mode, float('inf')):
+            continue
+        distance_km = straight_km * profile['detour']
+        minutes = distance_km / profile['speed_kmh'] * 60 + (profile['overhead_min'] if straight_km > 0 else 0)
+        routes.append({
+            'mode': mode,
+            'duration_minutes': max(1, round(minutes)) if straight_km > 0 else 0,
+            'distance_km': round(distance_km, 1)
+        })
+    routes.sort(key=lambda r: r['duration_minutes'])
+    routes = tuple(routes)
+    _route_cache.set(key, routes)
+    return routes
+
+
+def resolve_endpoint(user, value):
+    """
+    'home' / 'school' / 'current' / 'lat,lng' -> {'type', 'address', 'coordinates'}
+    无法解析时 coordinates 为None
+    """
+    coords = None
+    address = ''
+    match = _COORDINATES_RE.match(value or '')
+    if match:
+        kind = 'coordinates'
+        coords = (float(match.group(1)), float(match.group(2)))
+    elif value == 'current':
+        kind = 'current'
+        current = user.current_location
+        if current:
+            coords = (current.latitude, current.longitude)
+            address = nearest_place_name(*coords)
+    else:
+        kind = 'school' if value == 'school' else 'home'
+        address = user.school_address if kind == 'school' else user.home_address
+        coords = geocode(address)
+
+    return {
+        'type': kind,
+        'address': address,
+        'coordinates': {'lat': coords[0], 'lng': coords[1]} if coords else None
+    }
+
+
+def commute_between(user, from_param, to_param):
+    """location_commute 的响应数据（全部在内存中完成）"""
+    origin = resolve_endpoint(user, from_param)
+    destination = resolve_endpoint(user, to_param)
+    routes = []
+    maps_url = None
+    if origin['coordinates'] and destination['coordinates']:
+        o = (origin['coordinates']['lat'], origin['coordinates']['lng'])
+        d = (destination['coordinates']['lat'], destination['coordinates']['lng'])
+        routes = [dict(r) for r in estimate_routes(o, d)]
+        maps_url = f'https://maps.google.com/?saddr={o[0]},{o[1]}&daddr={d[0]},{d[1]}'
+    return {
+        'from': origin,
+        'to': destination,
+        'routes': routes,
+        'maps_url': maps_url
+    }
+
+
+def cache_info():
+    return {'geocode_entries': len(_geocode_cache), 'route_entries': len(_route_cache)}
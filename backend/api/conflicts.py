@@ -0,0 +1,190 @@
+"""
+定时事件的时间冲突
+
+非全天、有开始时间的事件（重复事件按每次发生）看作半开区间 [开始, 结束)，用"从公元 1 年起的分钟数"
+表示，可以跨日比较：没有结束时间的事件按 EVENT_DEFAULT_DURATION_MINUTES 计，结束不晚于开始的视为跨过午夜。
+
+- IntervalIndex：按开始时间排序的区间与前缀最大结束时间，查询与某个区间重叠的事件为 O(log n + k)
+- find_conflicts：按开始时间一次扫描（最小堆保存进行中的区间）找出窗口内全部重叠的事件对，O(n log n + k)
+- conflicts_for：写入路径检查一个事件（重复事件检查窗口内的每次发生）。只从 (user, date) 索引取出相关日期
+  （及前一天，可能跨过午夜）的定时事件，每次调用按这个窗口重建区间索引（O(k log k)，k 为窗口内的定时事件数），
+  每次发生在索引中二分查找。不常驻内存维护索引，见 conflicts_for
+"""
+import heapq
+from bisect import bisect_left
+from datetime import date, timedelta
+
+from django.conf import settings
+
+from . import recurrence
+from .models import Event
+
+MINUTES_PER_DAY = 24 * 60
+
+
+def to_minutes(day, t):
+    return day.toordinal() * MINUTES_PER_DAY + t.hour * 60 + t.minute
+
+
+def from_minutes(value):
+    """分钟数 -> (date, 'HH:MM')"""
+    days, minute = divmod(value, MINUTES_PER_DAY)
+    return date.fromordinal(days), f'{minute // 60:02d}:{minute % 60:02d}'
+
+
+def span(day, start_time, end_time):
+    """某天 start_time 开始的定时事件的 (开始, 结束) 分钟数"""
+    start = to_minutes(day, start_time)
+    if end_time is None:
+        return start, start + settings.EVENT_DEFAULT_DURATION_MINUTES
+    end = to_minutes(day, end_time)
+    if end <= start:
+        end += MINUTES_PER_DAY
+    return start, end
+
+
+def interval_of(event):
+    """事件（或某次发生）的 (开始, 结束) 分钟数；全天或没有开始时间的事件返回None"""
+    if event.is_all_day or event.start_time is None:
+        return None
+    return span(event.date, event.start_time, event.end_time)
+
+
+class IntervalIndex:
+    """按开始时间排序的区间；reach[i] 为前 i+1 个区间的最大结束时间，用于提前结束向前的查找"""
+
+    def __init__(self, events):
+        items = []
+        for event in events:
+            span = interval_of(event)
+            if span is not None:
+                items.append((span[0], span[1], event))
+        items.sort(key=lambda item: (item[0], item[1]))
+        self.items = items
+        self.starts = [item[0] for item in items]
+        self.reach = []
+        furthest = None
+        for _, end, _ in items:
+            furthest = end if furthest is None else max(furthest, end)
+            self.reach.append(furthest)
+
+    def __len__(self):
+        return len(self.items)
+
+    def overlapping(self, start, end):
+        """与 [start, end) 重叠的 (开始, 结束, 事件)，按开始时间排序"""
+        found = []
+        i = bisect_left(self.starts, end) - 1
+        while i >= 0 and self.reach[i] > start:
+            if self.items[i][1] > start:
+                found.append(self.items[i])
+            i -= 1
+        found.reverse()
+        return found
+
+
+def timed_events(user, start_date, end_date):
+    """[start_date, end_date] 内的定时事件，重复事件展开为各次发生"""
+    events = Event.objects.filter(
+        recurrence.events_in_window(start_date, end_date),
+        user=user,
+        is_all_day=False,
+        start_time__isnull=False,
+    ).select_related('calendar_type').prefetch_related(recurrence.occurrence_prefetch(start_date, end_date))
+    return recurrence.expand(events, start_date, end_date)
+
+
+def find_conflicts(events, window_start=None, window_end=None):
+    """
+    一次扫描找出重叠的事件对：[(重叠开始, 重叠结束, 事件a, 事件b)]，按重叠开始时间排序。
+    给出窗口（分钟数）时只保留重叠部分落在窗口内的对
+    """
+    items = sorted(
+        ((span[0], span[1], event) for event in events for span in [interval_of(event)] if span is not None),
+        key=lambda item: (item[0], item[1]),
+    )
+    active = []  # (结束, 序号)
+    pairs = []
+    for index, (start, end, event) in enumerate(items):
+        while active and active[0][0] <= start:
+            heapq.heappop(active)
+        for other_end, other in active:
+            overlap_end = min(end, other_end)
+            if window_start is not None and (overlap_end <= window_start or start >= window_end):
+                continue
+            pairs.append((start, overlap_end, items[other][2], event))
+        heapq.heappush(active, (end, index))
+    pairs.sort(key=lambda pair: pair[0])
+    return pairs
+
+
+def conflicts_in_range(user, start_date, end_date):
+    """GET /events/conflicts：窗口内的全部冲突（多取前一天，跨过午夜的事件也能参与比较）"""
+    events = timed_events(user, start_date - timedelta(days=1), end_date)
+    window_start = start_date.toordinal() * MINUTES_PER_DAY
+    window_end = (end_date.toordinal() + 1) * MINUTES_PER_DAY
+    return find_conflicts(events, window_start, window_end)
+
+
+def conflicts_for(user, event):
+    """
+    与 event 时间重叠的已有事件（event 可以未保存；已保存时排除它自己），按开始时间排序。
+    重复事件检查从开始日期起 RECURRENCE_WINDOW_DAYS 天内的每次发生
+
+    区间索引每次调用都按窗口重新查询、重建，而不是在写入时增量维护：事件由多个进程写入（Web 工作进程、
+    agent_service），常驻索引需要跨进程失效，读到的也可能不是本次写入事务中的数据。窗口只是一个用户的
+    相关日期，查询走 (user, date) 索引，k 通常只有几十个，排序的开销远小于这一次查询本身；
+    重复事件的各次发生共用同一次查询和同一个索引
+    """
+    if event.is_all_day or event.start_time is None:
+        return []
+    if event.recurrence:
+        horizon = event.date + timedelta(days=settings.RECURRENCE_WINDOW_DAYS)
+        days = list(recurrence.occurrence_dates(recurrence.parse_rule(event.recurrence), event.date, event.date, horizon))
+    else:
+        days = [event.date]
+    if not days:
+        return []
+
+    index = IntervalIndex(timed_events(user, days[0] - timedelta(days=1), days[-1] + timedelta(days=1)))
+    found = {}
+    for day in days:
+        start, end = interval_of(_at(event, day))
+        for _, _, other in index.overlapping(start, end):
+            if other.pk == event.pk:
+                continue
+            found.setdefault((other.pk, getattr(other, 'occurrence_date', None)), other)
+    return sorted(found.values(), key=lambda e: interval_of(e))
+
+
+def _at(event, day):
+    item = object.__new__(type(event))
+    item.__dict__.update(event.__dict__)
+    item.date = day
+    return item
+
+
+def conflict_data(event):
+    """冲突响应中的事件摘要"""
+    occurrence_date = getattr(event, 'occurrence_date', None)
+    return {
+        'id': str(event.id),
+        'occurrence_date': occurrence_date.isoformat() if occurrence_date else None,
+        'title': event.title,
+        'date': event.date.isoformat(),
+        'start_time': event.start_time.strftime('%H:%M'),
+        'end_time': event.end_time.strftime('%H:%M') if event.end_time else None,
+        'type_id': event.calendar_type.type_id if event.calendar_type else 'general',
+    }
+
+
+def pair_data(pair):
+    start, end, a, b = pair
+    day, overlap_start = from_minutes(start)
+    _, overlap_end = from_minutes(end)
+    return {
+        'date': day.isoformat(),
+        'overlap_start': overlap_start,
+        'overlap_end': overlap_end,
+        'events': [conflict_data(a), conflict_data(b)],
+    }
@@ -0,0 +1,166 @@
+"""
+附件下载
+
+- 鉴权：Bearer token，或 UploadedFileSerializer 生成的限时签名链接（?sig=，可直接在浏览器中打开）
+- 条件请求：ETag（内容哈希）/ Last-Modified，命中时返回 304
+- HTTP Range：单段范围返回 206，多段范围按整文件返回 200，越界返回 416
+- 数据经 FileResponse 流式输出，WSGI 服务器支持 wsgi.file_wrapper 时由 sendfile 发送；
+  配置 ATTACHMENT_SENDFILE_BACKEND 后改由前端代理（nginx X-Accel-Redirect / Apache X-Sendfile）发送，
+  Python 进程不读取文件内容
+"""
+import io
+import re
+
+from django.conf import settings
+from django.core import signing
+from django.http import FileResponse, HttpResponse
+from django.urls import reverse
+from django.utils.cache import get_conditional_response
+from django.utils.http import content_disposition_header, http_date, quote_etag
+
+_SIGNER_SALT = 'api.downloads'
+_RANGE_RE = re.compile(r'^bytes=(\d*)-(\d*)$')
+
+
+class RangeNotSatisfiable(Exception):
+    pass
+
+
+def signed_download_url(request, file_obj):
+    """带限时签名的下载链接（有效期 ATTACHMENT_LINK_MAX_AGE 秒）；签名包含所有者，用于定位其分片"""
+    sig = signing.TimestampSigner(salt=_SIGNER_SALT).sign(f'{file_obj.id}/{file_obj.user_id}')
+    path = reverse('file_download', args=[file_obj.id])
+    return request.build_absolute_uri(f'{path}?sig={sig}')
+
+
+def verify_signature(sig, file_id):
+    """签名有效且对应该文件时返回文件所有者的 id，否则返回None"""
+    try:
+        value = signing.TimestampSigner(salt=_SIGNER_SALT).unsign(sig, max_age=settings.ATTACHMENT_LINK_MAX_AGE)
+    except signing.BadSignature:
+        return None
+    signed_id, _, owner_id = value.partition('/')
+    return owner_id if signed_id == str(file_id) and owner_id else None
+
+
+def file_etag(file_obj):
+    """去重存储的文件以内容哈希为 ETag；旧文件用 id + 大小"""
+    if file_obj.blob_id:
+        return quote_etag(file_obj.blob_id)
+    return quote_etag(f'{file_obj.id.hex}-{file_obj.size}')
+
+
+def parse_range(header, size):
+    """
+    解析 Range 头，返回 (start, end)（闭区间）；
+    无 Range、多段或无法识别时返回None（按整文件响应），范围无法满足时抛出 RangeNotSatisfiable
+    """
+    match = _RANGE_RE.match((header or '').strip())
+    if not match:
+        return None
+    first, last = match.groups()
+    if not first and not last:
+        return None
+    if not first:
+        # bytes=-N：最后 N 个字节
+        length = int(last)
+        if length == 0 or size == 0:
+            raise RangeNotSatisfiable()
+        return max(0, size - length), size - 1
+    start = int(first)
+    end = min(int(last), size - 1) if last else size - 1
+    if start >= size or end < start:
+        raise RangeNotSatisfiable()
+    return start, end
+
+
+class _FileSlice(io.RawIOBase):
+    """只读取文件 [start, start+length) 的包装（有结束位置的 Range 使用，按块流式读取）"""
+
+    def __init__(self, f, start, length):
+        self._f = f
+        self._f.seek(start)
+        self._remaining = length
+
+    def readable(self):
+        return True
+
+    def read(self, n=-1):
+        if self._remaining <= 0:
+            return b''
+        if n is None or n < 0 or n > self._remaining:
+            n = self._remaining
+        data = self._f.read(n)
+        self._remaining -= len(data)
+        return data
+
+    def close(self):
+        self._f.close()
+        super().close()
+
+
+def _common_headers(response, file_obj, etag):
+    response['ETag'] = etag
+    response['Last-Modified'] = http_date(file_obj.created_at.timestamp())
+    response['Accept-Ranges'] = 'bytes'
+    response['Cache-Control'] = f'private, max-age={settings.ATTACHMENT_CACHE_MAX_AGE}'
+    return response
+
+
+def offload_response(field_file, content_type):
+    """交给前端代理发送存储中的文件（代理自行处理 Range），响应体为空"""
+    response = HttpResponse(content_type=content_type)
+    if settings.ATTACHMENT_SENDFILE_BACKEND == 'nginx':
+        response['X-Accel-Redirect'] = settings.ATTACHMENT_ACCEL_REDIRECT_PREFIX + field_file.name
+    else:
+        response['X-Sendfile'] = field_file.path
+    return response
+
+
+def _proxy_response(file_obj, etag, as_attachment):
+    response = offload_response(file_obj.file, file_obj.mime_type)
+    response['Content-Disposition'] = content_disposition_header(as_attachment, file_obj.original_name)
+    return _common_headers(response, file_obj, etag)
+
+
+def file_response(request, file_obj, as_attachment=False):
+    """为 UploadedFile 构造下载响应（处理条件请求与 Range）"""
+    etag = file_etag(file_obj)
+    not_modified = get_conditional_response(request, etag=etag, last_modified=int(file_obj.created_at.timestamp()))
+    if not_modified is not None:
+        return _common_headers(not_modified, file_obj, etag)
+
+    if settings.ATTACHMENT_SENDFILE_BACKEND:
+        return _proxy_response(file_obj, etag, as_attachment)
+
+    size = file_obj.size
+    byte_range = None
+    if_range = request.META.get('HTTP_IF_RANGE')
+    if not if_range or if_range == etag:
+        try:
+            byte_range = parse_range(request.META.get('HTTP_RANGE'), size)
+        except RangeNotSatisfiable:
+            response = HttpResponse(status=416)
+            response['Content-Range'] = f'bytes */{size}'
+            return _common_headers(response, file_obj, etag)
+
+    options = {
+        'as_attachment': as_attachment,
+        'filename': file_obj.original_name,
+        'content_type': file_obj.mime_type
+    }
+    f = open(file_obj.file.path, 'rb')
+    if byte_range is None:
+        response = FileResponse(f, **options)
+    else:
+        start, end = byte_range
+        if end == size - 1:
+            # 开放结尾的范围：定位后直接交给 FileResponse，仍可走 sendfile
+            f.seek(start)
+            response = FileResponse(f, status=206, **options)
+        else:
+            response = FileResponse(_FileSlice(f, start, end - start + 1), status=206, **options)
+            response['Content-Length'] = str(end - start + 1)
+        response['Content-Range'] = f'bytes {start}-{end}/{size}'
+    response.block_size = settings.ATTACHMENT_STREAM_BLOCK_SIZE
+    return _common_headers(response, file_obj, etag)
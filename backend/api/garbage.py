@@ -0,0 +1,142 @@
+"""
+附件垃圾回收（python manage.py gc_attachments，建议由 cron 定期执行）
+
+  1. 未关联任何事件、创建超过宽限期的 UploadedFile：按正常删除流程释放
+  2. 引用数与实际 UploadedFile 数（主库与各分片之和）不一致的 blob（例如用户被级联删除）：
+     校正引用数，归零的删除
+  3. MEDIA_ROOT/attachments 下没有任何记录引用、修改时间超过宽限期的文件（例如上传事务回滚后
+     留下的文件）：加入删除队列
+  4. 处理删除队列（包括后台线程未能删除、等待重试的条目）
+
+宽限期（ATTACHMENT_ORPHAN_GRACE_HOURS）避免回收刚上传、尚未关联到事件的附件。
+"""
+import logging
+import os
+from collections import Counter
+from datetime import timedelta
+
+from django.conf import settings
+from django.db import DEFAULT_DB_ALIAS, transaction
+from django.db.models import Count
+from django.utils import timezone
+
+from . import sharding
+from .attachments import blob_file_names, delete_uploaded_file, drain_deletions, enqueue_deletion
+from .models import FileBlob, FileDeletion, UploadedFile
+
+logger = logging.getLogger(__name__)
+
+ATTACHMENT_DIR = 'attachments'
+
+
+def orphan_uploads(cutoff):
+    """未关联任何事件且创建早于 cutoff 的附件（遍历主库与全部分片）"""
+    uploads = []
+    for alias in sharding.data_databases():
+        uploads += UploadedFile.objects.using(alias).filter(events__isnull=True, created_at__lt=cutoff)
+    return uploads
+
+
+def actual_ref_counts():
+    """每个 blob 实际被引用的次数（UploadedFile 可能分布在多个分片中，分别计数后相加）"""
+    counts = Counter()
+    for alias in sharding.data_databases():
+        rows = UploadedFile.objects.using(alias).filter(blob__isnull=False).values('blob').annotate(n=Count('pk'))
+        for row in rows:
+            counts[row['blob']] += row['n']
+    return counts
+
+
+def reconcile_blob_refs(dry_run=False):
+    """按实际引用校正 blob.ref_count，删除无人引用的 blob；返回 (校正数, 删除数)"""
+    # 在主库写事务中计数：上传与释放都在主库事务内完成分片写入，持有主库写锁期间引用数不会变化
+    with transaction.atomic(using=DEFAULT_DB_ALIAS):
+        counts = actual_ref_counts()
+        mismatched = [
+            (pk, counts.get(pk, 0))
+            for pk, ref_count in FileBlob.objects.values_list('pk', 'ref_count').iterator()
+            if ref_count != counts.get(pk, 0)
+        ]
+        unreferenced = [pk for pk, actual in mismatched if actual == 0]
+        if dry_run:
+            return len(mismatched), len(unreferenced)
+
+        for pk, actual in mismatched:
+            if actual:
+                FileBlob.objects.filter(pk=pk).update(ref_count=actual)
+        names = []
+        for blob in FileBlob.objects.filter(pk__in=unreferenced):
+            names += blob_file_names(blob)
+        FileBlob.objects.filter(pk__in=unreferenced).delete()
+        enqueue_deletion(names)
+    return len(mismatched), len(unreferenced)
+
+
+def known_file_names():
+    """数据库中引用到的全部存储文件名（含已在删除队列中的）"""
+    names = set()
+    for file_name, preview_name in FileBlob.objects.values_list('file', 'preview').iterator():
+        names.add(file_name)
+        names.add(preview_name)
+    for alias in sharding.data_databases():
+        names.update(UploadedFile.objects.using(alias).values_list('file', flat=True).iterator())
+    names.update(FileDeletion.objects.values_list('name', flat=True).iterator())
+    names.discard('')
+    return names
+
+
+def stray_files(cutoff):
+    """MEDIA_ROOT/attachments 下没有记录引用、修改时间早于 cutoff 的文件（存储相对路径）"""
+    root = os.path.join(settings.MEDIA_ROOT, ATTACHMENT_DIR)
+    if not os.path.isdir(root):
+        return []
+    known = known_file_names()
+    threshold = cutoff.timestamp()
+    stray = []
+    for dirpath, _, filenames in os.walk(root):
+        for filename in filenames:
+            path = os.path.join(dirpath, filename)
+            name = os.path.relpath(path, settings.MEDIA_ROOT).replace(os.sep, '/')
+            if name in known:
+                continue
+            try:
+                if os.path.getmtime(path) >= threshold:
+                    continue
+            except FileNotFoundError:
+                continue
+            stray.append(name)
+    return stray
+
+
+def collect_garbage(now=None, grace_hours=None, dry_run=False):
+    """执行一轮回收，返回各项计数；dry_run 时只统计不修改"""
+    now = now or timezone.now()
+    if grace_hours is None:
+        grace_hours = settings.ATTACHMENT_ORPHAN_GRACE_HOURS
+    cutoff = now - timedelta(hours=grace_hours)
+
+    uploads = orphan_uploads(cutoff)
+    if not dry_run:
+        for file_obj in uploads:
+            delete_uploaded_file(file_obj)
+
+    refs_fixed, blobs_removed = reconcile_blob_refs(dry_run=dry_run)
+
+    stray = stray_files(cutoff)
+    if not dry_run:
+        with transaction.atomic():
+            enqueue_deletion(stray)
+
+    if dry_run:
+        deleted, failed = 0, 0
+    else:
+        deleted, failed = drain_deletions()
+    return {
+        'orphan_uploads': len(uploads),
+        'refs_fixed': refs_fixed,
+        'blobs_removed': blobs_removed,
+        'stray_files': len(stray),
+        'files_deleted': deleted,
+        'files_failed': failed,
+        'queued': FileDeletion.objects.count(),
+    }
@@ -0,0 +1,47 @@
+"""地理计算工具：球面距离与定位轨迹降采样"""
+import math
+
+EARTH_RADIUS_M = 6371008.8
+
+
+def haversine_m(lat1, lon1, lat2, lon2):
+    """两点间的大圆距离（米）"""
+    phi1, phi2 = math.radians(lat1), math.radians(lat2)
+    dphi = phi2 - phi1
+    dlmb = math.radians(lon2 - lon1)
+    a = math.sin(dphi / 2) ** 2 + math.cos(phi1) * math.cos(phi2) * math.sin(dlmb / 2) ** 2
+    return 2 * EARTH_RADIUS_M * math.asin(min(1.0, math.sqrt(a)))
+
+
+def _too_near(a, b, distance_epsilon_m, time_epsilon_s):
+    """b 与更早的点 a 的距离或时间间隔不满足阈值"""
+    if haversine_m(a['latitude'], a['longitude'], b['latitude'], b['longitude']) < distance_epsilon_m:
+        return True
+    return (b['timestamp'] - a['timestamp']).total_seconds() < time_epsilon_s
+
+
+def downsample_fixes(fixes, last_kept=None, distance_epsilon_m=0.0, time_epsilon_s=0.0):
+    """
+    按时间排序后降采样定位点。
+    与上一个保留点的距离小于 distance_epsilon_m，或时间间隔小于 time_epsilon_s 的点被丢弃；
+    批次中最新的点始终保留，保证“当前位置”是最新的——与它太近的保留点从后往前移除，
+    使相邻两个保留点之间始终满足阈值。
+    例外：批次中只剩最新点且它离 last_kept 太近时仍然保留（last_kept 已存储，不能移除）。
+
+    fixes: [{'latitude', 'longitude', 'timestamp', ...}]
+    last_kept: 已存储的最新位置（同结构，可为None），作为比较起点
+    """
+    fixes = sorted(fixes, key=lambda f: f['timestamp'])
+    if not fixes:
+        return []
+    kept = []
+    anchor = last_kept
+    for fix in fixes[:-1]:
+        if anchor is None or not _too_near(anchor, fix, distance_epsilon_m, time_epsilon_s):
+            kept.append(fix)
+            anchor = fix
+    latest = fixes[-1]
+    while kept and _too_near(kept[-1], latest, distance_epsilon_m, time_epsilon_s):
+        kept.pop()
+    kept.append(latest)
+    return kept
@@ -0,0 +1,32 @@
+from django.core.management.base import BaseCommand, CommandError
+from api import sharding
+from api.models import LOCATION_COLUMNS, User, UserLocation
+
+
+class Command(BaseCommand):
+    help = 'Check that denormalized location columns on users match the latest user_locations rows'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--fix', action='store_true', help='Rewrite mismatched columns from user_locations')
+
+    def handle(self, *args, **options):
+        mismatched = []
+        users = User.objects.only('account_id', 'shard', *LOCATION_COLUMNS).order_by('account_id')
+        for user in users.iterator():
+            latest = list(UserLocation.objects.using(sharding.user_db(user)).filter(user=user).order_by('-timestamp')[:2]) + [None, None]
+            expected = User.location_columns(latest[0], latest[1])
+            actual = {name: getattr(user, name) for name in LOCATION_COLUMNS}
+            if actual != expected:
+                mismatched.append((user, expected))
+                self.stdout.write(f'Mismatch: {user.account_id}')
+
+        if not mismatched:
+            self.stdout.write(self.style.SUCCESS('All user location columns are consistent'))
+            return
+
+        if not options['fix']:
+            raise CommandError(f'{len(mismatched)} user(s) have stale location columns; rerun with --fix to repair')
+
+        for user, expected in mismatched:
+            User.objects.filter(pk=user.pk).update(**expected)
+        self.stdout.write(self.style.SUCCESS(f'Repaired {len(mismatched)} user(s)'))
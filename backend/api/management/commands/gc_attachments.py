@@ -0,0 +1,27 @@
+from django.core.management.base import BaseCommand
+from api.garbage import collect_garbage
+
+
+class Command(BaseCommand):
+    help = (
+        'Delete attachments not linked to any event, files under MEDIA_ROOT without a record, '
+        'and drain the file deletion queue (run periodically, e.g. from cron)'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--grace-hours', type=float, default=None,
+                            help='Only collect uploads/files older than this (default: ATTACHMENT_ORPHAN_GRACE_HOURS)')
+        parser.add_argument('--dry-run', action='store_true', help='Report what would be collected without deleting')
+
+    def handle(self, *args, **options):
+        stats = collect_garbage(grace_hours=options['grace_hours'], dry_run=options['dry_run'])
+        prefix = '[dry run] ' if options['dry_run'] else ''
+        self.stdout.write(
+            f"{prefix}orphan uploads: {stats['orphan_uploads']}, blob refcounts fixed: {stats['refs_fixed']}, "
+            f"blobs removed: {stats['blobs_removed']}, stray files: {stats['stray_files']}"
+        )
+        style = self.style.WARNING if stats['files_failed'] else self.style.SUCCESS
+        self.stdout.write(style(
+            f"{prefix}deleted {stats['files_deleted']} file(s), {stats['files_failed']} failed, "
+            f"{stats['queued']} left in queue"
+        ))
@@ -0,0 +1,25 @@
+from django.core.management.base import BaseCommand
+from api.models import FileBlob
+from api.previews import generate_preview
+
+
+class Command(BaseCommand):
+    help = 'Generate previews for attachments that are still pending (e.g. uploaded before a restart)'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--retry-failed', action='store_true', help='Also retry blobs whose preview failed')
+
+    def handle(self, *args, **options):
+        if options['retry_failed']:
+            FileBlob.objects.filter(preview_status=FileBlob.PREVIEW_FAILED).update(preview_status=FileBlob.PREVIEW_PENDING)
+
+        pending = list(FileBlob.objects.filter(preview_status=FileBlob.PREVIEW_PENDING).values_list('sha256', flat=True))
+        for sha256 in pending:
+            generate_preview(sha256)
+
+        counts = {
+            status: FileBlob.objects.filter(sha256__in=pending, preview_status=status).count()
+            for status, _ in FileBlob.PREVIEW_STATUS_CHOICES
+        }
+        summary = ', '.join(f'{status}: {count}' for status, count in counts.items() if count)
+        self.stdout.write(self.style.SUCCESS(f'Processed {len(pending)} blob(s){" (" + summary + ")" if summary else ""}'))
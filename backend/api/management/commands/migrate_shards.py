@@ -0,0 +1,14 @@
+from django.core.management.base import BaseCommand, CommandError
+from django.conf import settings
+from api import sharding
+
+
+class Command(BaseCommand):
+    help = 'Create and migrate every shard database (new shards are otherwise created on the first login routed to them)'
+
+    def handle(self, *args, **options):
+        if not sharding.enabled():
+            raise CommandError('Sharding is disabled (set JARVIS_SHARDS)')
+        for index in range(settings.SHARD_COUNT):
+            sharding.ensure_shard(sharding.shard_alias(index))
+        self.stdout.write(self.style.SUCCESS(f'Migrated {settings.SHARD_COUNT} shard(s) in {settings.SHARD_DIR}'))
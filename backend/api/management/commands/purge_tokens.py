@@ -0,0 +1,13 @@
+from django.core.management.base import BaseCommand
+from api.authentication import purge_tokens
+
+
+class Command(BaseCommand):
+    help = 'Delete expired and logged-out access tokens in batches (run periodically, e.g. from cron)'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=None, help='Rows per DELETE statement')
+
+    def handle(self, *args, **options):
+        count = purge_tokens(batch_size=options['batch_size'])
+        self.stdout.write(self.style.SUCCESS(f'Purged {count} expired access token / revocation row(s)'))
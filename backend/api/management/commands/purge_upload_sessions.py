@@ -0,0 +1,10 @@
+from django.core.management.base import BaseCommand
+from api.attachments import purge_expired_sessions
+
+
+class Command(BaseCommand):
+    help = 'Delete expired resumable upload sessions and their partial files (run periodically, e.g. from cron)'
+
+    def handle(self, *args, **options):
+        count = purge_expired_sessions()
+        self.stdout.write(self.style.SUCCESS(f'Purged {count} expired upload session(s)'))
@@ -0,0 +1,45 @@
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from api import sharding, signed_tokens
+from api.models import User
+
+
+class Command(BaseCommand):
+    help = (
+        'Move each user\'s data to the shard given by the current JARVIS_SHARDS hash (users still in the '
+        'primary database included), then merge rows left behind in old shards; run at low traffic. '
+        'Signed access tokens of moved users are revoked'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--dry-run', action='store_true', help='Only report the users that would move')
+
+    def handle(self, *args, **options):
+        if not sharding.enabled():
+            raise CommandError('Sharding is disabled (set JARVIS_SHARDS)')
+        for index in range(settings.SHARD_COUNT):
+            sharding.ensure_shard(sharding.shard_alias(index))
+
+        moved = rows = 0
+        users = User.objects.only('pk', 'account_id', 'shard').order_by('account_id')
+        for user in users.iterator():
+            target = sharding.shard_alias(sharding.shard_for(user.account_id))
+            source = sharding.user_db(user)
+            if source == target:
+                continue
+            self.stdout.write(f'{user.account_id}: {source} -> {target}')
+            if not options['dry_run']:
+                rows += sharding.move_user(user, target)
+                # 签名 token 中记录的分片已失效，该用户需重新登录
+                signed_tokens.revoke_user_tokens(user.pk)
+            moved += 1
+
+        swept = 0
+        if not options['dry_run']:
+            for alias in sharding.data_databases():
+                swept += sharding.sweep(alias)
+
+        verb = 'Would move' if options['dry_run'] else 'Moved'
+        self.stdout.write(self.style.SUCCESS(
+            f'{verb} {moved} user(s) ({rows} row(s)); merged stray rows of {swept} user(s)'
+        ))
@@ -0,0 +1,19 @@
+from django.core.management.base import BaseCommand
+from api import search, sharding
+
+
+class Command(BaseCommand):
+    help = (
+        'Reinstall the event full-text search table and triggers and rebuild the index from existing events '
+        '(run after migrations that rebuild the events or event_links tables)'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--database', default=None,
+                            help='Only rebuild this database alias (default: the main database and all shards)')
+
+    def handle(self, *args, **options):
+        aliases = [options['database']] if options['database'] else sharding.data_databases()
+        for alias in aliases:
+            count = search.rebuild(alias)
+            self.stdout.write(self.style.SUCCESS(f'{alias}: indexed {count} event(s)'))
@@ -1,6 +1,7 @@
 from django.core.management.base import BaseCommand
 from django.utils import timezone
 from datetime import timedelta, date
+from api import sharding
 from api.models import User, CalendarType, Event, EventLink
 
 
@@ -9,11 +10,14 @@ class Command(BaseCommand):
 
     def handle(self, *args, **options):
         # Get or create demo user
+        shard, alias = sharding.assign_shard('jarvis@cuhk.com')
+        sharding.ensure_shard(alias)
         user, created = User.objects.get_or_create(
             account_id='jarvis@cuhk.com',
             defaults={
                 'home_address': '123 Main Street, Sha Tin',
-                'school_address': 'CUHK, Sha Tin, Hong Kong'
+                'school_address': 'CUHK, Sha Tin, Hong Kong',
+                'shard': shard
             }
         )
         
@@ -24,6 +28,10 @@ class Command(BaseCommand):
         
         self.stdout.write(f'User: {user.account_id}')
         
+        with sharding.use_user_db(user):
+            self.seed(user)
+
+    def seed(self, user):
         # Delete existing calendar types and events for this user
         CalendarType.objects.filter(user=user).delete()
         Event.objects.filter(user=user).delete()
@@ -0,0 +1,31 @@
+import time
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from api.replicas import sync_replicas
+
+
+class Command(BaseCommand):
+    help = (
+        'Copy the primary database into the file-based read replicas (JARVIS_DB_REPLICAS), '
+        'stamping the replication heartbeat first; with --interval keeps running'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--interval', type=float, default=0, help='Repeat every N seconds (0 = run once)')
+        parser.add_argument('--heartbeat-only', action='store_true',
+                            help='Only write the heartbeat (replicas maintained by an external replication tool)')
+
+    def handle(self, *args, **options):
+        if not settings.DATABASE_REPLICAS and not options['heartbeat_only']:
+            raise CommandError('No replicas configured (set JARVIS_DB_REPLICAS)')
+        while True:
+            started = time.monotonic()
+            synced = sync_replicas(heartbeat_only=options['heartbeat_only'])
+            elapsed = (time.monotonic() - started) * 1000
+            self.stdout.write(self.style.SUCCESS(
+                f'Heartbeat written, {len(synced)} replica(s) synced in {elapsed:.0f} ms'
+            ))
+            if options['interval'] <= 0:
+                break
+            time.sleep(max(0.0, options['interval'] - elapsed / 1000))
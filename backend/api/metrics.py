@@ -0,0 +1,256 @@
+"""
+请求指标：按视图统计延迟、状态码、响应大小与 ORM 查询，慢请求记录 SQL，
+由 /api/v1/_metrics 以 Prometheus 文本格式输出（见 views.metrics_export）
+
+- 每个请求都记录延迟直方图、状态码计数与响应大小（内存中的计数器，开销为微秒级）
+- 按 METRICS_SAMPLE_RATE 抽样的请求额外记录查询数与查询耗时：每个数据库连接创建时挂上 execute_wrapper，
+  通过 contextvar 找到当前请求的记录器，未抽样的请求每条查询只多一次 contextvar 读取。
+  contextvar 会随 sync_to_async 传到线程中，异步视图的查询同样计入
+- 超过 METRICS_SLOW_REQUEST_MS 的请求写一条 WARNING 日志（api.metrics）；抽样到的请求附带按语句
+  合并的 SQL（次数与耗时，便于发现 N+1），未抽样的只有延迟
+- 流式响应（StreamingHttpResponse）只计到视图返回为止，不计响应大小
+
+指标保存在进程内存中，多进程部署时每个进程各自输出（Prometheus 按实例抓取后聚合）。
+"""
+import contextvars
+import logging
+import random
+import threading
+import time
+from bisect import bisect_left
+
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction
+from django.conf import settings
+from django.core.exceptions import MiddlewareNotUsed
+
+logger = logging.getLogger(__name__)
+
+# 直方图的桶（上界，含）
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+SIZE_BUCKETS = (256, 1024, 4096, 16384, 65536, 262144, 1048576, 4194304)
+QUERY_BUCKETS = (0, 1, 2, 3, 5, 10, 20, 50, 100, 200)
+
+# 当前请求的查询记录器（抽样到的请求才有）
+_recorder = contextvars.ContextVar('metrics_recorder', default=None)
+
+
+# ==================== 记录 ====================
+
+class QueryRecorder:
+    """一个请求内的查询：次数、总耗时与按 SQL 文本合并的明细"""
+
+    def __init__(self):
+        self.count = 0
+        self.seconds = 0.0
+        self.statements = {}  # sql -> [次数, 耗时]
+
+    def add(self, sql, seconds):
+        self.count += 1
+        self.seconds += seconds
+        entry = self.statements.get(sql)
+        if entry is None:
+            if len(self.statements) >= settings.METRICS_SLOW_SQL_LIMIT:
+                return
+            entry = self.statements[sql] = [0, 0.0]
+        entry[0] += 1
+        entry[1] += seconds
+
+
+def record_query(execute, sql, params, many, context):
+    """数据库连接的 execute_wrapper：抽样到的请求中记录每条查询的耗时"""
+    recorder = _recorder.get()
+    if recorder is None:
+        return execute(sql, params, many, context)
+    started = time.perf_counter()
+    try:
+        return execute(sql, params, many, context)
+    finally:
+        recorder.add(sql, time.perf_counter() - started)
+
+
+def instrument_connection(sender, connection, **kwargs):
+    """connection_created 信号：给新连接挂上 record_query"""
+    if record_query not in connection.execute_wrappers:
+        connection.execute_wrappers.append(record_query)
+
+
+class Histogram:
+    def __init__(self, buckets):
+        self.buckets = buckets
+        self.counts = [0] * (len(buckets) + 1)  # 最后一个是 +Inf
+        self.sum = 0.0
+
+    def observe(self, value):
+        self.counts[bisect_left(self.buckets, value)] += 1
+        self.sum += value
+
+
+class Registry:
+    """进程内的全部指标；键为 (view, method)"""
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.latency = {}
+        self.size = {}
+        self.queries = {}
+        self.query_seconds = {}
+        self.status = {}  # (view, method, status) -> 次数
+
+    def observe(self, view, method, status, seconds, size, recorder):
+        key = (view, method)
+        with self.lock:
+            histogram = self.latency.get(key)
+            if histogram is None:
+                histogram = self.latency[key] = Histogram(LATENCY_BUCKETS)
+            histogram.observe(seconds)
+            status_key = (view, method, status)
+            self.status[status_key] = self.status.get(status_key, 0) + 1
+            if size is not None:
+                histogram = self.size.get(key)
+                if histogram is None:
+                    histogram = self.size[key] = Histogram(SIZE_BUCKETS)
+                histogram.observe(size)
+            if recorder is not None:
+                histogram = self.queries.get(key)
+                if histogram is None:
+                    histogram = self.queries[key] = Histogram(QUERY_BUCKETS)
+                histogram.observe(recorder.count)
+                self.query_seconds[key] = self.query_seconds.get(key, 0.0) + recorder.seconds
+
+    def reset(self):
+        with self.lock:
+            for values in (self.latency, self.size, self.queries, self.query_seconds, self.status):
+                values.clear()
+
+
+registry = Registry()
+
+
+# ==================== 中间件 ====================
+
+def view_name(request):
+    match = getattr(request, 'resolver_match', None)
+    if match is None:
+        return 'unmatched'
+    return match.view_name or match._func_path
+
+
+def response_size(response):
+    if getattr(response, 'streaming', False):
+        return None
+    return len(response.content)
+
+
+class RequestMetricsMiddleware:
+    """记录每个请求的指标（放在 MIDDLEWARE 最前面，计入其他中间件的耗时）"""
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        if not settings.METRICS_ENABLED:
+            raise MiddlewareNotUsed()
+        self.get_response = get_response
+        self.is_async = iscoroutinefunction(get_response)
+        if self.is_async:
+            markcoroutinefunction(self)
+
+    def __call__(self, request):
+        if self.is_async:
+            return self.__acall__(request)
+        recorder = QueryRecorder() if random.random() < settings.METRICS_SAMPLE_RATE else None
+        token = _recorder.set(recorder)
+        started = time.perf_counter()
+        try:
+            response = self.get_response(request)
+        finally:
+            _recorder.reset(token)
+        self._finish(request, response, time.perf_counter() - started, recorder)
+        return response
+
+    async def __acall__(self, request):
+        recorder = QueryRecorder() if random.random() < settings.METRICS_SAMPLE_RATE else None
+        token = _recorder.set(recorder)
+        started = time.perf_counter()
+        try:
+            response = await self.get_response(request)
+        finally:
+            _recorder.reset(token)
+        self._finish(request, response, time.perf_counter() - started, recorder)
+        return response
+
+    @staticmethod
+    def _finish(request, response, seconds, recorder):
+        view = view_name(request)
+        registry.observe(view, request.method, response.status_code, seconds, response_size(response), recorder)
+        if seconds * 1000 >= settings.METRICS_SLOW_REQUEST_MS:
+            log_slow_request(request, view, response.status_code, seconds, recorder)
+
+
+def log_slow_request(request, view, status, seconds, recorder):
+    summary = f'Slow request {request.method} {request.path} ({view}) {status} {seconds * 1000:.1f} ms'
+    if recorder is None:
+        logger.warning('%s, queries not sampled', summary)
+        return
+    lines = [f'{summary}, {recorder.count} queries {recorder.seconds * 1000:.1f} ms']
+    statements = sorted(recorder.statements.items(), key=lambda item: item[1][1], reverse=True)
+    for sql, (count, total) in statements:
+        lines.append(f'  {total * 1000:8.1f} ms x{count:<4} {sql[:settings.METRICS_SLOW_SQL_CHARS]}')
+    logger.warning('\n'.join(lines))
+
+
+# ==================== Prometheus 文本格式 ====================
+
+def _label(value):
+    return str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+
+def _labels(view, method, **extra):
+    pairs = [('view', view), ('method', method), *extra.items()]
+    return ','.join(f'{name}="{_label(value)}"' for name, value in pairs)
+
+
+def _bound(value):
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+
+def _histogram_lines(name, histograms):
+    lines = []
+    for (view, method), histogram in sorted(histograms.items()):
+        cumulative = 0
+        for bound, count in zip((*histogram.buckets, '+Inf'), histogram.counts):
+            cumulative += count
+            le = bound if bound == '+Inf' else _bound(bound)
+            lines.append(f'{name}_bucket{{{_labels(view, method, le=le)}}} {cumulative}')
+        lines.append(f'{name}_sum{{{_labels(view, method)}}} {histogram.sum!r}')
+        lines.append(f'{name}_count{{{_labels(view, method)}}} {cumulative}')
+    return lines
+
+
+def render():
+    """全部指标的 Prometheus 文本（exposition format 0.0.4）"""
+    with registry.lock:
+        sections = [
+            ('jarvis_metrics_sample_rate', 'gauge', 'Fraction of requests whose ORM queries are recorded',
+             [f'jarvis_metrics_sample_rate {float(settings.METRICS_SAMPLE_RATE)!r}']),
+            ('jarvis_http_request_duration_seconds', 'histogram',
+             'Request latency until the view returns, by view and method', _histogram_lines(
+                 'jarvis_http_request_duration_seconds', registry.latency)),
+            ('jarvis_http_requests_total', 'counter', 'Requests by view, method and status', [
+                f'jarvis_http_requests_total{{{_labels(view, method, status=status)}}} {count}'
+                for (view, method, status), count in sorted(registry.status.items())
+            ]),
+            ('jarvis_http_response_size_bytes', 'histogram', 'Response body size (streaming responses excluded)',
+             _histogram_lines('jarvis_http_response_size_bytes', registry.size)),
+            ('jarvis_db_queries_per_request', 'histogram', 'ORM queries per sampled request',
+             _histogram_lines('jarvis_db_queries_per_request', registry.queries)),
+            ('jarvis_db_query_seconds_total', 'counter', 'Time spent in ORM queries by sampled requests', [
+                f'jarvis_db_query_seconds_total{{{_labels(view, method)}}} {seconds!r}'
+                for (view, method), seconds in sorted(registry.query_seconds.items())
+            ]),
+        ]
+    lines = []
+    for name, kind, help_text, samples in sections:
+        lines.append(f'# HELP {name} {help_text}')
+        lines.append(f'# TYPE {name} {kind}')
+        lines.extend(samples)
+    return '\n'.join(lines) + '\n'
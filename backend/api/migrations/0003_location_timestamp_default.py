@@ -0,0 +1,19 @@
+# Generated by Django 5.2.18 on 2026-10-19 15:22
+
+import django.utils.timezone
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("api", "0002_remove_description_field"),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name="userlocation",
+            name="timestamp",
+            field=models.DateTimeField(default=django.utils.timezone.now),
+        ),
+    ]
@@ -0,0 +1,78 @@
+# Generated by Django 5.2.18 on 2026-10-19 15:24
+
+from django.db import migrations, models
+
+
+def backfill_location_columns(apps, schema_editor):
+    """用每个用户最新的两条 user_locations 记录填充冗余列"""
+    User = apps.get_model("api", "User")
+    UserLocation = apps.get_model("api", "UserLocation")
+    users = []
+    for user in User.objects.filter(locations__isnull=False).distinct().iterator():
+        latest = list(UserLocation.objects.filter(user=user).order_by("-timestamp")[:2]) + [None, None]
+        for prefix, fix in (("current", latest[0]), ("previous", latest[1])):
+            setattr(user, f"{prefix}_latitude", fix.latitude if fix else None)
+            setattr(user, f"{prefix}_longitude", fix.longitude if fix else None)
+            setattr(user, f"{prefix}_accuracy", fix.accuracy if fix else None)
+            setattr(user, f"{prefix}_location_at", fix.timestamp if fix else None)
+        users.append(user)
+    User.objects.bulk_update(
+        users,
+        [
+            f"{prefix}_{name}"
+            for prefix in ("current", "previous")
+            for name in ("latitude", "longitude", "accuracy", "location_at")
+        ],
+        batch_size=500,
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("api", "0003_location_timestamp_default"),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name="user",
+            name="current_accuracy",
+            field=models.FloatField(blank=True, null=True),
+        ),
+        migrations.AddField(
+            model_name="user",
+            name="current_latitude",
+            field=models.FloatField(blank=True, null=True),
+        ),
+        migrations.AddField(
+            model_name="user",
+            name="current_location_at",
+            field=models.DateTimeField(blank=True, null=True),
+        ),
+        migrations.AddField(
+            model_name="user",
+            name="current_longitude",
+            field=models.FloatField(blank=True, null=True),
+        ),
+        migrations.AddField(
+            model_name="user",
+            name="previous_accuracy",
+            field=models.FloatField(blank=True, null=True),
+        ),
+        migrations.AddField(
+            model_name="user",
+            name="previous_latitude",
+            field=models.FloatField(blank=True, null=True),
+        ),
+        migrations.AddField(
+            model_name="user",
+            name="previous_location_at",
+            field=models.DateTimeField(blank=True, null=True),
+        ),
+        migrations.AddField(
+            model_name="user",
+            name="previous_longitude",
+            field=models.FloatField(blank=True, null=True),
+        ),
+        migrations.RunPython(backfill_location_columns, migrations.RunPython.noop),
+    ]
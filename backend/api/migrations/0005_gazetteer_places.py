@@ -0,0 +1,97 @@
+# Generated by Django 5.2.18 on 2026-10-19 15:26
+
+import uuid
+from django.db import migrations, models
+
+# 香港常用地名（名称/别名, 纬度, 经度, 覆盖半径米）
+PLACES = [
+    ("Hong Kong", 22.3027, 114.1772, 30000),
+    ("香港", 22.3027, 114.1772, 30000),
+    ("Kowloon", 22.3180, 114.1800, 8000),
+    ("九龙", 22.3180, 114.1800, 8000),
+    ("Sha Tin", 22.3817, 114.1880, 4000),
+    ("Shatin", 22.3817, 114.1880, 4000),
+    ("沙田", 22.3817, 114.1880, 4000),
+    ("Tai Po", 22.4501, 114.1688, 4000),
+    ("大埔", 22.4501, 114.1688, 4000),
+    ("Sai Kung", 22.3815, 114.2700, 5000),
+    ("西贡", 22.3815, 114.2700, 5000),
+    ("Ma On Shan", 22.4246, 114.2323, 3000),
+    ("马鞍山", 22.4246, 114.2323, 3000),
+    ("Tsuen Wan", 22.3710, 114.1140, 3000),
+    ("荃湾", 22.3710, 114.1140, 3000),
+    ("Hong Kong International Airport", 22.3080, 113.9185, 2500),
+    ("机场", 22.3080, 113.9185, 2500),
+    ("Tai Wai", 22.3728, 114.1786, 1500),
+    ("大围", 22.3728, 114.1786, 1500),
+    ("Kowloon Tong", 22.3370, 114.1760, 1500),
+    ("九龙塘", 22.3370, 114.1760, 1500),
+    ("Fo Tan", 22.3960, 114.1980, 1200),
+    ("火炭", 22.3960, 114.1980, 1200),
+    ("Mong Kok", 22.3193, 114.1694, 1200),
+    ("旺角", 22.3193, 114.1694, 1200),
+    ("Tsim Sha Tsui", 22.2988, 114.1722, 1200),
+    ("尖沙咀", 22.2988, 114.1722, 1200),
+    ("Central", 22.2820, 114.1588, 1200),
+    ("中环", 22.2820, 114.1588, 1200),
+    ("Causeway Bay", 22.2800, 114.1850, 1000),
+    ("铜锣湾", 22.2800, 114.1850, 1000),
+    ("Admiralty", 22.2790, 114.1650, 800),
+    ("金钟", 22.2790, 114.1650, 800),
+    ("CUHK", 22.4196, 114.2068, 800),
+    ("Chinese University of Hong Kong", 22.4196, 114.2068, 800),
+    ("香港中文大学", 22.4196, 114.2068, 800),
+    ("香港中文大學", 22.4196, 114.2068, 800),
+    ("HKU", 22.2830, 114.1371, 800),
+    ("University of Hong Kong", 22.2830, 114.1371, 800),
+    ("香港大学", 22.2830, 114.1371, 800),
+    ("HKUST", 22.3364, 114.2654, 800),
+    ("Hong Kong University of Science and Technology", 22.3364, 114.2654, 800),
+    ("香港科技大学", 22.3364, 114.2654, 800),
+    ("PolyU", 22.3045, 114.1800, 600),
+    ("香港理工大学", 22.3045, 114.1800, 600),
+    ("CityU", 22.3375, 114.1720, 600),
+    ("香港城市大学", 22.3375, 114.1720, 600),
+    ("University Station", 22.4133, 114.2100, 300),
+    ("大学站", 22.4133, 114.2100, 300),
+]
+
+
+def seed_places(apps, schema_editor):
+    GazetteerPlace = apps.get_model("api", "GazetteerPlace")
+    GazetteerPlace.objects.bulk_create(
+        [
+            GazetteerPlace(name=name, latitude=lat, longitude=lng, radius_m=radius)
+            for name, lat, lng, radius in PLACES
+        ],
+        ignore_conflicts=True,
+    )
+
+
+def remove_places(apps, schema_editor):
+    GazetteerPlace = apps.get_model("api", "GazetteerPlace")
+    GazetteerPlace.objects.filter(name__in=[p[0] for p in PLACES]).delete()
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("api", "0004_user_location_columns"),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name="GazetteerPlace",
+            fields=[
+                ("id", models.UUIDField(default=uuid.uuid4, editable=False, primary_key=True, serialize=False)),
+                ("name", models.CharField(max_length=255, unique=True)),
+                ("latitude", models.FloatField()),
+                ("longitude", models.FloatField()),
+                ("radius_m", models.FloatField(default=1000)),
+            ],
+            options={
+                "db_table": "gazetteer_places",
+            },
+        ),
+        migrations.RunPython(seed_places, remove_places),
+    ]
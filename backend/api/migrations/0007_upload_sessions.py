@@ -0,0 +1,31 @@
+# Generated by Django 5.2.18 on 2026-10-19 15:31
+
+import django.db.models.deletion
+import uuid
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("api", "0006_file_blobs"),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name="UploadSession",
+            fields=[
+                ("id", models.UUIDField(default=uuid.uuid4, editable=False, primary_key=True, serialize=False)),
+                ("original_name", models.CharField(max_length=255)),
+                ("mime_type", models.CharField(max_length=100)),
+                ("size", models.BigIntegerField()),
+                ("received", models.BigIntegerField(default=0)),
+                ("created_at", models.DateTimeField(auto_now_add=True)),
+                ("expires_at", models.DateTimeField(db_index=True)),
+                ("user", models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name="upload_sessions", to="api.user")),
+            ],
+            options={
+                "db_table": "upload_sessions",
+            },
+        ),
+    ]
@@ -0,0 +1,23 @@
+# Generated by Django 5.2.18 on 2026-10-19 15:35
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("api", "0007_upload_sessions"),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name="fileblob",
+            name="preview",
+            field=models.FileField(blank=True, upload_to="attachments/"),
+        ),
+        migrations.AddField(
+            model_name="fileblob",
+            name="preview_status",
+            field=models.CharField(choices=[("pending", "Pending"), ("ready", "Ready"), ("unsupported", "Unsupported"), ("failed", "Failed")], default="pending", max_length=20),
+        ),
+    ]
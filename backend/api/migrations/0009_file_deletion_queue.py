@@ -0,0 +1,28 @@
+# Generated by Django 5.2.18 on 2026-10-19 15:38
+
+import uuid
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("api", "0008_blob_previews"),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name="FileDeletion",
+            fields=[
+                ("id", models.UUIDField(default=uuid.uuid4, editable=False, primary_key=True, serialize=False)),
+                ("name", models.CharField(max_length=255)),
+                ("attempts", models.PositiveIntegerField(default=0)),
+                ("last_error", models.CharField(blank=True, max_length=255)),
+                ("created_at", models.DateTimeField(auto_now_add=True)),
+            ],
+            options={
+                "db_table": "file_deletions",
+                "ordering": ["created_at"],
+            },
+        ),
+    ]
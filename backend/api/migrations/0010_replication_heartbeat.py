@@ -0,0 +1,23 @@
+# Generated by Django 5.2.18 on 2026-10-19 15:45
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("api", "0009_file_deletion_queue"),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name="ReplicationHeartbeat",
+            fields=[
+                ("id", models.PositiveSmallIntegerField(default=1, primary_key=True, serialize=False)),
+                ("updated_at", models.DateTimeField()),
+            ],
+            options={
+                "db_table": "replication_heartbeat",
+            },
+        ),
+    ]
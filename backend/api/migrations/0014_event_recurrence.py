@@ -0,0 +1,52 @@
+# Generated by Django 5.2.18 on 2026-10-19 16:08
+
+import django.db.models.deletion
+import uuid
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("api", "0013_revoked_tokens"),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name="EventOccurrence",
+            fields=[
+                ("id", models.UUIDField(default=uuid.uuid4, editable=False, primary_key=True, serialize=False)),
+                ("date", models.DateField()),
+                ("cancelled", models.BooleanField(default=False)),
+                ("completed", models.BooleanField(default=False)),
+                ("completed_at", models.DateTimeField(blank=True, null=True)),
+                ("updated_at", models.DateTimeField(auto_now=True)),
+            ],
+            options={
+                "db_table": "event_occurrences",
+            },
+        ),
+        migrations.AddField(
+            model_name="event",
+            name="recurrence",
+            field=models.CharField(blank=True, default="", max_length=255),
+        ),
+        migrations.AddField(
+            model_name="event",
+            name="recurrence_end",
+            field=models.DateField(blank=True, null=True),
+        ),
+        migrations.AddIndex(
+            model_name="event",
+            index=models.Index(fields=["user", "date"], name="events_user_date"),
+        ),
+        migrations.AddField(
+            model_name="eventoccurrence",
+            name="event",
+            field=models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name="occurrences", to="api.event"),
+        ),
+        migrations.AddConstraint(
+            model_name="eventoccurrence",
+            constraint=models.UniqueConstraint(fields=("event", "date"), name="event_occurrences_event_date"),
+        ),
+    ]
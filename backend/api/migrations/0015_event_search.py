@@ -0,0 +1,50 @@
+# 事件全文搜索：FTS5 索引表与维护它的触发器
+# SQL 按本迁移创建时的内容写死，之后修改 api/search.py 不影响本迁移；触发器缺失时由 post_migrate 重新安装（见 search.py）
+
+from django.db import migrations
+
+SYNC_LINKS = (
+    "UPDATE event_search SET links = "
+    "(SELECT coalesce(group_concat(url, ' '), '') FROM event_links WHERE event_id = {ref}.event_id) "
+    "WHERE rowid = (SELECT rowid FROM events WHERE id = {ref}.event_id);"
+)
+
+FORWARD = [
+    "CREATE VIRTUAL TABLE IF NOT EXISTS event_search USING fts5(title, location, links, tokenize = 'trigram')",
+    "CREATE TRIGGER IF NOT EXISTS event_search_insert AFTER INSERT ON events BEGIN "
+    "INSERT INTO event_search (rowid, title, location, links) VALUES (new.rowid, new.title, new.location, ''); END",
+    "CREATE TRIGGER IF NOT EXISTS event_search_update AFTER UPDATE OF title, location ON events BEGIN "
+    "UPDATE event_search SET title = new.title, location = new.location WHERE rowid = new.rowid; END",
+    "CREATE TRIGGER IF NOT EXISTS event_search_delete AFTER DELETE ON events BEGIN "
+    "DELETE FROM event_search WHERE rowid = old.rowid; END",
+    "CREATE TRIGGER IF NOT EXISTS event_search_link_insert AFTER INSERT ON event_links BEGIN "
+    + SYNC_LINKS.format(ref="new") + " END",
+    "CREATE TRIGGER IF NOT EXISTS event_search_link_update AFTER UPDATE ON event_links BEGIN "
+    + SYNC_LINKS.format(ref="old") + " " + SYNC_LINKS.format(ref="new") + " END",
+    "CREATE TRIGGER IF NOT EXISTS event_search_link_delete AFTER DELETE ON event_links BEGIN "
+    + SYNC_LINKS.format(ref="old") + " END",
+    "INSERT INTO event_search (rowid, title, location, links) "
+    "SELECT rowid, title, location, "
+    "(SELECT coalesce(group_concat(url, ' '), '') FROM event_links WHERE event_id = events.id) FROM events",
+]
+
+BACKWARD = [
+    "DROP TRIGGER IF EXISTS event_search_link_delete",
+    "DROP TRIGGER IF EXISTS event_search_link_update",
+    "DROP TRIGGER IF EXISTS event_search_link_insert",
+    "DROP TRIGGER IF EXISTS event_search_delete",
+    "DROP TRIGGER IF EXISTS event_search_update",
+    "DROP TRIGGER IF EXISTS event_search_insert",
+    "DROP TABLE IF EXISTS event_search",
+]
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("api", "0014_event_recurrence"),
+    ]
+
+    operations = [
+        migrations.RunSQL(FORWARD, BACKWARD),
+    ]
@@ -0,0 +1,63 @@
+# 全文索引按 event_id 关联事件：events 没有 INTEGER PRIMARY KEY，VACUUM 或表重建后 rowid 可能变化
+# SQL 按本迁移创建时的内容写死（回滚时恢复迁移 0015 的结构）
+
+from importlib import import_module
+
+from django.db import migrations
+
+event_search_0015 = import_module("api.migrations.0015_event_search")
+
+ROW = "(SELECT row FROM event_search_rows WHERE event_id = {id})"
+LINKS = "(SELECT coalesce(group_concat(url, ' '), '') FROM event_links WHERE event_id = {id})"
+SYNC_LINKS = (
+    "UPDATE event_search SET links = " + LINKS.format(id="{ref}.event_id")
+    + " WHERE rowid = " + ROW.format(id="{ref}.event_id") + ";"
+)
+
+FORWARD = event_search_0015.BACKWARD + [
+    "CREATE VIRTUAL TABLE IF NOT EXISTS event_search USING fts5("
+    "event_id UNINDEXED, title, location, links, tokenize = 'trigram')",
+    "CREATE TABLE IF NOT EXISTS event_search_rows (event_id char(32) NOT NULL PRIMARY KEY, row integer NOT NULL) "
+    "WITHOUT ROWID",
+    "CREATE UNIQUE INDEX IF NOT EXISTS event_search_rows_row ON event_search_rows (row)",
+    "CREATE TRIGGER IF NOT EXISTS event_search_insert AFTER INSERT ON events BEGIN "
+    "INSERT INTO event_search (event_id, title, location, links) VALUES (new.id, new.title, new.location, ''); "
+    "INSERT INTO event_search_rows (event_id, row) VALUES (new.id, last_insert_rowid()); END",
+    "CREATE TRIGGER IF NOT EXISTS event_search_update AFTER UPDATE OF title, location ON events BEGIN "
+    "UPDATE event_search SET title = new.title, location = new.location "
+    "WHERE rowid = " + ROW.format(id="new.id") + "; END",
+    "CREATE TRIGGER IF NOT EXISTS event_search_delete AFTER DELETE ON events BEGIN "
+    "DELETE FROM event_search WHERE rowid = " + ROW.format(id="old.id") + "; "
+    "DELETE FROM event_search_rows WHERE event_id = old.id; END",
+    "CREATE TRIGGER IF NOT EXISTS event_search_link_insert AFTER INSERT ON event_links BEGIN "
+    + SYNC_LINKS.format(ref="new") + " END",
+    "CREATE TRIGGER IF NOT EXISTS event_search_link_update AFTER UPDATE ON event_links BEGIN "
+    + SYNC_LINKS.format(ref="old") + " " + SYNC_LINKS.format(ref="new") + " END",
+    "CREATE TRIGGER IF NOT EXISTS event_search_link_delete AFTER DELETE ON event_links BEGIN "
+    + SYNC_LINKS.format(ref="old") + " END",
+    "INSERT INTO event_search (event_id, title, location, links) "
+    "SELECT id, title, location, " + LINKS.format(id="events.id") + " FROM events",
+    "INSERT INTO event_search_rows (event_id, row) SELECT event_id, rowid FROM event_search",
+]
+
+BACKWARD = [
+    "DROP TRIGGER IF EXISTS event_search_link_delete",
+    "DROP TRIGGER IF EXISTS event_search_link_update",
+    "DROP TRIGGER IF EXISTS event_search_link_insert",
+    "DROP TRIGGER IF EXISTS event_search_delete",
+    "DROP TRIGGER IF EXISTS event_search_update",
+    "DROP TRIGGER IF EXISTS event_search_insert",
+    "DROP TABLE IF EXISTS event_search_rows",
+    "DROP TABLE IF EXISTS event_search",
+] + event_search_0015.FORWARD
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("api", "0015_event_search"),
+    ]
+
+    operations = [
+        migrations.RunSQL(FORWARD, BACKWARD),
+    ]
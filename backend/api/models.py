@@ -1,6 +1,18 @@
+from collections import namedtuple
 from django.db import models
+from django.utils import timezone
 import uuid
 
+from . import recurrence as recurrence_rules
+
+# 用户表上冗余存储的一次定位（与 UserLocation 的字段同名，可直接用于序列化）
+LocationFix = namedtuple('LocationFix', ['latitude', 'longitude', 'accuracy', 'timestamp'])
+
+LOCATION_COLUMNS = [
+    'current_latitude', 'current_longitude', 'current_accuracy', 'current_location_at',
+    'previous_latitude', 'previous_longitude', 'previous_accuracy', 'previous_location_at',
+]
+
 
 class User(models.Model):
     """用户模型 - 使用account_id作为唯一标识"""
@@ -8,6 +20,18 @@ class User(models.Model):
     account_id = models.CharField(max_length=255, unique=True, db_index=True)
     home_address = models.TextField(blank=True, default='')
     school_address = models.TextField(blank=True, default='')
+    # 最新两条位置的冗余副本，由位置写入路径与 user_locations 在同一事务中更新，
+    # 读取当前/上一位置时无需再查询 user_locations
+    current_latitude = models.FloatField(null=True, blank=True)
+    current_longitude = models.FloatField(null=True, blank=True)
+    current_accuracy = models.FloatField(null=True, blank=True)
+    current_location_at = models.DateTimeField(null=True, blank=True)
+    previous_latitude = models.FloatField(null=True, blank=True)
+    previous_longitude = models.FloatField(null=True, blank=True)
+    previous_accuracy = models.FloatField(null=True, blank=True)
+    previous_location_at = models.DateTimeField(null=True, blank=True)
+    # 用户数据所在的分片编号（见 api/sharding.py）；为空时数据在主库
+    shard = models.PositiveSmallIntegerField(null=True, blank=True)
     created_at = models.DateTimeField(auto_now_add=True)
     updated_at = models.DateTimeField(auto_now=True)
 
@@ -16,7 +40,39 @@ class User(models.Model):
 
     def __str__(self):
         return self.account_id
+
+    @property
+    def current_location(self):
+        """最新位置（LocationFix），没有记录时为None"""
+        if self.current_location_at is None:
+            return None
+        return LocationFix(self.current_latitude, self.current_longitude, self.current_accuracy, self.current_location_at)
+
+    @property
+    def previous_location(self):
+        """上一条位置（LocationFix），没有记录时为None"""
+        if self.previous_location_at is None:
+            return None
+        return LocationFix(self.previous_latitude, self.previous_longitude, self.previous_accuracy, self.previous_location_at)
+
+    @staticmethod
+    def location_columns(current, previous):
+        """由两条定位（UserLocation / LocationFix / None）得到冗余列的取值"""
+        values = {}
+        for prefix, fix in (('current', current), ('previous', previous)):
+            values[f'{prefix}_latitude'] = fix.latitude if fix else None
+            values[f'{prefix}_longitude'] = fix.longitude if fix else None
+            values[f'{prefix}_accuracy'] = fix.accuracy if fix else None
+            values[f'{prefix}_location_at'] = fix.timestamp if fix else None
+        return values
     
+    def refresh_from_db(self, using=None, fields=None, from_queryset=None):
+        # 访问延迟加载的字段时一次加载全部未加载的字段（签名 token 鉴权得到的用户只带 id 与 shard）
+        deferred = self.get_deferred_fields()
+        if fields is not None and deferred and set(fields) <= deferred:
+            fields = list(deferred)
+        super().refresh_from_db(using=using, fields=fields, from_queryset=from_queryset)
+
     # Django REST Framework 需要的属性
     @property
     def is_authenticated(self):
@@ -36,7 +92,8 @@ class UserLocation(models.Model):
     latitude = models.FloatField()
     longitude = models.FloatField()
     accuracy = models.FloatField(null=True, blank=True)
-    timestamp = models.DateTimeField(auto_now_add=True)
+    # 批量上报时使用客户端定位时间，单点上报默认为服务器当前时间
+    timestamp = models.DateTimeField(default=timezone.now)
 
     class Meta:
         db_table = 'user_locations'
@@ -46,22 +103,72 @@ class UserLocation(models.Model):
         return f"{self.user.account_id} @ {self.latitude}, {self.longitude}"
 
 
+class GazetteerPlace(models.Model):
+    """本地地名表，用于离线地理编码（见 api/commute.py）"""
+    id = models.UUIDField(primary_key=True, default=uuid.uuid4, editable=False)
+    name = models.CharField(max_length=255, unique=True)  # 地名或别名，如 'CUHK'、'沙田'
+    latitude = models.FloatField()
+    longitude = models.FloatField()
+    # 地名覆盖范围（米）；地址中出现多个地名时取范围最小、最具体的那个
+    radius_m = models.FloatField(default=1000)
+
+    class Meta:
+        db_table = 'gazetteer_places'
+
+    def __str__(self):
+        return self.name
+
+
+class ReplicationHeartbeat(models.Model):
+    """复制心跳（单行）：主库写入当前时间后再复制，副本上读到的时间即副本数据的新旧程度（见 api/replicas.py）"""
+    id = models.PositiveSmallIntegerField(primary_key=True, default=1)
+    updated_at = models.DateTimeField()
+
+    class Meta:
+        db_table = 'replication_heartbeat'
+
+    def __str__(self):
+        return self.updated_at.isoformat()
+
+
 class AccessToken(models.Model):
     """访问令牌"""
     id = models.UUIDField(primary_key=True, default=uuid.uuid4, editable=False)
     user = models.ForeignKey(User, on_delete=models.CASCADE, related_name='tokens')
     token = models.CharField(max_length=255, unique=True, db_index=True)
+    # 客户端设备标识（登录时提供）；同一用户同一设备只保留一个 token，重复登录时复用或轮换
+    device_id = models.CharField(max_length=64, blank=True, default='')
     created_at = models.DateTimeField(auto_now_add=True)
-    expires_at = models.DateTimeField()
+    expires_at = models.DateTimeField(db_index=True)  # purge_tokens 按过期时间批量删除
     is_active = models.BooleanField(default=True)
 
     class Meta:
         db_table = 'access_tokens'
+        indexes = [models.Index(fields=['user', 'device_id'], name='access_tokens_user_device')]
 
     def __str__(self):
         return f"Token for {self.user.account_id}"
 
 
+class RevokedToken(models.Model):
+    """
+    已撤销的签名 token（见 api/signed_tokens.py）：jti 非空时撤销该 token；
+    jti 为空时撤销 user 在 issued_before 之前签发的全部 token。过期后由 purge_tokens 删除
+    """
+    id = models.UUIDField(primary_key=True, default=uuid.uuid4, editable=False)
+    jti = models.CharField(max_length=32, blank=True, default='')
+    user = models.ForeignKey(User, on_delete=models.CASCADE, null=True, blank=True, related_name='+')
+    issued_before = models.DateTimeField(null=True, blank=True)
+    expires_at = models.DateTimeField(db_index=True)
+    created_at = models.DateTimeField(auto_now_add=True, db_index=True)
+
+    class Meta:
+        db_table = 'revoked_tokens'
+
+    def __str__(self):
+        return self.jti or f'{self.user_id} before {self.issued_before.isoformat()}'
+
+
 class CalendarType(models.Model):
     """日历类型/分类"""
     id = models.UUIDField(primary_key=True, default=uuid.uuid4, editable=False)
@@ -82,10 +189,41 @@ class CalendarType(models.Model):
         return f"{self.user.account_id} - {self.name}"
 
 
+class FileBlob(models.Model):
+    """附件内容（按 sha256 去重），被多个 UploadedFile 共享"""
+    PREVIEW_PENDING = 'pending'
+    PREVIEW_READY = 'ready'
+    PREVIEW_UNSUPPORTED = 'unsupported'
+    PREVIEW_FAILED = 'failed'
+    PREVIEW_STATUS_CHOICES = [
+        (PREVIEW_PENDING, 'Pending'),
+        (PREVIEW_READY, 'Ready'),
+        (PREVIEW_UNSUPPORTED, 'Unsupported'),
+        (PREVIEW_FAILED, 'Failed'),
+    ]
+
+    sha256 = models.CharField(max_length=64, primary_key=True)
+    file = models.FileField(upload_to='attachments/')
+    size = models.BigIntegerField()
+    ref_count = models.PositiveIntegerField(default=0)  # 引用该内容的 UploadedFile 数
+    # 图片缩略图 / PDF 首页预览（见 api/previews.py），与 blob 存放在同一目录
+    preview = models.FileField(upload_to='attachments/', blank=True)
+    preview_status = models.CharField(max_length=20, choices=PREVIEW_STATUS_CHOICES, default=PREVIEW_PENDING)
+    created_at = models.DateTimeField(auto_now_add=True)
+
+    class Meta:
+        db_table = 'file_blobs'
+
+    def __str__(self):
+        return self.sha256
+
+
 class UploadedFile(models.Model):
     """上传的文件"""
     id = models.UUIDField(primary_key=True, default=uuid.uuid4, editable=False)
     user = models.ForeignKey(User, on_delete=models.CASCADE, related_name='files')
+    # 去重之前上传的文件没有 blob，file 指向各自的文件
+    blob = models.ForeignKey(FileBlob, on_delete=models.PROTECT, null=True, blank=True, related_name='uploads')
     file = models.FileField(upload_to='attachments/')
     original_name = models.CharField(max_length=255)
     size = models.IntegerField()
@@ -99,6 +237,40 @@ class UploadedFile(models.Model):
         return self.original_name
 
 
+class FileDeletion(models.Model):
+    """待删除的存储文件（持久化队列）：与删除记录在同一事务中写入，由后台线程 / gc_attachments 命令删除"""
+    id = models.UUIDField(primary_key=True, default=uuid.uuid4, editable=False)
+    name = models.CharField(max_length=255)  # 存储中的相对路径
+    attempts = models.PositiveIntegerField(default=0)
+    last_error = models.CharField(max_length=255, blank=True)
+    created_at = models.DateTimeField(auto_now_add=True)
+
+    class Meta:
+        db_table = 'file_deletions'
+        ordering = ['created_at']
+
+    def __str__(self):
+        return self.name
+
+
+class UploadSession(models.Model):
+    """分块续传会话：数据按偏移直接写入 UPLOAD_SESSION_DIR/<id>.part，完成后转为附件"""
+    id = models.UUIDField(primary_key=True, default=uuid.uuid4, editable=False)
+    user = models.ForeignKey(User, on_delete=models.CASCADE, related_name='upload_sessions')
+    original_name = models.CharField(max_length=255)
+    mime_type = models.CharField(max_length=100)
+    size = models.BigIntegerField()  # 声明的文件总大小
+    received = models.BigIntegerField(default=0)  # 已连续写入的字节数，即下一块的起始偏移
+    created_at = models.DateTimeField(auto_now_add=True)
+    expires_at = models.DateTimeField(db_index=True)  # 每次写入后顺延
+
+    class Meta:
+        db_table = 'upload_sessions'
+
+    def __str__(self):
+        return f"{self.original_name} ({self.received}/{self.size})"
+
+
 class Event(models.Model):
     """事件/任务"""
     id = models.UUIDField(primary_key=True, default=uuid.uuid4, editable=False)
@@ -116,6 +288,12 @@ class Event(models.Model):
     completed_at = models.DateTimeField(null=True, blank=True)
     expanded = models.BooleanField(default=False)
     
+    # 重复规则（RRULE 子集，见 api/recurrence.py），空表示单次事件；重复事件的 date 是系列开始日期，
+    # completed 不使用，各次的完成状态记录在 EventOccurrence
+    recurrence = models.CharField(max_length=255, blank=True, default='')
+    # 系列最后一次发生的日期（保存时由规则计算，无结束条件时为空），窗口查询据此跳过已结束的系列
+    recurrence_end = models.DateField(null=True, blank=True)
+    
     attachment = models.ForeignKey(UploadedFile, on_delete=models.SET_NULL, null=True, blank=True, related_name='events')
     
     created_at = models.DateTimeField(auto_now_add=True)
@@ -124,10 +302,22 @@ class Event(models.Model):
     class Meta:
         db_table = 'events'
         ordering = ['date', 'start_time']
+        indexes = [
+            models.Index(fields=['user', 'date'], name='events_user_date'),
+        ]
 
     def __str__(self):
         return f"{self.user.account_id} - {self.title}"
 
+    def save(self, *args, **kwargs):
+        if self.recurrence:
+            self.recurrence_end = recurrence_rules.series_end(
+                self.recurrence, self._meta.get_field('date').to_python(self.date)
+            )
+        else:
+            self.recurrence_end = None
+        super().save(*args, **kwargs)
+
 
 class EventLink(models.Model):
     """事件关联的链接"""
@@ -141,3 +331,23 @@ class EventLink(models.Model):
 
     def __str__(self):
         return f"{self.event.title} - {self.url}"
+
+
+class EventOccurrence(models.Model):
+    """重复事件某一次发生的例外：完成状态或取消（按原发生日期）"""
+    id = models.UUIDField(primary_key=True, default=uuid.uuid4, editable=False)
+    event = models.ForeignKey(Event, on_delete=models.CASCADE, related_name='occurrences')
+    date = models.DateField()
+    cancelled = models.BooleanField(default=False)
+    completed = models.BooleanField(default=False)
+    completed_at = models.DateTimeField(null=True, blank=True)
+    updated_at = models.DateTimeField(auto_now=True)
+
+    class Meta:
+        db_table = 'event_occurrences'
+        constraints = [
+            models.UniqueConstraint(fields=['event', 'date'], name='event_occurrences_event_date'),
+        ]
+
+    def __str__(self):
+        return f"{self.event.title} @ {self.date}"
@@ -0,0 +1,182 @@
+"""
+附件预览图
+
+上传产生新的 blob 后（事务提交后），把生成任务交给进程内的线程池，上传请求不等待：
+  - 图片：缩放为长边 PREVIEW_MAX_EDGE 像素的 WebP
+  - PDF：渲染第一页（需要 pypdfium2）
+预览图与 blob 存放在一起（attachments/<前两位>/<sha256>.preview.webp），同一内容只生成一次。
+进程退出时尚未处理的任务保持 pending 状态，可用 `python manage.py generate_previews` 补齐。
+
+Pillow / pypdfium2 为可选依赖，缺失时对应类型标记为 unsupported，不影响上传。
+"""
+import logging
+import os
+import threading
+from io import BytesIO
+from concurrent.futures import ThreadPoolExecutor
+
+from django.conf import settings
+from django.core import signing
+from django.core.files.base import ContentFile
+from django.db import close_old_connections, transaction
+from django.http import FileResponse
+from django.urls import reverse
+from django.utils.cache import get_conditional_response
+from django.utils.http import quote_etag
+
+from .downloads import offload_response
+from .models import FileBlob
+
+try:
+    from PIL import Image, ImageOps
+except ImportError:  # pragma: no cover - 可选依赖
+    Image = None
+
+try:
+    import pypdfium2
+except ImportError:  # pragma: no cover - 可选依赖
+    pypdfium2 = None
+
+logger = logging.getLogger(__name__)
+
+_SIGNER_SALT = 'api.previews'
+_executor = None
+_executor_lock = threading.Lock()
+
+
+def preview_name(blob):
+    return f'{os.path.splitext(blob.file.name)[0]}.preview.webp'
+
+
+def _sniff(path):
+    with open(path, 'rb') as f:
+        head = f.read(8)
+    return 'pdf' if head.startswith(b'%PDF-') else 'image'
+
+
+def _render_image(path):
+    img = Image.open(path)
+    # JPEG 可直接以缩小的尺寸解码，避免把大图完整解码到内存
+    img.draft('RGB', (settings.PREVIEW_MAX_EDGE, settings.PREVIEW_MAX_EDGE))
+    img = ImageOps.exif_transpose(img)
+    img.thumbnail((settings.PREVIEW_MAX_EDGE, settings.PREVIEW_MAX_EDGE))
+    return img
+
+
+def _render_pdf(path):
+    pdf = pypdfium2.PdfDocument(path)
+    try:
+        page = pdf[0]
+        width, height = page.get_size()
+        scale = settings.PREVIEW_MAX_EDGE / max(width, height, 1)
+        return page.render(scale=scale).to_pil()
+    finally:
+        pdf.close()
+
+
+def render_preview(path):
+    """生成预览图（PIL Image），不支持的类型返回None"""
+    if Image is None:
+        return None
+    kind = _sniff(path)
+    if kind == 'pdf':
+        return _render_pdf(path) if pypdfium2 is not None else None
+    try:
+        return _render_image(path)
+    except (Image.UnidentifiedImageError, Image.DecompressionBombError):
+        return None
+
+
+def generate_preview(sha256):
+    """为 blob 生成预览图并更新状态；blob 已删除或已处理时直接返回"""
+    blob = FileBlob.objects.filter(sha256=sha256, preview_status=FileBlob.PREVIEW_PENDING).first()
+    if blob is None:
+        return
+    try:
+        img = render_preview(blob.file.path)
+    except Exception:
+        logger.exception('Failed to render preview for blob %s', sha256)
+        FileBlob.objects.filter(sha256=sha256).update(preview_status=FileBlob.PREVIEW_FAILED)
+        return
+    if img is None:
+        FileBlob.objects.filter(sha256=sha256).update(preview_status=FileBlob.PREVIEW_UNSUPPORTED)
+        return
+
+    buf = BytesIO()
+    if img.mode not in ('RGB', 'RGBA'):
+        img = img.convert('RGBA' if 'A' in img.getbands() else 'RGB')
+    img.save(buf, 'WEBP', quality=settings.PREVIEW_QUALITY)
+
+    storage = FileBlob._meta.get_field('file').storage
+    name = preview_name(blob)
+    storage.delete(name)
+    name = storage.save(name, ContentFile(buf.getvalue()))
+    updated = FileBlob.objects.filter(sha256=sha256).update(preview=name, preview_status=FileBlob.PREVIEW_READY)
+    if not updated:
+        # 生成期间 blob 被删除
+        storage.delete(name)
+
+
+def _run(sha256):
+    try:
+        generate_preview(sha256)
+    except Exception:
+        logger.exception('Preview task failed for blob %s', sha256)
+    finally:
+        close_old_connections()
+
+
+def executor():
+    global _executor
+    if _executor is None:
+        with _executor_lock:
+            if _executor is None:
+                _executor = ThreadPoolExecutor(max_workers=settings.PREVIEW_WORKERS, thread_name_prefix='preview')
+    return _executor
+
+
+def schedule_preview(blob):
+    """事务提交后把 blob 的预览任务交给线程池（不阻塞当前请求）"""
+    if settings.PREVIEW_WORKERS <= 0:
+        return
+    sha256 = blob.sha256
+    transaction.on_commit(lambda: executor().submit(_run, sha256))
+
+
+# ==================== 访问 ====================
+
+def preview_url(request, file_obj):
+    """
+    预览图地址。签名不含时间戳，同一文件的地址固定，浏览器可长期缓存；
+    预览图尚未生成时返回None
+    """
+    blob = file_obj.blob
+    if blob is None or blob.preview_status != FileBlob.PREVIEW_READY:
+        return None
+    sig = signing.Signer(salt=_SIGNER_SALT).sign(f'{file_obj.id}/{file_obj.user_id}')
+    path = reverse('file_preview', args=[file_obj.id])
+    return request.build_absolute_uri(f'{path}?sig={sig}')
+
+
+def verify_preview_signature(sig, file_id):
+    """签名对应该文件时返回文件所有者的 id，否则返回None"""
+    try:
+        value = signing.Signer(salt=_SIGNER_SALT).unsign(sig)
+    except signing.BadSignature:
+        return None
+    signed_id, _, owner_id = value.partition('/')
+    return owner_id if signed_id == str(file_id) and owner_id else None
+
+
+def preview_response(request, blob):
+    """预览图响应：内容随 blob 固定不变，带长期缓存头"""
+    etag = quote_etag(f'{blob.sha256}-preview')
+    response = get_conditional_response(request, etag=etag)
+    if response is None:
+        if settings.ATTACHMENT_SENDFILE_BACKEND:
+            response = offload_response(blob.preview, 'image/webp')
+        else:
+            response = FileResponse(open(blob.preview.path, 'rb'), content_type='image/webp')
+    response['ETag'] = etag
+    response['Cache-Control'] = f'private, max-age={settings.PREVIEW_CACHE_MAX_AGE}, immutable'
+    return response
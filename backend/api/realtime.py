@@ -0,0 +1,350 @@
+"""
+实时变更通道：按用户推送事件、日历类型与提醒的变更通知（ASGI 部署使用）
+
+- 事件、日历类型和重复事件单次例外的写入由模型信号捕获，在事务提交后（transaction.on_commit）发布，
+  回滚的写入不会推送。查询集上的 update / delete 不发信号，相关视图显式调用 event_changed
+- 通知只带类型、操作与 id 等少量字段，客户端据此修改本地数据或单独获取该对象，不必重新加载列表
+- 发布与订阅经由可替换的 Broker（settings.REALTIME_BACKEND）。默认的 InProcessBroker 只在本进程内分发，
+  多进程部署需换成共享的实现（如 Redis pub/sub），接口见 Broker
+- 客户端用 SSE（GET /api/v1/changes，见 async_views.changes）或 WebSocket（同一路径，见 websocket_application）订阅
+
+通知格式（JSON）：
+  {"type": "event", "op": "upsert", "id": "<uuid>", "date": "2026-10-19"}
+  {"type": "event", "op": "upsert", "id": "<uuid>", "occurrence_date": "...", "completed": true, "cancelled": false}
+  {"type": "event", "op": "delete", "id": "<uuid>"}
+  {"type": "calendar_type", "op": "upsert" | "delete", "id": "<type_id>"}
+  {"type": "reminders", "op": "replace", "reminders": [...]}
+  {"type": "ready"}   订阅建立后的第一条，客户端此后加载一次列表即不会漏掉变更
+  {"type": "resync"}  客户端消费太慢、积压的通知被丢弃，需重新加载全部数据
+"""
+import asyncio
+import json
+import logging
+import threading
+import time
+from abc import ABC, abstractmethod
+from collections import deque
+from urllib.parse import parse_qs
+
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.db import close_old_connections, transaction
+from django.utils.module_loading import import_string
+from rest_framework import exceptions
+
+from .models import Event
+
+logger = logging.getLogger(__name__)
+
+PATH = '/api/v1/changes'
+READY = {'type': 'ready'}
+RESYNC = {'type': 'resync'}
+
+
+# ==================== 发布 / 订阅 ====================
+
+class Subscription:
+    """
+    一个连接的通知队列，属于创建它的事件循环。
+    与上一条尚未发出的通知相同时不重复排队；积压超过 size 条（客户端消费太慢）时丢弃积压，改为一条 resync
+    """
+
+    def __init__(self, user_id, size, on_close=None):
+        self.user_id = user_id
+        self.size = size
+        self.loop = asyncio.get_running_loop()
+        self.pending = deque()
+        self.ready = asyncio.Event()
+        self.on_close = on_close
+
+    def put(self, message):
+        """在 self.loop 中调用"""
+        if self.pending and self.pending[-1] == message:
+            return
+        if len(self.pending) >= self.size:
+            self.pending.clear()
+            message = RESYNC
+        self.pending.append(message)
+        self.ready.set()
+
+    def put_threadsafe(self, message):
+        try:
+            self.loop.call_soon_threadsafe(self.put, message)
+        except RuntimeError:
+            # 事件循环已关闭，连接随之结束
+            pass
+
+    async def get(self, timeout):
+        """下一条通知；timeout 秒内没有时返回 None"""
+        if not self.pending:
+            self.ready.clear()
+            try:
+                await asyncio.wait_for(self.ready.wait(), timeout)
+            except asyncio.TimeoutError:
+                return None
+        return self.pending.popleft()
+
+    def close(self):
+        if self.on_close is not None:
+            self.on_close(self)
+            self.on_close = None
+
+
+class Broker(ABC):
+    """
+    发布 / 订阅接口。publish 可在任意线程调用（通常在事务提交回调中，不应阻塞），
+    subscribe 在事件循环中调用，返回 Subscription，连接结束时调用其 close()。
+    跨进程的实现在 subscribe 时订阅 user_id 对应的频道，收到消息后调用 subscription.put_threadsafe。
+    缺少任一方法的实现在创建时（broker()）即报 TypeError，而不是等到第一次发布
+    """
+
+    @abstractmethod
+    def publish(self, user_id, message):
+        """向 user_id 的所有订阅发送 message"""
+
+    @abstractmethod
+    def subscribe(self, user_id):
+        """订阅 user_id 的通知，返回 Subscription"""
+
+
+class InProcessBroker(Broker):
+    """只在本进程内分发（单进程 ASGI 部署，或 Agent Service 同进程部署）"""
+
+    def __init__(self):
+        self._subscribers = {}  # user_id -> set(Subscription)
+        self._lock = threading.Lock()
+
+    def publish(self, user_id, message):
+        with self._lock:
+            targets = list(self._subscribers.get(user_id, ()))
+        for subscription in targets:
+            subscription.put_threadsafe(message)
+
+    def subscribe(self, user_id):
+        subscription = Subscription(user_id, settings.REALTIME_QUEUE_SIZE, self._unsubscribe)
+        with self._lock:
+            self._subscribers.setdefault(user_id, set()).add(subscription)
+        return subscription
+
+    def _unsubscribe(self, subscription):
+        with self._lock:
+            subscribers = self._subscribers.get(subscription.user_id)
+            if subscribers is not None:
+                subscribers.discard(subscription)
+                if not subscribers:
+                    del self._subscribers[subscription.user_id]
+
+    def subscriber_count(self, user_id=None):
+        with self._lock:
+            if user_id is None:
+                return sum(len(s) for s in self._subscribers.values())
+            return len(self._subscribers.get(str(user_id), ()))
+
+
+_broker = None
+_broker_lock = threading.Lock()
+
+
+def broker():
+    """settings.REALTIME_BACKEND 指定的 Broker（进程内单例）"""
+    global _broker
+    if _broker is None:
+        with _broker_lock:
+            if _broker is None:
+                _broker = import_string(settings.REALTIME_BACKEND)()
+    return _broker
+
+
+def publish(user_id, message):
+    """立即发布；发布失败只记录日志，不影响写入请求"""
+    try:
+        broker().publish(str(user_id), message)
+    except Exception:
+        logger.exception('Publishing change notification failed')
+
+
+def publish_on_commit(using, user_id, message):
+    """using 上的事务提交后发布（不在事务中时立即发布）"""
+    transaction.on_commit(lambda: publish(user_id, message), using=using)
+
+
+# ==================== 通知 ====================
+
+def event_message(event):
+    return {'type': 'event', 'op': 'upsert', 'id': str(event.pk), 'date': str(event.date)}
+
+
+def event_changed(event):
+    """事件本身没有保存、但关联数据（如链接）被批量修改时调用"""
+    publish_on_commit(event._state.db, event.user_id, event_message(event))
+
+
+def _event_owner(instance, using):
+    """关联事件的 (用户 id, 事件)；事件已缓存在实例上时不查询"""
+    if type(instance).event.is_cached(instance):
+        return instance.event.user_id, instance.event
+    user_id = Event.objects.using(using).filter(pk=instance.event_id).values_list('user_id', flat=True).first()
+    return user_id, None
+
+
+def event_saved(sender, instance, using, raw=False, **kwargs):
+    if not raw:
+        publish_on_commit(using, instance.user_id, event_message(instance))
+
+
+def event_deleted(sender, instance, using, **kwargs):
+    publish_on_commit(using, instance.user_id, {'type': 'event', 'op': 'delete', 'id': str(instance.pk)})
+
+
+def occurrence_saved(sender, instance, using, raw=False, **kwargs):
+    if raw:
+        return
+    user_id, _ = _event_owner(instance, using)
+    if user_id is not None:
+        publish_on_commit(using, user_id, {
+            'type': 'event', 'op': 'upsert', 'id': str(instance.event_id), 'occurrence_date': str(instance.date),
+            'completed': instance.completed, 'cancelled': instance.cancelled,
+        })
+
+
+def link_saved(sender, instance, using, raw=False, **kwargs):
+    if raw:
+        return
+    user_id, event = _event_owner(instance, using)
+    if event is not None:
+        publish_on_commit(using, user_id, event_message(event))
+    elif user_id is not None:
+        publish_on_commit(using, user_id, {'type': 'event', 'op': 'upsert', 'id': str(instance.event_id)})
+
+
+def calendar_type_saved(sender, instance, using, raw=False, **kwargs):
+    if not raw:
+        publish_on_commit(using, instance.user_id, {'type': 'calendar_type', 'op': 'upsert', 'id': instance.type_id})
+
+
+def calendar_type_deleted(sender, instance, using, **kwargs):
+    # 被删除类型下的事件已移到 general（与 DELETE /calendar-types/<id> 相同），客户端在本地同样处理
+    publish_on_commit(using, instance.user_id, {'type': 'calendar_type', 'op': 'delete', 'id': instance.type_id})
+
+
+def reminders_changed(user, reminders):
+    publish(user.pk, {'type': 'reminders', 'op': 'replace', 'reminders': reminders})
+
+
+def connect_signals():
+    from django.db.models.signals import post_delete, post_save
+    from .models import CalendarType, EventLink, EventOccurrence
+
+    post_save.connect(event_saved, sender=Event, dispatch_uid='realtime_event_save')
+    post_delete.connect(event_deleted, sender=Event, dispatch_uid='realtime_event_delete')
+    post_save.connect(occurrence_saved, sender=EventOccurrence, dispatch_uid='realtime_occurrence_save')
+    post_save.connect(link_saved, sender=EventLink, dispatch_uid='realtime_link_save')
+    post_save.connect(calendar_type_saved, sender=CalendarType, dispatch_uid='realtime_type_save')
+    post_delete.connect(calendar_type_deleted, sender=CalendarType, dispatch_uid='realtime_type_delete')
+
+
+# ==================== 订阅连接 ====================
+
+def dumps(message):
+    return json.dumps(message, ensure_ascii=False, separators=(',', ':'))
+
+
+async def messages(user_id):
+    """
+    一个连接收到的通知（先是 ready）；超过 REALTIME_HEARTBEAT_SECONDS 没有通知时产出 None（用于心跳），
+    连接持续 REALTIME_MAX_CONNECTION_SECONDS 后结束，客户端重连时重新鉴权
+    """
+    subscription = broker().subscribe(str(user_id))
+    deadline = time.monotonic() + settings.REALTIME_MAX_CONNECTION_SECONDS
+    try:
+        yield READY
+        while True:
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                return
+            yield await subscription.get(min(settings.REALTIME_HEARTBEAT_SECONDS, remaining))
+    finally:
+        subscription.close()
+
+
+def sse_events(user_id):
+    """SSE 格式的响应内容：通知为 data 行，心跳为注释行"""
+    async def events():
+        yield f'retry: {settings.REALTIME_RETRY_MS}\n\n'
+        async for message in messages(user_id):
+            yield ': ping\n\n' if message is None else f'data: {dumps(message)}\n\n'
+    return events()
+
+
+class _TokenRequest:
+    """只带 Authorization 头的请求对象，供 TokenAuthentication 校验 WebSocket 的 token"""
+
+    def __init__(self, token):
+        self.META = {'HTTP_AUTHORIZATION': f'Bearer {token}'}
+
+
+def scope_token(scope):
+    """WebSocket 的 token：Authorization 头，或 ?access_token=（浏览器 WebSocket 不能设置请求头）"""
+    for name, value in scope.get('headers', ()):
+        if name == b'authorization':
+            scheme, _, token = value.decode('latin-1').partition(' ')
+            if scheme.lower() == 'bearer' and token:
+                return token
+    tokens = parse_qs(scope.get('query_string', b'').decode('latin-1')).get('access_token')
+    return tokens[0] if tokens else None
+
+
+async def websocket_user(scope):
+    from .authentication import TokenAuthentication
+
+    token = scope_token(scope)
+    if token is None:
+        return None
+    try:
+        result = await TokenAuthentication().aauthenticate(_TokenRequest(token))
+    except exceptions.APIException:
+        return None
+    finally:
+        await sync_to_async(close_old_connections)()
+    return result[0] if result else None
+
+
+async def websocket_application(scope, receive, send):
+    """WebSocket 订阅：鉴权失败以 4401 关闭；只推送通知，忽略客户端发来的消息"""
+    if (await receive())['type'] != 'websocket.connect':
+        return
+    if scope['path'].rstrip('/') != PATH:
+        await send({'type': 'websocket.close', 'code': 4404})
+        return
+    user = await websocket_user(scope)
+    if user is None:
+        await send({'type': 'websocket.close', 'code': 4401})
+        return
+    await send({'type': 'websocket.accept'})
+
+    async def until_disconnect():
+        while (await receive())['type'] != 'websocket.disconnect':
+            pass
+
+    async def forward():
+        async for message in messages(user.pk):
+            if message is not None:
+                await send({'type': 'websocket.send', 'text': dumps(message)})
+        await send({'type': 'websocket.close', 'code': 1000})
+
+    tasks = [asyncio.ensure_future(until_disconnect()), asyncio.ensure_future(forward())]
+    try:
+        await asyncio.wait(tasks, return_when=asyncio.FIRST_COMPLETED)
+    finally:
+        for task in tasks:
+            task.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
+
+
+def asgi_router(django_application):
+    """HTTP（包括 SSE）交给 Django，WebSocket 交给 websocket_application"""
+    async def application(scope, receive, send):
+        if scope['type'] == 'websocket':
+            return await websocket_application(scope, receive, send)
+        return await django_application(scope, receive, send)
+    return application
@@ -0,0 +1,289 @@
+"""
+重复事件（RRULE 子集）
+
+事件的 recurrence 字段保存规则文本，例如：
+  FREQ=DAILY
+  FREQ=WEEKLY;INTERVAL=2;BYDAY=MO,WE,FR;COUNT=20
+  FREQ=MONTHLY;UNTIL=20261231
+支持 FREQ（DAILY / WEEKLY / MONTHLY）、INTERVAL、BYDAY（仅 WEEKLY）、COUNT 与 UNTIL（二者不能同时出现）。
+事件的 date 是系列的开始日期；按月重复时没有该日的月份跳过（与 RFC 5545 相同）。
+
+一个系列只存一行，读取时只在请求的日期窗口内展开：按规则直接算出窗口内第一次发生的位置，
+不从开始日期逐个推算，因此展开的开销只与窗口内的次数有关。单次发生的完成状态与取消记录
+保存在 event_occurrences（按发生日期），展开时合并。
+"""
+import calendar
+import heapq
+from dataclasses import dataclass
+from datetime import date, datetime, time, timedelta
+
+from django.db.models import Prefetch, Q
+
+FREQUENCIES = ('DAILY', 'WEEKLY', 'MONTHLY')
+WEEKDAYS = ('MO', 'TU', 'WE', 'TH', 'FR', 'SA', 'SU')
+MAX_COUNT = 5000
+MAX_INTERVAL = 99
+# 展开的日期上限，避免日期运算越过 date.max
+_HORIZON = date(9000, 1, 1)
+
+
+class InvalidRule(ValueError):
+    pass
+
+
+@dataclass(frozen=True)
+class Rule:
+    freq: str
+    interval: int = 1
+    weekdays: tuple = ()  # 0=周一 … 6=周日，升序
+    count: int | None = None
+    until: date | None = None
+
+    def __str__(self):
+        parts = [f'FREQ={self.freq}']
+        if self.interval != 1:
+            parts.append(f'INTERVAL={self.interval}')
+        if self.weekdays:
+            parts.append('BYDAY=' + ','.join(WEEKDAYS[d] for d in self.weekdays))
+        if self.count is not None:
+            parts.append(f'COUNT={self.count}')
+        if self.until is not None:
+            parts.append(f'UNTIL={self.until:%Y%m%d}')
+        return ';'.join(parts)
+
+
+def _parse_until(value):
+    # 接受 20261231、20261231T235959Z 与 2026-12-31
+    try:
+        if '-' in value:
+            return date.fromisoformat(value[:10])
+        return datetime.strptime(value[:8], '%Y%m%d').date()
+    except ValueError:
+        raise InvalidRule(f'Invalid UNTIL: {value}')
+
+
+def _positive_int(key, value, maximum):
+    try:
+        number = int(value)
+    except ValueError:
+        raise InvalidRule(f'Invalid {key}: {value}')
+    if not 1 <= number <= maximum:
+        raise InvalidRule(f'{key} must be between 1 and {maximum}')
+    return number
+
+
+def parse_rule(text):
+    """规则文本 -> Rule；不支持或不合法时抛出 InvalidRule（消息返回给客户端）"""
+    text = text.strip()
+    if text.upper().startswith('RRULE:'):
+        text = text[len('RRULE:'):]
+    values = {}
+    for part in filter(None, text.split(';')):
+        key, sep, value = part.partition('=')
+        key = key.strip().upper()
+        if not sep or not value.strip():
+            raise InvalidRule(f'Invalid rule part: {part}')
+        if key in values:
+            raise InvalidRule(f'Duplicate rule part: {key}')
+        values[key] = value.strip().upper()
+
+    unknown = set(values) - {'FREQ', 'INTERVAL', 'BYDAY', 'COUNT', 'UNTIL'}
+    if unknown:
+        raise InvalidRule(f"Unsupported rule part: {', '.join(sorted(unknown))}")
+    freq = values.get('FREQ')
+    if freq not in FREQUENCIES:
+        raise InvalidRule(f"FREQ must be one of: {', '.join(FREQUENCIES)}")
+    if 'COUNT' in values and 'UNTIL' in values:
+        raise InvalidRule('COUNT and UNTIL cannot be used together')
+
+    weekdays = ()
+    if 'BYDAY' in values:
+        if freq != 'WEEKLY':
+            raise InvalidRule('BYDAY is only supported with FREQ=WEEKLY')
+        try:
+            weekdays = tuple(sorted({WEEKDAYS.index(d.strip()) for d in values['BYDAY'].split(',')}))
+        except ValueError:
+            raise InvalidRule(f"Invalid BYDAY: {values['BYDAY']}")
+
+    return Rule(
+        freq=freq,
+        interval=_positive_int('INTERVAL', values['INTERVAL'], MAX_INTERVAL) if 'INTERVAL' in values else 1,
+        weekdays=weekdays,
+        count=_positive_int('COUNT', values['COUNT'], MAX_COUNT) if 'COUNT' in values else None,
+        until=_parse_until(values['UNTIL']) if 'UNTIL' in values else None,
+    )
+
+
+def normalize(text):
+    """校验并规范化规则文本（空字符串表示不重复）"""
+    return str(parse_rule(text)) if text.strip() else ''
+
+
+# ==================== 展开 ====================
+
+def _daily(rule, dtstart, start, end):
+    step = rule.interval
+    k = -(-(start - dtstart).days // step)  # 窗口内第一次发生的序号（向上取整）
+    while rule.count is None or k < rule.count:
+        day = dtstart + timedelta(days=k * step)
+        if day > end:
+            return
+        yield day
+        k += 1
+
+
+def _weekly(rule, dtstart, start, end):
+    days = rule.weekdays or (dtstart.weekday(),)
+    week0 = dtstart - timedelta(days=dtstart.weekday())
+    first = [d for d in days if d >= dtstart.weekday()]  # 第一周只有开始日期及之后的几天
+    period = (start - week0).days // 7 // rule.interval
+    # 窗口之前已发生的次数，用于 COUNT
+    n = 0 if period == 0 else len(first) + (period - 1) * len(days)
+    while True:
+        week = week0 + timedelta(weeks=period * rule.interval)
+        if week > end:
+            return
+        for weekday in first if period == 0 else days:
+            if rule.count is not None and n >= rule.count:
+                return
+            n += 1
+            day = week + timedelta(days=weekday)
+            if day > end:
+                return
+            if day >= start:
+                yield day
+        period += 1
+
+
+def _monthly(rule, dtstart, start, end):
+    # 有 COUNT 时需要数出被跳过的月份，从第一个月开始；否则直接跳到窗口所在的月
+    k = 0
+    if rule.count is None:
+        months = (start.year - dtstart.year) * 12 + start.month - dtstart.month
+        k = max(0, months // rule.interval)
+    n = 0
+    while True:
+        year, month = divmod(dtstart.month - 1 + k * rule.interval, 12)
+        year, month = dtstart.year + year, month + 1
+        if date(year, month, 1) > end:
+            return
+        if dtstart.day <= calendar.monthrange(year, month)[1]:
+            if rule.count is not None and n >= rule.count:
+                return
+            n += 1
+            day = date(year, month, dtstart.day)
+            if day > end:
+                return
+            if day >= start:
+                yield day
+        k += 1
+
+
+_EXPANDERS = {'DAILY': _daily, 'WEEKLY': _weekly, 'MONTHLY': _monthly}
+
+
+def occurrence_dates(rule, dtstart, start, end):
+    """规则在 [start, end] 内的发生日期（升序）"""
+    end = min(end, _HORIZON)
+    if rule.until is not None:
+        end = min(end, rule.until)
+    start = max(start, dtstart)
+    if start > end:
+        return iter(())
+    return _EXPANDERS[rule.freq](rule, dtstart, start, end)
+
+
+def is_occurrence(rule, dtstart, day):
+    return next(occurrence_dates(rule, dtstart, day, day), None) is not None
+
+
+def series_end(text, dtstart):
+    """系列最后一次发生的日期；没有 COUNT / UNTIL 时为 None（无限重复）"""
+    rule = parse_rule(text)
+    if rule.count is None:
+        return rule.until
+    last = None
+    for last in occurrence_dates(rule, dtstart, dtstart, _HORIZON):
+        pass
+    return last or dtstart
+
+
+# ==================== 查询 ====================
+
+def events_in_window(start_date, end_date):
+    """单次事件在窗口内，或重复系列与窗口有交集（开始不晚于窗口结束、最后一次不早于窗口开始）"""
+    series = ~Q(recurrence='') & Q(date__lte=end_date) & (
+        Q(recurrence_end__isnull=True) | Q(recurrence_end__gte=start_date)
+    )
+    return Q(recurrence='', date__gte=start_date, date__lte=end_date) | series
+
+
+def occurrence_prefetch(start_date, end_date):
+    """只预取窗口内的例外记录（供 expand 合并）"""
+    from .models import EventOccurrence  # models 在保存时引用本模块
+    return Prefetch('occurrences', queryset=EventOccurrence.objects.filter(date__gte=start_date, date__lte=end_date))
+
+
+def sort_key(event):
+    """事件 / 各次发生的列表顺序：按日期，全天（没有开始时间）在前，再按开始时间"""
+    return (event.date, event.start_time is not None, event.start_time or time.min)
+
+
+def occurrences(event, start, end):
+    """
+    重复事件在 [start, end] 内的各次发生：事件对象的浅拷贝，date 与 occurrence_date 为发生日期，
+    完成状态取自该日的 EventOccurrence；被取消的日期不返回。
+    event.occurrences 应已按窗口预取（见 occurrence_prefetch），否则这里会再查询一次
+    """
+    exceptions = {o.date: o for o in event.occurrences.all()}
+    for day in occurrence_dates(parse_rule(event.recurrence), event.date, start, end):
+        exception = exceptions.get(day)
+        if exception is not None and exception.cancelled:
+            continue
+        # 浅拷贝实例属性（比 copy.copy 走 __reduce_ex__ 快得多）；_state 与预取缓存和系列共用
+        item = object.__new__(type(event))
+        item.__dict__.update(event.__dict__)
+        item.date = item.occurrence_date = day
+        item.completed = exception.completed if exception else False
+        item.completed_at = exception.completed_at if exception else None
+        yield item
+
+
+def expand(events, start, end):
+    """把查询结果中的重复事件在窗口内展开，与单次事件一起按 (date, start_time) 排序"""
+    result = []
+    for event in events:
+        if event.recurrence:
+            result.extend(occurrences(event, start, end))
+        else:
+            result.append(event)
+    result.sort(key=sort_key)
+    return result
+
+
+class OccurrenceMerger:
+    """
+    把重复系列在窗口内的各次发生归并进按 sort_key 有序的单次事件流（流式输出时使用）。
+    每个系列一个惰性生成器，堆中只保存各系列的下一次发生，内存与系列数成正比、与窗口长度无关
+    """
+
+    def __init__(self, series, start, end):
+        self._heap = []
+        for index, event in enumerate(series):
+            self._push(index, occurrences(event, start, end))
+
+    def _push(self, index, items):
+        item = next(items, None)
+        if item is not None:
+            # index 保证键相同时不比较事件对象，并保持系列原有的先后顺序
+            heapq.heappush(self._heap, (sort_key(item), index, item, items))
+
+    def before(self, key):
+        """
+        依次取出不排在 key 之后的各次发生（key 为None时取出全部）。键相同时系列在前：
+        非流式的 expand 是稳定排序，系列行的 date 是开始日期，在查询结果中排在同一天的单次事件之前
+        """
+        while self._heap and (key is None or self._heap[0][0] <= key):
+            _, index, item, items = heapq.heappop(self._heap)
+            self._push(index, items)
+            yield item
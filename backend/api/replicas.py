@@ -0,0 +1,209 @@
+"""
+读写分离：读多的 GET 端点从只读副本读取，写入始终走主库（default）
+
+- 只有用 @replica_reads 标记的视图在 GET/HEAD 时使用副本，其余读取（包括鉴权）仍走主库
+- 副本延迟：主库中 replication_heartbeat 记录最近一次复制的时间，随数据一起复制到副本，
+  副本上读到的时间即数据的新旧程度；超过 REPLICA_MAX_LAG_SECONDS 的副本不再使用
+- 读己之写：请求中发生过写入时，该用户在 REPLICA_STICKY_SECONDS 内的读取留在主库
+  （记录在 Django 缓存中，多进程部署需配置共享缓存）；该时长不小于副本允许的最大延迟，
+  因此用户总能读到自己的写入。同一请求内写入之后的读取也改走主库
+
+副本可以是本机的数据库文件（`manage.py sync_replicas` 用 SQLite 在线备份复制），
+也可以由外部复制工具维护，此时用 `sync_replicas --heartbeat-only` 持续写入心跳。
+"""
+import contextvars
+import random
+import sqlite3
+import threading
+import time
+from functools import wraps
+
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction, sync_to_async
+from django.conf import settings
+from django.core.cache import cache
+from django.core.exceptions import MiddlewareNotUsed
+from django.db import DEFAULT_DB_ALIAS, DatabaseError
+from django.utils import timezone
+
+from .models import ReplicationHeartbeat
+
+# 当前视图选定的副本（None 表示读主库）
+_replica = contextvars.ContextVar('replica', default=None)
+# 当前请求的状态（由中间件设置）；用可变字典，线程间桥接时修改同样可见
+_request_state = contextvars.ContextVar('replica_request_state', default=None)
+
+_heartbeats = {}  # alias -> (心跳时间, 检查时的 monotonic 时间)
+_heartbeats_lock = threading.Lock()
+
+
+class ReplicaRouter:
+    def db_for_read(self, model, **hints):
+        alias = _replica.get()
+        state = _request_state.get()
+        if alias and not (state and state['wrote']):
+            return alias
+        return DEFAULT_DB_ALIAS
+
+    def db_for_write(self, model, **hints):
+        state = _request_state.get()
+        if state is not None:
+            state['wrote'] = True
+        return DEFAULT_DB_ALIAS
+
+    def allow_relation(self, obj1, obj2, **hints):
+        return True
+
+    def allow_migrate(self, db, app_label, model_name=None, **hints):
+        # 副本是主库的完整拷贝，不单独迁移
+        return db == DEFAULT_DB_ALIAS
+
+
+# ==================== 延迟检查 ====================
+
+def _sticky_key(user_id):
+    return f'replica-sticky:{user_id}'
+
+
+def mark_sticky(user_id):
+    cache.set(_sticky_key(user_id), True, timeout=settings.REPLICA_STICKY_SECONDS)
+
+
+def is_sticky(user_id):
+    return bool(cache.get(_sticky_key(user_id)))
+
+
+def replica_lag(alias):
+    """副本落后的秒数（无法读取心跳时为无穷大）；心跳每 REPLICA_LAG_CHECK_SECONDS 秒最多查询一次"""
+    now = time.monotonic()
+    cached = _heartbeats.get(alias)
+    if cached is None or now - cached[1] >= settings.REPLICA_LAG_CHECK_SECONDS:
+        try:
+            beat = ReplicationHeartbeat.objects.using(alias).filter(pk=1).values_list('updated_at', flat=True).first()
+        except DatabaseError:
+            beat = None
+        with _heartbeats_lock:
+            _heartbeats[alias] = cached = (beat, now)
+    beat = cached[0]
+    if beat is None:
+        return float('inf')
+    return max(0.0, (timezone.now() - beat).total_seconds())
+
+
+def choose_replica(user):
+    """为该用户的读请求选择副本；无可用副本或用户刚写入过时返回None（读主库）"""
+    if not settings.DATABASE_REPLICAS:
+        return None
+    if user is not None and is_sticky(user.pk):
+        return None
+    healthy = [a for a in settings.DATABASE_REPLICAS if replica_lag(a) <= settings.REPLICA_MAX_LAG_SECONDS]
+    return random.choice(healthy) if healthy else None
+
+
+def replica_reads(view):
+    """
+    标记视图的 GET/HEAD 请求从副本读取。放在 DRF 装饰器之下（或 async_read_view 之下），
+    鉴权完成后才选择副本，token 查询始终走主库。
+    """
+    def user_of(request):
+        user = getattr(request, 'user', None)
+        return user if getattr(user, 'is_authenticated', False) else None
+
+    if iscoroutinefunction(view):
+        @wraps(view)
+        async def async_wrapper(request, *args, **kwargs):
+            if request.method not in ('GET', 'HEAD') or not settings.DATABASE_REPLICAS:
+                return await view(request, *args, **kwargs)
+            token = _replica.set(await sync_to_async(choose_replica)(user_of(request)))
+            try:
+                return await view(request, *args, **kwargs)
+            finally:
+                _replica.reset(token)
+        return async_wrapper
+
+    @wraps(view)
+    def wrapper(request, *args, **kwargs):
+        if request.method not in ('GET', 'HEAD') or not settings.DATABASE_REPLICAS:
+            return view(request, *args, **kwargs)
+        token = _replica.set(choose_replica(user_of(request)))
+        try:
+            return view(request, *args, **kwargs)
+        finally:
+            _replica.reset(token)
+    return wrapper
+
+
+class ReplicaStickinessMiddleware:
+    """请求中发生写入时，让该用户接下来 REPLICA_STICKY_SECONDS 秒的读取留在主库"""
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        if not settings.DATABASE_REPLICAS:
+            raise MiddlewareNotUsed()
+        self.get_response = get_response
+        self.is_async = iscoroutinefunction(get_response)
+        if self.is_async:
+            markcoroutinefunction(self)
+
+    def __call__(self, request):
+        if self.is_async:
+            return self.__acall__(request)
+        state = {'wrote': False}
+        token = _request_state.set(state)
+        try:
+            response = self.get_response(request)
+        finally:
+            _request_state.reset(token)
+        self._finish(request, state)
+        return response
+
+    async def __acall__(self, request):
+        state = {'wrote': False}
+        token = _request_state.set(state)
+        try:
+            response = await self.get_response(request)
+        finally:
+            _request_state.reset(token)
+        if state['wrote']:
+            await sync_to_async(self._finish)(request, state)
+        return response
+
+    @staticmethod
+    def _finish(request, state):
+        user = getattr(request, 'user', None)
+        if state['wrote'] and getattr(user, 'is_authenticated', False) and getattr(user, 'pk', None):
+            mark_sticky(user.pk)
+
+
+# ==================== 复制 ====================
+
+def write_heartbeat():
+    """在主库记录当前时间；之后复制出的副本中读到的心跳即其数据时间的下界"""
+    ReplicationHeartbeat.objects.using(DEFAULT_DB_ALIAS).update_or_create(
+        pk=1, defaults={'updated_at': timezone.now()}
+    )
+
+
+def copy_to_replica(alias):
+    """用 SQLite 在线备份把主库完整复制到副本文件（副本上已打开的连接之后读到新数据）"""
+    source = sqlite3.connect(settings.DATABASES[DEFAULT_DB_ALIAS]['NAME'])
+    target = sqlite3.connect(settings.DATABASES[alias]['NAME'], timeout=30)
+    try:
+        source.backup(target)
+    finally:
+        target.close()
+        source.close()
+
+
+def sync_replicas(aliases=None, heartbeat_only=False):
+    write_heartbeat()
+    if heartbeat_only:
+        return []
+    aliases = aliases or settings.DATABASE_REPLICAS
+    for alias in aliases:
+        copy_to_replica(alias)
+    # 本进程内的心跳缓存立即失效
+    with _heartbeats_lock:
+        for alias in aliases:
+            _heartbeats.pop(alias, None)
+    return aliases
@@ -0,0 +1,103 @@
+"""
+空闲时段（GET /schedule/free-slots）
+
+一次查询取出窗口内（含前一天，跨过午夜的事件会占用窗口开头）的定时事件，只取日期和时间列，
+重复系列在内存中按规则展开（窗口内有系列时再查一次被取消的日期）。忙碌区间按开始时间排序后，
+逐日在 [day_start, day_end) 内做一次扫描：游标停在已扫过区间的最远结束处，
+区间开始与游标之间足够长的空隙即一个空闲时段。总开销 O(n log n + 天数)。
+"""
+from datetime import datetime, timedelta
+
+from django.conf import settings
+
+from . import recurrence
+from .conflicts import MINUTES_PER_DAY, from_minutes, span
+from .models import Event, EventOccurrence
+
+
+def busy_intervals(user, start_date, end_date):
+    """[start_date - 1, end_date] 内定时事件的 (开始, 结束) 分钟数，按开始时间排序"""
+    rows = Event.objects.filter(
+        recurrence.events_in_window(start_date - timedelta(days=1), end_date),
+        user=user,
+        is_all_day=False,
+        start_time__isnull=False,
+    ).order_by().values_list('id', 'date', 'start_time', 'end_time', 'recurrence')
+
+    intervals = []
+    series = []
+    for event_id, day, start_time, end_time, rule in rows:
+        if rule:
+            series.append((event_id, day, start_time, end_time, rule))
+        else:
+            intervals.append(span(day, start_time, end_time))
+
+    if series:
+        first = start_date - timedelta(days=1)
+        cancelled = set(EventOccurrence.objects.filter(
+            event_id__in=[s[0] for s in series], cancelled=True, date__gte=first, date__lte=end_date
+        ).values_list('event_id', 'date'))
+        for event_id, day, start_time, end_time, rule in series:
+            for occurrence in recurrence.occurrence_dates(recurrence.parse_rule(rule), day, first, end_date):
+                if (event_id, occurrence) not in cancelled:
+                    intervals.append(span(occurrence, start_time, end_time))
+
+    intervals.sort()
+    return intervals
+
+
+def free_windows(busy, start_date, end_date, day_start, day_end, duration, not_before=None):
+    """
+    按天在 [day_start, day_end)（当天零点起的分钟数）内找出不短于 duration 分钟的空闲时段，
+    返回 [(开始, 结束)] 分钟数。busy 须按开始时间排序；not_before 之前的时间不算空闲
+    """
+    windows = []
+    i = 0
+    reach = None  # 已扫过区间的最远结束时间
+    day = start_date
+    while day <= end_date:
+        base = day.toordinal() * MINUTES_PER_DAY
+        lo, hi = base + day_start, base + day_end
+        cursor = lo if reach is None else max(lo, reach)
+        if not_before is not None:
+            cursor = max(cursor, not_before)
+        while i < len(busy) and busy[i][0] < hi:
+            start, end = busy[i]
+            if start - cursor >= duration:
+                windows.append((cursor, start))
+            cursor = max(cursor, end)
+            reach = end if reach is None else max(reach, end)
+            i += 1
+        if hi - cursor >= duration:
+            windows.append((cursor, hi))
+        day += timedelta(days=1)
+    return windows
+
+
+def free_slots(user, start_date, end_date, day_start, day_end, duration, now=None):
+    """用户在日期范围内的空闲时段；now（北京时间的 naive datetime）之前的时间不返回"""
+    not_before = None
+    if now is not None:
+        # 从当前时间向上取整到 FREE_SLOTS_ROUND_MINUTES，给出的开始时间更自然
+        minute = now.toordinal() * MINUTES_PER_DAY + now.hour * 60 + now.minute + (1 if now.second else 0)
+        step = settings.FREE_SLOTS_ROUND_MINUTES
+        not_before = -(-minute // step) * step
+    busy = busy_intervals(user, start_date, end_date)
+    return free_windows(busy, start_date, end_date, day_start, day_end, duration, not_before)
+
+
+def slot_data(window):
+    start, end = window
+    day, start_text = from_minutes(start)
+    _, end_text = from_minutes(end)
+    if end % MINUTES_PER_DAY == 0:
+        end_text = '24:00'
+    return {'date': day.isoformat(), 'start': start_text, 'end': end_text, 'minutes': end - start}
+
+
+def parse_clock(value):
+    """'HH:MM'（允许 24:00）-> 当天零点起的分钟数；格式错误抛出 ValueError"""
+    if value == '24:00':
+        return MINUTES_PER_DAY
+    parsed = datetime.strptime(value, '%H:%M')
+    return parsed.hour * 60 + parsed.minute
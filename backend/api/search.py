@@ -0,0 +1,180 @@
+"""
+事件全文搜索（SQLite FTS5）
+
+event_search 是 FTS5 虚拟表，每个事件一行，索引标题、地点与链接 URL；event_id 列（UNINDEXED）存放事件 id，
+搜索结果按 event_id 与 events.id 关联。events 的主键是 UUID，没有 INTEGER PRIMARY KEY，
+VACUUM 和表重建都可能重新编号 events 的 rowid，所以不用 rowid 关联。
+event_search 按 event_id 定位需要扫描整张索引表（UNINDEXED 列没有索引），触发器与搜索经 event_search_rows
+（event_id -> 索引行 rowid，两个方向都有索引）关联：搜索可以从 FTS 匹配出发，也可以按用户和日期顺序读 events、
+凑满结果即停止（短词）。FTS5 索引行的 rowid 不会被 VACUUM 改变。
+使用 trigram 分词：按任意三个连续字符建立索引，中文不需要分词也能按子串匹配，英文词的前缀自然也能匹配。
+索引由 events / event_links 上的触发器维护（见迁移 0015、0016），与事件、链接的写入在同一个事务中，
+bulk_create、级联删除和分片迁移的原始 SQL 也不会遗漏。
+
+注意：Django 在 SQLite 上修改 events / event_links 的某些字段时会重建整张表，触发器随旧表删除。
+每次 migrate 结束时 restore_triggers（post_migrate）检查触发器，缺失时重新安装并重建索引；
+也可手动运行 `manage.py rebuild_search_index`。
+
+查询按空白切分为若干词（全部需要匹配）：不少于 3 个字符的词走 FTS 索引并按 bm25 排序（标题权重最高），
+1-2 个字符的词（如"开会"）无法用 trigram 索引，在索引表上按 LIKE 子串过滤。
+"""
+from django.db import connections, router, transaction
+
+from .models import Event
+
+TRIGRAM = 3
+# bm25 的列权重：title, location, links
+WEIGHTS = (10.0, 4.0, 1.0)
+MAX_LIMIT = 200
+
+_LINKS = "(SELECT coalesce(group_concat(url, ' '), '') FROM event_links WHERE event_id = {id})"
+_ROW = "(SELECT row FROM event_search_rows WHERE event_id = {id})"
+_SYNC_LINKS = (
+    f"UPDATE event_search SET links = {_LINKS.format(id='{ref}.event_id')} "
+    f"WHERE rowid = {_ROW.format(id='{ref}.event_id')};"
+)
+
+SCHEMA = [
+    "CREATE VIRTUAL TABLE IF NOT EXISTS event_search USING fts5("
+    "event_id UNINDEXED, title, location, links, tokenize = 'trigram')",
+    "CREATE TABLE IF NOT EXISTS event_search_rows (event_id char(32) NOT NULL PRIMARY KEY, row integer NOT NULL) "
+    "WITHOUT ROWID",
+    "CREATE UNIQUE INDEX IF NOT EXISTS event_search_rows_row ON event_search_rows (row)",
+    "CREATE TRIGGER IF NOT EXISTS event_search_insert AFTER INSERT ON events BEGIN "
+    "INSERT INTO event_search (event_id, title, location, links) VALUES (new.id, new.title, new.location, ''); "
+    "INSERT INTO event_search_rows (event_id, row) VALUES (new.id, last_insert_rowid()); END",
+    "CREATE TRIGGER IF NOT EXISTS event_search_update AFTER UPDATE OF title, location ON events BEGIN "
+    "UPDATE event_search SET title = new.title, location = new.location "
+    f"WHERE rowid = {_ROW.format(id='new.id')}; END",
+    "CREATE TRIGGER IF NOT EXISTS event_search_delete AFTER DELETE ON events BEGIN "
+    f"DELETE FROM event_search WHERE rowid = {_ROW.format(id='old.id')}; "
+    "DELETE FROM event_search_rows WHERE event_id = old.id; END",
+    f"CREATE TRIGGER IF NOT EXISTS event_search_link_insert AFTER INSERT ON event_links BEGIN "
+    f"{_SYNC_LINKS.format(ref='new')} END",
+    f"CREATE TRIGGER IF NOT EXISTS event_search_link_update AFTER UPDATE ON event_links BEGIN "
+    f"{_SYNC_LINKS.format(ref='old')} {_SYNC_LINKS.format(ref='new')} END",
+    f"CREATE TRIGGER IF NOT EXISTS event_search_link_delete AFTER DELETE ON event_links BEGIN "
+    f"{_SYNC_LINKS.format(ref='old')} END",
+]
+
+DROP = [
+    "DROP TRIGGER IF EXISTS event_search_link_delete",
+    "DROP TRIGGER IF EXISTS event_search_link_update",
+    "DROP TRIGGER IF EXISTS event_search_link_insert",
+    "DROP TRIGGER IF EXISTS event_search_delete",
+    "DROP TRIGGER IF EXISTS event_search_update",
+    "DROP TRIGGER IF EXISTS event_search_insert",
+    "DROP TABLE IF EXISTS event_search_rows",
+    "DROP TABLE IF EXISTS event_search",
+]
+
+TRIGGERS = (
+    'event_search_insert', 'event_search_update', 'event_search_delete',
+    'event_search_link_insert', 'event_search_link_update', 'event_search_link_delete',
+)
+
+POPULATE = [
+    "INSERT INTO event_search (event_id, title, location, links) "
+    f"SELECT id, title, location, {_LINKS.format(id='events.id')} FROM events",
+    "INSERT INTO event_search_rows (event_id, row) SELECT event_id, rowid FROM event_search",
+]
+
+
+def rebuild(alias):
+    """重新安装 alias 中的索引表与触发器并按现有数据重建，返回索引的事件数"""
+    with transaction.atomic(using=alias), connections[alias].cursor() as cursor:
+        for sql in DROP + SCHEMA + POPULATE:
+            cursor.execute(sql)
+        cursor.execute("INSERT INTO event_search (event_search) VALUES ('optimize')")
+        cursor.execute("SELECT count(*) FROM event_search")
+        return cursor.fetchone()[0]
+
+
+def missing_triggers(alias):
+    """alias 中缺失的索引触发器；索引表不存在（迁移 0015 尚未执行）时为空"""
+    with connections[alias].cursor() as cursor:
+        cursor.execute(
+            "SELECT type, name FROM sqlite_master WHERE name = 'event_search' OR "
+            f"(type = 'trigger' AND name IN ({', '.join(['%s'] * len(TRIGGERS))}))",
+            TRIGGERS,
+        )
+        present = {name for _, name in cursor.fetchall()}
+    if 'event_search' not in present:
+        return []
+    return [name for name in TRIGGERS if name not in present]
+
+
+def restore_triggers(sender, using, **kwargs):
+    """post_migrate：重建 events / event_links 表的迁移会连同触发器一起删除，缺失时重新安装并重建索引"""
+    if connections[using].vendor == 'sqlite' and missing_triggers(using):
+        rebuild(using)
+
+
+def parse_query(text):
+    """查询文本 -> (FTS5 MATCH 表达式或 None, 短词列表)；每个词作为短语匹配，FTS 语法字符不生效"""
+    long_terms, short_terms = [], []
+    for term in text.split():
+        term = term.strip('"*')
+        if not term:
+            continue
+        (long_terms if len(term) >= TRIGRAM else short_terms).append(term)
+    match = ' AND '.join('"' + term.replace('"', '""') + '"' for term in long_terms) or None
+    return match, short_terms
+
+
+def _like(term):
+    return '%' + term.replace('\\', '\\\\').replace('%', '\\%').replace('_', '\\_') + '%'
+
+
+def search_ids(user, text, start_date=None, end_date=None, limit=50):
+    """
+    用户事件中匹配 text 的事件 id，按相关度（有可用 FTS 的词时）或日期倒序排列。
+    给出日期范围时只返回范围内的单次事件与和范围有交集的重复系列（与 events_in_window 相同）
+    """
+    match, short_terms = parse_query(text)
+    if match is None and not short_terms:
+        return []
+
+    where, params = ['e.user_id = %s'], [user.pk.hex]
+    if match is not None:
+        where.append('event_search MATCH %s')
+        params.append(match)
+    for term in short_terms:
+        where.append(
+            "(s.title LIKE %s ESCAPE '\\' OR s.location LIKE %s ESCAPE '\\' OR s.links LIKE %s ESCAPE '\\')"
+        )
+        params.extend([_like(term)] * 3)
+    if start_date is not None:
+        where.append("(CASE WHEN e.recurrence = '' THEN e.date >= %s "
+                     "ELSE e.recurrence_end IS NULL OR e.recurrence_end >= %s END)")
+        params.extend([start_date.isoformat()] * 2)
+    if end_date is not None:
+        where.append('e.date <= %s')
+        params.append(end_date.isoformat())
+
+    if match is not None:
+        order = 'bm25(event_search, {}, {}, {}), e.date DESC'.format(*WEIGHTS)
+    else:
+        order = 'e.date DESC'
+    sql = (
+        'SELECT e.id FROM event_search s JOIN event_search_rows r ON r.row = s.rowid '
+        'JOIN events e ON e.id = r.event_id '
+        f"WHERE {' AND '.join(where)} ORDER BY {order} LIMIT %s"
+    )
+    params.append(limit)
+    alias = router.db_for_read(Event)
+    with connections[alias].cursor() as cursor:
+        cursor.execute(sql, params)
+        return [row[0] for row in cursor.fetchall()]
+
+
+def search_events(user, text, start_date=None, end_date=None, limit=50):
+    """匹配的 Event 对象（带类型、附件及其 blob 与链接，序列化时不再逐个查询），顺序同 search_ids"""
+    ids = search_ids(user, text, start_date, end_date, limit)
+    if not ids:
+        return []
+    events = Event.objects.filter(pk__in=ids).select_related('calendar_type', 'attachment').prefetch_related(
+        'links', 'attachment__blob'
+    )
+    by_id = {event.pk.hex: event for event in events}
+    return [by_id[i] for i in ids if i in by_id]
@@ -1,4 +1,8 @@
+from django.conf import settings
 from rest_framework import serializers
+from . import recurrence
+from .downloads import signed_download_url
+from .previews import preview_url
 from .models import User, UserLocation, CalendarType, Event, EventLink, UploadedFile
 
 
@@ -12,7 +16,8 @@ class UserSerializer(serializers.ModelSerializer):
         read_only_fields = ['account_id', 'created_at', 'updated_at']
     
     def get_current_location(self, obj):
-        latest_location = obj.locations.first()
+        # 取自用户行上的冗余列，不额外查询 user_locations
+        latest_location = obj.current_location
         if latest_location:
             return {
                 'latitude': latest_location.latitude,
@@ -41,6 +46,9 @@ class CalendarTypeSerializer(serializers.ModelSerializer):
         read_only_fields = ['id', 'created_at', 'updated_at']
     
     def get_event_count(self, obj):
+        # 列表查询通过 annotate(num_events=...) 预先计算，避免逐个 COUNT
+        if hasattr(obj, 'num_events'):
+            return obj.num_events
         return obj.events.count()
 
 
@@ -73,18 +81,34 @@ class CalendarTypeCreateSerializer(serializers.Serializer):
 class UploadedFileSerializer(serializers.ModelSerializer):
     """上传文件序列化器"""
     url = serializers.SerializerMethodField()
+    download_url = serializers.SerializerMethodField()
+    preview_url = serializers.SerializerMethodField()
     name = serializers.CharField(source='original_name')
     
     class Meta:
         model = UploadedFile
-        fields = ['id', 'name', 'url', 'size', 'mime_type', 'created_at']
-        read_only_fields = ['id', 'url', 'size', 'mime_type', 'created_at']
+        fields = ['id', 'name', 'url', 'download_url', 'preview_url', 'size', 'mime_type', 'created_at']
+        read_only_fields = ['id', 'url', 'download_url', 'preview_url', 'size', 'mime_type', 'created_at']
     
     def get_url(self, obj):
         request = self.context.get('request')
         if obj.file and request:
             return request.build_absolute_uri(obj.file.url)
         return None
+    
+    def get_download_url(self, obj):
+        """经鉴权的下载地址（限时签名，可直接在浏览器中打开）"""
+        request = self.context.get('request')
+        if obj.file and request:
+            return signed_download_url(request, obj)
+        return None
+    
+    def get_preview_url(self, obj):
+        """缩略图 / PDF 首页预览地址（后台生成完成前为None）"""
+        request = self.context.get('request')
+        if request:
+            return preview_url(request, obj)
+        return None
 
 
 class EventLinkSerializer(serializers.ModelSerializer):
@@ -101,13 +125,14 @@ class EventSerializer(serializers.ModelSerializer):
     attachment = UploadedFileSerializer(read_only=True)
     color = serializers.SerializerMethodField()
     type_id = serializers.CharField(source='calendar_type.type_id', read_only=True)
+    occurrence_date = serializers.SerializerMethodField()
     
     class Meta:
         model = Event
         fields = [
             'id', 'title', 'date', 'is_all_day', 'start_time', 'end_time',
             'location', 'type_id', 'color', 'completed', 'completed_at',
-            'expanded', 'links', 'attachment', 'created_at', 'updated_at'
+            'expanded', 'recurrence', 'occurrence_date', 'links', 'attachment', 'created_at', 'updated_at'
         ]
         read_only_fields = ['id', 'color', 'completed_at', 'created_at', 'updated_at']
     
@@ -118,6 +143,19 @@ class EventSerializer(serializers.ModelSerializer):
         if obj.calendar_type:
             return obj.calendar_type.color
         return '#6B7280'
+    
+    def get_occurrence_date(self, obj):
+        # 只有重复事件展开出的各次发生带有 occurrence_date
+        occurrence_date = getattr(obj, 'occurrence_date', None)
+        return occurrence_date.isoformat() if occurrence_date else None
+
+
+def validate_recurrence(value):
+    """校验重复规则并返回规范化的文本"""
+    try:
+        return recurrence.normalize(value)
+    except recurrence.InvalidRule as e:
+        raise serializers.ValidationError(str(e))
 
 
 class EventCreateSerializer(serializers.Serializer):
@@ -132,6 +170,11 @@ class EventCreateSerializer(serializers.Serializer):
     # 使用CharField而不是URLField，允许更灵活的链接格式
     links = serializers.ListField(child=serializers.CharField(max_length=2000), required=False, default=list)
     attachment_id = serializers.UUIDField(required=False, allow_null=True)
+    # RRULE 子集，例如 FREQ=WEEKLY;BYDAY=MO,WE;COUNT=10
+    recurrence = serializers.CharField(max_length=255, required=False, allow_blank=True, default='')
+
+    def validate_recurrence(self, value):
+        return validate_recurrence(value)
 
 
 class EventUpdateSerializer(serializers.Serializer):
@@ -146,11 +189,17 @@ class EventUpdateSerializer(serializers.Serializer):
     completed = serializers.BooleanField(required=False)
     expanded = serializers.BooleanField(required=False)
     attachment_id = serializers.UUIDField(required=False, allow_null=True)
+    recurrence = serializers.CharField(max_length=255, required=False, allow_blank=True)
+
+    def validate_recurrence(self, value):
+        return validate_recurrence(value)
 
 
 class EventCompleteSerializer(serializers.Serializer):
     """完成事件的序列化器"""
     completed = serializers.BooleanField()
+    # 重复事件必须指定是哪一次发生
+    occurrence_date = serializers.DateField(required=False)
 
 
 class LinkSerializer(serializers.Serializer):
@@ -161,6 +210,7 @@ class LinkSerializer(serializers.Serializer):
 class LoginSerializer(serializers.Serializer):
     """登录序列化器"""
     account_id = serializers.CharField(max_length=255)
+    device_id = serializers.CharField(max_length=64, required=False, allow_blank=True, default='')
 
 
 class LocationUpdateSerializer(serializers.Serializer):
@@ -170,6 +220,37 @@ class LocationUpdateSerializer(serializers.Serializer):
     accuracy = serializers.FloatField(required=False, allow_null=True)
 
 
+class LocationFixSerializer(serializers.Serializer):
+    """批量上报中的单个定位点"""
+    latitude = serializers.FloatField(min_value=-90, max_value=90)
+    longitude = serializers.FloatField(min_value=-180, max_value=180)
+    accuracy = serializers.FloatField(required=False, allow_null=True)
+    timestamp = serializers.DateTimeField()
+
+
+class LocationBatchSerializer(serializers.Serializer):
+    """批量位置上报序列化器"""
+    points = LocationFixSerializer(many=True, allow_empty=False)
+
+    def validate_points(self, value):
+        max_points = settings.LOCATION_BATCH_MAX_POINTS
+        if len(value) > max_points:
+            raise serializers.ValidationError(f"At most {max_points} points per batch")
+        return value
+
+
+class UploadSessionCreateSerializer(serializers.Serializer):
+    """分块续传会话创建序列化器"""
+    name = serializers.CharField(max_length=255)
+    size = serializers.IntegerField(min_value=1)
+    mime_type = serializers.CharField(max_length=100, required=False, allow_blank=True, default='')
+
+    def validate_size(self, value):
+        if value > settings.ATTACHMENT_MAX_BYTES:
+            raise serializers.ValidationError('File size exceeds 10MB limit')
+        return value
+
+
 class UserUpdateSerializer(serializers.Serializer):
     """用户信息更新序列化器"""
     home_address = serializers.CharField(required=False, allow_blank=True)
@@ -0,0 +1,289 @@
+"""
+按用户分片存储（JARVIS_SHARDS=N 时启用）
+
+每个用户的日程数据（日历类型、事件、链接、重复事件例外、附件记录、位置、续传会话）存放在自己所属的
+分片库 shards/shard<i>.sqlite3 中；users、access_tokens、file_blobs 等全局表仍在主库（default）。
+不同分片的写入互不排队（每个分片有各自的写锁），单机可承载的并发写入随分片数增加。
+
+- 用户所在分片记录在 users.shard，新用户按 account_id 的哈希分配，首次登录时创建并迁移分片库；
+  shard 为空的老用户数据仍在主库，由 `manage.py rebalance_shards` 迁入分片
+- 请求中用户的分片在鉴权成功后激活（contextvar），ShardRouter 据此路由分片表的查询；
+  请求之外（管理命令、后台线程）使用 use_db / use_user_db 显式指定
+- 分片库不启用外键约束：分片表对 users、file_blobs 的引用跨越了数据库，由应用维护
+- 分片数只能增加；增加后运行 rebalance_shards 把用户迁移到新的哈希位置
+"""
+import contextvars
+import hashlib
+import os
+import threading
+from contextlib import contextmanager, nullcontext
+
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction
+from django.conf import settings
+from django.core.exceptions import MiddlewareNotUsed
+from django.core.management import call_command
+from django.db import DEFAULT_DB_ALIAS, connections, transaction
+
+from jarvis_backend.sqlite.base import WriterLock
+
+from .models import CalendarType, Event, EventLink, EventOccurrence, UploadedFile, UploadSession, User, UserLocation
+
+# 分片表及其归属用户的查询路径，按复制顺序排列（被引用的在前）
+SHARDED_MODELS = [
+    (CalendarType, 'user'),
+    (UploadedFile, 'user'),
+    (Event, 'user'),
+    (EventLink, 'event__user'),
+    (EventOccurrence, 'event__user'),
+    (UserLocation, 'user'),
+    (UploadSession, 'user'),
+]
+_SHARDED = {model for model, _ in SHARDED_MODELS}
+
+_current_db = contextvars.ContextVar('shard_db', default=None)
+_ready = set()
+_ready_lock = threading.Lock()
+
+
+class ShardNotSelected(RuntimeError):
+    """访问分片表时没有激活任何用户的分片"""
+
+
+def enabled():
+    return settings.SHARD_COUNT > 0
+
+
+def shard_alias(index):
+    return f'shard{index}'
+
+
+def shard_for(account_id):
+    """account_id -> 分片编号（稳定哈希，与进程无关）"""
+    digest = hashlib.sha1(account_id.encode('utf-8')).hexdigest()
+    return int(digest[:8], 16) % settings.SHARD_COUNT
+
+
+def user_db(user):
+    """用户数据所在的数据库别名；未分配分片的用户（或未启用分片）为主库"""
+    if not enabled() or user.shard is None:
+        return DEFAULT_DB_ALIAS
+    return shard_alias(user.shard)
+
+
+def data_databases():
+    """存放用户数据的全部数据库（GC 等需要遍历时使用）；尚未创建的分片先创建"""
+    if not enabled():
+        return [DEFAULT_DB_ALIAS]
+    aliases = [shard_alias(i) for i in range(settings.SHARD_COUNT)]
+    for alias in aliases:
+        ensure_shard(alias)
+    return [DEFAULT_DB_ALIAS] + aliases
+
+
+def current_db():
+    return _current_db.get() or DEFAULT_DB_ALIAS
+
+
+def activate(user):
+    """在当前上下文中激活用户的分片（鉴权成功后调用）"""
+    _current_db.set(user_db(user))
+
+
+@contextmanager
+def use_db(alias):
+    token = _current_db.set(alias)
+    try:
+        yield alias
+    finally:
+        _current_db.reset(token)
+
+
+def use_user_db(user):
+    return use_db(user_db(user))
+
+
+@contextmanager
+def atomic(using=None, central=False):
+    """
+    分片上的事务；central=True 时同时在主库开启事务（外层），分片先提交、主库后提交。
+    只涉及分片表的写入不要带 central，否则所有用户的写入会在主库写锁上排队。
+    同时写多个库时写锁一律按“先主库、后分片”的顺序获取（见 move_user），不能在持有分片写锁时再写主库。
+    """
+    using = using or current_db()
+    outer = transaction.atomic(using=DEFAULT_DB_ALIAS) if central else nullcontext()
+    with outer, transaction.atomic(using=using):
+        yield
+
+
+def ensure_shard(alias):
+    """分片库不存在或未迁移时执行迁移（每个进程每个分片只检查一次，跨进程用文件锁互斥）"""
+    if alias == DEFAULT_DB_ALIAS or alias in _ready:
+        return
+    with _ready_lock:
+        if alias in _ready:
+            return
+        os.makedirs(settings.SHARD_DIR, exist_ok=True)
+        lock = WriterLock(f'{settings.DATABASES[alias]["NAME"]}.migrate.lock')
+        lock.acquire()
+        try:
+            call_command('migrate', database=alias, verbosity=0, interactive=False)
+        finally:
+            lock.close()
+            # 迁移结束时 schema editor 会重新打开外键检查，关闭连接使之后的连接按 init_command 关闭外键
+            connections[alias].close()
+        _ready.add(alias)
+
+
+def assign_shard(account_id):
+    """新用户的分片：(shard 编号, 数据库别名)；未启用分片时为 (None, 'default')"""
+    if not enabled():
+        return None, DEFAULT_DB_ALIAS
+    index = shard_for(account_id)
+    return index, shard_alias(index)
+
+
+# ==================== 路由 ====================
+
+def _db_from_instance(instance):
+    if instance is None:
+        return None
+    if isinstance(instance, User):
+        return user_db(instance)
+    if type(instance) in _SHARDED:
+        if instance._state.db:
+            return instance._state.db
+        for name in ('user', 'event'):
+            related = instance._state.fields_cache.get(name)
+            if related is not None:
+                return _db_from_instance(related)
+    return None
+
+
+class ShardRouter:
+    def _route(self, model, hints):
+        if model not in _SHARDED:
+            # 全局表：配置了副本时交给 ReplicaRouter，否则固定主库（不能沿用分片对象的 _state.db）
+            return None if settings.DATABASE_REPLICAS else DEFAULT_DB_ALIAS
+        alias = _db_from_instance(hints.get('instance')) or _current_db.get()
+        if alias is None:
+            raise ShardNotSelected(f'No shard selected for {model._meta.label}; use api.sharding.use_user_db()')
+        return alias
+
+    def db_for_read(self, model, **hints):
+        return self._route(model, hints)
+
+    def db_for_write(self, model, **hints):
+        return self._route(model, hints)
+
+    def allow_relation(self, obj1, obj2, **hints):
+        return True
+
+    def allow_migrate(self, db, app_label, model_name=None, **hints):
+        # 分片库使用完整的表结构（全局表在分片中保持为空），主库交给后续路由器决定
+        return True if db.startswith('shard') else None
+
+
+class ShardMiddleware:
+    """每个请求开始时清空分片上下文，避免复用线程时沿用上一个请求的用户分片"""
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        if not enabled():
+            raise MiddlewareNotUsed()
+        self.get_response = get_response
+        self.is_async = iscoroutinefunction(get_response)
+        if self.is_async:
+            markcoroutinefunction(self)
+
+    def __call__(self, request):
+        if self.is_async:
+            return self.__acall__(request)
+        token = _current_db.set(None)
+        try:
+            return self.get_response(request)
+        finally:
+            _current_db.reset(token)
+
+    async def __acall__(self, request):
+        token = _current_db.set(None)
+        try:
+            return await self.get_response(request)
+        finally:
+            _current_db.reset(token)
+
+
+# ==================== 迁移 ====================
+
+def _copy_rows(user_id, source, target):
+    """把用户在 source 中的全部分片数据复制到 target（主键不变，已存在的行跳过），返回行数"""
+    copied = 0
+    for model, owner in SHARDED_MODELS:
+        rows = list(model.objects.using(source).filter(**{f'{owner}_id' if owner == 'user' else owner: user_id}))
+        if rows:
+            model.objects.using(target).bulk_create(rows, ignore_conflicts=True)
+            copied += len(rows)
+    return copied
+
+
+def _delete_rows(user_id, alias):
+    for model, owner in reversed(SHARDED_MODELS):
+        lookup = f'{owner}_id' if owner == 'user' else owner
+        model.objects.using(alias).filter(**{lookup: user_id})._raw_delete(alias)
+
+
+def move_user(user, target):
+    """
+    把用户数据从当前所在库迁移到 target 并更新 users.shard。
+    主库、源库、目标库的写事务持续到迁移结束，期间其他写入在这些库的写锁上等待。
+    主库事务在最外层：与 atomic(central=True) 一样先取主库写锁再取分片写锁，
+    否则迁移持有分片写锁等待主库、请求持有主库写锁等待分片，两边互相等待。
+    """
+    source = user_db(user)
+    if source == target:
+        return 0
+    ensure_shard(target)
+    index = None if target == DEFAULT_DB_ALIAS else int(target[len('shard'):])
+    with (
+        transaction.atomic(using=DEFAULT_DB_ALIAS),
+        transaction.atomic(using=source),
+        transaction.atomic(using=target),
+    ):
+        copied = _copy_rows(user.pk, source, target)
+        User.objects.using(DEFAULT_DB_ALIAS).filter(pk=user.pk).update(shard=index)
+        _delete_rows(user.pk, source)
+    user.shard = index
+    return copied
+
+
+def stray_user_ids(alias):
+    """alias 中存有数据、但记录的分片不是 alias 的用户（迁移期间仍写入旧库的请求留下的数据）"""
+    present = set()
+    for model, owner in SHARDED_MODELS:
+        if owner == 'user':
+            present.update(model.objects.using(alias).values_list('user_id', flat=True).distinct())
+    stray = []
+    for user in User.objects.using(DEFAULT_DB_ALIAS).filter(pk__in=present).only('pk', 'shard'):
+        if user_db(user) != alias:
+            stray.append(user.pk)
+    return stray
+
+
+def sweep(alias):
+    """
+    把 alias 中不属于它的用户数据合并到这些用户当前的分片，返回处理的用户数。
+    锁顺序同 move_user；在主库事务内读取用户的分片，合并期间不会被并发的迁移改变。
+    """
+    moved = 0
+    for user_id in stray_user_ids(alias):
+        with transaction.atomic(using=DEFAULT_DB_ALIAS):
+            user = User.objects.using(DEFAULT_DB_ALIAS).only('pk', 'shard').get(pk=user_id)
+            target = user_db(user)
+            if target == alias:
+                continue
+            ensure_shard(target)
+            with transaction.atomic(using=alias), transaction.atomic(using=target):
+                _copy_rows(user_id, alias, target)
+                _delete_rows(user_id, alias)
+        moved += 1
+    return moved
@@ -0,0 +1,184 @@
+"""
+无状态访问令牌（JARVIS_TOKEN_FORMAT=signed）
+
+格式：jv1.<kid>.<payload>.<signature>
+  - payload：base64url 编码的 JSON，{"sub": 用户 id, "sh": 分片, "iat": 签发时间, "exp": 过期时间, "jti": 随机 id}
+    iat 精确到微秒：按用户撤销后同一秒内重新登录签发的 token 不会被误判为撤销前签发
+  - signature：以 kid 对应的密钥对 "<kid>.<payload>" 计算的 HMAC-SHA256
+校验只在内存中完成（签名、过期时间、撤销集合），不查询 access_tokens。鉴权得到的用户只带 id 与分片，
+视图访问其他字段时才从 users 表加载。
+
+撤销：注销时把 jti 写入 revoked_tokens（rebalance_shards 迁移用户后按用户撤销其之前签发的全部 token）。
+每个进程在内存中持有未过期的撤销记录，每 SIGNED_TOKEN_REVOCATION_REFRESH_SECONDS 秒增量同步一次，
+其他进程的撤销在该时间内生效；过期的记录由 purge_tokens 删除，集合大小只与有效期内的注销次数有关。
+
+密钥轮换：SIGNED_TOKEN_KEYS 中第一个密钥用于签发，其余只用于校验。轮换时把新密钥加在最前面，
+旧密钥保留到它签发的 token 全部过期（ACCESS_TOKEN_TTL_SECONDS）后再移除。
+"""
+import base64
+import json
+import secrets
+import threading
+import time
+from dataclasses import dataclass
+from datetime import datetime, timedelta, timezone as dt_timezone
+
+from django.conf import settings
+from django.utils import timezone
+from django.utils.crypto import constant_time_compare, salted_hmac
+
+from .models import RevokedToken, User
+
+PREFIX = 'jv1'
+_SALT = 'api.signed_tokens'
+# 增量同步时向前多取的秒数：并发提交的撤销记录 created_at 可能略早于上次同步时看到的最大值
+_SYNC_OVERLAP = timedelta(seconds=5)
+
+_revoked_jtis = {}  # jti -> 过期时间戳
+_revoked_users = {}  # 用户 id -> 此时间戳之前签发的 token 全部无效
+_sync = {'at': None, 'seen': None}  # 上次同步的 monotonic 时间、看到的最大 created_at
+_lock = threading.Lock()
+
+
+class InvalidToken(Exception):
+    pass
+
+
+@dataclass
+class SignedToken:
+    token: str
+    user_id: str
+    shard: int | None
+    jti: str
+    issued_at: float
+    expires: int
+
+    @property
+    def expires_at(self):
+        return datetime.fromtimestamp(self.expires, tz=dt_timezone.utc)
+
+
+def is_signed(token):
+    return token.startswith(PREFIX + '.')
+
+
+def _b64encode(data):
+    return base64.urlsafe_b64encode(data).rstrip(b'=').decode('ascii')
+
+
+def _b64decode(text):
+    return base64.urlsafe_b64decode(text + '=' * (-len(text) % 4))
+
+
+def _signature(secret, kid, payload):
+    return _b64encode(salted_hmac(_SALT, f'{kid}.{payload}', secret=secret, algorithm='sha256').digest())
+
+
+def issue(user):
+    """为用户签发签名 token（不写数据库）"""
+    kid, secret = settings.SIGNED_TOKEN_KEYS[0]
+    now = time.time()
+    claims = {
+        'sub': user.pk.hex,
+        'sh': user.shard,
+        'iat': round(now, 6),
+        'exp': int(now) + settings.ACCESS_TOKEN_TTL_SECONDS,
+        'jti': secrets.token_hex(12),
+    }
+    payload = _b64encode(json.dumps(claims, separators=(',', ':')).encode('utf-8'))
+    token = f'{PREFIX}.{kid}.{payload}.{_signature(secret, kid, payload)}'
+    return SignedToken(token, claims['sub'], claims['sh'], claims['jti'], claims['iat'], claims['exp'])
+
+
+def verify(token, refresh=True):
+    """
+    校验签名、过期时间与撤销集合，返回 SignedToken；无效时抛出 InvalidToken（消息即返回给客户端的原因）。
+    异步调用方先在线程中 refresh_revocations()，再以 refresh=False 调用
+    """
+    try:
+        prefix, kid, payload, signature = token.split('.')
+    except ValueError:
+        raise InvalidToken('Invalid token')
+    secret = dict(settings.SIGNED_TOKEN_KEYS).get(kid)
+    if prefix != PREFIX or secret is None or not constant_time_compare(signature, _signature(secret, kid, payload)):
+        raise InvalidToken('Invalid token')
+    try:
+        claims = json.loads(_b64decode(payload))
+        signed = SignedToken(token, claims['sub'], claims['sh'], claims['jti'], claims['iat'], claims['exp'])
+    except (ValueError, KeyError, TypeError):
+        raise InvalidToken('Invalid token')
+    if signed.expires < time.time():
+        raise InvalidToken('Token expired')
+    if refresh:
+        refresh_revocations()
+    if is_revoked(signed):
+        raise InvalidToken('Token revoked')
+    return signed
+
+
+def token_user(signed):
+    """鉴权得到的用户：只带 id 与分片，访问其他字段时一次加载（见 User.refresh_from_db）"""
+    return User.from_db('default', ['id', 'shard'], [User._meta.pk.to_python(signed.user_id), signed.shard])
+
+
+# ==================== 撤销 ====================
+
+def is_revoked(signed):
+    if signed.jti in _revoked_jtis:
+        return True
+    revoked_before = _revoked_users.get(signed.user_id)
+    return revoked_before is not None and signed.issued_at < revoked_before
+
+
+def _remember(jti, user_id, issued_before, expires_at):
+    if jti:
+        _revoked_jtis[jti] = expires_at.timestamp()
+    elif user_id:
+        _revoked_users[user_id] = max(_revoked_users.get(user_id, 0), issued_before.timestamp())
+
+
+def refresh_due():
+    return _sync['at'] is None or time.monotonic() - _sync['at'] >= settings.SIGNED_TOKEN_REVOCATION_REFRESH_SECONDS
+
+
+def refresh_revocations(force=False):
+    """距上次同步超过 SIGNED_TOKEN_REVOCATION_REFRESH_SECONDS 秒时，从 revoked_tokens 增量加载新的撤销记录"""
+    if not force and not refresh_due():
+        return
+    with _lock:
+        if not force and not refresh_due():
+            return
+        rows = RevokedToken.objects.filter(expires_at__gte=timezone.now())
+        if _sync['seen'] is not None:
+            rows = rows.filter(created_at__gte=_sync['seen'] - _SYNC_OVERLAP)
+        for jti, user_id, issued_before, expires_at, created_at in rows.values_list(
+            'jti', 'user_id', 'issued_before', 'expires_at', 'created_at'
+        ):
+            _remember(jti, user_id.hex if user_id else None, issued_before, expires_at)
+            if _sync['seen'] is None or created_at > _sync['seen']:
+                _sync['seen'] = created_at
+        # 丢弃已过期的记录：对应的 token 已经因过期无法通过校验
+        cutoff = time.time()
+        for jti in [j for j, exp in _revoked_jtis.items() if exp < cutoff]:
+            del _revoked_jtis[jti]
+        horizon = cutoff - settings.ACCESS_TOKEN_TTL_SECONDS
+        for user_id in [u for u, ts in _revoked_users.items() if ts < horizon]:
+            del _revoked_users[user_id]
+        _sync['at'] = time.monotonic()
+
+
+def revoke(signed):
+    """撤销一个签名 token（注销），本进程立即生效"""
+    RevokedToken.objects.create(jti=signed.jti, expires_at=signed.expires_at)
+    with _lock:
+        _revoked_jtis[signed.jti] = signed.expires
+
+
+def revoke_user_tokens(user_id):
+    """撤销用户此前签发的全部签名 token（例如用户被迁移到其他分片，token 中的分片已失效）"""
+    now = timezone.now()
+    RevokedToken.objects.create(
+        user_id=user_id, issued_before=now, expires_at=now + timedelta(seconds=settings.ACCESS_TOKEN_TTL_SECONDS)
+    )
+    with _lock:
+        _remember('', user_id.hex, now, None)
@@ -0,0 +1,108 @@
+"""
+流式 JSON 响应（events_list / agent_info 的大范围查询）
+
+响应体与 make_response 完全相同（同样的信封、键顺序与 DRF JSONRenderer 的紧凑编码），只是分块写出：
+先写信封和列表之前的字段，列表元素每 STREAM_CHUNK_SIZE 个序列化一次写出，最后写列表之后的字段
+（可以是在列表写完后才求值的统计）。查询用 iterator / aiterator 分块读取，内存占用只与块大小有关。
+
+响应在视图返回之后才生成：分片与副本的上下文（contextvar）此时已经重置，
+查询需在视图中用 .using() 固定数据库（见 views.stream_db）。
+"""
+import logging
+
+from django.conf import settings
+from django.http import StreamingHttpResponse
+from django.utils import timezone
+from rest_framework.utils.encoders import JSONEncoder
+
+logger = logging.getLogger(__name__)
+
+# 与 DRF JSONRenderer 的默认设置相同：不转义中文、紧凑分隔符、不允许 NaN
+_encoder = JSONEncoder(ensure_ascii=False, separators=(',', ':'), allow_nan=False)
+
+
+def dumps(value):
+    # 与 JSONRenderer 一样转义 U+2028 / U+2029（在 JavaScript 字符串字面量中非法）
+    return _encoder.encode(value).replace('\u2028', '\\u2028').replace('\u2029', '\\u2029')
+
+
+def _open(mapping):
+    """字典编码后去掉结尾的 }，便于继续追加键"""
+    return dumps(mapping)[:-1]
+
+
+class JsonStream:
+    """
+    make_response({..., list_key: [...], ...}) 的分块写出。
+    data 中 list_key 的值被忽略，由 items 提供；之后的键如果值是可调用对象，在列表写完后调用取值。
+    serialize(chunk) 把一块元素转为可编码的列表
+    """
+
+    def __init__(self, data, list_key, serialize):
+        keys = list(data)
+        position = keys.index(list_key)
+        self.before = {key: data[key] for key in keys[:position]}
+        self.after = [(key, data[key]) for key in keys[position + 1:]]
+        self.list_key = list_key
+        self.serialize = serialize
+
+    def head(self):
+        envelope = _open({'success': True, 'server_time': timezone.now().isoformat()})
+        data = _open(self.before)
+        separator = ',' if self.before else ''
+        return f'{envelope},"data":{data}{separator}{dumps(self.list_key)}:['
+
+    def chunk(self, items, first):
+        body = ','.join(dumps(item) for item in self.serialize(items))
+        return body if first else ',' + body
+
+    def tail(self):
+        after = {key: value() if callable(value) else value for key, value in self.after}
+        return ']' + (',' + dumps(after)[1:] if after else '}') + '}'
+
+
+def _chunks(stream, items, chunk_size):
+    yield stream.head()
+    batch, first = [], True
+    try:
+        for item in items:
+            batch.append(item)
+            if len(batch) >= chunk_size:
+                yield stream.chunk(batch, first)
+                batch, first = [], False
+        if batch:
+            yield stream.chunk(batch, first)
+        yield stream.tail()
+    except Exception:
+        # 响应头已经发出，无法再返回错误响应；记录后中断连接，客户端得到不完整的 JSON
+        logger.exception('Streaming response failed')
+        raise
+
+
+async def _achunks(stream, items, chunk_size):
+    yield stream.head()
+    batch, first = [], True
+    try:
+        async for item in items:
+            batch.append(item)
+            if len(batch) >= chunk_size:
+                yield stream.chunk(batch, first)
+                batch, first = [], False
+        if batch:
+            yield stream.chunk(batch, first)
+        yield stream.tail()
+    except Exception:
+        logger.exception('Streaming response failed')
+        raise
+
+
+def stream_response(stream, items, chunk_size=None):
+    """同步视图：items 为（惰性的）可迭代对象"""
+    chunks = _chunks(stream, items, chunk_size or settings.STREAM_CHUNK_SIZE)
+    return StreamingHttpResponse(chunks, content_type='application/json')
+
+
+def astream_response(stream, items, chunk_size=None):
+    """异步视图：items 为异步可迭代对象（ASGI 下同步迭代器会被整体缓冲，不能用于流式输出）"""
+    chunks = _achunks(stream, items, chunk_size or settings.STREAM_CHUNK_SIZE)
+    return StreamingHttpResponse(chunks, content_type='application/json')
@@ -1,3 +1,1875 @@
-from django.test import TestCase
+"""
+接口查询预算：api/urls.py 中的每个路由都在接近真实的数据上断言查询数与响应时间上限
 
-# Create your tests here.
+- 两个账号的数据结构相同、规模不同（SMALL_SCALE / LARGE_SCALE 倍的事件、重复系列、链接和附件），
+  同一请求分别以两个账号执行：两边的查询数必须相同（与数据量无关，N+1 在这里暴露），
+  且等于 queries= 或不超过 max_queries= 的预算
+- 超出预算时失败信息列出两边次数不同的语句与全部 SQL
+- 响应时间上限按请求计（默认 DEFAULT_MAX_MS），较慢的机器可用 JARVIS_TEST_TIME_SCALE 按比例放宽
+- 查询在所有数据库连接（含分片）上统计；测试在事务中运行，atomic() 产生的 SAVEPOINT / RELEASE 不计入
+- 每个路由对应一个 test_<路由名> 方法，test_every_route_has_budget 保证新增路由时同时补上预算
+
+文件后半部分是各模块的行为测试（写锁与锁顺序、续传上传、附件去重与垃圾回收、重复规则展开、签名 token、
+冲突与空闲时段、降采样、实时变更通道、读写分离等）。
+
+运行（在 backend 目录下）：python manage.py test api
+"""
+import asyncio
+import json
+import os
+import re
+import shutil
+import sqlite3
+import subprocess
+import sys
+import tempfile
+import threading
+import time as clock
+import uuid
+from collections import Counter
+from contextlib import ExitStack
+from datetime import date, datetime, time, timedelta, timezone as dt_timezone
+from io import BytesIO
+from random import Random
+from unittest import mock
+
+from asgiref.sync import async_to_sync, sync_to_async
+from django.conf import settings
+from django.core.cache import cache
+from django.core.files.base import ContentFile
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.db import OperationalError, connections, router, transaction
+from django.core.management import call_command
+from django.http import HttpResponse
+from django.test import (
+    AsyncClient, AsyncRequestFactory, Client, RequestFactory, SimpleTestCase, TestCase, TransactionTestCase, override_settings,
+)
+from django.test.client import MULTIPART_CONTENT
+from django.urls import reverse
+from django.utils import timezone
+from rest_framework.test import force_authenticate
+
+from jarvis_backend.sqlite.base import WriterLock, is_read_only
+
+from . import async_views, commute, realtime, recurrence, replicas, search, sharding, signed_tokens, urls, views
+from .attachments import create_session, drain_deletions, store_upload, write_chunk
+from .authentication import issue_token, purge_tokens, revoke_token
+from .conflicts import conflicts_for, conflicts_in_range, find_conflicts, from_minutes, interval_of, to_minutes
+from .downloads import RangeNotSatisfiable, parse_range, signed_download_url
+from .garbage import collect_garbage, reconcile_blob_refs, stray_files
+from .geo import downsample_fixes, haversine_m
+from .models import (
+    AccessToken, CalendarType, Event, EventLink, EventOccurrence, FileBlob, FileDeletion, RevokedToken, UploadedFile, User,
+)
+from .previews import preview_url
+from .schedule import free_slots, free_windows, parse_clock, slot_data
+from .views import beijing_today, store_user_locations, user_detail
+
+SMALL_SCALE = 1
+LARGE_SCALE = 5
+DEFAULT_MAX_MS = 500
+TIME_SCALE = float(os.getenv('JARVIS_TEST_TIME_SCALE', '1'))
+# 比较两边的语句时，IN (%s, %s, ...) 的参数个数不算差别
+_PARAM_LIST = re.compile(r'%s(, %s)+')
+
+
+class QueryLog:
+    """execute_wrapper：记录所有连接上执行的 SQL（[别名] 语句）"""
+
+    IGNORED = ('SAVEPOINT ', 'RELEASE SAVEPOINT ', 'ROLLBACK TO SAVEPOINT ')
+
+    def __init__(self):
+        self.queries = []
+        self._stack = None
+
+    def __enter__(self):
+        self._stack = ExitStack()
+        for alias in connections:
+            self._stack.enter_context(connections[alias].execute_wrapper(self))
+        return self
+
+    def __exit__(self, *exc_info):
+        self._stack.close()
+
+    def __call__(self, execute, sql, params, many, context):
+        if not sql.startswith(self.IGNORED):
+            self.queries.append(f'[{context["connection"].alias}] {sql}')
+        return execute(sql, params, many, context)
+
+
+async def read_stream(stream):
+    """异步流式响应（JARVIS_ASYNC_VIEWS=1）的全部内容"""
+    return b''.join([chunk async for chunk in stream])
+
+
+class Account:
+    """一个测试账号及其数据；scale 倍的事件、重复系列与附件"""
+
+    def __init__(self, account_id, scale):
+        self.scale = scale
+        login = Client().post(
+            '/api/v1/auth/login', {'account_id': account_id, 'device_id': 'budget'}, content_type='application/json'
+        )
+        self.token = login.json()['data']['access_token']
+        self.user = User.objects.get(account_id=account_id)
+        self.user.home_address = 'CUHK'
+        self.user.school_address = 'HKU'
+        self.user.save()
+        now = timezone.now()
+        store_user_locations(self.user, [
+            {'latitude': 22.4196, 'longitude': 114.2068, 'accuracy': 10, 'timestamp': now - timedelta(minutes=5)},
+            {'latitude': 22.2830, 'longitude': 114.1371, 'accuracy': 8, 'timestamp': now},
+        ])
+
+        with sharding.use_user_db(self.user):
+            types = list(CalendarType.objects.filter(user=self.user))
+            self.custom_type = CalendarType.objects.create(
+                user=self.user, type_id='gym_budget', name='Gym', color='#A855F7', is_deletable=True
+            )
+            types.append(self.custom_type)
+
+            self.files = [
+                store_upload(self.user, SimpleUploadedFile(
+                    f'notes-{i}.txt', f'{account_id} attachment {i}'.encode(), content_type='text/plain'
+                ))
+                for i in range(scale * 2)
+            ]
+            # 一半的附件已生成预览图（预览任务在事务提交后才执行，测试中直接写入）
+            for file_obj in self.files[::2]:
+                blob = file_obj.blob
+                blob.preview.save(f'{blob.sha256}.preview.webp', ContentFile(b'RIFF preview'), save=False)
+                blob.preview_status = FileBlob.PREVIEW_READY
+                blob.save()
+            self.spare_file = self.files[-1]
+
+            today = beijing_today()
+            events = []
+            for i in range(scale * 10):
+                timed = i % 3 != 0
+                start = time(8 + i % 10, 30 if i % 2 else 0)
+                events.append(Event(
+                    user=self.user,
+                    calendar_type=types[i % len(types)],
+                    title=f'Team meeting {i}' if i % 2 else f'复习 Chapter {i}',
+                    date=today + timedelta(days=i % 14),
+                    is_all_day=not timed,
+                    start_time=start if timed else None,
+                    end_time=time(start.hour + 1, start.minute) if timed else None,
+                    location='Library' if i % 2 else 'Room 101',
+                    completed=i % 5 == 0,
+                    attachment=self.files[i % len(self.files)] if i % 3 == 0 else None,
+                ))
+            for i in range(scale * 2):
+                events.append(Event(
+                    user=self.user,
+                    calendar_type=types[i % len(types)],
+                    title=f'Workout {i}',
+                    date=today - timedelta(days=7),
+                    is_all_day=False,
+                    start_time=time(7, 0),
+                    end_time=time(7, 45),
+                    recurrence='FREQ=DAILY' if i % 2 else 'FREQ=WEEKLY;BYDAY=MO,WE,FR',
+                ))
+            Event.objects.bulk_create(events)
+            EventLink.objects.bulk_create([
+                EventLink(event=event, url=f'https://example.com/{event.pk}/{n}')
+                for event in events for n in range(2)
+            ])
+            self.series = [e for e in events if e.recurrence]
+            EventOccurrence.objects.bulk_create([
+                EventOccurrence(event=series, date=today - timedelta(days=1), completed=True, completed_at=now)
+                for series in self.series
+            ])
+
+            # 单次事件：带附件与链接的 / 没有附件的
+            self.event = events[0]
+            self.plain_event = events[1]
+            self.daily = next(e for e in self.series if e.recurrence == 'FREQ=DAILY')
+
+    def client(self):
+        return Client(HTTP_AUTHORIZATION=f'Bearer {self.token}')
+
+    def upload_session(self, complete=False):
+        """8 字节的续传会话；complete 时已写入全部数据（内容因账号而异，不会与对方的 blob 去重）"""
+        with sharding.use_user_db(self.user):
+            session = create_session(self.user, 'report.bin', 8, 'application/octet-stream')
+            if complete:
+                write_chunk(session, BytesIO(f'{self.scale:08d}'.encode()), 0)
+            return session
+
+
+class ApiTestCase(TestCase):
+    """上传文件写入临时目录、不启动后台线程的测试基类"""
+    # 启用分片时用户数据在 shard<i> 库中
+    databases = '__all__'
+
+    def _should_check_constraints(self, connection):
+        # 分片库中的 user_id 指向主库的 users，跨库外键不检查
+        return connection.alias == 'default' and super()._should_check_constraints(connection)
+
+    @classmethod
+    def setUpClass(cls):
+        cls._media = tempfile.mkdtemp(prefix='jarvis-test-media-')
+        cls._settings = override_settings(
+            MEDIA_ROOT=os.path.join(cls._media, 'media'),
+            UPLOAD_SESSION_DIR=os.path.join(cls._media, 'upload_sessions'),
+            # 预算按随机 token 计：每个请求鉴权查询一次 access_tokens
+            ACCESS_TOKEN_FORMAT='opaque',
+            PREVIEW_WORKERS=0,
+            FILE_DELETION_WORKERS=0,
+            METRICS_SLOW_REQUEST_MS=1e9,
+        )
+        cls._settings.enable()
+        super().setUpClass()
+
+    @classmethod
+    def tearDownClass(cls):
+        super().tearDownClass()
+        cls._settings.disable()
+        shutil.rmtree(cls._media, ignore_errors=True)
+
+
+class QueryBudgetTestCase(ApiTestCase):
+    """assertBudget：以两个账号执行同一请求，比较查询数并检查预算与响应时间"""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.small = Account('budget-small@jarvis.local', SMALL_SCALE)
+        cls.large = Account('budget-large@jarvis.local', LARGE_SCALE)
+
+    def setUp(self):
+        # 进程内缓存（地名表）先加载，两个账号的请求都不再查询
+        commute.load_places()
+
+    def send(self, account, method, path, data=None, content_type='application/json', **extra):
+        """发出请求并读完响应（流式响应的查询在读取时执行）"""
+        client = account.client()
+        if method in ('GET', 'HEAD'):
+            response = getattr(client, method.lower())(path, **extra)
+        else:
+            response = getattr(client, method.lower())(path, data, content_type=content_type, **extra)
+        if response.streaming:
+            if response.is_async:
+                response.body = async_to_sync(read_stream)(response.streaming_content)
+            else:
+                response.body = b''.join(response.streaming_content)
+        response.close()
+        return response
+
+    def assertBudget(self, method, path, queries=None, max_queries=None, status=200, max_ms=DEFAULT_MAX_MS,
+                     data=None, request=None, **kwargs):
+        """
+        path / data 可以是以 Account 为参数的函数（各账号的 id 不同）；request(account) 用于自定义发送方式。
+        queries 为精确预算，max_queries 为上限，二者给出其一
+        """
+        assert (queries is None) != (max_queries is None), 'give exactly one of queries / max_queries'
+        runs = []
+        for account in (self.small, self.large):
+            url = path(account) if callable(path) else path
+            if request is None:
+                body = data(account) if callable(data) else data
+                send = lambda: self.send(account, method, url, body, **kwargs)  # noqa: E731
+            else:
+                send = lambda: request(account)  # noqa: E731
+            with QueryLog() as log:
+                started = clock.perf_counter()
+                response = send()
+                elapsed_ms = (clock.perf_counter() - started) * 1000
+            runs.append((account, log.queries, elapsed_ms))
+            body_text = getattr(response, 'body', None) or getattr(response, 'content', b'')
+            self.assertEqual(
+                response.status_code, status, f'{method} {url} (scale {account.scale}): {body_text[:500]!r}'
+            )
+
+        (_, small_queries, _), (_, large_queries, _) = runs
+        label = f'{method} {url}'
+        if len(small_queries) != len(large_queries):
+            self.fail(self.report(
+                f'{label}: query count depends on data size '
+                f'({len(small_queries)} at scale {SMALL_SCALE}, {len(large_queries)} at scale {LARGE_SCALE})',
+                small_queries, large_queries
+            ))
+        count = len(large_queries)
+        if queries is not None and count != queries:
+            self.fail(self.report(f'{label}: {count} queries, budget is exactly {queries}',
+                                  small_queries, large_queries))
+        if max_queries is not None and count > max_queries:
+            self.fail(self.report(f'{label}: {count} queries, budget is at most {max_queries}',
+                                  small_queries, large_queries))
+        limit = max_ms * TIME_SCALE
+        for account, _, elapsed_ms in runs:
+            if elapsed_ms > limit:
+                self.fail(f'{label}: {elapsed_ms:.1f} ms at scale {account.scale}, ceiling is {limit:.0f} ms')
+
+    @staticmethod
+    def report(summary, small_queries, large_queries):
+        lines = [summary]
+        small = Counter(_PARAM_LIST.sub('%s, ...', sql) for sql in small_queries)
+        large = Counter(_PARAM_LIST.sub('%s, ...', sql) for sql in large_queries)
+        changed = [sql for sql in large if small[sql] != large[sql]]
+        changed += [sql for sql in small if sql not in large]
+        if changed:
+            lines.append(f'Statements whose count changed (scale {SMALL_SCALE} -> {LARGE_SCALE}):')
+            lines.extend(f'  x{small[sql]} -> x{large[sql]}  {sql}' for sql in changed)
+        lines.append(f'All queries at scale {LARGE_SCALE}:')
+        lines.extend(f'  {i:3}. {sql}' for i, sql in enumerate(large_queries, 1))
+        return '\n'.join(lines)
+
+
+def month():
+    today = beijing_today()
+    return f'start_date={today}&end_date={today + timedelta(days=30)}'
+
+
+class EndpointQueryBudgetTests(QueryBudgetTestCase):
+    """每个路由的查询预算；鉴权（随机 token）每个请求一条查询"""
+
+    def test_every_route_has_budget(self):
+        missing = [p.name for p in urls.urlpatterns if not hasattr(self, f'test_{p.name}')]
+        self.assertEqual(missing, [], 'Add a query budget test named test_<route name> for these routes')
+
+    # ==================== AUTH ====================
+
+    def test_auth_login(self):
+        # 老用户：读用户、查设备 token（仍有效时复用）
+        self.assertBudget('POST', '/api/v1/auth/login', queries=2,
+                          data=lambda a: {'account_id': a.user.account_id, 'device_id': 'budget'})
+        # 新用户：分配分片、创建用户与默认日历类型、签发 token
+        self.assertBudget('POST', '/api/v1/auth/login', queries=6,
+                          data=lambda a: {'account_id': f'new-{a.scale}@jarvis.local', 'device_id': 'phone'})
+
+    def test_auth_logout(self):
+        self.assertBudget('POST', '/api/v1/auth/logout', queries=2)
+
+    # ==================== METRICS / TIME ====================
+
+    @override_settings(METRICS_TOKEN='scrape-token')
+    def test_metrics_export(self):
+        self.assertBudget('GET', '/api/v1/_metrics', queries=0, HTTP_AUTHORIZATION='Bearer scrape-token')
+        self.assertBudget('GET', '/api/v1/_metrics', queries=0, status=401, HTTP_AUTHORIZATION='Bearer wrong')
+
+    def test_get_server_time(self):
+        self.assertBudget('GET', '/api/v1/time', queries=0)
+
+    # ==================== USER ====================
+
+    def test_user_detail(self):
+        self.assertBudget('GET', '/api/v1/user', queries=1)
+        self.assertBudget('PUT', '/api/v1/user', queries=2, data={'home_address': 'Sha Tin'})
+
+    def test_user_location(self):
+        self.assertBudget('GET', '/api/v1/user/location', queries=1)
+        self.assertBudget('POST', '/api/v1/user/location', queries=5,
+                          data={'latitude': 22.3, 'longitude': 114.17, 'accuracy': 12})
+
+    def test_user_location_batch(self):
+        start = timezone.now()
+        points = [
+            {'latitude': 22.3 + i * 0.001, 'longitude': 114.17, 'accuracy': 5,
+             'timestamp': (start + timedelta(minutes=i)).isoformat()}
+            for i in range(50)
+        ]
+        self.assertBudget('POST', '/api/v1/user/location/batch', queries=5, data={'points': points})
+
+    # ==================== CALENDAR TYPES ====================
+
+    def test_calendar_types_list(self):
+        self.assertBudget('GET', '/api/v1/calendar-types', queries=2)
+        self.assertBudget('POST', '/api/v1/calendar-types', queries=3, status=201,
+                          data={'name': 'Reading', 'color': '#3B82F6'})
+
+    def test_calendar_type_detail(self):
+        self.assertBudget('GET', '/api/v1/calendar-types/general', queries=3)
+        self.assertBudget('PUT', '/api/v1/calendar-types/gym_budget', queries=4, data={'name': 'Fitness'})
+        self.assertBudget('DELETE', '/api/v1/calendar-types/gym_budget', queries=6)
+
+    def test_calendar_type_visibility(self):
+        self.assertBudget('PATCH', '/api/v1/calendar-types/school/visibility', queries=4, data={'is_visible': False})
+
+    # ==================== EVENTS ====================
+
+    def test_events_list(self):
+        self.assertBudget('GET', f'/api/v1/events?{month()}', queries=5)
+        # 流式输出按 STREAM_CHUNK_SIZE 分块读取，每块一组预取查询（测试数据不足一块）
+        self.assertBudget('GET', f'/api/v1/events?{month()}&stream=true', max_queries=8)
+        # 两个账号在这一天都有带附件的未完成事件（附件 blob 的预取不会被跳过）
+        day = beijing_today() + timedelta(days=3)
+        self.assertBudget('GET', f'/api/v1/events?date={day}&completed=false', queries=5)
+        self.assertBudget('POST', '/api/v1/events?check_conflicts=true', queries=10, status=201, data=lambda a: {
+            'title': 'Budget review', 'date': str(beijing_today()), 'is_all_day': False,
+            'start_time': '09:15', 'end_time': '10:15', 'type_id': 'events',
+            'links': ['https://example.com/a', 'https://example.com/b'], 'attachment_id': str(a.spare_file.pk),
+        })
+
+    def test_events_conflicts(self):
+        self.assertBudget('GET', f'/api/v1/events/conflicts?{month()}', queries=3)
+
+    def test_events_search(self):
+        self.assertBudget('GET', '/api/v1/events/search?q=meeting', queries=5)
+        self.assertBudget('GET', f'/api/v1/events/search?q=复习&{month()}', queries=5)
+
+    def test_event_detail(self):
+        path = lambda a: f'/api/v1/events/{a.event.pk}'  # noqa: E731
+        self.assertBudget('GET', path, queries=4)
+        self.assertBudget('PUT', path, queries=11, data={'title': 'Renamed', 'type_id': 'school'})
+        self.assertBudget('DELETE', lambda a: f'/api/v1/events/{a.daily.pk}?occurrence_date={beijing_today()}',
+                          queries=5)
+        self.assertBudget('DELETE', path, queries=14)
+
+    def test_event_complete(self):
+        self.assertBudget('PATCH', lambda a: f'/api/v1/events/{a.plain_event.pk}/complete', queries=3,
+                          data={'completed': True})
+        self.assertBudget('PATCH', lambda a: f'/api/v1/events/{a.daily.pk}/complete', queries=4,
+                          data={'completed': True, 'occurrence_date': str(beijing_today())})
+
+    def test_event_links(self):
+        path = lambda a: f'/api/v1/events/{a.event.pk}/links'  # noqa: E731
+        self.assertBudget('POST', path, queries=4, data={'url': 'https://example.com/new'})
+        self.assertBudget('DELETE', path, queries=4, data={'url': 'https://example.com/new'})
+
+    # ==================== CHANGES ====================
+
+    def test_changes(self):
+        # WSGI（测试客户端）下不可用，不查询数据库
+        self.assertBudget('GET', '/api/v1/changes', queries=0, status=501)
+
+        async def subscribe(account):
+            # 与浏览器的 EventSource 相同，token 放在查询参数中
+            response = await AsyncClient().get(f'/api/v1/changes?access_token={account.token}')
+            stream = response.streaming_content
+            response.body = await anext(stream) + await anext(stream)
+            await stream.aclose()
+            return response
+
+        def request(account):
+            response = async_to_sync(subscribe)(account)
+            self.assertIn(b'"type":"ready"', response.body)
+            return response
+
+        # ASGI：鉴权后只推送通知
+        self.assertBudget('GET', '/api/v1/changes', queries=1, request=request)
+
+    # ==================== SCHEDULE ====================
+
+    def test_schedule_free_slots(self):
+        today = beijing_today()
+        self.assertBudget('GET', f'/api/v1/schedule/free-slots?start={today}&end={today + timedelta(days=13)}',
+                          queries=3)
+
+    # ==================== FILES ====================
+
+    def test_file_upload(self):
+        upload = lambda content: lambda a: {  # noqa: E731
+            'file': SimpleUploadedFile('photo.jpg', content + a.user.account_id.encode(), content_type='image/jpeg')
+        }
+        self.assertBudget('POST', '/api/v1/files/upload', queries=4, status=201,
+                          data=upload(b'new content'), content_type=MULTIPART_CONTENT)
+        # 内容相同：引用已有的 blob
+        self.assertBudget('POST', '/api/v1/files/upload', queries=4, status=201,
+                          data=upload(b'new content'), content_type=MULTIPART_CONTENT)
+
+    def test_file_delete(self):
+        self.assertBudget('DELETE', lambda a: f'/api/v1/files/{a.spare_file.pk}', queries=9)
+
+    def test_file_download(self):
+        self.assertBudget('GET', lambda a: f'/api/v1/files/{a.event.attachment_id}/download', queries=2)
+        # 签名链接：不经鉴权，按签名中的所有者查询
+        self.assertBudget(
+            'GET', lambda a: signed_download_url(self.signed_request(), a.event.attachment).split('testserver')[1],
+            queries=2, HTTP_AUTHORIZATION=''
+        )
+
+    def test_file_preview(self):
+        file_of = lambda a: a.files[0]  # noqa: E731
+        self.assertBudget('GET', lambda a: f'/api/v1/files/{file_of(a).pk}/preview', queries=3)
+        self.assertBudget(
+            'GET', lambda a: preview_url(self.signed_request(), file_of(a)).split('testserver')[1],
+            queries=3, HTTP_AUTHORIZATION=''
+        )
+
+    def test_upload_session_create(self):
+        self.assertBudget('POST', '/api/v1/files/uploads', queries=2, status=201,
+                          data={'name': 'lecture.pdf', 'size': 1024, 'mime_type': 'application/pdf'})
+
+    def test_upload_session_detail(self):
+        sessions = {}
+
+        def path(account):
+            if account.scale not in sessions:
+                sessions[account.scale] = account.upload_session()
+            return f'/api/v1/files/uploads/{sessions[account.scale].pk}'
+
+        self.assertBudget('GET', path, queries=2)
+        self.assertBudget('PUT', path, queries=4, data=b'1234', content_type='application/octet-stream',
+                          HTTP_CONTENT_RANGE='bytes 0-3/8')
+        self.assertBudget('DELETE', path, queries=3)
+
+    def test_upload_session_complete(self):
+        self.assertBudget(
+            'POST', lambda a: f'/api/v1/files/uploads/{a.upload_session(complete=True).pk}/complete',
+            queries=7, status=201
+        )
+
+    # ==================== REMINDERS / COMMUTE ====================
+
+    def test_reminders_list(self):
+        self.assertBudget('GET', '/api/v1/reminders', queries=1)
+
+    def test_location_commute(self):
+        self.assertBudget('GET', '/api/v1/location/commute?from=current&to=school', queries=1)
+
+    # ==================== AGENT ====================
+
+    def test_agent_info(self):
+        self.assertBudget('GET', '/api/v1/agent/info', queries=5)
+        self.assertBudget('GET', '/api/v1/agent/info?stream=true', max_queries=8)
+
+    def test_agent_action(self):
+        today = str(beijing_today())
+        actions = [
+            ({'action': 'create_event', 'payload': {
+                'title': 'Agent task', 'date': today, 'is_all_day': False, 'start_time': '09:00', 'end_time': '10:00',
+                'type_id': 'events', 'links': ['https://example.com/agent']}}, 7),
+            (lambda a: {'action': 'update_event', 'payload': {'event_id': str(a.plain_event.pk), 'title': 'Moved'}}, 6),
+            (lambda a: {'action': 'complete_event', 'payload': {'event_id': str(a.plain_event.pk)}}, 3),
+            (lambda a: {'action': 'complete_event', 'payload': {
+                'event_id': str(a.daily.pk), 'occurrence_date': today}}, 4),
+            ({'action': 'create_calendar_type', 'payload': {'name': 'Music', 'color': '#EF4444'}}, 2),
+            (lambda a: {'action': 'delete_event', 'payload': {'event_id': str(a.event.pk)}}, 13),
+        ]
+        for data, budget in actions:
+            self.assertBudget('POST', '/api/v1/agent/action?check_conflicts=true', queries=budget, data=data)
+
+    def test_agent_reminder_context(self):
+        self.assertBudget('GET', '/api/v1/agent/reminder-context', queries=3)
+
+    def test_agent_parse_task(self):
+        self.assertBudget('POST', '/api/v1/agent/parse-task', queries=2, data={'user_input': '下午三点开会'})
+        self.assertBudget('POST', '/api/v1/agent/parse-task?check_conflicts=true', queries=6, status=201, data={
+            'title': '开会', 'type_id': 'school', 'is_all_day': False, 'start_time': '15:00', 'end_time': '16:00',
+        })
+
+    def test_agent_parse_calendar_type(self):
+        self.assertBudget('POST', '/api/v1/agent/parse-calendar-type', queries=1, data={'user_input': '健身'})
+        self.assertBudget('POST', '/api/v1/agent/parse-calendar-type', queries=1,
+                          data={'name': '健身', 'color': '#ec4899'})
+
+    def test_agent_parse_event(self):
+        self.assertBudget('POST', '/api/v1/agent/parse-event', queries=2, data={'user_input': '下周一图书馆学习'})
+        self.assertBudget('POST', '/api/v1/agent/parse-event?check_conflicts=true', queries=5, data={
+            'title': '图书馆学习', 'date': str(beijing_today()), 'is_all_day': False,
+            'start_time': '14:00', 'end_time': '16:00', 'type_id': 'school',
+        })
+
+    def test_agent_generate_reminders(self):
+        self.assertBudget('POST', '/api/v1/agent/generate-reminders', queries=1, data={'reminders': [
+            {'id': 'r1', 'type': 'weather', 'title': '天气', 'subtitle': '晴'},
+            {'id': 'r2', 'type': 'commute', 'title': '通勤', 'subtitle': '25 分钟'},
+            {'id': 'r3', 'type': 'important', 'title': '待办', 'subtitle': '3 项'},
+        ]})
+
+    @staticmethod
+    def signed_request():
+        """生成签名链接用的请求对象（只需要 build_absolute_uri）"""
+        return RequestFactory().get('/')
+
+
+def move_during_central_write():
+    """
+    在子进程中执行（ShardLockOrderTests）：用户从 shard0 迁到 shard1 的同时，另一线程以迁移前的用户对象
+    在 atomic(central=True) 中写主库和 shard0。两边的锁顺序不一致时互相等待，线程在期限内无法结束。
+    输出 ok，或失败原因。
+    """
+    call_command('migrate', verbosity=0, interactive=False)
+    sharding.data_databases()
+    user = User.objects.create(account_id='mover', shard=0)
+    with sharding.use_user_db(user):
+        CalendarType.objects.create(user=user, type_id='work', name='Work', color='#3B82F6')
+
+    inside = threading.Event()
+    copy_rows = sharding._copy_rows
+
+    def slow_copy(*args):
+        inside.set()
+        clock.sleep(0.5)
+        return copy_rows(*args)
+
+    sharding._copy_rows = slow_copy
+    errors = []
+
+    def move():
+        try:
+            sharding.move_user(User.objects.get(pk=user.pk), 'shard1')
+        except Exception as exc:
+            errors.append(exc)
+        finally:
+            connections.close_all()
+
+    def write():
+        inside.wait(10)
+        try:
+            with sharding.use_user_db(user), sharding.atomic(central=True):
+                User.objects.filter(pk=user.pk).update(home_address='CUHK')
+                CalendarType.objects.create(user=user, type_id='gym', name='Gym', color='#A855F7')
+        except Exception as exc:
+            errors.append(exc)
+        finally:
+            connections.close_all()
+
+    threads = [threading.Thread(target=move), threading.Thread(target=write)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join(10)
+    if any(thread.is_alive() for thread in threads):
+        print('deadlock', flush=True)
+        os._exit(1)
+    if errors:
+        print(*errors, sep='\n', flush=True)
+        os._exit(1)
+
+    # 迁移后仍写入旧分片的数据由 sweep 合并
+    sharding.sweep('shard0')
+    type_ids = set(CalendarType.objects.using('shard1').filter(user_id=user.pk).values_list('type_id', flat=True))
+    print('ok' if type_ids == {'work', 'gym'} else f'shard1 has {sorted(type_ids)}', flush=True)
+
+
+class ShardLockOrderTests(SimpleTestCase):
+    """分片迁移与同时写主库、分片的请求并发执行（真实的数据库文件与写锁，在子进程中运行）"""
+
+    def test_move_during_central_write(self):
+        workdir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, workdir, ignore_errors=True)
+        env = {
+            **os.environ,
+            'DJANGO_SETTINGS_MODULE': 'jarvis_backend.settings',
+            'JARVIS_DB_PROFILE': 'production',
+            'JARVIS_DB_PATH': os.path.join(workdir, 'db.sqlite3'),
+            'JARVIS_SHARDS': '2',
+            'JARVIS_SHARD_DIR': os.path.join(workdir, 'shards'),
+            'JARVIS_DB_REPLICAS': '',
+        }
+        script = 'import django; django.setup(); from api.tests import move_during_central_write as run; run()'
+        result = subprocess.run(
+            [sys.executable, '-c', script], cwd=settings.BASE_DIR, env=env,
+            capture_output=True, text=True, timeout=120,
+        )
+        self.assertEqual(result.stdout.strip().splitlines()[-1:], ['ok'], result.stdout + result.stderr)
+
+
+class WriterLockTests(SimpleTestCase):
+    def test_times_out_instead_of_waiting_forever(self):
+        path = os.path.join(tempfile.mkdtemp(), 'db.sqlite3.writer.lock')
+        self.addCleanup(shutil.rmtree, os.path.dirname(path))
+        holder, waiter = WriterLock(path), WriterLock(path, timeout=0.05)
+        self.addCleanup(holder.close)
+        self.addCleanup(waiter.close)
+        holder.acquire()
+        started = clock.monotonic()
+        with self.assertRaisesMessage(OperationalError, 'database is locked'):
+            waiter.acquire()
+        self.assertGreaterEqual(clock.monotonic() - started, 0.05)
+        self.assertFalse(waiter.held)
+
+        holder.release()
+        waiter.acquire()
+        self.assertTrue(waiter.held)
+
+    def lock_path(self):
+        path = os.path.join(tempfile.mkdtemp(), 'db.sqlite3.writer.lock')
+        self.addCleanup(shutil.rmtree, os.path.dirname(path))
+        return path
+
+    def test_threads_acquire_in_arrival_order(self):
+        path = self.lock_path()
+        holder = WriterLock(path)
+        holder.acquire()
+        order, threads = [], []
+
+        def take(index):
+            lock = WriterLock(path, timeout=5)
+            lock.acquire()
+            order.append(index)
+            lock.release()
+
+        for index in range(5):
+            threads.append(threading.Thread(target=take, args=(index,)))
+            threads[-1].start()
+            # 等这个线程进入队列再启动下一个
+            while len(holder._lock._queue) < index + 1:
+                clock.sleep(0.001)
+        holder.release()
+        for thread in threads:
+            thread.join()
+        self.assertEqual(order, list(range(5)))
+
+    def test_other_process_holder_times_out_and_releases(self):
+        path = self.lock_path()
+        script = (
+            'import fcntl, os, sys\n'
+            f'fd = os.open({path!r}, os.O_RDWR | os.O_CREAT)\n'
+            'fcntl.flock(fd, fcntl.LOCK_EX)\n'
+            'print("locked", flush=True)\n'
+            'sys.stdin.readline()\n'
+        )
+        holder = subprocess.Popen([sys.executable, '-c', script], stdin=subprocess.PIPE, stdout=subprocess.PIPE, text=True)
+        self.addCleanup(holder.wait)
+        self.assertEqual(holder.stdout.readline().strip(), 'locked')
+
+        waiter = WriterLock(path, timeout=0.1)
+        with self.assertRaisesMessage(OperationalError, 'database is locked'):
+            waiter.acquire()
+        holder.stdin.close()
+        holder.wait()
+
+        # 超时放弃的等待拿到文件锁后随即释放，其他进程可以获取
+        probe = (
+            'import fcntl, os, time\n'
+            f'fd = os.open({path!r}, os.O_RDWR)\n'
+            'deadline = time.monotonic() + 5\n'
+            'while True:\n'
+            '    try:\n'
+            '        fcntl.flock(fd, fcntl.LOCK_EX | fcntl.LOCK_NB)\n'
+            '        break\n'
+            '    except BlockingIOError:\n'
+            '        if time.monotonic() > deadline: raise\n'
+            '        time.sleep(0.01)\n'
+        )
+        self.assertEqual(subprocess.run([sys.executable, '-c', probe]).returncode, 0)
+        waiter.acquire()
+        self.assertTrue(waiter.held)
+        waiter.release()
+
+    def test_read_only_statements_skip_the_lock(self):
+        for sql in [
+            'SELECT 1',
+            'EXPLAIN QUERY PLAN SELECT 1',
+            'WITH recent AS (SELECT id FROM events) SELECT * FROM recent',
+            'WITH t AS (SELECT "update" FROM x) SELECT * FROM t',
+            'PRAGMA table_info(events)',
+            'PRAGMA main.journal_mode',
+        ]:
+            self.assertTrue(is_read_only(sql), sql)
+        for sql in [
+            'INSERT INTO events VALUES (1)',
+            'UPDATE events SET title = %s',
+            'WITH old AS (SELECT id FROM events) DELETE FROM events WHERE id IN (SELECT id FROM old)',
+            'PRAGMA journal_mode = WAL',
+            'PRAGMA wal_checkpoint(TRUNCATE)',
+            'CREATE TABLE t (id)',
+        ]:
+            self.assertFalse(is_read_only(sql), sql)
+
+
+class UploadChunkTests(ApiTestCase):
+    """续传上传：每块的字节数必须与 Content-Range 一致"""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.account = Account('chunks@jarvis.local', SMALL_SCALE)
+
+    def put(self, session, body, content_range):
+        return self.account.client().put(
+            f'/api/v1/files/uploads/{session.pk}', body,
+            content_type='application/octet-stream', HTTP_CONTENT_RANGE=content_range,
+        )
+
+    def test_body_length_must_match_content_range(self):
+        session = self.account.upload_session()
+        for body, content_range in [(b'123456', 'bytes 0-3/8'), (b'12', 'bytes 0-3/8'), (b'1234', 'bytes 0-3/9')]:
+            response = self.put(session, body, content_range)
+            self.assertEqual(response.status_code, 400, content_range)
+            self.assertEqual(response.json()['error']['code'], 'VALIDATION_ERROR')
+
+        response = self.put(session, b'1234', 'bytes 0-3/8')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.json()['data']['offset'], 4)
+
+    def test_write_stops_at_range_end(self):
+        session = self.account.upload_session()
+        with sharding.use_user_db(self.account.user):
+            self.assertEqual(write_chunk(session, BytesIO(b'12'), 0, 3), 2)
+            self.assertEqual(session.received, 2)
+            self.assertEqual(write_chunk(session, BytesIO(b'3456789'), 2, 5), 4)
+            self.assertEqual(session.received, 6)
+
+
+class UserDetailTests(ApiTestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.account = Account('profile@jarvis.local', SMALL_SCALE)
+
+    def test_address_update_keeps_concurrent_location(self):
+        # 请求鉴权时读到的用户行，之后位置上报更新了冗余列
+        stale = User.objects.get(pk=self.account.user.pk)
+        store_user_locations(self.account.user, [{'latitude': 22.3364, 'longitude': 114.2655, 'accuracy': 5}])
+
+        request = RequestFactory().put(
+            '/api/v1/user', {'home_address': 'HKUST'}, content_type='application/json'
+        )
+        force_authenticate(request, user=stale)
+        self.assertEqual(user_detail(request).status_code, 200)
+
+        user = User.objects.get(pk=stale.pk)
+        self.assertEqual(user.home_address, 'HKUST')
+        self.assertEqual((user.current_latitude, user.current_longitude), (22.3364, 114.2655))
+
+
+class AgentCacheInvalidationTests(SimpleTestCase):
+    """agent_service 在创建日历类型 / 事件后清掉受影响的按用户缓存（后端与 LLM 以桩替代）"""
+
+    TOKEN = 'agent-cache-token'
+
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        # 模块导入时创建 OpenAI 客户端，需要任意 key
+        os.environ.setdefault('OPENAI_API_KEY', 'test')
+        from agent_service import main
+        cls.agent = main
+
+    def setUp(self):
+        self.user_key = self.agent.user_cache_key(self.TOKEN)
+        self.day = self.agent.beijing_now().date().isoformat()
+        self.addCleanup(self.agent.context_cache.invalidate, self.user_key)
+        self.addCleanup(self.agent.reminder_cache.invalidate, self.user_key)
+        self.addCleanup(self.agent.llm_cache.invalidate, self.user_key)
+
+    def backend(self, path, *, token, method='GET', payload=None):
+        if payload is not None and 'user_input' in payload:
+            return {
+                'available_types': [{'id': 'general', 'name': 'General'}],
+                'available_colors': [{'name': 'Pink', 'value': '#EC4899'}],
+                'current_date': self.day,
+            }
+        return {'id': 'created'}
+
+    def call(self, view, user_input, llm_result):
+        with (
+            mock.patch.object(self.agent, 'jarvis_request', side_effect=self.backend),
+            mock.patch.object(self.agent, 'llm_json', return_value=llm_result),
+        ):
+            return view(self.agent.TextInput(user_input=user_input), token=self.TOKEN)
+
+    def test_new_calendar_type_clears_context(self):
+        self.agent.context_cache.set(self.user_key, f'/agent/parse-task:{self.day}', {'available_types': []})
+        self.call(self.agent.parse_calendar_type, '健身，粉色', {'name': '健身', 'color': '#EC4899'})
+        self.assertIsNone(self.agent.context_cache.get(self.user_key, f'/agent/parse-task:{self.day}'))
+
+    def test_new_event_clears_reminders(self):
+        self.agent.reminder_cache.set(self.user_key, 'reminders', {'reminders': []})
+        self.call(self.agent.parse_event, '图书馆学习 14:00-16:00', {
+            'title': '图书馆学习', 'date': self.day, 'type_id': 'general',
+        })
+        self.assertIsNone(self.agent.reminder_cache.get(self.user_key, 'reminders'))
+
+
+class SearchTriggerTests(ApiTestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.account = Account('search@jarvis.local', SMALL_SCALE)
+
+    def test_post_migrate_restores_dropped_triggers(self):
+        alias = sharding.user_db(self.account.user)
+        with connections[alias].cursor() as cursor:
+            # 重建 events 表的迁移会连同触发器一起删除
+            cursor.execute('DROP TRIGGER event_search_insert')
+            cursor.execute('DROP TRIGGER event_search_link_delete')
+        self.assertEqual(search.missing_triggers(alias), ['event_search_insert', 'event_search_link_delete'])
+
+        search.restore_triggers(sender=None, using=alias)
+        self.assertEqual(search.missing_triggers(alias), [])
+        with sharding.use_user_db(self.account.user):
+            event = Event.objects.create(
+                user=self.account.user, calendar_type=self.account.custom_type, title='Quarterly review',
+                date=beijing_today(),
+            )
+            self.assertEqual(search.search_ids(self.account.user, 'Quarterly'), [event.pk.hex])
+
+    def test_index_survives_renumbered_rowids(self):
+        user = self.account.user
+        with sharding.use_user_db(user):
+            first = Event.objects.create(
+                user=user, calendar_type=self.account.custom_type, title='Budget planning', date=beijing_today(),
+            )
+            second = Event.objects.create(
+                user=user, calendar_type=self.account.custom_type, title='Travel booking', date=beijing_today(),
+            )
+            # VACUUM 与表重建可能重新编号没有 INTEGER PRIMARY KEY 的表的 rowid；这里交换两个事件的 rowid
+            with connections[sharding.user_db(user)].cursor() as cursor:
+                cursor.execute('SELECT max(rowid) FROM events')
+                top = cursor.fetchone()[0]
+                for event, rowid in [(first, top + 1), (second, top + 2), (first, top + 3)]:
+                    cursor.execute('UPDATE events SET rowid = %s WHERE id = %s', [rowid, event.pk.hex])
+                cursor.execute('UPDATE events SET rowid = %s WHERE id = %s', [top + 1, second.pk.hex])
+
+            self.assertEqual(search.search_ids(user, 'Budget'), [first.pk.hex])
+            self.assertEqual(search.search_ids(user, 'Travel'), [second.pk.hex])
+            first.title = 'Budget review'
+            first.save()
+            EventLink.objects.create(event=second, url='https://example.com/flights')
+            self.assertEqual(search.search_ids(user, 'review'), [first.pk.hex])
+            self.assertEqual(search.search_ids(user, 'flights'), [second.pk.hex])
+            second.delete()
+            self.assertEqual(search.search_ids(user, 'Travel'), [])
+            self.assertEqual(search.search_ids(user, 'Budget'), [first.pk.hex])
+
+
+class SignedTokenTests(ApiTestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create(account_id='signed@jarvis.local')
+
+    def issue_at(self, timestamp, user=None):
+        with mock.patch.object(signed_tokens, 'time', mock.Mock(time=lambda: timestamp, monotonic=clock.monotonic)):
+            return signed_tokens.issue(user or self.user)
+
+    def test_verify_round_trip(self):
+        issued = signed_tokens.issue(self.user)
+        self.assertTrue(signed_tokens.is_signed(issued.token))
+        signed = signed_tokens.verify(issued.token)
+        self.assertEqual((signed.user_id, signed.shard, signed.jti), (self.user.pk.hex, self.user.shard, issued.jti))
+        self.assertEqual(signed_tokens.token_user(signed).pk, self.user.pk)
+
+    def test_rejects_tampered_tokens(self):
+        prefix, kid, payload, signature = signed_tokens.issue(self.user).token.split('.')
+        other = signed_tokens.issue(User.objects.create(account_id='other@jarvis.local'))
+        for token in [
+            f'{prefix}.{kid}.{other.token.split(".")[2]}.{signature}',  # 换了 payload
+            f'{prefix}.{kid}.{payload}.{signature[:-2]}xx',
+            f'{prefix}.k9.{payload}.{signature}',  # 未知密钥
+            f'{prefix}.{kid}.{payload}',
+            'not-a-token',
+        ]:
+            with self.assertRaisesMessage(signed_tokens.InvalidToken, 'Invalid token'):
+                signed_tokens.verify(token)
+
+    def test_expired_token(self):
+        issued = self.issue_at(clock.time() - settings.ACCESS_TOKEN_TTL_SECONDS - 1)
+        with self.assertRaisesMessage(signed_tokens.InvalidToken, 'Token expired'):
+            signed_tokens.verify(issued.token)
+
+    def test_key_rotation(self):
+        with override_settings(SIGNED_TOKEN_KEYS=[('k1', 'old-secret')]):
+            old = signed_tokens.issue(self.user)
+        # 新密钥在前用于签发，旧密钥保留用于校验
+        with override_settings(SIGNED_TOKEN_KEYS=[('k2', 'new-secret'), ('k1', 'old-secret')]):
+            new = signed_tokens.issue(self.user)
+            self.assertEqual(new.token.split('.')[1], 'k2')
+            self.assertEqual(signed_tokens.verify(old.token).jti, old.jti)
+            self.assertEqual(signed_tokens.verify(new.token).jti, new.jti)
+        with override_settings(SIGNED_TOKEN_KEYS=[('k2', 'new-secret')]):
+            with self.assertRaisesMessage(signed_tokens.InvalidToken, 'Invalid token'):
+                signed_tokens.verify(old.token)
+            signed_tokens.verify(new.token)
+
+    def test_revoked_token(self):
+        revoked, kept = signed_tokens.issue(self.user), signed_tokens.issue(self.user)
+        signed_tokens.revoke(signed_tokens.verify(revoked.token))
+        with self.assertRaisesMessage(signed_tokens.InvalidToken, 'Token revoked'):
+            signed_tokens.verify(revoked.token)
+        signed_tokens.verify(kept.token)
+
+        # 其他进程：内存中没有这条撤销记录，同步 revoked_tokens 后生效
+        del signed_tokens._revoked_jtis[revoked.jti]
+        signed_tokens.refresh_revocations(force=True)
+        with self.assertRaisesMessage(signed_tokens.InvalidToken, 'Token revoked'):
+            signed_tokens.verify(revoked.token, refresh=False)
+
+    def test_relogin_in_same_second_as_user_revocation(self):
+        # 撤销记录保存在进程内存中，不随测试事务回滚，使用单独的用户
+        user = User.objects.create(account_id='moved@jarvis.local')
+        second = int(clock.time())
+        before = self.issue_at(second + 0.1, user)
+        revoked_at = datetime.fromtimestamp(second + 0.2, tz=dt_timezone.utc)
+        with mock.patch.object(signed_tokens.timezone, 'now', return_value=revoked_at):
+            signed_tokens.revoke_user_tokens(user.pk)
+        after = self.issue_at(second + 0.3, user)
+
+        with self.assertRaisesMessage(signed_tokens.InvalidToken, 'Token revoked'):
+            signed_tokens.verify(before.token)
+        self.assertEqual(signed_tokens.verify(after.token).user_id, user.pk.hex)
+
+
+class AccessTokenTests(ApiTestCase):
+    """随机 token：同一设备复用或轮换，purge_tokens 分批删除过期与已注销的 token"""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create(account_id='tokens@jarvis.local')
+
+    def make_token(self, expires_in, is_active=True, device_id=''):
+        return AccessToken.objects.create(
+            user=self.user, device_id=device_id, token=str(uuid.uuid4()), is_active=is_active,
+            expires_at=timezone.now() + timedelta(seconds=expires_in),
+        )
+
+    def test_same_device_reuses_token(self):
+        first = issue_token(self.user, 'phone')
+        with self.assertNumQueries(1):
+            again = issue_token(self.user, 'phone')
+        self.assertEqual((again.pk, again.token, again.expires_at), (first.pk, first.token, first.expires_at))
+        # 其他设备与不带 device_id 的登录各自新建一行
+        laptop = issue_token(self.user, 'laptop')
+        anonymous = {issue_token(self.user).token, issue_token(self.user).token}
+        self.assertEqual(len({first.token, laptop.token} | anonymous), 4)
+        self.assertEqual(AccessToken.objects.filter(user=self.user).count(), 4)
+
+        # 登录接口：同一设备重复登录得到同一个 token
+        tokens = [
+            Client().post(
+                '/api/v1/auth/login', {'account_id': 'login@jarvis.local', 'device_id': 'phone'},
+                content_type='application/json',
+            ).json()['data']['access_token']
+            for _ in range(2)
+        ]
+        self.assertEqual(tokens[0], tokens[1])
+        self.assertEqual(AccessToken.objects.filter(user__account_id='login@jarvis.local').count(), 1)
+
+    def test_rotates_near_expiry_or_after_logout(self):
+        near_expiry = self.make_token(settings.ACCESS_TOKEN_REUSE_MIN_SECONDS - 60, device_id='phone')
+        rotated = issue_token(self.user, 'phone')
+        self.assertEqual(rotated.pk, near_expiry.pk)
+        self.assertNotEqual(rotated.token, near_expiry.token)
+        self.assertGreater(rotated.expires_at, timezone.now() + timedelta(seconds=settings.ACCESS_TOKEN_REUSE_MIN_SECONDS))
+        # 轮换后旧 token 失效
+        self.assertEqual(Client(HTTP_AUTHORIZATION=f'Bearer {near_expiry.token}').get('/api/v1/user').status_code, 401)
+        self.assertEqual(Client(HTTP_AUTHORIZATION=f'Bearer {rotated.token}').get('/api/v1/user').status_code, 200)
+
+        revoke_token(rotated)
+        after_logout = issue_token(self.user, 'phone')
+        self.assertEqual(after_logout.pk, rotated.pk)
+        self.assertNotEqual(after_logout.token, rotated.token)
+        self.assertTrue(after_logout.is_active)
+        # 停用但未到期的 token 同样轮换，不会被复用
+        AccessToken.objects.filter(pk=after_logout.pk).update(is_active=False)
+        reactivated = issue_token(self.user, 'phone')
+        self.assertNotEqual(reactivated.token, after_logout.token)
+        self.assertTrue(reactivated.is_active)
+        self.assertEqual(AccessToken.objects.filter(user=self.user).count(), 1)
+
+    def test_purge_in_batches(self):
+        live = {self.make_token(3600).pk, self.make_token(60, device_id='phone').pk}
+        for _ in range(5):
+            self.make_token(-60)
+        for _ in range(3):
+            self.make_token(3600, is_active=False)
+        self.make_token(-60, is_active=False)
+        now = timezone.now()
+        RevokedToken.objects.create(jti='old', expires_at=now - timedelta(minutes=1))
+        kept_revocation = RevokedToken.objects.create(jti='new', expires_at=now + timedelta(hours=1))
+
+        with QueryLog() as log:
+            self.assertEqual(purge_tokens(batch_size=2), 10)
+        deletes = [sql for sql in log.queries if 'DELETE' in sql]
+        # 过期 6 个：2 + 2 + 2 + 0；已注销 3 个：2 + 1；撤销记录 1 个：1
+        self.assertEqual(len(deletes), 7, '\n'.join(deletes))
+        self.assertTrue(all('LIMIT 2' in sql for sql in deletes), '\n'.join(deletes))
+        self.assertEqual(set(AccessToken.objects.values_list('pk', flat=True)), live)
+        self.assertEqual(list(RevokedToken.objects.values_list('pk', flat=True)), [kept_revocation.pk])
+        self.assertEqual(purge_tokens(batch_size=2), 0)
+
+    def test_purge_never_removes_live_tokens(self):
+        rng = Random(7)
+        live = set()
+        for _ in range(60):
+            expires_in = rng.choice([-3600, -1, 5, 3600])
+            is_active = rng.random() < 0.7
+            token = self.make_token(expires_in, is_active=is_active)
+            if is_active and expires_in > 0:
+                live.add(token.pk)
+        for batch_size in (1, 7, 1000):
+            with self.subTest(batch_size=batch_size):
+                purge_tokens(batch_size=batch_size)
+                self.assertEqual(set(AccessToken.objects.values_list('pk', flat=True)), live)
+        self.assertTrue(live)
+
+
+class StreamEquivalenceTests(ApiTestCase):
+    """
+    流式输出与一次性输出的响应体逐字节相同（客户端用同一套解析）：
+    同步与异步视图都直接调用（不受 JARVIS_ASYNC_VIEWS 影响），server_time 固定
+    """
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.account = Account('stream@jarvis.local', SMALL_SCALE)
+        cls.empty = Account('stream-empty@jarvis.local', SMALL_SCALE)
+        with sharding.use_user_db(cls.account.user):
+            # 非 ASCII 与 U+2028 / U+2029：两种输出的转义方式必须一致
+            Event.objects.create(
+                user=cls.account.user, calendar_type=cls.account.custom_type, title='组会\u2028讨论\u2029',
+                date=beijing_today(), is_all_day=True, location='香港大学',
+            )
+
+    def body(self, view, path, is_async):
+        headers = {'Authorization': f'Bearer {self.account.token}'}
+        if is_async:
+            response = async_to_sync(view)(AsyncRequestFactory().get(path, headers=headers))
+            if response.streaming:
+                return True, async_to_sync(read_stream)(response.streaming_content)
+            return False, response.content
+        with sharding.use_user_db(self.account.user):
+            response = view(RequestFactory().get(path, headers=headers))
+            if response.streaming:
+                return True, b''.join(response.streaming_content)
+            return False, response.render().content
+
+    def assertSameBody(self, name, query, expected_total):
+        now = timezone.now()
+        path = reverse(name)
+        for is_async in (False, True):
+            view = getattr(async_views if is_async else views, name)
+            with self.subTest(view=name, query=query, async_views=is_async), \
+                    mock.patch('django.utils.timezone.now', return_value=now), \
+                    override_settings(STREAM_CHUNK_SIZE=3):
+                streamed, stream_body = self.body(view, f'{path}?{query}&stream=true', is_async)
+                buffered, buffered_body = self.body(view, f'{path}?{query}&stream=false', is_async)
+                self.assertEqual((streamed, buffered), (True, False))
+                self.assertEqual(stream_body, buffered_body)
+                data = json.loads(stream_body)['data']
+                self.assertEqual(len(data['events']), expected_total)
+
+    def test_events_list(self):
+        events = json.loads(self.body(views.events_list, f'{reverse("events_list")}?{month()}&stream=false', False)[1])
+        self.assertGreater(events['data']['total'], 3)
+        self.assertSameBody('events_list', month(), events['data']['total'])
+
+    def test_events_list_empty(self):
+        self.assertSameBody('events_list', 'start_date=1990-01-01&end_date=1990-01-31', 0)
+
+    def test_agent_info(self):
+        self.assertSameBody('agent_info', month(), self.expected_agent_events(month()))
+        self.assertSameBody('agent_info', 'start_date=1990-01-01&end_date=1990-01-31', 0)
+
+    def expected_agent_events(self, query):
+        info = json.loads(self.body(views.agent_info, f'{reverse("agent_info")}?{query}&stream=false', False)[1])
+        self.assertGreater(len(info['data']['events']), 3)
+        return len(info['data']['events'])
+
+
+class DownsampleFixesTests(SimpleTestCase):
+    START = datetime(2026, 1, 5, 8, 0, tzinfo=dt_timezone.utc)
+
+    def fix(self, north_m, seconds):
+        # 纬度每度约 111.2 km
+        return {'latitude': 22.3 + north_m / 111195, 'longitude': 114.2, 'timestamp': self.START + timedelta(seconds=seconds)}
+
+    def downsample(self, fixes, last_kept=None):
+        return downsample_fixes(fixes, last_kept, distance_epsilon_m=50, time_epsilon_s=30)
+
+    def test_drops_fixes_too_close_or_too_soon(self):
+        fixes = [self.fix(0, 0), self.fix(10, 60), self.fix(100, 80), self.fix(200, 90), self.fix(300, 150)]
+        # 顺序打乱也按时间处理；第 2 个太近、第 4 个太快
+        kept = self.downsample(list(reversed(fixes)))
+        self.assertEqual(kept, [fixes[0], fixes[2], fixes[4]])
+
+    def test_compares_first_fix_with_last_kept(self):
+        stored = self.fix(0, 0)
+        fixes = [self.fix(10, 60), self.fix(100, 120), self.fix(200, 180)]
+        self.assertEqual(self.downsample(fixes, stored), fixes[1:])
+
+    def test_latest_fix_replaces_close_kept_fixes(self):
+        # 最新点离 B 太近，替换 B 后离 A 同样太近，A 也被移除
+        a, b, latest = self.fix(0, 0), self.fix(60, 60), self.fix(30, 120)
+        self.assertEqual(self.downsample([a, b, latest]), [latest])
+        # 只剩最新点时即使离已存储的位置太近也保留
+        self.assertEqual(self.downsample([latest], a), [latest])
+
+    def test_adjacent_kept_fixes_meet_thresholds(self):
+        rng = Random(7)
+        for _ in range(200):
+            fixes, north, seconds = [], 0.0, 0
+            for _ in range(rng.randrange(1, 12)):
+                north += rng.uniform(-80, 80)
+                seconds += rng.randrange(5, 60)
+                fixes.append(self.fix(north, seconds))
+            kept = self.downsample(fixes)
+            self.assertIs(kept[-1], fixes[-1])
+            for earlier, later in zip(kept, kept[1:]):
+                self.assertGreaterEqual(haversine_m(
+                    earlier['latitude'], earlier['longitude'], later['latitude'], later['longitude']
+                ), 50)
+                self.assertGreaterEqual((later['timestamp'] - earlier['timestamp']).total_seconds(), 30)
+
+
+def naive_occurrences(rule, dtstart, until):
+    """逐日检查的参照实现：dtstart 到 until 之间的全部发生日期（含 COUNT / UNTIL）"""
+    days = rule.weekdays or (dtstart.weekday(),)
+    week0 = dtstart - timedelta(days=dtstart.weekday())
+    result, day = [], dtstart
+    while day <= until and (rule.until is None or day <= rule.until):
+        if rule.freq == 'DAILY':
+            hit = (day - dtstart).days % rule.interval == 0
+        elif rule.freq == 'WEEKLY':
+            hit = (day - week0).days // 7 % rule.interval == 0 and day.weekday() in days
+        else:
+            months = (day.year - dtstart.year) * 12 + day.month - dtstart.month
+            hit = months % rule.interval == 0 and day.day == dtstart.day
+        if hit:
+            result.append(day)
+            if rule.count is not None and len(result) == rule.count:
+                break
+        day += timedelta(days=1)
+    return result
+
+
+class RecurrenceTests(SimpleTestCase):
+    def dates(self, text, dtstart, start, end):
+        return list(recurrence.occurrence_dates(recurrence.parse_rule(text), dtstart, start, end))
+
+    def test_parse_normalizes_rule(self):
+        self.assertEqual(recurrence.normalize('RRULE:byday=fr,mo,fr;freq=weekly;interval=1'), 'FREQ=WEEKLY;BYDAY=MO,FR')
+        self.assertEqual(recurrence.normalize('FREQ=MONTHLY;UNTIL=2026-12-31'), 'FREQ=MONTHLY;UNTIL=20261231')
+        self.assertEqual(recurrence.normalize(''), '')
+
+    def test_parse_rejects_invalid_rules(self):
+        for text in [
+            'FREQ=YEARLY', 'FREQ=DAILY;BYDAY=MO', 'FREQ=DAILY;COUNT=3;UNTIL=20261231', 'FREQ=DAILY;INTERVAL=0',
+            'FREQ=DAILY;COUNT=x', 'FREQ=WEEKLY;BYDAY=XX', 'FREQ=DAILY;BYHOUR=9', 'FREQ=DAILY;FREQ=WEEKLY', 'FREQ',
+        ]:
+            with self.assertRaises(recurrence.InvalidRule, msg=text):
+                recurrence.parse_rule(text)
+
+    def test_count_spans_window_start(self):
+        # 窗口之前已发生的次数计入 COUNT
+        self.assertEqual(
+            self.dates('FREQ=DAILY;COUNT=5', date(2026, 1, 1), date(2026, 1, 3), date(2026, 1, 10)),
+            [date(2026, 1, 3), date(2026, 1, 4), date(2026, 1, 5)],
+        )
+
+    def test_weekly_byday_with_interval(self):
+        # 2026-01-07 是周三：第一周只有周三、周五，隔一周后是周一、周三、周五
+        text = 'FREQ=WEEKLY;INTERVAL=2;BYDAY=MO,WE,FR;COUNT=5'
+        self.assertEqual(
+            self.dates(text, date(2026, 1, 7), date(2026, 1, 1), date(2026, 2, 28)),
+            [date(2026, 1, 7), date(2026, 1, 9), date(2026, 1, 19), date(2026, 1, 21), date(2026, 1, 23)],
+        )
+        self.assertEqual(
+            self.dates(text, date(2026, 1, 7), date(2026, 1, 12), date(2026, 1, 20)), [date(2026, 1, 19)]
+        )
+
+    def test_monthly_skips_missing_days(self):
+        self.assertEqual(
+            self.dates('FREQ=MONTHLY;COUNT=3', date(2026, 1, 31), date(2026, 1, 1), date(2026, 12, 31)),
+            [date(2026, 1, 31), date(2026, 3, 31), date(2026, 5, 31)],
+        )
+        self.assertEqual(recurrence.series_end('FREQ=MONTHLY;COUNT=3', date(2026, 1, 31)), date(2026, 5, 31))
+        self.assertEqual(
+            self.dates('FREQ=MONTHLY', date(2024, 1, 29), date(2025, 2, 1), date(2025, 3, 31)), [date(2025, 3, 29)]
+        )
+
+    def test_windows_match_day_by_day_expansion(self):
+        rng = Random(11)
+        rules = [
+            'FREQ=DAILY', 'FREQ=DAILY;INTERVAL=3;COUNT=20', 'FREQ=WEEKLY', 'FREQ=WEEKLY;INTERVAL=2;BYDAY=MO,WE,FR',
+            'FREQ=WEEKLY;INTERVAL=3;BYDAY=TU,SU;COUNT=15', 'FREQ=MONTHLY;INTERVAL=2',
+            'FREQ=MONTHLY;COUNT=10', 'FREQ=WEEKLY;BYDAY=SA;UNTIL=20270301',
+        ]
+        for text in rules:
+            rule = recurrence.parse_rule(text)
+            for _ in range(30):
+                dtstart = date(2026, 1, 1) + timedelta(days=rng.randrange(365))
+                start = dtstart + timedelta(days=rng.randrange(-30, 400))
+                end = start + timedelta(days=rng.randrange(0, 120))
+                expected = [d for d in naive_occurrences(rule, dtstart, end) if d >= start]
+                self.assertEqual(self.dates(text, dtstart, start, end), expected, f'{text} from {dtstart}')
+
+
+class RangeTests(ApiTestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.account = Account('ranges@jarvis.local', SMALL_SCALE)
+        cls.file = cls.account.files[0]
+        cls.content = b'ranges@jarvis.local attachment 0'
+
+    def test_parse_range(self):
+        for header, expected in [
+            (None, None), ('', None), ('bytes=0-3', (0, 3)), ('bytes=5-', (5, 9)), ('bytes=3-100', (3, 9)),
+            ('bytes=-3', (7, 9)), ('bytes=-20', (0, 9)),
+            # 多段与无法识别的单位按整文件响应
+            ('bytes=0-1,3-4', None), ('items=0-1', None), ('bytes=-', None),
+        ]:
+            self.assertEqual(parse_range(header, 10), expected, header)
+
+    def test_unsatisfiable_ranges(self):
+        for header, size in [('bytes=10-', 10), ('bytes=5-3', 10), ('bytes=-0', 10), ('bytes=0-', 0), ('bytes=-1', 0)]:
+            with self.assertRaises(RangeNotSatisfiable, msg=f'{header} of {size}'):
+                parse_range(header, size)
+
+    def download(self, **headers):
+        response = self.account.client().get(f'/api/v1/files/{self.file.pk}/download', **headers)
+        response.body = b''.join(response.streaming_content) if response.streaming else response.content
+        response.close()
+        return response
+
+    def test_download_ranges(self):
+        response = self.download(HTTP_RANGE='bytes=7-12')
+        self.assertEqual(response.status_code, 206)
+        self.assertEqual(response['Content-Range'], f'bytes 7-12/{len(self.content)}')
+        self.assertEqual(response.body, self.content[7:13])
+
+        response = self.download(HTTP_RANGE='bytes=-6')
+        self.assertEqual((response.status_code, response.body), (206, self.content[-6:]))
+
+        response = self.download(HTTP_RANGE=f'bytes={len(self.content)}-')
+        self.assertEqual(response.status_code, 416)
+        self.assertEqual(response['Content-Range'], f'bytes */{len(self.content)}')
+
+    def test_if_range(self):
+        etag = self.download()['ETag']
+        response = self.download(HTTP_RANGE='bytes=0-5', HTTP_IF_RANGE=etag)
+        self.assertEqual((response.status_code, response.body), (206, self.content[:6]))
+        # 客户端缓存的版本已变化：忽略 Range，返回整个文件
+        response = self.download(HTTP_RANGE='bytes=0-5', HTTP_IF_RANGE='"stale"')
+        self.assertEqual((response.status_code, response.body), (200, self.content))
+        # 条件请求命中时不返回内容
+        self.assertEqual(self.download(HTTP_IF_NONE_MATCH=etag).status_code, 304)
+
+
+def timed_event(title, day, start, end=None, **fields):
+    """未保存的定时事件；start / end 为 'HH:MM'"""
+    return Event(
+        title=title, date=day, is_all_day=False, start_time=time.fromisoformat(start),
+        end_time=time.fromisoformat(end) if end else None, **fields
+    )
+
+
+class ScheduleTestCase(ApiTestCase):
+    """没有其他数据的用户，事件直接写入其所在的库"""
+    DAY = date(2026, 3, 2)
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create(account_id=f'{cls.__name__.lower()}@jarvis.local')
+        with sharding.use_user_db(cls.user):
+            cls.calendar_type = CalendarType.objects.create(
+                user=cls.user, type_id='general', name='General', color='#6B7280', is_deletable=False
+            )
+
+    def setUp(self):
+        self.enterContext(sharding.use_user_db(self.user))
+
+    def create(self, title, day, start, end=None, **fields):
+        event = timed_event(title, day, start, end, user=self.user, calendar_type=self.calendar_type, **fields)
+        event.save()
+        return event
+
+
+class ConflictTests(ScheduleTestCase):
+    def test_find_conflicts(self):
+        day, next_day = self.DAY, self.DAY + timedelta(days=1)
+        events = [
+            timed_event('a', day, '09:00', '10:00'),
+            timed_event('b', day, '09:30', '11:00'),
+            timed_event('c', day, '10:00', '10:30'),  # 与 a 首尾相接，不算重叠
+            timed_event('d', day, '12:00'),  # 没有结束时间按默认时长
+            timed_event('e', day, '12:45', '13:00'),
+            timed_event('f', day, '23:00', '01:00'),  # 跨过午夜
+            timed_event('g', next_day, '00:30', '02:00'),
+            Event(title='all-day', date=day, is_all_day=True),
+        ]
+        pairs = {
+            (a.title, b.title, from_minutes(start)[1], from_minutes(end)[1])
+            for start, end, a, b in find_conflicts(events)
+        }
+        self.assertEqual(pairs, {
+            ('a', 'b', '09:30', '10:00'), ('b', 'c', '10:00', '10:30'), ('d', 'e', '12:45', '13:00'),
+            ('f', 'g', '00:30', '01:00'),
+        })
+
+    def test_find_conflicts_matches_pairwise_check(self):
+        rng = Random(5)
+        for _ in range(50):
+            events = []
+            for n in range(rng.randrange(2, 25)):
+                start = rng.randrange(0, 24 * 60 - 15, 15)
+                end = (start + rng.choice([15, 30, 45, 60, 120])) % (24 * 60)
+                events.append(timed_event(
+                    str(n), self.DAY + timedelta(days=rng.randrange(2)),
+                    f'{start // 60:02d}:{start % 60:02d}', f'{end // 60:02d}:{end % 60:02d}',
+                ))
+            expected = set()
+            for i, a in enumerate(events):
+                for b in events[i + 1:]:
+                    (a_start, a_end), (b_start, b_end) = interval_of(a), interval_of(b)
+                    if a_start < b_end and b_start < a_end:
+                        expected.add((frozenset([a.title, b.title]), max(a_start, b_start), min(a_end, b_end)))
+            found = {(frozenset([a.title, b.title]), start, end) for start, end, a, b in find_conflicts(events)}
+            self.assertEqual(found, expected)
+
+    def test_conflicts_for_recurring_occurrences(self):
+        series = self.create('standup', self.DAY, '08:00', '09:00', recurrence='FREQ=DAILY;COUNT=5')
+        new = timed_event('review', self.DAY + timedelta(days=2), '08:30', '09:30', user=self.user)
+        [conflict] = conflicts_for(self.user, new)
+        self.assertEqual((conflict.pk, conflict.occurrence_date), (series.pk, self.DAY + timedelta(days=2)))
+
+        # 取消的那次不再冲突；每周重复的新事件检查它的每次发生
+        EventOccurrence.objects.create(event=series, date=self.DAY + timedelta(days=2), cancelled=True)
+        self.assertEqual(conflicts_for(self.user, new), [])
+        weekly = timed_event('gym', self.DAY, '08:45', '10:00', user=self.user, recurrence='FREQ=WEEKLY')
+        self.assertEqual([c.occurrence_date for c in conflicts_for(self.user, weekly)], [self.DAY])
+
+    def test_conflicts_in_range_includes_event_from_previous_day(self):
+        self.create('night shift', self.DAY - timedelta(days=1), '22:00', '02:00')
+        self.create('early run', self.DAY, '01:00', '01:30')
+        self.create('outside', self.DAY + timedelta(days=1), '01:00', '01:30')
+        [(start, end, a, b)] = conflicts_in_range(self.user, self.DAY, self.DAY)
+        self.assertEqual((a.title, b.title), ('night shift', 'early run'))
+        self.assertEqual((from_minutes(start), from_minutes(end)), ((self.DAY, '01:00'), (self.DAY, '01:30')))
+
+
+class FreeSlotTests(ScheduleTestCase):
+    def minutes(self, day, clock_text):
+        return to_minutes(day, time(0, 0)) + parse_clock(clock_text)
+
+    def slots(self, windows):
+        return [(slot_data(w)['date'], slot_data(w)['start'], slot_data(w)['end']) for w in windows]
+
+    def test_free_windows(self):
+        day = self.DAY
+        busy = [
+            (self.minutes(day, '09:00'), self.minutes(day, '10:00')),
+            (self.minutes(day, '09:30'), self.minutes(day, '11:00')),
+            (self.minutes(day, '12:30'), self.minutes(day, '13:00')),
+            (self.minutes(day, '13:00'), self.minutes(day, '14:00')),
+        ]
+        windows = free_windows(busy, day, day, parse_clock('08:00'), parse_clock('18:00'), 60)
+        self.assertEqual(self.slots(windows), [
+            (str(day), '08:00', '09:00'), (str(day), '11:00', '12:30'), (str(day), '14:00', '18:00'),
+        ])
+        # not_before 之前不算空闲；短于 duration 的空隙不返回
+        windows = free_windows(busy, day, day, parse_clock('08:00'), parse_clock('18:00'), 90,
+                               not_before=self.minutes(day, '08:30'))
+        self.assertEqual(self.slots(windows), [(str(day), '11:00', '12:30'), (str(day), '14:00', '18:00')])
+
+    def test_event_across_midnight_blocks_next_morning(self):
+        day, next_day = self.DAY, self.DAY + timedelta(days=1)
+        busy = [(self.minutes(day, '23:00'), self.minutes(next_day, '01:00'))]
+        windows = free_windows(busy, day, next_day, 0, parse_clock('24:00'), 30)
+        self.assertEqual(self.slots(windows), [(str(day), '00:00', '23:00'), (str(next_day), '01:00', '24:00')])
+
+    def test_free_windows_match_minute_scan(self):
+        rng = Random(3)
+        day_start, day_end, duration = parse_clock('07:00'), parse_clock('22:00'), 45
+        for _ in range(50):
+            days = rng.randrange(1, 4)
+            busy = sorted(
+                (start, start + rng.choice([15, 30, 60, 90, 240]))
+                for start in (
+                    to_minutes(self.DAY, time(0, 0)) + rng.randrange(-24 * 60, days * 24 * 60, 15)
+                    for _ in range(rng.randrange(0, 15))
+                )
+            )
+            expected = []
+            for offset in range(days):
+                base = to_minutes(self.DAY + timedelta(days=offset), time(0, 0))
+                run_start = None
+                for minute in range(base + day_start, base + day_end + 1):
+                    free = minute < base + day_end and not any(s <= minute < e for s, e in busy)
+                    if free and run_start is None:
+                        run_start = minute
+                    elif not free and run_start is not None:
+                        if minute - run_start >= duration:
+                            expected.append((run_start, minute))
+                        run_start = None
+            end_date = self.DAY + timedelta(days=days - 1)
+            self.assertEqual(free_windows(busy, self.DAY, end_date, day_start, day_end, duration), expected)
+
+    def test_free_slots_from_stored_events(self):
+        day = self.DAY
+        self.create('late call', day - timedelta(days=1), '23:00', '08:30')
+        series = self.create('lecture', day - timedelta(days=7), '10:00', '12:00', recurrence='FREQ=DAILY')
+        self.create('lunch', day, '12:00')
+        EventOccurrence.objects.create(event=series, date=day + timedelta(days=1), cancelled=True)
+
+        def find(now):
+            return self.slots(free_slots(
+                self.user, day, day + timedelta(days=1), parse_clock('08:00'), parse_clock('18:00'), 60, now=now
+            ))
+
+        self.assertEqual(find(datetime(day.year, day.month, day.day, 7, 50)), [
+            (str(day), '08:30', '10:00'),  # 前一天晚上开始的事件占到 08:30
+            (str(day), '13:00', '18:00'),
+            (str(day + timedelta(days=1)), '08:00', '18:00'),  # 当天的讲座已取消
+        ])
+        # 当前时间向上取整到 09:15，到 10:00 不足 60 分钟
+        self.assertEqual(find(datetime(day.year, day.month, day.day, 9, 5, 30))[0], (str(day), '13:00', '18:00'))
+
+
+class RealtimeTests(TransactionTestCase):
+    """实时变更通道：写入在事务真正提交后才发布，回滚不发布，通知只发给该用户的订阅，SSE 视图推送通知"""
+    databases = '__all__'
+
+    def setUp(self):
+        # 分片测试库在内存中，迁移时 schema editor 打开的外键检查不会像 ensure_shard 那样靠重连恢复；
+        # 这里的写入真正提交，分片里指向主库 users 的外键需要与线上一样不检查
+        for alias in sharding.data_databases()[1:]:
+            with connections[alias].cursor() as cursor:
+                cursor.execute(settings.DATABASES[alias]['OPTIONS']['init_command'])
+        self.broker = realtime.InProcessBroker()
+        patcher = mock.patch.object(realtime, '_broker', self.broker)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        self.loop = asyncio.new_event_loop()
+        self.addCleanup(self.loop.close)
+        self.user, self.token = self.login('realtime@jarvis.local')
+        self.other, _ = self.login('realtime-other@jarvis.local')
+
+    def login(self, account_id):
+        response = Client().post('/api/v1/auth/login', {'account_id': account_id}, content_type='application/json')
+        return User.objects.get(account_id=account_id), response.json()['data']['access_token']
+
+    def subscribe(self, user):
+        async def subscribe():
+            return self.broker.subscribe(str(user.pk))
+        subscription = self.loop.run_until_complete(subscribe())
+        self.addCleanup(subscription.close)
+        return subscription
+
+    def received(self, subscription):
+        """subscription 中已到达的全部通知"""
+        async def drain():
+            messages = []
+            while (message := await subscription.get(0.01)) is not None:
+                messages.append(message)
+            return messages
+        return self.loop.run_until_complete(drain())
+
+    def create_event(self, user, title='Standup'):
+        with sharding.use_user_db(user):
+            return Event.objects.create(
+                user=user, calendar_type=CalendarType.objects.get(user=user, type_id='general'), title=title,
+                date=beijing_today(),
+            )
+
+    def upsert(self, event):
+        return {'type': 'event', 'op': 'upsert', 'id': str(event.pk), 'date': str(event.date)}
+
+    def test_broker_must_implement_both_methods(self):
+        class PublishOnly(realtime.Broker):
+            def publish(self, user_id, message):
+                pass
+
+        with self.assertRaises(TypeError):
+            PublishOnly()
+
+    def test_autocommit_write_publishes_immediately(self):
+        subscription = self.subscribe(self.user)
+        event = self.create_event(self.user)
+        self.assertEqual(self.received(subscription), [self.upsert(event)])
+
+    def test_write_in_atomic_publishes_after_commit(self):
+        subscription = self.subscribe(self.user)
+        alias = sharding.user_db(self.user)
+        with transaction.atomic(using=alias):
+            event = self.create_event(self.user)
+            with sharding.use_user_db(self.user):
+                EventLink.objects.create(event=event, url='https://example.com/agenda')
+            self.assertEqual(self.received(subscription), [])
+        # 事件与链接的两条相同通知只排队一次
+        self.assertEqual(self.received(subscription), [self.upsert(event)])
+
+    def test_rollback_publishes_nothing(self):
+        subscription = self.subscribe(self.user)
+        alias = sharding.user_db(self.user)
+        with self.assertRaises(RuntimeError), transaction.atomic(using=alias):
+            self.create_event(self.user)
+            raise RuntimeError
+        kept = self.create_event(self.user, 'Kept')
+        with transaction.atomic(using=alias):
+            with self.assertRaises(RuntimeError), transaction.atomic(using=alias):
+                self.create_event(self.user, 'Rolled back savepoint')
+                raise RuntimeError
+        self.assertEqual(self.received(subscription), [self.upsert(kept)])
+
+    def test_notifications_are_scoped_to_the_user(self):
+        mine, theirs = self.subscribe(self.user), self.subscribe(self.other)
+        event = self.create_event(self.user)
+        expected = [self.upsert(event), {'type': 'event', 'op': 'delete', 'id': str(event.pk)}]
+        with sharding.use_user_db(self.user):
+            event.delete()
+        self.assertEqual(self.received(mine), expected)
+        self.assertEqual(self.received(theirs), [])
+
+        mine.close()
+        self.create_event(self.user)
+        self.assertEqual(self.broker.subscriber_count(self.user.pk), 0)
+
+    def test_sse_view_streams_committed_changes(self):
+        async def stream():
+            response = await AsyncClient().get(f'/api/v1/changes?access_token={self.token}')
+            self.assertEqual(response['Content-Type'], 'text/event-stream')
+            chunks = response.streaming_content
+            try:
+                self.assertTrue((await anext(chunks)).startswith(b'retry: '))
+                self.assertEqual(await anext(chunks), b'data: {"type":"ready"}\n\n')
+                self.assertEqual(self.broker.subscriber_count(self.user.pk), 1)
+                await sync_to_async(self.create_event)(self.other)
+                event = await sync_to_async(self.create_event)(self.user, '周会')
+                return event, await anext(chunks)
+            finally:
+                await chunks.aclose()
+
+        event, chunk = async_to_sync(stream)()
+        self.assertEqual(chunk, f'data: {realtime.dumps(self.upsert(event))}\n\n'.encode())
+        self.assertEqual(self.broker.subscriber_count(), 0)
+
+
+class AttachmentLifecycleTests(ApiTestCase):
+    """去重 blob 的引用计数、删除队列与垃圾回收：共享内容在最后一个引用消失前不能被删除"""
+
+    CONTENT = b'shared lecture notes'
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.alice = Account('blob-alice@jarvis.local', SMALL_SCALE)
+        cls.bob = Account('blob-bob@jarvis.local', SMALL_SCALE)
+
+    def upload(self, account, content=CONTENT):
+        response = account.client().post('/api/v1/files/upload', {
+            'file': SimpleUploadedFile('notes.txt', content, content_type='text/plain'),
+        })
+        self.assertEqual(response.status_code, 201)
+        with sharding.use_user_db(account.user):
+            return UploadedFile.objects.get(pk=response.json()['data']['id'])
+
+    def delete(self, account, file_obj):
+        response = account.client().delete(f'/api/v1/files/{file_obj.pk}')
+        self.assertEqual(response.status_code, 200)
+
+    def path(self, name):
+        return os.path.join(settings.MEDIA_ROOT, name)
+
+    def blob(self, file_obj):
+        return FileBlob.objects.filter(pk=file_obj.blob_id).first()
+
+    def test_shared_blob_survives_until_last_copy_is_deleted(self):
+        first, second = self.upload(self.alice), self.upload(self.bob)
+        self.assertEqual(first.blob_id, second.blob_id)
+        name = self.blob(first).file.name
+        self.assertEqual(self.blob(first).ref_count, 2)
+        self.assertTrue(os.path.exists(self.path(name)))
+
+        self.delete(self.alice, first)
+        self.assertEqual(self.blob(second).ref_count, 1)
+        self.assertFalse(FileDeletion.objects.exists())
+        self.assertEqual(drain_deletions(), (0, 0))
+        result = collect_garbage()
+        self.assertEqual((result['refs_fixed'], result['blobs_removed'], result['stray_files']), (0, 0, 0))
+        self.assertEqual(self.blob(second).ref_count, 1)
+        self.assertTrue(os.path.exists(self.path(name)))
+
+        self.delete(self.bob, second)
+        self.assertIsNone(self.blob(second))
+        # 文件随事务进入删除队列，由后台线程（这里直接调用）删除
+        self.assertEqual(list(FileDeletion.objects.values_list('name', flat=True)), [name])
+        self.assertTrue(os.path.exists(self.path(name)))
+        self.assertEqual(drain_deletions(), (1, 0))
+        self.assertFalse(os.path.exists(self.path(name)))
+        self.assertFalse(FileDeletion.objects.exists())
+
+    def test_reupload_before_drain_keeps_new_file(self):
+        first = self.upload(self.alice)
+        old_name = self.blob(first).file.name
+        self.delete(self.alice, first)
+        # 旧文件还在删除队列中时重新上传同样的内容：新 blob 不能被队列删掉
+        again = self.upload(self.bob)
+        new_name = self.blob(again).file.name
+        # 旧文件尚未删除，新 blob 存为另一个文件名
+        self.assertNotEqual(new_name, old_name)
+        self.assertEqual(drain_deletions(), (1, 0))
+        self.assertTrue(os.path.exists(self.path(new_name)))
+        self.assertFalse(os.path.exists(self.path(old_name)))
+        self.assertEqual(self.blob(again).ref_count, 1)
+
+    def test_orphan_uploads_release_their_reference(self):
+        attached, orphan = self.upload(self.alice), self.upload(self.bob)
+        with sharding.use_user_db(self.alice.user):
+            Event.objects.filter(pk=self.alice.plain_event.pk).update(attachment=attached)
+        name = self.blob(attached).file.name
+
+        # 宽限期之后，未关联事件的附件按正常删除流程释放，仍被事件引用的内容保留
+        result = collect_garbage(now=timezone.now() + timedelta(hours=settings.ATTACHMENT_ORPHAN_GRACE_HOURS + 1))
+        with sharding.use_user_db(self.bob.user):
+            self.assertFalse(UploadedFile.objects.filter(pk=orphan.pk).exists())
+        self.assertGreaterEqual(result['orphan_uploads'], 1)
+        self.assertEqual(self.blob(attached).ref_count, 1)
+        self.assertTrue(os.path.exists(self.path(name)))
+
+    def test_reconcile_blob_refs(self):
+        shared, _ = self.upload(self.alice), self.upload(self.bob)
+        lost = self.upload(self.alice, b'content whose record disappeared')
+        lost_name = self.blob(lost).file.name
+        FileBlob.objects.filter(pk=shared.blob_id).update(ref_count=5)
+        # 记录被级联删除等途径绕过 release_blob：blob 仍记着一个引用
+        with sharding.use_user_db(self.alice.user):
+            UploadedFile.objects.filter(pk=lost.pk).delete()
+
+        self.assertEqual(reconcile_blob_refs(dry_run=True), (2, 1))
+        self.assertEqual(self.blob(shared).ref_count, 5)
+
+        self.assertEqual(reconcile_blob_refs(), (2, 1))
+        self.assertEqual(self.blob(shared).ref_count, 2)
+        self.assertIsNone(self.blob(lost))
+        self.assertEqual(drain_deletions(), (1, 0))
+        self.assertFalse(os.path.exists(self.path(lost_name)))
+        self.assertTrue(os.path.exists(self.path(self.blob(shared).file.name)))
+        self.assertEqual(reconcile_blob_refs(), (0, 0))
+
+    def test_stray_files(self):
+        kept = self.upload(self.alice)
+        directory = self.path('attachments/zz')
+        os.makedirs(directory, exist_ok=True)
+        old, fresh = os.path.join(directory, 'old.bin'), os.path.join(directory, 'fresh.bin')
+        for path in (old, fresh):
+            with open(path, 'wb') as f:
+                f.write(b'left over')
+        day_ago = clock.time() - 86400 * 2
+        os.utime(old, (day_ago, day_ago))
+        # 已被记录引用的文件不论多旧都不是孤立文件
+        kept_path = self.path(self.blob(kept).file.name)
+        os.utime(kept_path, (day_ago, day_ago))
+
+        cutoff = timezone.now() - timedelta(days=1)
+        self.assertEqual(stray_files(cutoff), ['attachments/zz/old.bin'])
+        result = collect_garbage(grace_hours=24)
+        self.assertEqual(result['stray_files'], 1)
+        self.assertFalse(os.path.exists(old))
+        self.assertTrue(os.path.exists(fresh))
+        self.assertTrue(os.path.exists(kept_path))
+
+
+def replica_routing():
+    """
+    在子进程中执行（ReplicaTests）：主库与一个真实的副本文件（replica1），JARVIS_ASYNC_VIEWS 决定事件列表
+    走同步还是异步视图。每次读取前只在主库插入一条事件，响应中有它即说明读的是主库。
+    输出各场景读取来源（default / replica1）的 JSON。
+    """
+    call_command('migrate', verbosity=0, interactive=False)
+    is_async = settings.ASYNC_READ_VIEWS
+    today = beijing_today()
+    tokens, users = {}, {}
+    for account_id in ('alice', 'bob'):
+        login = Client().post(
+            '/api/v1/auth/login', {'account_id': account_id, 'device_id': 'replica'}, content_type='application/json'
+        )
+        tokens[account_id] = login.json()['data']['access_token']
+        users[account_id] = User.objects.get(account_id=account_id)
+
+    def send(method, path, account_id, **kwargs):
+        client = AsyncClient() if is_async else Client()
+        call = getattr(client, method)
+        return (async_to_sync(call) if is_async else call)(
+            path, headers={'Authorization': f'Bearer {tokens[account_id]}'}, **kwargs
+        )
+
+    def source(account_id):
+        user = users[account_id]
+        marker = Event.objects.create(
+            user=user, calendar_type=CalendarType.objects.get(user=user, type_id='general'),
+            title=f'primary-{clock.monotonic_ns()}', date=today, is_all_day=True,
+        )
+        events = send('get', f'/api/v1/events?date={today}', account_id).json()['data']['events']
+        return 'default' if marker.title in {e['title'] for e in events} else 'replica1'
+
+    def fresh_replica():
+        replicas.sync_replicas()
+        cache.clear()
+
+    results = {}
+    fresh_replica()
+    results['fresh'] = source('alice')
+
+    # 副本心跳停在一小时前：延迟超过 REPLICA_MAX_LAG_SECONDS，读取回到主库
+    replica = sqlite3.connect(settings.DATABASES['replica1']['NAME'])
+    with replica:
+        replica.execute("UPDATE replication_heartbeat SET updated_at = datetime('now', '-1 hour')")
+    replica.close()
+    replicas._heartbeats.clear()
+    results['lagging'] = source('alice')
+
+    # 写入之后该用户在 REPLICA_STICKY_SECONDS 内读主库，其他用户不受影响
+    fresh_replica()
+    created = send('post', '/api/v1/events', 'alice', content_type='application/json', data={
+        'title': 'Written', 'date': today.isoformat(), 'type_id': 'general',
+    })
+    assert created.status_code == 201, created.content
+    results['after_write'] = source('alice')
+    results['other_user'] = source('bob')
+    clock.sleep(settings.REPLICA_STICKY_SECONDS + 0.2)
+    fresh_replica()
+    results['sticky_expired'] = source('alice')
+
+    # 同一请求内：写入之前读副本，写入之后读主库；请求结束后该用户被标记
+    fresh_replica()
+    seen = []
+    alice = users['alice']
+    if is_async:
+        async def view(request):
+            seen.append(await sync_to_async(router.db_for_read)(Event))
+            await User.objects.filter(pk=alice.pk).aupdate(home_address='CUHK')
+            seen.append(await sync_to_async(router.db_for_read)(Event))
+            return HttpResponse()
+    else:
+        def view(request):
+            seen.append(router.db_for_read(Event))
+            User.objects.filter(pk=alice.pk).update(home_address='CUHK')
+            seen.append(router.db_for_read(Event))
+            return HttpResponse()
+    handler = replicas.ReplicaStickinessMiddleware(replicas.replica_reads(view))
+    request = RequestFactory().get('/')
+    request.user = alice
+    (async_to_sync(handler) if is_async else handler)(request)
+    results['same_request'] = seen
+    results['marked_sticky'] = replicas.is_sticky(alice.pk)
+    print(json.dumps(results), flush=True)
+
+
+class ReplicaTests(SimpleTestCase):
+    """读写分离（真实的主库与副本文件，在子进程中分别以同步和异步视图运行 replica_routing）"""
+
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.results = {is_async: cls.run_routing(is_async) for is_async in (False, True)}
+
+    @staticmethod
+    def run_routing(is_async):
+        workdir = tempfile.mkdtemp()
+        try:
+            env = {
+                **os.environ,
+                'DJANGO_SETTINGS_MODULE': 'jarvis_backend.settings',
+                'JARVIS_DB_PATH': os.path.join(workdir, 'db.sqlite3'),
+                'JARVIS_DB_REPLICAS': os.path.join(workdir, 'replica1.sqlite3'),
+                'JARVIS_REPLICA_MAX_LAG_SECONDS': '1',
+                'JARVIS_ASYNC_VIEWS': '1' if is_async else '0',
+                'JARVIS_SHARDS': '0',
+            }
+            script = 'import django; django.setup(); from api.tests import replica_routing as run; run()'
+            result = subprocess.run(
+                [sys.executable, '-c', script], cwd=settings.BASE_DIR, env=env,
+                capture_output=True, text=True, timeout=120,
+            )
+        finally:
+            shutil.rmtree(workdir, ignore_errors=True)
+        try:
+            return json.loads(result.stdout.strip().splitlines()[-1])
+        except (IndexError, ValueError):
+            return {'error': result.stdout + result.stderr}
+
+    def assertSources(self, expected):
+        for is_async, results in self.results.items():
+            with self.subTest(async_views=is_async):
+                self.assertNotIn('error', results, results.get('error'))
+                self.assertEqual({key: results[key] for key in expected}, expected)
+
+    def test_lagging_replica_is_skipped(self):
+        self.assertSources({'fresh': 'replica1', 'lagging': 'default'})
+
+    def test_reads_stay_on_primary_after_a_write(self):
+        self.assertSources({'after_write': 'default', 'other_user': 'replica1', 'sticky_expired': 'replica1'})
+
+    def test_reads_after_a_write_in_the_same_request_use_primary(self):
+        self.assertSources({'same_request': ['replica1', 'default'], 'marked_sticky': True})
@@ -1,32 +1,53 @@
+from django.conf import settings
 from django.urls import path
-from . import views
+from . import views, async_views
+
+# ASGI 部署时读多的端点使用异步实现（见 api/async_views.py）
+read_views = async_views if settings.ASYNC_READ_VIEWS else views
 
 urlpatterns = [
     # Auth
     path('auth/login', views.auth_login, name='auth_login'),
     path('auth/logout', views.auth_logout, name='auth_logout'),
     
+    # Metrics（Prometheus 抓取，见 api/metrics.py）
+    path('_metrics', views.metrics_export, name='metrics_export'),
+    
     # Time
-    path('time', views.get_server_time, name='get_server_time'),
+    path('time', read_views.get_server_time, name='get_server_time'),
     
     # User
     path('user', views.user_detail, name='user_detail'),
     path('user/location', views.user_location, name='user_location'),
+    path('user/location/batch', views.user_location_batch, name='user_location_batch'),
     
     # Calendar Types
-    path('calendar-types', views.calendar_types_list, name='calendar_types_list'),
+    path('calendar-types', read_views.calendar_types_list, name='calendar_types_list'),
     path('calendar-types/<str:type_id>', views.calendar_type_detail, name='calendar_type_detail'),
     path('calendar-types/<str:type_id>/visibility', views.calendar_type_visibility, name='calendar_type_visibility'),
     
     # Events
-    path('events', views.events_list, name='events_list'),
+    path('events', read_views.events_list, name='events_list'),
+    path('events/conflicts', views.events_conflicts, name='events_conflicts'),
+    path('events/search', views.events_search, name='events_search'),
     path('events/<uuid:event_id>', views.event_detail, name='event_detail'),
     path('events/<uuid:event_id>/complete', views.event_complete, name='event_complete'),
     path('events/<uuid:event_id>/links', views.event_links, name='event_links'),
     
+    # Changes（实时变更通道，SSE；WebSocket 见 api/realtime.py）
+    path('changes', async_views.changes, name='changes'),
+    
+    # Schedule
+    path('schedule/free-slots', views.schedule_free_slots, name='schedule_free_slots'),
+    
     # Files
     path('files/upload', views.file_upload, name='file_upload'),
     path('files/<uuid:file_id>', views.file_delete, name='file_delete'),
+    path('files/<uuid:file_id>/download', views.file_download, name='file_download'),
+    path('files/<uuid:file_id>/preview', views.file_preview, name='file_preview'),
+    path('files/uploads', views.upload_session_create, name='upload_session_create'),
+    path('files/uploads/<uuid:upload_id>', views.upload_session_detail, name='upload_session_detail'),
+    path('files/uploads/<uuid:upload_id>/complete', views.upload_session_complete, name='upload_session_complete'),
     
     # Reminders (Placeholder)
     path('reminders', views.reminders_list, name='reminders_list'),
@@ -35,11 +56,11 @@ urlpatterns = [
     path('location/commute', views.location_commute, name='location_commute'),
     
     # Agent API - 为AI Agent提供接口
-    path('agent/info', views.agent_info, name='agent_info'),
+    path('agent/info', read_views.agent_info, name='agent_info'),
     path('agent/action', views.agent_action, name='agent_action'),
     
     # Agent AI Endpoints - 供前端调用，对接外部AI Agent
-    path('agent/reminder-context', views.agent_reminder_context, name='agent_reminder_context'),
+    path('agent/reminder-context', read_views.agent_reminder_context, name='agent_reminder_context'),
     path('agent/parse-task', views.agent_parse_task, name='agent_parse_task'),
     path('agent/parse-calendar-type', views.agent_parse_calendar_type, name='agent_parse_calendar_type'),
     path('agent/parse-event', views.agent_parse_event, name='agent_parse_event'),
@@ -3,11 +3,16 @@ from rest_framework import status
 from rest_framework.decorators import api_view, permission_classes, authentication_classes
 from rest_framework.permissions import AllowAny, IsAuthenticated
 from rest_framework.response import Response
+from django.conf import settings
+from django.db import router
+from django.http import HttpResponse
 from django.utils import timezone
-from django.db import transaction
+from django.db.models import Count, OuterRef, Q, Subquery
+from django.db.models.functions import Coalesce
 from datetime import timedelta, date, timezone as dt_timezone
+import hmac
+import re
 import uuid
-import os
 
 # 北京时间时区 (UTC+8)
 BEIJING_TZ = dt_timezone(timedelta(hours=8))
@@ -16,15 +21,26 @@ def beijing_today():
     """获取当前北京时间的日期"""
     return timezone.now().astimezone(BEIJING_TZ).date()
 
-from .models import User, UserLocation, AccessToken, CalendarType, Event, EventLink, UploadedFile
+from .models import (
+    LOCATION_COLUMNS, User, UserLocation, CalendarType, Event, EventLink, EventOccurrence, FileBlob,
+    UploadedFile, UploadSession
+)
 from .serializers import (
     UserSerializer, UserLocationSerializer, CalendarTypeSerializer,
     CalendarTypeCreateSerializer, EventSerializer, EventCreateSerializer,
     EventUpdateSerializer, EventCompleteSerializer, LinkSerializer,
-    LoginSerializer, LocationUpdateSerializer, UserUpdateSerializer,
-    UploadedFileSerializer
+    LoginSerializer, LocationUpdateSerializer, LocationBatchSerializer,
+    UserUpdateSerializer, UploadedFileSerializer, UploadSessionCreateSerializer
+)
+from .authentication import TokenAuthentication, get_bearer_token, issue_token, revoke_token
+from . import commute, conflicts, metrics, realtime, recurrence, schedule, search, sharding, streaming
+from .attachments import (
+    create_session, delete_uploaded_file, discard_session, finalize_session, store_upload, write_chunk
 )
-from .authentication import TokenAuthentication
+from .downloads import file_response, verify_signature
+from .geo import downsample_fixes
+from .previews import preview_response, verify_preview_signature
+from .replicas import replica_reads
 
 # 模块级日志器
 logger = logging.getLogger(__name__)
@@ -67,8 +83,390 @@ def create_default_calendar_types(user):
         {'type_id': 'holidays', 'name': 'Holidays', 'color': '#3B82F6', 'is_deletable': True},
         {'type_id': 'school', 'name': 'School', 'color': '#22C55E', 'is_deletable': True},
     ]
-    for type_data in default_types:
-        CalendarType.objects.create(user=user, **type_data)
+    with sharding.use_user_db(user):
+        CalendarType.objects.bulk_create([CalendarType(user=user, **type_data) for type_data in default_types])
+
+
+def location_to_dict(location):
+    """位置记录 -> 响应字典（无记录返回None）"""
+    if not location:
+        return None
+    return {
+        'latitude': location.latitude,
+        'longitude': location.longitude,
+        'accuracy': location.accuracy,
+        'timestamp': location.timestamp.isoformat()
+    }
+
+
+def trim_user_locations(user):
+    """只保留用户最新的 LOCATION_RETENTION 条位置记录（一条 DELETE 语句完成）"""
+    latest_ids = UserLocation.objects.filter(user=user).order_by('-timestamp').values('id')[:settings.LOCATION_RETENTION]
+    UserLocation.objects.filter(user=user).exclude(id__in=latest_ids).delete()
+
+
+def store_user_locations(user, fixes):
+    """
+    写入位置记录，并在同一事务中更新用户表上的当前/上一位置冗余列。
+    fixes: [{'latitude', 'longitude', 'accuracy', 'timestamp'(可选)}]，返回新建的 UserLocation 列表
+    """
+    with sharding.use_user_db(user), sharding.atomic(central=True):
+        # 先锁住用户行再合并，避免并发上报互相覆盖冗余列
+        locked = User.objects.select_for_update().only(*LOCATION_COLUMNS).get(pk=user.pk)
+        created = UserLocation.objects.bulk_create([
+            UserLocation(
+                user=user,
+                latitude=f['latitude'],
+                longitude=f['longitude'],
+                accuracy=f.get('accuracy'),
+                **({'timestamp': f['timestamp']} if f.get('timestamp') else {})
+            )
+            for f in fixes
+        ])
+        trim_user_locations(user)
+        
+        candidates = [loc for loc in (locked.current_location, locked.previous_location) if loc] + created
+        candidates.sort(key=lambda loc: loc.timestamp, reverse=True)
+        candidates += [None, None]
+        columns = User.location_columns(candidates[0], candidates[1])
+        User.objects.filter(pk=user.pk).update(**columns)
+    
+    for name, value in columns.items():
+        setattr(user, name, value)
+    return created
+
+
+def calendar_types_with_counts(user):
+    """用户的日历类型，附带事件数（一次查询完成，避免逐个COUNT）"""
+    # 用相关子查询而不是 GROUP BY，保持类型原有的返回顺序
+    event_counts = Event.objects.filter(
+        calendar_type=OuterRef('pk')
+    ).order_by().values('calendar_type').annotate(c=Count('id')).values('c')
+    return CalendarType.objects.filter(user=user).annotate(num_events=Coalesce(Subquery(event_counts), 0))
+
+
+def event_window(params):
+    """
+    events_list 展开重复事件的日期窗口：date，或 start_date / end_date；
+    未指定的一侧取今天前后 RECURRENCE_WINDOW_DAYS 天（单次事件仍只按给出的参数过滤）
+    """
+    if params.get('date'):
+        day = date.fromisoformat(params['date'])
+        return day, day
+    default = timedelta(days=settings.RECURRENCE_WINDOW_DAYS)
+    start_date = date.fromisoformat(params['start_date']) if params.get('start_date') else None
+    end_date = date.fromisoformat(params['end_date']) if params.get('end_date') else None
+    if start_date is None:
+        start_date = min(end_date or beijing_today(), beijing_today()) - default
+    if end_date is None:
+        end_date = max(start_date, beijing_today()) + default
+    return start_date, end_date
+
+
+def filter_events(events, params):
+    """按查询参数过滤事件（events_list GET）；重复系列按 event_window 取出，由 list_occurrences 展开"""
+    date = params.get('date')
+    start_date = params.get('start_date')
+    end_date = params.get('end_date')
+    type_id = params.get('type_id')
+    completed = params.get('completed')
+
+    single = Q(recurrence='')
+    if date:
+        single &= Q(date=date)
+    if start_date:
+        single &= Q(date__gte=start_date)
+    if end_date:
+        single &= Q(date__lte=end_date)
+    window_start, window_end = event_window(params)
+    series = ~Q(recurrence='') & recurrence.events_in_window(window_start, window_end)
+    events = events.filter(single | series).prefetch_related(recurrence.occurrence_prefetch(window_start, window_end))
+    if type_id:
+        events = events.filter(calendar_type__type_id=type_id)
+    if completed is not None:
+        # 重复事件的完成状态按次记录，展开后再过滤
+        completed_bool = completed.lower() == 'true'
+        events = events.filter(Q(completed=completed_bool) | ~Q(recurrence=''))
+    return events
+
+
+def completed_filter(params):
+    """completed 查询参数：True / False，未给出时为None"""
+    completed = params.get('completed')
+    return None if completed is None else completed.lower() == 'true'
+
+
+def list_occurrences(events, params):
+    """把 filter_events 的结果在窗口内展开，并按各次的完成状态过滤"""
+    start_date, end_date = event_window(params)
+    occurrences = recurrence.expand(events, start_date, end_date)
+    completed = completed_filter(params)
+    if completed is not None:
+        occurrences = [e for e in occurrences if e.completed == completed]
+    return occurrences
+
+
+def events_list_range(params):
+    """events_list 中单次事件的日期范围，未限定的一侧为None"""
+    if params.get('date'):
+        day = date.fromisoformat(params['date'])
+        return day, day
+    start_date = params.get('start_date')
+    end_date = params.get('end_date')
+    return (date.fromisoformat(start_date) if start_date else None,
+            date.fromisoformat(end_date) if end_date else None)
+
+
+def wants_stream(params, start_date, end_date):
+    """
+    是否流式输出列表：?stream=true / false 显式指定；否则日期范围达到 STREAM_MIN_DAYS 天
+    （或有一侧不限日期）时流式输出。两种方式的响应体相同
+    """
+    value = params.get('stream')
+    if value is not None:
+        return value.lower() in ('true', '1')
+    if start_date is None or end_date is None:
+        return True
+    return (end_date - start_date).days + 1 >= settings.STREAM_MIN_DAYS
+
+
+def stream_db():
+    """
+    流式响应在视图返回后才查询，此时分片与副本的上下文已重置；
+    在视图中取出当前应读取的数据库，查询集用 .using() 固定
+    """
+    return router.db_for_read(Event)
+
+
+def iter_occurrences(events, start_date, end_date, completed=None):
+    """
+    流式输出用的 list_occurrences：单次事件按 (date, start_time) 用 iterator 分块读取，
+    重复系列一次取出、在窗口内惰性展开后归并，顺序与 recurrence.expand 相同
+    """
+    merger = recurrence.OccurrenceMerger(list(events.exclude(recurrence='')), start_date, end_date)
+    singles = events.filter(recurrence='').order_by('date', 'start_time')
+    for event in singles.iterator(chunk_size=settings.STREAM_CHUNK_SIZE):
+        for item in merger.before(recurrence.sort_key(event)):
+            if completed is None or item.completed == completed:
+                yield item
+        yield event
+    for item in merger.before(None):
+        if completed is None or item.completed == completed:
+            yield item
+
+
+def events_stream(request):
+    """events_list 的流式响应体（events 与 total，与非流式相同）"""
+    total = 0
+
+    def serialize(chunk):
+        nonlocal total
+        total += len(chunk)
+        return EventSerializer(chunk, many=True, context={'request': request}).data
+
+    return streaming.JsonStream({'events': None, 'total': lambda: total}, 'events', serialize)
+
+
+def occurrence_of(event, value):
+    """重复事件的发生日期（date 或 ISO 字符串）；不是该系列的一次发生时返回None"""
+    try:
+        day = value if isinstance(value, date) else date.fromisoformat(str(value))
+    except ValueError:
+        return None
+    return day if recurrence.is_occurrence(recurrence.parse_rule(event.recurrence), event.date, day) else None
+
+
+def set_occurrence(event, day, **fields):
+    """记录重复事件某一次的例外（完成状态或取消），返回 EventOccurrence"""
+    occurrence, _ = EventOccurrence.objects.update_or_create(event=event, date=day, defaults=fields)
+    return occurrence
+
+
+def agent_info_date_range(params):
+    """agent_info 的日期范围（默认今天起30天）"""
+    start_date = params.get('start_date')
+    end_date = params.get('end_date')
+
+    if not start_date:
+        start_date = date.today()
+    else:
+        start_date = date.fromisoformat(start_date)
+
+    if not end_date:
+        end_date = start_date + timedelta(days=30)
+    else:
+        end_date = date.fromisoformat(end_date)
+    return start_date, end_date
+
+
+def agent_info_events(user, start_date, end_date):
+    """窗口内的单次事件与重复系列（由 recurrence.expand 展开）"""
+    return Event.objects.filter(recurrence.events_in_window(start_date, end_date), user=user).select_related(
+        'calendar_type', 'attachment'
+    ).prefetch_related('links', recurrence.occurrence_prefetch(start_date, end_date)).order_by('date', 'start_time')
+
+
+def agent_event_data(e):
+    """agent_info 中的单个事件（或一次发生）"""
+    return {
+        'id': str(e.id),
+        'title': e.title,
+        'date': e.date.isoformat(),
+        'is_all_day': e.is_all_day,
+        'start_time': e.start_time.strftime('%H:%M') if e.start_time else None,
+        'end_time': e.end_time.strftime('%H:%M') if e.end_time else None,
+        'location': e.location,
+        'type_id': e.calendar_type.type_id if e.calendar_type else 'general',
+        'color': e.calendar_type.color if e.calendar_type else '#6B7280',
+        'completed': e.completed,
+        'recurrence': e.recurrence,
+        'occurrence_date': e.occurrence_date.isoformat() if getattr(e, 'occurrence_date', None) else None,
+        'links': [link.url for link in e.links.all()],
+        'has_attachment': e.attachment is not None
+    }
+
+
+class AgentInfoSummary:
+    """agent_info 的统计信息，随事件逐个累计（流式输出时在事件写完后取值）"""
+
+    def __init__(self, start_date, end_date):
+        self.start_date = start_date
+        self.end_date = end_date
+        self.today = date.today()
+        self.total = self.completed = self.today_events = 0
+
+    def add(self, events):
+        for e in events:
+            self.total += 1
+            self.completed += e.completed
+            self.today_events += e.date == self.today
+
+    def data(self):
+        return {
+            'total_events': self.total,
+            'completed_events': self.completed,
+            'pending_events': self.total - self.completed,
+            'today_events': self.today_events,
+            'date_range': {
+                'start': self.start_date.isoformat(),
+                'end': self.end_date.isoformat()
+            }
+        }
+
+
+def agent_info_data(user, calendar_types, events_data, summary):
+    """agent_info 的响应数据；流式输出时 events_data 为占位、summary 为可调用对象"""
+    types_data = [
+        {
+            'id': t.type_id,
+            'name': t.name,
+            'color': t.color,
+            'is_visible': t.is_visible,
+            'is_deletable': t.is_deletable,
+            'event_count': t.num_events
+        }
+        for t in calendar_types
+    ]
+
+    return {
+        'user': {
+            'account_id': user.account_id,
+            'home_address': user.home_address,
+            'school_address': user.school_address
+        },
+        'location': {
+            'current': location_to_dict(user.current_location),
+            'previous': location_to_dict(user.previous_location)
+        },
+        'calendar_types': types_data,
+        'events': events_data,
+        'summary': summary,
+        'server_time': timezone.now().isoformat()
+    }
+
+
+def build_agent_info(user, calendar_types, events, start_date, end_date):
+    """组装 agent_info 响应数据（入参均为已查询好的对象，位置取自用户行，不再访问数据库）"""
+    summary = AgentInfoSummary(start_date, end_date)
+    summary.add(events)
+    return agent_info_data(user, calendar_types, [agent_event_data(e) for e in events], summary.data())
+
+
+def agent_info_stream(user, calendar_types, start_date, end_date):
+    """agent_info 的流式响应体（与 build_agent_info 的结果相同）"""
+    summary = AgentInfoSummary(start_date, end_date)
+
+    def serialize(chunk):
+        summary.add(chunk)
+        return [agent_event_data(e) for e in chunk]
+
+    return streaming.JsonStream(agent_info_data(user, calendar_types, None, summary.data), 'events', serialize)
+
+
+def reminder_context_events(user, today, end_date):
+    return Event.objects.filter(recurrence.events_in_window(today, end_date), user=user).select_related(
+        'calendar_type'
+    ).prefetch_related(recurrence.occurrence_prefetch(today, end_date)).order_by('date', 'start_time')
+
+
+def build_reminder_context(user, events, today, end_date):
+    """组装 agent_reminder_context 响应数据（不含附件和链接）"""
+    events_data = [
+        {
+            'id': str(e.id),
+            'title': e.title,
+            'date': e.date.isoformat(),
+            'is_all_day': e.is_all_day,
+            'start_time': e.start_time.strftime('%H:%M') if e.start_time else None,
+            'end_time': e.end_time.strftime('%H:%M') if e.end_time else None,
+            'location': e.location,
+            'type_id': e.calendar_type.type_id if e.calendar_type else 'general',
+            'type_name': e.calendar_type.name if e.calendar_type else 'General',
+            'color': e.calendar_type.color if e.calendar_type else '#6B7280',
+            'completed': e.completed
+        }
+        for e in events
+    ]
+
+    return {
+        'user': {
+            'account_id': user.account_id,
+            'home_address': user.home_address or '',
+            'school_address': user.school_address or ''
+        },
+        'current_location': location_to_dict(user.current_location),
+        # 当前位置（没有则从家出发）到学校的通勤估算，供提醒卡片直接使用
+        'commute': commute.commute_between(user, 'current' if user.current_location else 'home', 'school'),
+        'events': events_data,
+        'date_range': {
+            'start': today.isoformat(),
+            'end': end_date.isoformat()
+        },
+        'server_time': timezone.now().isoformat()
+    }
+
+
+def wants_conflicts(request):
+    """写入接口可选返回时间冲突：?check_conflicts=true 或请求体中 "check_conflicts": true"""
+    value = request.query_params.get('check_conflicts')
+    if value is None and hasattr(request.data, 'get'):
+        value = request.data.get('check_conflicts')
+    return str(value).lower() in ('1', 'true', 'yes')
+
+
+def event_conflicts(user, event):
+    """与事件时间重叠的已有事件摘要（写入接口的 conflicts 字段）"""
+    return [conflicts.conflict_data(e) for e in conflicts.conflicts_for(user, event)]
+
+
+def server_time_data():
+    now = timezone.now()
+    return {
+        'server_time': now.isoformat(),
+        'timezone': 'UTC',
+        'date': now.strftime('%Y-%m-%d'),
+        'timestamp': int(now.timestamp() * 1000)
+    }
 
 
 # ==================== AUTH ====================
@@ -84,27 +482,25 @@ def auth_login(request):
     
     account_id = serializer.validated_data['account_id']
     
-    with transaction.atomic():
-        user, is_new = User.objects.get_or_create(account_id=account_id)
-        
-        if is_new:
-            create_default_calendar_types(user)
-        
-        # 创建新token
-        token = str(uuid.uuid4())
-        expires_at = timezone.now() + timedelta(days=7)
-        
-        AccessToken.objects.create(
-            user=user,
-            token=token,
-            expires_at=expires_at
-        )
+    # 老用户登录只读 users 表，签发 token 时才可能写库；新用户在事务中创建
+    user = User.objects.filter(account_id=account_id).first()
+    is_new = user is None
+    if is_new:
+        # 新用户的分片在首次登录时分配，分片库不存在时先创建
+        shard, alias = sharding.assign_shard(account_id)
+        sharding.ensure_shard(alias)
+        with sharding.use_db(alias), sharding.atomic(central=True):
+            user, is_new = User.objects.get_or_create(account_id=account_id, defaults={'shard': shard})
+            if is_new:
+                create_default_calendar_types(user)
+    
+    access_token = issue_token(user, serializer.validated_data['device_id'])
     
     user_serializer = UserSerializer(user)
     
     return make_response({
-        'access_token': token,
-        'expires_in': 7 * 24 * 3600,
+        'access_token': access_token.token,
+        'expires_in': int((access_token.expires_at - timezone.now()).total_seconds()),
         'is_new_user': is_new,
         'user': user_serializer.data
     })
@@ -116,8 +512,7 @@ def auth_login(request):
 def auth_logout(request):
     """用户登出"""
     if request.auth:
-        request.auth.is_active = False
-        request.auth.save()
+        revoke_token(request.auth)
     return make_response(message='Logged out successfully')
 
 
@@ -128,13 +523,7 @@ def auth_logout(request):
 @permission_classes([AllowAny])
 def get_server_time(request):
     """获取服务器时间"""
-    now = timezone.now()
-    return make_response({
-        'server_time': now.isoformat(),
-        'timezone': 'UTC',
-        'date': now.strftime('%Y-%m-%d'),
-        'timestamp': int(now.timestamp() * 1000)
-    })
+    return make_response(server_time_data())
 
 
 # ==================== USER ====================
@@ -159,7 +548,8 @@ def user_detail(request):
             user.home_address = serializer.validated_data['home_address']
         if 'school_address' in serializer.validated_data:
             user.school_address = serializer.validated_data['school_address']
-        user.save()
+        # 只写地址列：鉴权时读取的位置冗余列可能已被并发的位置上报更新
+        user.save(update_fields=['home_address', 'school_address', 'updated_at'])
         
         return make_response(UserSerializer(user).data)
 
@@ -172,33 +562,16 @@ def user_location(request):
     user = request.user
     
     if request.method == 'GET':
-        latest_location = user.locations.first()
-        if not latest_location:
-            return make_response(None)
-        
-        return make_response({
-            'latitude': latest_location.latitude,
-            'longitude': latest_location.longitude,
-            'accuracy': latest_location.accuracy,
-            'timestamp': latest_location.timestamp.isoformat()
-        })
+        # 直接读取用户行上的冗余列，不再查询 user_locations
+        return make_response(location_to_dict(user.current_location))
     
     elif request.method == 'POST':
         serializer = LocationUpdateSerializer(data=request.data)
         if not serializer.is_valid():
             return make_error_response('VALIDATION_ERROR', 'Invalid data', serializer.errors)
         
-        location = UserLocation.objects.create(
-            user=user,
-            latitude=serializer.validated_data['latitude'],
-            longitude=serializer.validated_data['longitude'],
-            accuracy=serializer.validated_data.get('accuracy')
-        )
-        
-        # 只保留最新的2条位置记录，删除其他的
-        old_locations = user.locations.order_by('-timestamp')[2:]
-        for old_loc in old_locations:
-            old_loc.delete()
+        # 写入并只保留最新的2条位置记录，同时更新用户表上的当前位置
+        location, = store_user_locations(user, [serializer.validated_data])
         
         return make_response({
             'location_id': str(location.id),
@@ -209,17 +582,58 @@ def user_location(request):
         })
 
 
+@api_view(['POST'])
+@authentication_classes([TokenAuthentication])
+@permission_classes([IsAuthenticated])
+def user_location_batch(request):
+    """
+    批量上报定位轨迹
+    
+    请求: { "points": [{"latitude", "longitude", "accuracy", "timestamp"}, ...] }
+    与上一个保留点距离/时间间隔小于阈值的点被丢弃（见 settings.LOCATION_*_EPSILON_*），
+    幸存点一次 bulk insert 写入，超出保留条数的旧记录用一条 DELETE 清理，
+    并同步用户表上的当前/上一位置。
+    """
+    user = request.user
+    
+    serializer = LocationBatchSerializer(data=request.data)
+    if not serializer.is_valid():
+        return make_error_response('VALIDATION_ERROR', 'Invalid data', serializer.errors)
+    
+    points = serializer.validated_data['points']
+    latest = user.current_location
+    anchor = latest._asdict() if latest else None
+    kept = downsample_fixes(
+        points,
+        anchor,
+        distance_epsilon_m=settings.LOCATION_DISTANCE_EPSILON_M,
+        time_epsilon_s=settings.LOCATION_TIME_EPSILON_S
+    )
+    
+    # 超出保留条数的点写入后会立即被清理，只写入最新的几条
+    to_store = kept[-settings.LOCATION_RETENTION:]
+    created = store_user_locations(user, to_store)
+    
+    return make_response({
+        'received': len(points),
+        'stored': len(created),
+        'dropped': len(points) - len(kept),
+        'latest': location_to_dict(user.current_location)
+    })
+
+
 # ==================== CALENDAR TYPES ====================
 
 @api_view(['GET', 'POST'])
 @authentication_classes([TokenAuthentication])
 @permission_classes([IsAuthenticated])
+@replica_reads
 def calendar_types_list(request):
     """获取/创建日历类型"""
     user = request.user
     
     if request.method == 'GET':
-        types = CalendarType.objects.filter(user=user)
+        types = calendar_types_with_counts(user)
         serializer = CalendarTypeSerializer(types, many=True)
         return make_response(serializer.data)
     
@@ -310,36 +724,26 @@ def calendar_type_visibility(request, type_id):
 @api_view(['GET', 'POST'])
 @authentication_classes([TokenAuthentication])
 @permission_classes([IsAuthenticated])
+@replica_reads
 def events_list(request):
     """获取/创建事件"""
     user = request.user
     
     if request.method == 'GET':
-        events = Event.objects.filter(user=user).select_related('calendar_type', 'attachment').prefetch_related('links')
-        
-        # 过滤
-        date = request.query_params.get('date')
-        start_date = request.query_params.get('start_date')
-        end_date = request.query_params.get('end_date')
-        type_id = request.query_params.get('type_id')
-        completed = request.query_params.get('completed')
-        
-        if date:
-            events = events.filter(date=date)
-        if start_date:
-            events = events.filter(date__gte=start_date)
-        if end_date:
-            events = events.filter(date__lte=end_date)
-        if type_id:
-            events = events.filter(calendar_type__type_id=type_id)
-        if completed is not None:
-            completed_bool = completed.lower() == 'true'
-            events = events.filter(completed=completed_bool)
+        params = request.query_params
+        events = Event.objects.filter(user=user).select_related('calendar_type', 'attachment').prefetch_related('links', 'attachment__blob')
+        events = filter_events(events, params)
+        if wants_stream(params, *events_list_range(params)):
+            start_date, end_date = event_window(params)
+            items = iter_occurrences(events.using(stream_db()), start_date, end_date, completed_filter(params))
+            return streaming.stream_response(events_stream(request), items)
+        # 重复事件在窗口内展开
+        events = list_occurrences(events, params)
         
         serializer = EventSerializer(events, many=True, context={'request': request})
         return make_response({
             'events': serializer.data,
-            'total': events.count()
+            'total': len(events)
         })
     
     elif request.method == 'POST':
@@ -363,7 +767,7 @@ def events_list(request):
             except UploadedFile.DoesNotExist:
                 pass
         
-        with transaction.atomic():
+        with sharding.atomic():
             event = Event.objects.create(
                 user=user,
                 calendar_type=calendar_type,
@@ -373,6 +777,7 @@ def events_list(request):
                 start_time=data.get('start_time'),
                 end_time=data.get('end_time'),
                 location=data.get('location', ''),
+                recurrence=data['recurrence'],
                 attachment=attachment
             )
             
@@ -380,11 +785,69 @@ def events_list(request):
             for url in data.get('links', []):
                 EventLink.objects.create(event=event, url=url)
         
-        return make_response(
-            EventSerializer(event, context={'request': request}).data,
-            message='Event created successfully',
-            status_code=201
-        )
+        event_data = EventSerializer(event, context={'request': request}).data
+        if wants_conflicts(request):
+            event_data['conflicts'] = event_conflicts(user, event)
+        return make_response(event_data, message='Event created successfully', status_code=201)
+
+
+@api_view(['GET'])
+@authentication_classes([TokenAuthentication])
+@permission_classes([IsAuthenticated])
+@replica_reads
+def events_conflicts(request):
+    """日期范围内时间重叠的定时事件（默认今天起30天，重复事件按每次发生比较）"""
+    try:
+        start_date, end_date = agent_info_date_range(request.query_params)
+    except ValueError:
+        return make_error_response('VALIDATION_ERROR', 'Dates must be in YYYY-MM-DD format')
+    if end_date < start_date:
+        return make_error_response('VALIDATION_ERROR', 'end_date must not be earlier than start_date')
+    
+    pairs = conflicts.conflicts_in_range(request.user, start_date, end_date)
+    return make_response({
+        'conflicts': [conflicts.pair_data(pair) for pair in pairs],
+        'total': len(pairs),
+        'date_range': {
+            'start': start_date.isoformat(),
+            'end': end_date.isoformat()
+        }
+    })
+
+
+@api_view(['GET'])
+@authentication_classes([TokenAuthentication])
+@permission_classes([IsAuthenticated])
+@replica_reads
+def events_search(request):
+    """
+    按标题、地点与链接全文搜索事件（FTS5 trigram 索引，按相关度排序）。
+    q: 搜索词（空格分隔的词都需匹配）；start_date / end_date: 可选日期范围；limit: 默认 50，最多 200
+    """
+    params = request.query_params
+    query = params.get('q', '').strip()
+    if not query:
+        return make_error_response('VALIDATION_ERROR', 'q is required')
+    try:
+        limit = int(params.get('limit', 50))
+    except ValueError:
+        return make_error_response('VALIDATION_ERROR', 'limit must be an integer')
+    if not 1 <= limit <= search.MAX_LIMIT:
+        return make_error_response('VALIDATION_ERROR', f'limit must be between 1 and {search.MAX_LIMIT}')
+    try:
+        start_date = date.fromisoformat(params['start_date']) if params.get('start_date') else None
+        end_date = date.fromisoformat(params['end_date']) if params.get('end_date') else None
+    except ValueError:
+        return make_error_response('VALIDATION_ERROR', 'Dates must be in YYYY-MM-DD format')
+    if start_date and end_date and end_date < start_date:
+        return make_error_response('VALIDATION_ERROR', 'end_date must not be earlier than start_date')
+
+    events = search.search_events(request.user, query, start_date, end_date, limit)
+    return make_response({
+        'events': EventSerializer(events, many=True, context={'request': request}).data,
+        'total': len(events),
+        'query': query
+    })
 
 
 @api_view(['GET', 'PUT', 'DELETE'])
@@ -395,7 +858,7 @@ def event_detail(request, event_id):
     user = request.user
     
     try:
-        event = Event.objects.select_related('calendar_type', 'attachment').prefetch_related('links').get(id=event_id, user=user)
+        event = Event.objects.select_related('calendar_type', 'attachment').prefetch_related('links', 'attachment__blob').get(id=event_id, user=user)
     except Event.DoesNotExist:
         return make_error_response('NOT_FOUND', 'Event not found', status_code=404)
     
@@ -421,6 +884,12 @@ def event_detail(request, event_id):
             event.end_time = data['end_time']
         if 'location' in data:
             event.location = data['location']
+        if 'recurrence' in data:
+            event.recurrence = data['recurrence']
+        if 'completed' in data and event.recurrence:
+            return make_error_response(
+                'VALIDATION_ERROR', 'Recurring events are completed per occurrence', {'completed': ['Use PATCH /complete with occurrence_date']}
+            )
         if 'completed' in data:
             event.completed = data['completed']
             if data['completed']:
@@ -456,24 +925,24 @@ def event_detail(request, event_id):
         # 重新加载以获取最新的attachment数据
         event.refresh_from_db()
         
-        return make_response(
-            EventSerializer(event, context={'request': request}).data,
-            message='Event updated successfully'
-        )
+        event_data = EventSerializer(event, context={'request': request}).data
+        if wants_conflicts(request):
+            event_data['conflicts'] = event_conflicts(user, event)
+        return make_response(event_data, message='Event updated successfully')
     
     elif request.method == 'DELETE':
+        # 重复事件带 occurrence_date 时只取消这一次
+        if request.query_params.get('occurrence_date') and event.recurrence:
+            day = occurrence_of(event, request.query_params['occurrence_date'])
+            if day is None:
+                return make_error_response('NOT_FOUND', 'Occurrence not found', status_code=404)
+            set_occurrence(event, day, cancelled=True)
+            return make_response(message='Occurrence cancelled successfully')
+        
         # 删除关联的附件文件
         if event.attachment:
-            attachment = event.attachment
-            # 删除物理文件
-            if attachment.file:
-                try:
-                    if os.path.isfile(attachment.file.path):
-                        os.remove(attachment.file.path)
-                except Exception as e:
-                    print(f"Failed to delete file: {e}")
-            # 删除数据库记录
-            attachment.delete()
+            # 删除附件记录，内容无其他引用时删除物理文件
+            delete_uploaded_file(event.attachment)
         
         event.delete()
         return make_response(message='Event deleted successfully')
@@ -495,6 +964,24 @@ def event_complete(request, event_id):
     if not serializer.is_valid():
         return make_error_response('VALIDATION_ERROR', 'Invalid data', serializer.errors)
     
+    # 重复事件按次记录完成状态
+    if event.recurrence:
+        if 'occurrence_date' not in serializer.validated_data:
+            return make_error_response(
+                'VALIDATION_ERROR', 'Invalid data', {'occurrence_date': ['Required for recurring events']}
+            )
+        day = occurrence_of(event, serializer.validated_data['occurrence_date'])
+        if day is None:
+            return make_error_response('NOT_FOUND', 'Occurrence not found', status_code=404)
+        completed = serializer.validated_data['completed']
+        occurrence = set_occurrence(event, day, completed=completed, completed_at=timezone.now() if completed else None)
+        return make_response({
+            'id': str(event.id),
+            'occurrence_date': day.isoformat(),
+            'completed': occurrence.completed,
+            'completed_at': occurrence.completed_at.isoformat() if occurrence.completed_at else None
+        })
+    
     event.completed = serializer.validated_data['completed']
     if event.completed:
         event.completed_at = timezone.now()
@@ -534,10 +1021,65 @@ def event_links(request, event_id):
     
     elif request.method == 'DELETE':
         EventLink.objects.filter(event=event, url=url).delete()
+        realtime.event_changed(event)
         links = [link.url for link in event.links.all()]
         return make_response({'links': links})
 
 
+# ==================== SCHEDULE ====================
+
+@api_view(['GET'])
+@authentication_classes([TokenAuthentication])
+@permission_classes([IsAuthenticated])
+@replica_reads
+def schedule_free_slots(request):
+    """
+    日期范围内不短于 duration 分钟的空闲时段（默认只查今天），由定时事件一次排序扫描得出。
+    duration: 分钟数（默认 60）；start / end: YYYY-MM-DD；day_start / day_end: 每天可安排的时间 HH:MM
+    """
+    params = request.query_params
+    try:
+        duration = int(params.get('duration', 60))
+    except ValueError:
+        return make_error_response('VALIDATION_ERROR', 'duration must be an integer number of minutes')
+    if not 1 <= duration <= conflicts.MINUTES_PER_DAY:
+        return make_error_response('VALIDATION_ERROR', 'duration must be between 1 and 1440 minutes')
+
+    today = beijing_today()
+    try:
+        start_date = date.fromisoformat(params['start']) if params.get('start') else today
+        end_date = date.fromisoformat(params['end']) if params.get('end') else start_date
+    except ValueError:
+        return make_error_response('VALIDATION_ERROR', 'Dates must be in YYYY-MM-DD format')
+    if end_date < start_date:
+        return make_error_response('VALIDATION_ERROR', 'end must not be earlier than start')
+    if (end_date - start_date).days >= settings.FREE_SLOTS_MAX_DAYS:
+        return make_error_response(
+            'VALIDATION_ERROR', f'Date range must not exceed {settings.FREE_SLOTS_MAX_DAYS} days'
+        )
+
+    try:
+        day_start = schedule.parse_clock(params.get('day_start') or settings.FREE_SLOTS_DAY_START)
+        day_end = schedule.parse_clock(params.get('day_end') or settings.FREE_SLOTS_DAY_END)
+    except ValueError:
+        return make_error_response('VALIDATION_ERROR', 'day_start and day_end must be in HH:MM format')
+    if day_end <= day_start:
+        return make_error_response('VALIDATION_ERROR', 'day_end must be later than day_start')
+
+    # 已经过去的时间不算空闲
+    now = timezone.now().astimezone(BEIJING_TZ).replace(tzinfo=None)
+    windows = schedule.free_slots(request.user, start_date, end_date, day_start, day_end, duration, now=now)
+    return make_response({
+        'slots': [schedule.slot_data(window) for window in windows],
+        'total': len(windows),
+        'duration': duration,
+        'date_range': {
+            'start': start_date.isoformat(),
+            'end': end_date.isoformat()
+        }
+    })
+
+
 # ==================== FILES ====================
 
 @api_view(['POST'])
@@ -547,22 +1089,29 @@ def file_upload(request):
     """上传文件"""
     user = request.user
     
-    if 'file' not in request.FILES:
+    # 请求体明显超限时不读取数据直接拒绝（预留 64KB 给 multipart 边界和其他字段）
+    try:
+        content_length = int(request.META.get('CONTENT_LENGTH') or 0)
+    except ValueError:
+        content_length = 0
+    if content_length > settings.ATTACHMENT_MAX_BYTES + 64 * 1024:
+        return make_error_response('FILE_TOO_LARGE', 'File size exceeds 10MB limit', status_code=413)
+    
+    # 上传数据由 HashingUploadHandler 逐块写入临时文件并计算 sha256
+    files = request.FILES
+    if getattr(request, 'upload_too_large', False):
+        return make_error_response('FILE_TOO_LARGE', 'File size exceeds 10MB limit', status_code=413)
+    if 'file' not in files:
         return make_error_response('VALIDATION_ERROR', 'No file provided')
     
-    uploaded_file = request.FILES['file']
+    uploaded_file = files['file']
     
     # 检查文件大小 (10MB)
-    if uploaded_file.size > 10 * 1024 * 1024:
+    if uploaded_file.size > settings.ATTACHMENT_MAX_BYTES:
         return make_error_response('FILE_TOO_LARGE', 'File size exceeds 10MB limit', status_code=413)
     
-    file_obj = UploadedFile.objects.create(
-        user=user,
-        file=uploaded_file,
-        original_name=uploaded_file.name,
-        size=uploaded_file.size,
-        mime_type=uploaded_file.content_type or 'application/octet-stream'
-    )
+    # 相同内容只保存一份，多条记录共享同一个 blob
+    file_obj = store_upload(user, uploaded_file)
     
     return make_response(
         UploadedFileSerializer(file_obj, context={'request': request}).data,
@@ -570,6 +1119,56 @@ def file_upload(request):
     )
 
 
+def signed_file(file_id, owner_id):
+    """签名链接指向的附件（请求未经鉴权，按签名中的所有者定位其分片）"""
+    owner = User.objects.filter(pk=owner_id).only('pk', 'shard').first()
+    if owner is None:
+        return None
+    with sharding.use_user_db(owner):
+        return UploadedFile.objects.filter(id=file_id, user_id=owner.pk).first()
+
+
+@api_view(['GET', 'HEAD'])
+@authentication_classes([TokenAuthentication])
+@permission_classes([AllowAny])
+def file_download(request, file_id):
+    """
+    下载附件：支持 Range、ETag / Last-Modified 条件请求，大文件不读入内存
+    鉴权：Bearer token，或 download_url 中的限时签名（?sig=）；?download=1 时以附件形式下载
+    """
+    if request.user and request.user.is_authenticated:
+        file_obj = UploadedFile.objects.filter(id=file_id, user=request.user).first()
+    else:
+        owner_id = verify_signature(request.query_params.get('sig', ''), file_id)
+        if owner_id is None:
+            return make_error_response('UNAUTHORIZED', 'Authentication credentials were not provided', status_code=401)
+        file_obj = signed_file(file_id, owner_id)
+    
+    if file_obj is None or not file_obj.file:
+        return make_error_response('NOT_FOUND', 'File not found', status_code=404)
+    
+    return file_response(request, file_obj, as_attachment=request.query_params.get('download') == '1')
+
+
+@api_view(['GET', 'HEAD'])
+@authentication_classes([TokenAuthentication])
+@permission_classes([AllowAny])
+def file_preview(request, file_id):
+    """附件预览图（图片缩略图 / PDF 首页），鉴权方式同下载，带长期缓存头"""
+    if request.user and request.user.is_authenticated:
+        file_obj = UploadedFile.objects.filter(id=file_id, user=request.user).first()
+    else:
+        owner_id = verify_preview_signature(request.query_params.get('sig', ''), file_id)
+        if owner_id is None:
+            return make_error_response('UNAUTHORIZED', 'Authentication credentials were not provided', status_code=401)
+        file_obj = signed_file(file_id, owner_id)
+    
+    if file_obj is None or file_obj.blob is None or file_obj.blob.preview_status != FileBlob.PREVIEW_READY:
+        return make_error_response('NOT_FOUND', 'Preview not available', status_code=404)
+    
+    return preview_response(request, file_obj.blob)
+
+
 @api_view(['DELETE'])
 @authentication_classes([TokenAuthentication])
 @permission_classes([IsAuthenticated])
@@ -582,16 +1181,121 @@ def file_delete(request, file_id):
     except UploadedFile.DoesNotExist:
         return make_error_response('NOT_FOUND', 'File not found', status_code=404)
     
-    # 删除实际文件
-    if file_obj.file:
-        if os.path.isfile(file_obj.file.path):
-            os.remove(file_obj.file.path)
-    
-    file_obj.delete()
+    # 删除记录；内容的最后一个引用消失时才删除实际文件
+    delete_uploaded_file(file_obj)
     
     return make_response(message='File deleted successfully')
 
 
+def upload_session_data(session):
+    return {
+        'upload_id': str(session.id),
+        'name': session.original_name,
+        'size': session.size,
+        'offset': session.received,
+        'expires_at': session.expires_at.isoformat()
+    }
+
+
+def get_upload_session(user, upload_id):
+    """用户未过期的续传会话，不存在时返回None"""
+    return UploadSession.objects.filter(id=upload_id, user=user, expires_at__gte=timezone.now()).first()
+
+
+CONTENT_RANGE_RE = re.compile(r'^bytes (\d+)-(\d+)/(\d+|\*)$')
+
+
+@api_view(['POST'])
+@authentication_classes([TokenAuthentication])
+@permission_classes([IsAuthenticated])
+def upload_session_create(request):
+    """
+    创建分块续传会话
+    
+    请求: { "name": "report.pdf", "size": 10485760, "mime_type": "application/pdf" }
+    之后用 PUT /files/uploads/<upload_id>（Content-Range: bytes start-end/size）上传各块，
+    中断后 GET 会话取得 offset 从该处续传，全部写入后 POST .../complete 生成附件。
+    """
+    serializer = UploadSessionCreateSerializer(data=request.data)
+    if not serializer.is_valid():
+        return make_error_response('VALIDATION_ERROR', 'Invalid data', serializer.errors)
+    
+    data = serializer.validated_data
+    session = create_session(request.user, data['name'], data['size'], data['mime_type'])
+    return make_response(upload_session_data(session), status_code=201)
+
+
+@api_view(['GET', 'PUT', 'DELETE'])
+@authentication_classes([TokenAuthentication])
+@permission_classes([IsAuthenticated])
+def upload_session_detail(request, upload_id):
+    """查询续传进度 / 上传一块数据 / 放弃上传"""
+    session = get_upload_session(request.user, upload_id)
+    if session is None:
+        return make_error_response('NOT_FOUND', 'Upload session not found or expired', status_code=404)
+    
+    if request.method == 'GET':
+        return make_response(upload_session_data(session))
+    
+    if request.method == 'DELETE':
+        discard_session(session)
+        return make_response(message='Upload cancelled')
+    
+    # PUT: 请求体是原始字节，按 Content-Range 的起始偏移直接写入磁盘
+    match = CONTENT_RANGE_RE.match(request.META.get('HTTP_CONTENT_RANGE', ''))
+    if not match:
+        return make_error_response('VALIDATION_ERROR', 'Content-Range header required: bytes start-end/size')
+    start, end = int(match.group(1)), int(match.group(2))
+    if match.group(3) != '*' and int(match.group(3)) != session.size:
+        return make_error_response('VALIDATION_ERROR', 'Total size does not match the upload session')
+    if end < start or end >= session.size:
+        return make_error_response('INVALID_RANGE', 'Range outside of the declared file size', status_code=416)
+    if start > session.received:
+        # 不允许留空洞：客户端应从 offset 处续传
+        return make_error_response(
+            'OFFSET_MISMATCH', f'Expected chunk starting at byte {session.received}',
+            {'offset': session.received}, status_code=409
+        )
+    
+    # 请求体长度必须与 Content-Range 一致：多出的字节不写入，长度不符时整块拒绝
+    expected = end - start + 1
+    content_length = request.META.get('CONTENT_LENGTH') or ''
+    if content_length.isdigit() and int(content_length) != expected:
+        return make_error_response(
+            'VALIDATION_ERROR', f'Body is {content_length} bytes but Content-Range covers {expected}',
+            {'offset': session.received}
+        )
+    written = write_chunk(session, request.stream, start, end)
+    if written != expected:
+        # 请求体提前结束：已写入的部分保留，客户端从 offset 处续传
+        return make_error_response(
+            'VALIDATION_ERROR', f'Received {written} of {expected} bytes declared by Content-Range',
+            {'offset': session.received}
+        )
+    return make_response(upload_session_data(session))
+
+
+@api_view(['POST'])
+@authentication_classes([TokenAuthentication])
+@permission_classes([IsAuthenticated])
+def upload_session_complete(request, upload_id):
+    """所有数据写入后生成附件，返回与 /files/upload 相同的文件信息"""
+    session = get_upload_session(request.user, upload_id)
+    if session is None:
+        return make_error_response('NOT_FOUND', 'Upload session not found or expired', status_code=404)
+    if session.received < session.size:
+        return make_error_response(
+            'INCOMPLETE_UPLOAD', f'Received {session.received} of {session.size} bytes',
+            {'offset': session.received}, status_code=409
+        )
+    
+    file_obj = finalize_session(session)
+    return make_response(
+        UploadedFileSerializer(file_obj, context={'request': request}).data,
+        status_code=201
+    )
+
+
 # ==================== REMINDERS (Placeholder) ====================
 
 @api_view(['GET'])
@@ -645,45 +1349,20 @@ def reminders_list(request):
     return make_response(reminders)
 
 
-# ==================== COMMUTE (Placeholder) ====================
+# ==================== COMMUTE ====================
 
 @api_view(['GET'])
 @authentication_classes([TokenAuthentication])
 @permission_classes([IsAuthenticated])
 def location_commute(request):
-    """获取通勤信息 - 返回占位数据"""
-    user = request.user
-    
+    """
+    获取通勤信息 - 离线估算（本地地名表 + 球面距离 + 出行方式速度模型）
+    from/to: home | school | current | "lat,lng"
+    """
     from_param = request.query_params.get('from', 'home')
     to_param = request.query_params.get('to', 'school')
     
-    return make_response({
-        'from': {
-            'type': from_param,
-            'address': user.home_address if from_param == 'home' else user.school_address,
-            'coordinates': {'lat': 22.3964, 'lng': 114.1095}
-        },
-        'to': {
-            'type': to_param,
-            'address': user.school_address if to_param == 'school' else user.home_address,
-            'coordinates': {'lat': 22.4196, 'lng': 114.2068}
-        },
-        'routes': [
-            {
-                'mode': 'driving',
-                'duration_minutes': 25,
-                'distance_km': 8.5,
-                'traffic_status': 'normal'
-            },
-            {
-                'mode': 'transit',
-                'duration_minutes': 35,
-                'distance_km': 9.2,
-                'transit_details': 'MTR East Rail Line'
-            }
-        ],
-        'maps_url': 'https://maps.google.com/'
-    })
+    return make_response(commute.commute_between(request.user, from_param, to_param))
 
 
 # ==================== AGENT API ====================
@@ -691,6 +1370,7 @@ def location_commute(request):
 @api_view(['GET'])
 @authentication_classes([TokenAuthentication])
 @permission_classes([IsAuthenticated])
+@replica_reads
 def agent_info(request):
     """
     为AI Agent提供完整的用户和日程信息
@@ -698,107 +1378,18 @@ def agent_info(request):
     """
     user = request.user
     
-    # 获取用户位置
-    current_location = None
-    previous_location = None
-    locations = list(user.locations.order_by('-timestamp')[:2])
-    if len(locations) > 0:
-        current_location = {
-            'latitude': locations[0].latitude,
-            'longitude': locations[0].longitude,
-            'accuracy': locations[0].accuracy,
-            'timestamp': locations[0].timestamp.isoformat()
-        }
-    if len(locations) > 1:
-        previous_location = {
-            'latitude': locations[1].latitude,
-            'longitude': locations[1].longitude,
-            'accuracy': locations[1].accuracy,
-            'timestamp': locations[1].timestamp.isoformat()
-        }
-    
-    # 获取所有日历类型
-    calendar_types = CalendarType.objects.filter(user=user)
-    types_data = [
-        {
-            'id': t.type_id,
-            'name': t.name,
-            'color': t.color,
-            'is_visible': t.is_visible,
-            'is_deletable': t.is_deletable,
-            'event_count': t.events.count()
-        }
-        for t in calendar_types
-    ]
-    
-    # 获取指定日期范围的事件（默认未来30天）
-    from datetime import date, timedelta
-    start_date = request.query_params.get('start_date')
-    end_date = request.query_params.get('end_date')
-    
-    if not start_date:
-        start_date = date.today()
-    else:
-        start_date = date.fromisoformat(start_date)
-    
-    if not end_date:
-        end_date = start_date + timedelta(days=30)
-    else:
-        end_date = date.fromisoformat(end_date)
-    
-    events = Event.objects.filter(
-        user=user,
-        date__gte=start_date,
-        date__lte=end_date
-    ).select_related('calendar_type', 'attachment').prefetch_related('links').order_by('date', 'start_time')
-    
-    events_data = [
-        {
-            'id': str(e.id),
-            'title': e.title,
-            'date': e.date.isoformat(),
-            'is_all_day': e.is_all_day,
-            'start_time': e.start_time.strftime('%H:%M') if e.start_time else None,
-            'end_time': e.end_time.strftime('%H:%M') if e.end_time else None,
-            'location': e.location,
-            'type_id': e.calendar_type.type_id if e.calendar_type else 'general',
-            'color': e.calendar_type.color if e.calendar_type else '#6B7280',
-            'completed': e.completed,
-            'links': [link.url for link in e.links.all()],
-            'has_attachment': e.attachment is not None
-        }
-        for e in events
-    ]
-    
-    # 统计信息
-    total_events = events.count()
-    completed_events = events.filter(completed=True).count()
-    today_events = events.filter(date=date.today()).count()
+    # 所有日历类型（含事件数）、日期范围内的事件（默认未来30天）；位置取自用户行
+    calendar_types = list(calendar_types_with_counts(user))
+    start_date, end_date = agent_info_date_range(request.query_params)
+    if wants_stream(request.query_params, start_date, end_date):
+        events = agent_info_events(user, start_date, end_date).using(stream_db())
+        return streaming.stream_response(
+            agent_info_stream(user, calendar_types, start_date, end_date),
+            iter_occurrences(events, start_date, end_date)
+        )
+    events = recurrence.expand(agent_info_events(user, start_date, end_date), start_date, end_date)
     
-    return make_response({
-        'user': {
-            'account_id': user.account_id,
-            'home_address': user.home_address,
-            'school_address': user.school_address
-        },
-        'location': {
-            'current': current_location,
-            'previous': previous_location
-        },
-        'calendar_types': types_data,
-        'events': events_data,
-        'summary': {
-            'total_events': total_events,
-            'completed_events': completed_events,
-            'pending_events': total_events - completed_events,
-            'today_events': today_events,
-            'date_range': {
-                'start': start_date.isoformat(),
-                'end': end_date.isoformat()
-            }
-        },
-        'server_time': timezone.now().isoformat()
-    })
+    return make_response(build_agent_info(user, calendar_types, events, start_date, end_date))
 
 
 @api_view(['POST'])
@@ -844,7 +1435,8 @@ def agent_action(request):
                 is_all_day=payload.get('is_all_day', True),
                 start_time=payload.get('start_time'),
                 end_time=payload.get('end_time'),
-                location=payload.get('location', '')
+                location=payload.get('location', ''),
+                recurrence=recurrence.normalize(payload.get('recurrence') or '')
             )
             
             # 添加链接
@@ -854,6 +1446,10 @@ def agent_action(request):
             result['status'] = 'success'
             result['event_id'] = str(event.id)
             result['message'] = f"Event '{event.title}' created successfully"
+            if wants_conflicts(request):
+                # payload 中的日期和时间是字符串，重新读取为 date / time
+                event.refresh_from_db()
+                result['conflicts'] = event_conflicts(user, event)
         
         elif action == 'update_event':
             event_id = payload.get('event_id')
@@ -871,10 +1467,15 @@ def agent_action(request):
                 event.end_time = payload['end_time']
             if 'location' in payload:
                 event.location = payload['location']
+            if 'recurrence' in payload:
+                event.recurrence = recurrence.normalize(payload['recurrence'] or '')
             
             event.save()
             result['status'] = 'success'
             result['message'] = f"Event '{event.title}' updated successfully"
+            if wants_conflicts(request):
+                event.refresh_from_db()
+                result['conflicts'] = event_conflicts(user, event)
         
         elif action == 'delete_event':
             event_id = payload.get('event_id')
@@ -883,14 +1484,7 @@ def agent_action(request):
             
             # 删除关联的附件（和event_detail一样的处理）
             if event.attachment:
-                attachment = event.attachment
-                if attachment.file:
-                    try:
-                        if os.path.isfile(attachment.file.path):
-                            os.remove(attachment.file.path)
-                    except Exception as e:
-                        print(f"Failed to delete file: {e}")
-                attachment.delete()
+                delete_uploaded_file(event.attachment)
             
             # EventLink会自动通过CASCADE删除
             event.delete()
@@ -901,9 +1495,19 @@ def agent_action(request):
             event_id = payload.get('event_id')
             completed = payload.get('completed', True)
             event = Event.objects.get(id=event_id, user=user)
-            event.completed = completed
-            event.completed_at = timezone.now() if completed else None
-            event.save()
+            if event.recurrence:
+                # 重复事件按次完成，payload 需带 occurrence_date
+                day = occurrence_of(event, payload.get('occurrence_date'))
+                if day is None:
+                    result['status'] = 'error'
+                    result['message'] = 'occurrence_date is required and must be an occurrence of this recurring event'
+                    return make_response(result)
+                set_occurrence(event, day, completed=completed, completed_at=timezone.now() if completed else None)
+                result['occurrence_date'] = day.isoformat()
+            else:
+                event.completed = completed
+                event.completed_at = timezone.now() if completed else None
+                event.save()
             result['status'] = 'success'
             result['message'] = f"Event '{event.title}' marked as {'completed' if completed else 'incomplete'}"
         
@@ -964,6 +1568,7 @@ def agent_action(request):
 @api_view(['GET'])
 @authentication_classes([TokenAuthentication])
 @permission_classes([IsAuthenticated])
+@replica_reads
 def agent_reminder_context(request):
     """
     为AI Reminder提供上下文数据
@@ -973,58 +1578,12 @@ def agent_reminder_context(request):
     """
     user = request.user
     
-    # 获取用户当前位置
-    current_location = None
-    latest_location = user.locations.first()
-    if latest_location:
-        current_location = {
-            'latitude': latest_location.latitude,
-            'longitude': latest_location.longitude,
-            'accuracy': latest_location.accuracy,
-            'timestamp': latest_location.timestamp.isoformat()
-        }
-    
     # 获取未来10天的事件（不含附件和链接）
     today = beijing_today()  # 使用北京时间
     end_date = today + timedelta(days=10)
+    events = recurrence.expand(reminder_context_events(user, today, end_date), today, end_date)
     
-    events = Event.objects.filter(
-        user=user,
-        date__gte=today,
-        date__lte=end_date
-    ).select_related('calendar_type').order_by('date', 'start_time')
-    
-    events_data = [
-        {
-            'id': str(e.id),
-            'title': e.title,
-            'date': e.date.isoformat(),
-            'is_all_day': e.is_all_day,
-            'start_time': e.start_time.strftime('%H:%M') if e.start_time else None,
-            'end_time': e.end_time.strftime('%H:%M') if e.end_time else None,
-            'location': e.location,
-            'type_id': e.calendar_type.type_id if e.calendar_type else 'general',
-            'type_name': e.calendar_type.name if e.calendar_type else 'General',
-            'color': e.calendar_type.color if e.calendar_type else '#6B7280',
-            'completed': e.completed
-        }
-        for e in events
-    ]
-    
-    return make_response({
-        'user': {
-            'account_id': user.account_id,
-            'home_address': user.home_address or '',
-            'school_address': user.school_address or ''
-        },
-        'current_location': current_location,
-        'events': events_data,
-        'date_range': {
-            'start': today.isoformat(),
-            'end': end_date.isoformat()
-        },
-        'server_time': timezone.now().isoformat()
-    })
+    return make_response(build_reminder_context(user, events, today, end_date))
 
 
 @api_view(['POST'])
@@ -1124,7 +1683,7 @@ def agent_parse_task(request):
     )
     
     # 返回创建的事件数据（和EventSerializer字段对齐）
-    return make_response({
+    response = {
         'event': {
             'id': str(event.id),
             'title': event.title,
@@ -1142,7 +1701,10 @@ def agent_parse_task(request):
         },
         'available_types': available_types,  # 始终返回可用类型
         'message': f"Task '{title}' created for today"
-    }, status_code=201)
+    }
+    if wants_conflicts(request):
+        response['conflicts'] = event_conflicts(user, event)
+    return make_response(response, status_code=201)
 
 
 @api_view(['POST'])
@@ -1288,19 +1850,28 @@ def agent_parse_event(request):
     if not calendar_types.filter(type_id=type_id).exists():
         type_id = 'general'
     
-    return make_response({
-        'parsed': {
-            'title': title,
-            'date': data.get('date', beijing_today().isoformat()),  # 使用北京时间
-            'is_all_day': data.get('is_all_day', True),
-            'start_time': data.get('start_time'),
-            'end_time': data.get('end_time'),
-            'location': data.get('location', ''),
-            'type_id': type_id
-        },
+    parsed = {
+        'title': title,
+        'date': data.get('date', beijing_today().isoformat()),  # 使用北京时间
+        'is_all_day': data.get('is_all_day', True),
+        'start_time': data.get('start_time'),
+        'end_time': data.get('end_time'),
+        'location': data.get('location', ''),
+        'type_id': type_id
+    }
+    response = {
+        'parsed': parsed,
         'available_types': available_types,
         'message': 'Event parsed successfully'
-    })
+    }
+    if wants_conflicts(request):
+        # 尚未创建：按解析结果构造未保存的事件检查冲突，日期或时间无法解析时不报告
+        candidate = EventCreateSerializer(data=parsed)
+        response['conflicts'] = []
+        if candidate.is_valid():
+            fields = {k: candidate.validated_data.get(k) for k in ('date', 'is_all_day', 'start_time', 'end_time')}
+            response['conflicts'] = event_conflicts(user, Event(user=user, **fields))
+    return make_response(response)
 
 
 @api_view(['POST'])
@@ -1365,5 +1936,25 @@ def agent_generate_reminders(request):
     
     # 如果没有提供任何提醒，返回空数组（前端会保持之前的数据）
     # 不再返回默认占位提醒，让前端决定如何处理
+    if processed_reminders:
+        realtime.reminders_changed(request.user, processed_reminders)
     
     return make_response(processed_reminders)
+
+
+# ==================== METRICS ====================
+
+@api_view(['GET'])
+@authentication_classes([])
+@permission_classes([AllowAny])
+def metrics_export(request):
+    """
+    Prometheus 文本格式的请求指标（见 api/metrics.py）。
+    使用独立的抓取 token（settings.METRICS_TOKEN），未配置时端点关闭
+    """
+    if not settings.METRICS_TOKEN:
+        return make_error_response('NOT_FOUND', 'Metrics endpoint is disabled', status_code=404)
+    token = get_bearer_token(request)
+    if token is None or not hmac.compare_digest(token.encode(), settings.METRICS_TOKEN.encode()):
+        return make_error_response('UNAUTHORIZED', 'Invalid metrics token', status_code=401)
+    return HttpResponse(metrics.render(), content_type='text/plain; version=0.0.4; charset=utf-8')
@@ -0,0 +1,133 @@
+"""
+Agent → 后端 传输方式基准测试
+----------------------------
+对比 agent_service 调用 Django 后端的两种传输方式的单次解析开销：
+  - http:      经回环网络 + WSGI + 中间件 + JSON 渲染（与独立部署一致）
+  - inprocess: 同进程直接调用 Django 视图
+
+一次“解析”= 两次后端调用（阶段1获取上下文 + 阶段2提交解析结果），
+与 /parse-event 的实际调用序列一致，但不经过 LLM 和 Agent 缓存。
+
+运行（在 backend 目录下）：
+  python benchmarks/agent_transport.py --iterations 500
+使用临时 SQLite 数据库，不会修改 db.sqlite3。
+"""
+
+import argparse
+import os
+import statistics
+import sys
+import tempfile
+import threading
+import time
+from pathlib import Path
+from wsgiref.simple_server import WSGIRequestHandler, WSGIServer, make_server
+from socketserver import ThreadingMixIn
+
+BACKEND_DIR = Path(__file__).resolve().parent.parent
+sys.path.insert(0, str(BACKEND_DIR))
+
+_tmpdir = tempfile.TemporaryDirectory()
+os.environ["JARVIS_DB_PATH"] = os.path.join(_tmpdir.name, "bench.sqlite3")
+os.environ.setdefault("OPENAI_API_KEY", "bench")
+os.environ.setdefault("DJANGO_SETTINGS_MODULE", "jarvis_backend.settings")
+
+import agent_service.main as agent  # noqa: E402
+
+agent.setup_django()
+
+from datetime import timedelta  # noqa: E402
+
+from django.core.management import call_command  # noqa: E402
+from django.core.wsgi import get_wsgi_application  # noqa: E402
+from django.utils import timezone  # noqa: E402
+
+from api.models import AccessToken, User  # noqa: E402
+from api.views import create_default_calendar_types  # noqa: E402
+
+
+class _QuietHandler(WSGIRequestHandler):
+    def log_message(self, format, *args):  # noqa: A002
+        pass
+
+
+class _ThreadingWSGIServer(ThreadingMixIn, WSGIServer):
+    daemon_threads = True
+
+
+def seed_user() -> str:
+    call_command("migrate", verbosity=0)
+    user = User.objects.create(account_id="bench@jarvis.local")
+    create_default_calendar_types(user)
+    token = "bench-token"
+    AccessToken.objects.create(user=user, token=token, expires_at=timezone.now() + timedelta(days=1))
+    return token
+
+
+def one_parse(token: str) -> None:
+    ctx = agent.jarvis_request("/agent/parse-event", token=token, method="POST", payload={"user_input": "明天下午三点开会"})
+    agent.jarvis_request(
+        "/agent/parse-event",
+        token=token,
+        method="POST",
+        payload={
+            "title": "开会",
+            "date": ctx["current_date"],
+            "is_all_day": False,
+            "start_time": "15:00",
+            "end_time": "16:00",
+            "location": "",
+            "type_id": ctx["available_types"][0]["id"],
+        },
+    )
+
+
+def run(transport: str, token: str, iterations: int, warmup: int) -> dict:
+    agent.JARVIS_TRANSPORT = transport
+    for _ in range(warmup):
+        one_parse(token)
+    samples = []
+    for _ in range(iterations):
+        t0 = time.perf_counter()
+        one_parse(token)
+        samples.append((time.perf_counter() - t0) * 1000)
+    samples.sort()
+
+    def pct(p: float) -> float:
+        return samples[min(len(samples) - 1, int(len(samples) * p))]
+
+    return {
+        "transport": transport,
+        "mean": statistics.fmean(samples),
+        "p50": pct(0.50),
+        "p95": pct(0.95),
+        "p99": pct(0.99),
+    }
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--iterations", type=int, default=300)
+    parser.add_argument("--warmup", type=int, default=20)
+    args = parser.parse_args()
+
+    token = seed_user()
+    server = make_server("127.0.0.1", 0, get_wsgi_application(), server_class=_ThreadingWSGIServer, handler_class=_QuietHandler)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    agent.JARVIS_API_BASE = f"http://127.0.0.1:{server.server_port}/api/v1"
+
+    try:
+        results = [run(t, token, args.iterations, args.warmup) for t in ("http", "inprocess")]
+    finally:
+        server.shutdown()
+
+    print(f"per-parse overhead, {args.iterations} parses (2 backend calls each), ms")
+    print(f"{'transport':<10} {'mean':>8} {'p50':>8} {'p95':>8} {'p99':>8}")
+    for r in results:
+        print(f"{r['transport']:<10} {r['mean']:>8.2f} {r['p50']:>8.2f} {r['p95']:>8.2f} {r['p99']:>8.2f}")
+    http_mean, inproc_mean = results[0]["mean"], results[1]["mean"]
+    print(f"inprocess saves {http_mean - inproc_mean:.2f} ms per parse ({http_mean / inproc_mean:.1f}x)")
+
+
+if __name__ == "__main__":
+    main()
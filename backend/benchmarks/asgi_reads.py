@@ -0,0 +1,136 @@
+"""
+读接口并发基准：WSGI vs ASGI（同步视图）vs ASGI（异步 ORM 视图）
+--------------------------------------------------------------
+在同一个临时数据库上依次启动三种部署，用相同的并发压测五个读接口
+（events、agent/info、agent/reminder-context、calendar-types、time）：
+  - wsgi:       manage.py runserver（当前的开发/部署方式，多线程 WSGI）
+  - asgi-sync:  uvicorn + jarvis_backend.asgi，JARVIS_ASYNC_VIEWS=0（同步视图桥接到线程）
+  - asgi-async: uvicorn + jarvis_backend.asgi，异步视图（api/async_views.py）
+
+运行（在 backend 目录下）：
+  python benchmarks/asgi_reads.py --events 500 --concurrency 1 8 32 --requests 400
+"""
+
+import argparse
+import os
+import subprocess
+import sys
+import tempfile
+import time
+from concurrent.futures import ThreadPoolExecutor
+from datetime import date, timedelta
+from pathlib import Path
+
+import requests
+
+BACKEND_DIR = Path(__file__).resolve().parent.parent
+sys.path.insert(0, str(BACKEND_DIR))
+sys.path.insert(0, str(Path(__file__).resolve().parent))
+
+from common import free_port, summarize, wait_until_up  # noqa: E402
+
+READ_PATHS = [
+    "/events",
+    "/agent/info",
+    "/agent/reminder-context",
+    "/calendar-types",
+    "/time",
+]
+
+
+def seed(env: dict, events: int) -> None:
+    """migrate + seed_demo，再为演示账号补充 events 条事件"""
+    manage = [sys.executable, "manage.py"]
+    subprocess.run(manage + ["migrate", "--verbosity", "0"], cwd=BACKEND_DIR, env=env, check=True)
+    subprocess.run(manage + ["seed_demo"], cwd=BACKEND_DIR, env=env, check=True, stdout=subprocess.DEVNULL)
+    script = f"""
+from datetime import date, timedelta
+from api.models import User, CalendarType, Event
+user = User.objects.get(account_id='jarvis@cuhk.com')
+types = list(CalendarType.objects.filter(user=user))
+today = date.today()
+Event.objects.bulk_create([
+    Event(user=user, calendar_type=types[i % len(types)], title=f'bench {{i}}',
+          date=today + timedelta(days=i % 30), is_all_day=(i % 3 == 0))
+    for i in range({events})
+])
+"""
+    subprocess.run(manage + ["shell", "-c", script], cwd=BACKEND_DIR, env=env, check=True, stdout=subprocess.DEVNULL)
+
+
+def login(base: str) -> str:
+    resp = requests.post(f"{base}/auth/login", json={"account_id": "jarvis@cuhk.com"}, timeout=10)
+    resp.raise_for_status()
+    return resp.json()["data"]["access_token"]
+
+
+def drive(base: str, token: str, total: int, concurrency: int) -> dict:
+    session_headers = {"Authorization": f"Bearer {token}"}
+    start = date.today().isoformat()
+    end = (date.today() + timedelta(days=30)).isoformat()
+
+    def one(i: int):
+        path = READ_PATHS[i % len(READ_PATHS)]
+        params = {"start_date": start, "end_date": end} if path == "/events" else None
+        t0 = time.perf_counter()
+        try:
+            ok = requests.get(f"{base}{path}", params=params, headers=session_headers, timeout=60).ok
+        except requests.RequestException:
+            ok = False
+        return (time.perf_counter() - t0) * 1000, ok
+
+    started = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=concurrency) as pool:
+        outcomes = list(pool.map(one, range(total)))
+    wall = time.perf_counter() - started
+    return summarize([ms for ms, ok in outcomes if ok], sum(1 for _, ok in outcomes if not ok), wall)
+
+
+def server_command(mode: str, port: int) -> tuple:
+    if mode == "wsgi":
+        return [sys.executable, "manage.py", "runserver", f"127.0.0.1:{port}", "--noreload"], {}
+    cmd = [sys.executable, "-m", "uvicorn", "jarvis_backend.asgi:application",
+           "--host", "127.0.0.1", "--port", str(port), "--log-level", "warning"]
+    return cmd, {"JARVIS_ASYNC_VIEWS": "1" if mode == "asgi-async" else "0"}
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--events", type=int, default=300, help="演示账号额外生成的事件数")
+    parser.add_argument("--requests", type=int, default=300, help="每个并发级别的请求数")
+    parser.add_argument("--concurrency", type=int, nargs="+", default=[1, 8, 32])
+    parser.add_argument("--modes", nargs="+", default=["wsgi", "asgi-sync", "asgi-async"],
+                        choices=["wsgi", "asgi-sync", "asgi-async"])
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        env = dict(os.environ, JARVIS_DB_PATH=os.path.join(tmp, "reads.sqlite3"))
+        env.pop("JARVIS_ASYNC_VIEWS", None)
+        seed(env, args.events)
+
+        rows = []
+        for mode in args.modes:
+            port = free_port()
+            cmd, extra_env = server_command(mode, port)
+            proc = subprocess.Popen(cmd, cwd=BACKEND_DIR, env=dict(env, **extra_env),
+                                    stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+            base = f"http://127.0.0.1:{port}/api/v1"
+            try:
+                wait_until_up(f"{base}/time")
+                token = login(base)
+                drive(base, token, len(READ_PATHS) * 4, 1)  # 预热
+                for c in args.concurrency:
+                    rows.append((mode, c, drive(base, token, args.requests, c)))
+            finally:
+                proc.terminate()
+                proc.wait(timeout=10)
+
+    print(f"read endpoints mix ({', '.join(READ_PATHS)}), {args.events} extra events, {args.requests} requests/level")
+    print(f"{'mode':<11} {'conc':>4} {'err':>4} {'rps':>8} {'p50':>8} {'p95':>8} {'p99':>8}")
+    for mode, c, r in rows:
+        print(f"{mode:<11} {c:>4} {r['errors']:>4} {r['throughput_rps']:>8.1f} "
+              f"{r['p50_ms']:>8.1f} {r['p95_ms']:>8.1f} {r['p99_ms']:>8.1f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,106 @@
+"""
+附件去重效果
+-----------
+在临时数据库和临时 MEDIA_ROOT 上模拟一批用户上传附件：每个用户从一个共享文件池
+（课程讲义、通知等，多人会上传同一份）中随机挑选若干文件上传，另有少量私有文件。
+全部经过 POST /files/upload，最后统计逻辑字节数（UploadedFile.size 之和，即去重前
+磁盘上会写入的数据量）与实际落盘的字节数，并删除一部分附件以校验引用计数。
+
+运行（在 backend 目录下）：
+  python benchmarks/attachment_dedup.py --users 40 --uploads-per-user 12
+"""
+
+import argparse
+import os
+import random
+import sys
+import tempfile
+import time
+from pathlib import Path
+
+BACKEND_DIR = Path(__file__).resolve().parent.parent
+sys.path.insert(0, str(BACKEND_DIR))
+
+
+def disk_usage(root: Path) -> int:
+    return sum(p.stat().st_size for p in root.rglob("*") if p.is_file())
+
+
+def make_pool(rng: random.Random, count: int, min_kb: int, max_kb: int) -> list:
+    return [(f"shared-{i}.pdf", rng.randbytes(rng.randint(min_kb, max_kb) * 1024)) for i in range(count)]
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--users", type=int, default=40)
+    parser.add_argument("--uploads-per-user", type=int, default=12)
+    parser.add_argument("--shared-files", type=int, default=30, help="共享文件池大小")
+    parser.add_argument("--private-ratio", type=float, default=0.2, help="上传私有（不重复）文件的比例")
+    parser.add_argument("--min-kb", type=int, default=50)
+    parser.add_argument("--max-kb", type=int, default=2048)
+    parser.add_argument("--delete-ratio", type=float, default=0.3, help="最后随机删除的附件比例")
+    parser.add_argument("--seed", type=int, default=7)
+    args = parser.parse_args()
+
+    tmp = tempfile.TemporaryDirectory()
+    media_root = Path(tmp.name) / "media"
+    os.environ["JARVIS_DB_PATH"] = os.path.join(tmp.name, "dedup.sqlite3")
+    os.environ["JARVIS_MEDIA_ROOT"] = str(media_root)
+    os.environ.setdefault("DJANGO_SETTINGS_MODULE", "jarvis_backend.settings")
+
+    import django
+    django.setup()
+    from django.core.files.uploadedfile import SimpleUploadedFile
+    from django.core.management import call_command
+    from django.test import Client
+    from api.attachments import drain_deletions
+    from api.models import FileBlob, UploadedFile
+
+    call_command("migrate", verbosity=0)
+    rng = random.Random(args.seed)
+    pool = make_pool(rng, args.shared_files, args.min_kb, args.max_kb)
+    client = Client()
+
+    file_ids = []
+    started = time.perf_counter()
+    for u in range(args.users):
+        resp = client.post("/api/v1/auth/login", {"account_id": f"dedup-{u}@jarvis.local"}, content_type="application/json")
+        headers = {"HTTP_AUTHORIZATION": f"Bearer {resp.json()['data']['access_token']}"}
+        for i in range(args.uploads_per_user):
+            if rng.random() < args.private_ratio:
+                name, content = f"private-{u}-{i}.pdf", rng.randbytes(rng.randint(args.min_kb, args.max_kb) * 1024)
+            else:
+                name, content = rng.choice(pool)
+            resp = client.post("/api/v1/files/upload",
+                               {"file": SimpleUploadedFile(name, content, content_type="application/pdf")}, **headers)
+            assert resp.status_code == 201, resp.content
+            file_ids.append((headers, resp.json()["data"]["id"]))
+    elapsed = time.perf_counter() - started
+
+    uploads = UploadedFile.objects.count()
+    logical = sum(UploadedFile.objects.values_list("size", flat=True))
+    blobs = FileBlob.objects.count()
+    physical = disk_usage(media_root)
+    print(f"uploads            {uploads}")
+    print(f"distinct blobs     {blobs}")
+    print(f"logical bytes      {logical / 1e6:10.1f} MB  (stored without dedup)")
+    print(f"bytes on disk      {physical / 1e6:10.1f} MB")
+    print(f"saved              {(logical - physical) / 1e6:10.1f} MB  ({(1 - physical / logical) * 100:.1f}%)")
+    print(f"upload throughput  {uploads / elapsed:10.1f} files/s")
+
+    # 删除一部分附件：引用数归零的 blob 及其文件应被清理，其余保持不变
+    for headers, file_id in rng.sample(file_ids, int(len(file_ids) * args.delete_ratio)):
+        assert client.delete(f"/api/v1/files/{file_id}", **headers).status_code == 200
+    # 物理文件由后台线程删除，这里同步处理队列中剩余的条目后再核对
+    drain_deletions()
+    referenced = set(UploadedFile.objects.values_list("blob_id", flat=True))
+    remaining = set(FileBlob.objects.values_list("sha256", flat=True))
+    on_disk = sum(1 for p in media_root.rglob("*") if p.is_file())
+    assert referenced == remaining and on_disk == len(remaining), (len(referenced), len(remaining), on_disk)
+    print(f"after deleting {args.delete_ratio:.0%}: {UploadedFile.objects.count()} uploads, "
+          f"{len(remaining)} blobs, {disk_usage(media_root) / 1e6:.1f} MB on disk (refcounts consistent)")
+    tmp.cleanup()
+
+
+if __name__ == "__main__":
+    main()
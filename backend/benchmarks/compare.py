@@ -0,0 +1,68 @@
+"""
+对比多次压测结果（load_driver.py 的 JSON 输出）
+--------------------------------------------
+第一个文件作为基线，其余文件逐列给出数值和相对基线的变化，输出 Markdown 表格。
+
+运行（在 backend 目录下）：
+  python benchmarks/compare.py benchmarks/results/abc1234.json benchmarks/results/def5678.json
+"""
+
+import argparse
+import json
+from pathlib import Path
+
+METRICS = [
+    ("p50_ms", "p50 (ms)", False),
+    ("p95_ms", "p95 (ms)", False),
+    ("p99_ms", "p99 (ms)", False),
+    ("throughput_rps", "rps", True),
+    ("errors", "errors", False),
+]
+
+
+def fmt_delta(base: float, value: float, higher_is_better: bool) -> str:
+    if not base:
+        return ""
+    change = (value - base) / base * 100
+    better = change > 0 if higher_is_better else change < 0
+    mark = "✅" if better and abs(change) >= 5 else ("⚠️" if not better and abs(change) >= 5 else "")
+    return f" ({change:+.1f}%{mark})"
+
+
+def render(results: list) -> str:
+    base = results[0]
+    header = ["endpoint", "metric"] + [r["commit"] for r in results]
+    lines = ["| " + " | ".join(header) + " |", "|" + "---|" * len(header)]
+    endpoints = list(base["endpoints"])
+    for r in results[1:]:
+        endpoints += [e for e in r["endpoints"] if e not in endpoints]
+    for endpoint in endpoints:
+        for key, label, higher_is_better in METRICS:
+            row = [endpoint, label]
+            base_value = base["endpoints"].get(endpoint, {}).get(key)
+            for i, r in enumerate(results):
+                value = r["endpoints"].get(endpoint, {}).get(key)
+                if value is None:
+                    row.append("-")
+                    continue
+                cell = f"{value:.1f}" if isinstance(value, float) else str(value)
+                if i and base_value is not None:
+                    cell += fmt_delta(base_value, value, higher_is_better)
+                row.append(cell)
+            lines.append("| " + " | ".join(row) + " |")
+    return "\n".join(lines)
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("results", nargs="+", type=Path, help="第一个为基线")
+    args = parser.parse_args()
+    results = [json.loads(p.read_text()) for p in args.results]
+    for r in results:
+        if r["config"] != results[0]["config"]:
+            print(f"注意：{r['commit']} 的压测配置与基线不同：{r['config']}\n")
+    print(render(results))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,160 @@
+"""
+事件全文搜索：10 万个事件上的 /events/search
+-------------------------------------------
+在临时数据库中为一个用户写入 --events 个事件（中英文标题混合，部分带地点和链接），分布在前后两年内。
+对几类查询（英文词前缀、中文短词、中文长词、链接域名、带日期范围）：
+  - 经由 Django 测试客户端测量 GET /events/search 的延迟
+  - 不经 HTTP 比较 search.search_events 与不使用索引的做法：ORM 中对标题 / 地点 / 链接 URL 做 icontains
+    扫描、按日期倒序取同样数量的结果（常见词很快凑满结果就停止，少见的词需要扫描全部事件）
+另外输出写入全部事件（触发器同步维护索引）与 rebuild_search_index 重建索引的耗时。
+
+运行（在 backend 目录下）：
+  python benchmarks/event_search.py --events 100000 --iterations 50
+"""
+
+import argparse
+import os
+import random
+import sys
+import tempfile
+import time
+from datetime import date, timedelta
+from pathlib import Path
+
+BACKEND_DIR = Path(__file__).resolve().parent.parent
+sys.path.insert(0, str(BACKEND_DIR))
+sys.path.insert(0, str(Path(__file__).resolve().parent))
+
+from common import summarize  # noqa: E402
+
+TITLES_EN = ["Weekly meeting", "Standup", "Dentist appointment", "Lab report", "Reading group", "Call with mom",
+             "Project review", "Gym session", "Flight to Shanghai", "Thesis writing"]
+TITLES_ZH = ["项目评审会议", "组会", "开会讨论需求", "实验报告截止", "健身", "读书会", "给妈妈打电话",
+             "论文写作", "去上海的航班", "体检"]
+LOCATIONS = ["", "", "Room 101", "三号会议室", "图书馆", "Gym", "Zoom", "食堂"]
+DOMAINS = ["github.com", "zoom.us", "docs.google.com", "meeting.tencent.com"]
+QUERIES = {
+    "english prefix": {"q": "meet"},
+    "chinese 2 chars": {"q": "组会"},
+    "chinese 4 chars": {"q": "项目评审"},
+    "link domain": {"q": "github"},
+    "two words": {"q": "project review"},
+    "with date range": {"q": "meet", "start_date": "{today}", "end_date": "{month}"},
+    "rare title": {"q": "#77777"},
+    "rare link": {"q": "item/4242"},
+}
+
+
+def seed(user, count: int, rng: random.Random) -> float:
+    """写入 count 个事件及其链接，返回耗时（秒，含触发器维护索引）"""
+    from api.models import CalendarType, Event, EventLink
+
+    general = CalendarType.objects.get(user=user, type_id="general")
+    today = date.today()
+    started = time.perf_counter()
+    for offset in range(0, count, 5000):
+        events, links = [], []
+        for i in range(offset, min(count, offset + 5000)):
+            title = rng.choice(TITLES_ZH if rng.random() < 0.5 else TITLES_EN)
+            event = Event(user=user, calendar_type=general, title=f"{title} #{i}",
+                          date=today + timedelta(days=rng.randrange(-365, 365)), location=rng.choice(LOCATIONS))
+            events.append(event)
+            if rng.random() < 0.2:
+                links.append(EventLink(event=event, url=f"https://{rng.choice(DOMAINS)}/item/{i}"))
+        Event.objects.bulk_create(events)
+        EventLink.objects.bulk_create(links)
+    return time.perf_counter() - started
+
+
+def measure(client, token: str, path: str, iterations: int) -> tuple:
+    samples = []
+    started = time.perf_counter()
+    for _ in range(iterations):
+        t = time.perf_counter()
+        resp = client.get(path, HTTP_AUTHORIZATION=f"Bearer {token}")
+        samples.append((time.perf_counter() - t) * 1000)
+        assert resp.status_code == 200, resp.content
+    return summarize(samples, 0, time.perf_counter() - started), resp.json()["data"]["total"]
+
+
+def timed_calls(fn, iterations: int) -> dict:
+    samples = []
+    started = time.perf_counter()
+    for _ in range(iterations):
+        t = time.perf_counter()
+        fn()
+        samples.append((time.perf_counter() - t) * 1000)
+    return summarize(samples, 0, time.perf_counter() - started)
+
+
+def scan(user, params: dict, limit: int) -> list:
+    """不使用索引：ORM icontains 扫描标题 / 地点 / 链接（每个词都需匹配）"""
+    from django.db.models import Q
+    from api.models import Event
+
+    qs = Event.objects.filter(user=user)
+    for term in params["q"].split():
+        qs = qs.filter(Q(title__icontains=term) | Q(location__icontains=term) | Q(links__url__icontains=term))
+    if "start_date" in params:
+        qs = qs.filter(date__gte=params["start_date"], date__lte=params["end_date"])
+    return list(qs.distinct().select_related("calendar_type", "attachment").prefetch_related("links")
+                .order_by("-date")[:limit])
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--events", type=int, default=100000)
+    parser.add_argument("--iterations", type=int, default=50, help="每项测量的请求数")
+    parser.add_argument("--limit", type=int, default=50)
+    parser.add_argument("--seed", type=int, default=7)
+    args = parser.parse_args()
+
+    tmp = tempfile.TemporaryDirectory()
+    os.environ["JARVIS_DB_PATH"] = os.path.join(tmp.name, "search.sqlite3")
+    os.environ["JARVIS_MEDIA_ROOT"] = os.path.join(tmp.name, "media")
+    os.environ.setdefault("DJANGO_SETTINGS_MODULE", "jarvis_backend.settings")
+
+    import django
+    django.setup()
+    from urllib.parse import urlencode
+    from django.core.management import call_command
+    from django.test import Client
+    from api import search, sharding
+    from api.models import User
+
+    call_command("migrate", verbosity=0)
+    client = Client()
+    resp = client.post("/api/v1/auth/login", {"account_id": "bench-search@jarvis.local"},
+                       content_type="application/json")
+    token = resp.json()["data"]["access_token"]
+    user = User.objects.get(account_id="bench-search@jarvis.local")
+    alias = sharding.user_db(user)
+    with sharding.use_db(alias):
+        write_s = seed(user, args.events, random.Random(args.seed))
+    started = time.perf_counter()
+    search.rebuild(alias)
+    rebuild_s = time.perf_counter() - started
+
+    today = date.today()
+    fill = {"today": today.isoformat(), "month": (today + timedelta(days=30)).isoformat()}
+    rows = []
+    for name, template in QUERIES.items():
+        params = {key: value.format(**fill) for key, value in template.items()}
+        path = "/api/v1/events/search?" + urlencode({**params, "limit": args.limit})
+        http, total = measure(client, token, path, args.iterations)
+        start = date.fromisoformat(params["start_date"]) if "start_date" in params else None
+        end = date.fromisoformat(params["end_date"]) if "end_date" in params else None
+        with sharding.use_db(alias):
+            fts = timed_calls(lambda: search.search_events(user, params["q"], start, end, args.limit), args.iterations)
+            like = timed_calls(lambda: scan(user, params, args.limit), max(1, args.iterations // 5))
+        rows.append((name, total, http, fts, like))
+
+    print(f"{args.events} events: write with index triggers {write_s:.1f}s, rebuild_search_index {rebuild_s:.1f}s")
+    print(f"{'query':<18}{'hits':>6}{'p50 ms':>9}{'p95 ms':>9}{'p99 ms':>9}{'fts p50 ms':>12}{'scan p50 ms':>13}")
+    for name, total, http, fts, like in rows:
+        print(f"{name:<18}{total:>6}{http['p50_ms']:>9.2f}{http['p95_ms']:>9.2f}{http['p99_ms']:>9.2f}"
+              f"{fts['p50_ms']:>12.2f}{like['p50_ms']:>13.1f}")
+
+
+if __name__ == "__main__":
+    main()
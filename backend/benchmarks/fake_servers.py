@@ -0,0 +1,155 @@
+"""
+本地桩服务：OpenAI 兼容的 chat 接口 + OpenWeather 天气接口
+-------------------------------------------------------
+用于在没有真实 OpenAI / OpenWeather key 的情况下压测 agent_service。
+  - POST /v1/chat/completions  根据 prompt 返回确定性的 JSON 解析结果
+  - GET  /data/2.5/weather     返回固定的天气数据
+两类接口的延迟（均值 + 抖动）和错误率可分别配置，随机数由 --seed 固定，结果可复现。
+
+单独运行（在 backend 目录下）：
+  python benchmarks/fake_servers.py --port 9100 --llm-latency-ms 300 --llm-error-rate 0.01
+然后让 agent_service 指向它：
+  export OPENAI_API_BASE="http://127.0.0.1:9100/v1"
+  export OPENWEATHER_API_BASE="http://127.0.0.1:9100"
+"""
+
+import argparse
+import asyncio
+import json
+import random
+import re
+import time
+from dataclasses import dataclass
+
+from fastapi import FastAPI, Request
+from fastapi.responses import JSONResponse
+
+
+@dataclass
+class FaultProfile:
+    """一类接口的延迟与错误注入配置。"""
+    latency_ms: float = 0.0
+    jitter_ms: float = 0.0
+    error_rate: float = 0.0
+    error_status: int = 500
+
+
+def _extract(pattern: str, text: str, default: str = "") -> str:
+    m = re.search(pattern, text)
+    return m.group(1).strip() if m else default
+
+
+def fake_llm_answer(prompt: str) -> dict:
+    """按 agent_service 的三种 prompt 模板给出确定性的回答。"""
+    user_input = _extract(r"输入:\s*(.+)", prompt, "任务")
+    if "color 必须精确从列表选择" in prompt:
+        colors = _extract(r"color 必须精确从列表选择:\s*(.+)", prompt)
+        first = colors.split(",")[0].strip() if colors else "#3B82F6"
+        return {"name": user_input[:20], "color": first}
+
+    type_opts = _extract(r"type_id 必须从:\s*(.+)", prompt)
+    type_id = type_opts.split("(")[0].strip() if type_opts else "general"
+    parsed = {
+        "title": user_input[:50],
+        "is_all_day": False,
+        "start_time": "15:00",
+        "end_time": "16:00",
+        "location": "",
+        "type_id": type_id,
+    }
+    if "解析事件" in prompt:
+        parsed["date"] = _extract(r"当前日期\s*([0-9-]{10})", prompt)
+    return parsed
+
+
+def create_app(llm: FaultProfile, weather: FaultProfile, seed: int = 0) -> FastAPI:
+    app = FastAPI(title="Jarvis fake upstreams")
+    rng = random.Random(seed)
+    counters = {"llm": 0, "weather": 0, "llm_errors": 0, "weather_errors": 0}
+
+    async def inject(profile: FaultProfile, kind: str):
+        counters[kind] += 1
+        delay = max(0.0, profile.latency_ms + rng.uniform(-profile.jitter_ms, profile.jitter_ms))
+        if delay:
+            await asyncio.sleep(delay / 1000)
+        if profile.error_rate and rng.random() < profile.error_rate:
+            counters[f"{kind}_errors"] += 1
+            return JSONResponse(
+                {"error": {"message": f"injected {kind} failure", "type": "server_error"}},
+                status_code=profile.error_status,
+            )
+        return None
+
+    @app.post("/v1/chat/completions")
+    async def chat_completions(request: Request):
+        failure = await inject(llm, "llm")
+        if failure is not None:
+            return failure
+        body = await request.json()
+        prompt = "\n".join(m.get("content", "") for m in body.get("messages", []))
+        content = json.dumps(fake_llm_answer(prompt), ensure_ascii=False)
+        return {
+            "id": f"chatcmpl-fake-{counters['llm']}",
+            "object": "chat.completion",
+            "created": int(time.time()),
+            "model": body.get("model", "fake"),
+            "choices": [
+                {
+                    "index": 0,
+                    "message": {"role": "assistant", "content": content},
+                    "finish_reason": "stop",
+                }
+            ],
+            "usage": {"prompt_tokens": len(prompt), "completion_tokens": len(content), "total_tokens": len(prompt) + len(content)},
+        }
+
+    @app.get("/data/2.5/weather")
+    async def current_weather(lat: float = 0.0, lon: float = 0.0):
+        failure = await inject(weather, "weather")
+        if failure is not None:
+            return failure
+        return {
+            "coord": {"lat": lat, "lon": lon},
+            "weather": [{"id": 802, "main": "Clouds", "description": "多云"}],
+            "main": {"temp": 24.0, "humidity": 65},
+            "name": "Fake City",
+        }
+
+    @app.get("/stats")
+    def stats():
+        return counters
+
+    return app
+
+
+def add_arguments(parser: argparse.ArgumentParser) -> None:
+    parser.add_argument("--llm-latency-ms", type=float, default=200.0)
+    parser.add_argument("--llm-jitter-ms", type=float, default=50.0)
+    parser.add_argument("--llm-error-rate", type=float, default=0.0)
+    parser.add_argument("--weather-latency-ms", type=float, default=50.0)
+    parser.add_argument("--weather-jitter-ms", type=float, default=10.0)
+    parser.add_argument("--weather-error-rate", type=float, default=0.0)
+    parser.add_argument("--seed", type=int, default=0)
+
+
+def app_from_args(args: argparse.Namespace) -> FastAPI:
+    return create_app(
+        FaultProfile(args.llm_latency_ms, args.llm_jitter_ms, args.llm_error_rate),
+        FaultProfile(args.weather_latency_ms, args.weather_jitter_ms, args.weather_error_rate),
+        seed=args.seed,
+    )
+
+
+def main() -> None:
+    import uvicorn
+
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=9100)
+    add_arguments(parser)
+    args = parser.parse_args()
+    uvicorn.run(app_from_args(args), host=args.host, port=args.port, log_level="warning")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,155 @@
+"""
+空闲时段：密集日程上的 /schedule/free-slots
+-------------------------------------------
+在临时数据库中为每个规模（--sizes，默认 1000 / 5000 / 10000 个定时事件）创建一个用户，
+事件随机分布在从今天起 --days 天内的 07:00-23:00（时长 15-120 分钟，互相大量重叠），
+另有几个每天 / 每周重复的例行事件。对每个用户：
+  - 经由 Django 测试客户端测量 GET /schedule/free-slots（整个范围，duration=30）的延迟与每次请求的查询数
+  - 在同一份忙碌区间上比较排序扫描（schedule.free_windows）与逐个候选时间检查全部区间的朴素做法，
+    并核对两者给出的可用开始时间一致
+
+运行（在 backend 目录下）：
+  python benchmarks/free_slots.py --iterations 50
+"""
+
+import argparse
+import os
+import random
+import sys
+import tempfile
+import time
+from datetime import date, time as dt_time, timedelta
+from pathlib import Path
+
+BACKEND_DIR = Path(__file__).resolve().parent.parent
+sys.path.insert(0, str(BACKEND_DIR))
+sys.path.insert(0, str(Path(__file__).resolve().parent))
+
+from common import summarize  # noqa: E402
+
+ROUTINES = [
+    ("Gym", "FREQ=DAILY", dt_time(7), dt_time(8)),
+    ("Lecture", "FREQ=WEEKLY;BYDAY=MO,WE,FR", dt_time(10), dt_time(12)),
+    ("Lab", "FREQ=WEEKLY;BYDAY=TU,TH", dt_time(14), dt_time(17)),
+]
+DURATION = 30
+STEP = 15  # 朴素做法的候选开始时间间隔（分钟）
+
+
+def seed_user(user, start: date, days: int, count: int, rng: random.Random) -> None:
+    from api.models import CalendarType, Event
+
+    general = CalendarType.objects.get(user=user, type_id="general")
+    events = []
+    for title, rule, start_time, end_time in ROUTINES:
+        series = Event(user=user, calendar_type=general, title=title, date=start, is_all_day=False,
+                       start_time=start_time, end_time=end_time, recurrence=rule)
+        events.append(series)  # 无限重复，recurrence_end 为空，与 save() 结果相同
+    for _ in range(count):
+        minute = rng.randrange(7 * 60, 23 * 60, 5)
+        length = rng.randrange(15, 121, 5)
+        end = min(minute + length, 24 * 60 - 1)
+        events.append(Event(
+            user=user, calendar_type=general, title="Busy", date=start + timedelta(days=rng.randrange(days)),
+            is_all_day=False, start_time=dt_time(minute // 60, minute % 60), end_time=dt_time(end // 60, end % 60),
+        ))
+    Event.objects.bulk_create(events, batch_size=1000)
+
+
+def naive_free_starts(busy: list, start: date, end: date, day_start: int, day_end: int, duration: int) -> list:
+    """朴素做法：每天每隔 STEP 分钟取一个候选开始时间，逐个检查是否与任何忙碌区间重叠"""
+    found = []
+    day = start
+    while day <= end:
+        base = day.toordinal() * 24 * 60
+        for minute in range(base + day_start, base + day_end - duration + 1, STEP):
+            if all(b_end <= minute or b_start >= minute + duration for b_start, b_end in busy):
+                found.append(minute)
+        day += timedelta(days=1)
+    return found
+
+
+def starts_in(windows: list, duration: int) -> list:
+    """空闲时段中按 STEP 对齐、能放下 duration 的开始时间（与朴素做法的结果可直接比较）"""
+    found = []
+    for lo, hi in windows:
+        minute = -(-lo // STEP) * STEP
+        while minute + duration <= hi:
+            found.append(minute)
+            minute += STEP
+    return found
+
+
+def timed(fn, *args):
+    t = time.perf_counter()
+    result = fn(*args)
+    return result, (time.perf_counter() - t) * 1000
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--sizes", default="1000,5000,10000", help="每个用户的单次事件数，逗号分隔")
+    parser.add_argument("--days", type=int, default=30, help="事件分布与查询的天数（从今天起）")
+    parser.add_argument("--iterations", type=int, default=50, help="每个规模的请求数")
+    parser.add_argument("--seed", type=int, default=7)
+    args = parser.parse_args()
+
+    tmp = tempfile.TemporaryDirectory()
+    os.environ["JARVIS_DB_PATH"] = os.path.join(tmp.name, "free_slots.sqlite3")
+    os.environ["JARVIS_MEDIA_ROOT"] = os.path.join(tmp.name, "media")
+    os.environ.setdefault("DJANGO_SETTINGS_MODULE", "jarvis_backend.settings")
+
+    import django
+    django.setup()
+    from django.core.management import call_command
+    from django.db import connections
+    from django.test import Client
+    from django.test.utils import CaptureQueriesContext
+    from api import schedule, sharding
+    from api.models import User
+
+    call_command("migrate", verbosity=0)
+    client = Client()
+    # 查询从明天开始，"已经过去的时间不算空闲"不影响两种做法的比较
+    start = date.today() + timedelta(days=1)
+    end = start + timedelta(days=args.days - 1)
+    day_start, day_end = 8 * 60, 22 * 60
+    path = f"/api/v1/schedule/free-slots?duration={DURATION}&start={start}&end={end}"
+
+    rows = []
+    for size in (int(s) for s in args.sizes.split(",")):
+        account = f"bench-free-{size}@jarvis.local"
+        resp = client.post("/api/v1/auth/login", {"account_id": account}, content_type="application/json")
+        token = resp.json()["data"]["access_token"]
+        user = User.objects.get(account_id=account)
+        with sharding.use_user_db(user):
+            seed_user(user, start, args.days, size, random.Random(args.seed))
+            busy = schedule.busy_intervals(user, start, end)
+        alias = sharding.user_db(user)
+
+        samples = []
+        started = time.perf_counter()
+        for _ in range(args.iterations):
+            with CaptureQueriesContext(connections[alias]) as queries:
+                t = time.perf_counter()
+                resp = client.get(path, HTTP_AUTHORIZATION=f"Bearer {token}")
+                samples.append((time.perf_counter() - t) * 1000)
+            assert resp.status_code == 200, resp.content
+        stats = summarize(samples, 0, time.perf_counter() - started)
+        slots = resp.json()["data"]["total"]
+
+        windows, sweep_ms = timed(schedule.free_windows, busy, start, end, day_start, day_end, DURATION)
+        naive, naive_ms = timed(naive_free_starts, busy, start, end, day_start, day_end, DURATION)
+        assert starts_in(windows, DURATION) == naive, "sweep and naive scan disagree"
+        rows.append((size, len(busy), slots, len(queries), stats, sweep_ms, naive_ms))
+
+    print(f"{args.days} days, duration {DURATION} min, day 08:00-22:00, {len(ROUTINES)} recurring routines per user")
+    print(f"{'events':>7}{'busy':>7}{'slots':>7}{'queries':>9}{'p50 ms':>9}{'p95 ms':>9}{'p99 ms':>9}"
+          f"{'sweep ms':>10}{'naive ms':>10}")
+    for size, n_busy, slots, n_queries, s, sweep_ms, naive_ms in rows:
+        print(f"{size:>7}{n_busy:>7}{slots:>7}{n_queries:>9}{s['p50_ms']:>9.2f}{s['p95_ms']:>9.2f}"
+              f"{s['p99_ms']:>9.2f}{sweep_ms:>10.2f}{naive_ms:>10.1f}")
+
+
+if __name__ == "__main__":
+    main()
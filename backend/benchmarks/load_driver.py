@@ -0,0 +1,229 @@
+"""
+agent_service 端到端压测
+-----------------------
+在本机拉起一套完整环境并对 agent_service 的四个端点施压：
+  1. 临时 SQLite 库：migrate + seed_demo，并为每个压测用户登录、上报定位
+  2. Django 后端（manage.py runserver）
+  3. 本地桩服务（benchmarks/fake_servers.py）：OpenAI 兼容 chat + 天气
+  4. agent_service（uvicorn），指向上述后端和桩服务
+依次压测 /parse-task、/parse-event、/parse-calendar-type、/generate-reminders，
+输出每个端点的 p50 / p95 / p99 延迟、吞吐和错误数，并把结果写成 JSON（带当前 commit），
+可用 benchmarks/compare.py 对比多个 commit 的结果。
+
+运行（在 backend 目录下）：
+  python benchmarks/load_driver.py --requests 200 --concurrency 8
+  python benchmarks/load_driver.py --llm-latency-ms 0 --transport inprocess
+  python benchmarks/compare.py benchmarks/results/<base>.json benchmarks/results/<head>.json
+
+Agent 缓存默认关闭（TTL=0），以测量完整调用链；--agent-caches 可开启。
+"""
+
+import argparse
+import json
+import os
+import subprocess
+import sys
+import tempfile
+import time
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timezone
+from pathlib import Path
+
+import requests
+
+BACKEND_DIR = Path(__file__).resolve().parent.parent
+RESULTS_DIR = Path(__file__).resolve().parent / "results"
+
+sys.path.insert(0, str(Path(__file__).resolve().parent))
+from common import free_port, summarize, wait_until_up  # noqa: E402
+from fake_servers import add_arguments as add_fault_arguments  # noqa: E402
+
+ENDPOINTS = ["/parse-task", "/parse-event", "/parse-calendar-type", "/generate-reminders"]
+
+SAMPLE_INPUTS = {
+    "/parse-task": ["下午三点开会", "晚上七点健身", "10:00-11:30 写报告", "中午和同学吃饭", "早上跑步"],
+    "/parse-event": ["明天下午2点在图书馆学习", "周五晚上8点看电影", "下周一上午九点面试", "后天3点到5点上课"],
+    "/parse-calendar-type": ["创建一个粉色的健身类型", "蓝色的学习分类", "绿色 旅行", "红色的紧急事项"],
+}
+
+
+def git_commit() -> str:
+    try:
+        return subprocess.check_output(
+            ["git", "rev-parse", "--short", "HEAD"], cwd=BACKEND_DIR, text=True, stderr=subprocess.DEVNULL
+        ).strip()
+    except (OSError, subprocess.CalledProcessError):
+        return "unknown"
+
+
+class Stack:
+    """按需启动后端、桩服务和 agent_service 子进程，退出时统一回收。"""
+
+    def __init__(self, args: argparse.Namespace):
+        self.args = args
+        self.procs = []
+        self.tmpdir = tempfile.TemporaryDirectory()
+        self.env = dict(os.environ, JARVIS_DB_PATH=os.path.join(self.tmpdir.name, "load.sqlite3"))
+
+    def spawn(self, cmd: list, env: dict) -> None:
+        self.procs.append(subprocess.Popen(cmd, cwd=BACKEND_DIR, env=env, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL))
+
+    def start(self) -> tuple:
+        a = self.args
+        backend_url = a.backend_url
+        if not backend_url:
+            manage = [sys.executable, "manage.py"]
+            subprocess.run(manage + ["migrate", "--verbosity", "0"], cwd=BACKEND_DIR, env=self.env, check=True)
+            subprocess.run(manage + ["seed_demo"], cwd=BACKEND_DIR, env=self.env, check=True, stdout=subprocess.DEVNULL)
+            port = free_port()
+            self.spawn(manage + ["runserver", f"127.0.0.1:{port}", "--noreload"], self.env)
+            backend_url = f"http://127.0.0.1:{port}/api/v1"
+            wait_until_up(f"{backend_url}/time")
+
+        fake_port = free_port()
+        fake_cmd = [sys.executable, "benchmarks/fake_servers.py", "--port", str(fake_port),
+                    "--llm-latency-ms", str(a.llm_latency_ms), "--llm-jitter-ms", str(a.llm_jitter_ms),
+                    "--llm-error-rate", str(a.llm_error_rate), "--weather-latency-ms", str(a.weather_latency_ms),
+                    "--weather-jitter-ms", str(a.weather_jitter_ms), "--weather-error-rate", str(a.weather_error_rate),
+                    "--seed", str(a.seed)]
+        self.spawn(fake_cmd, self.env)
+        wait_until_up(f"http://127.0.0.1:{fake_port}/stats")
+
+        agent_url = a.agent_url
+        if not agent_url:
+            ttl = "30" if a.agent_caches else "0"
+            agent_env = dict(
+                self.env,
+                JARVIS_API_BASE=backend_url,
+                JARVIS_TRANSPORT=a.transport,
+                JARVIS_TOKEN="",
+                OPENAI_API_BASE=f"http://127.0.0.1:{fake_port}/v1",
+                OPENAI_API_KEY="fake",
+                OPENWEATHER_API_BASE=f"http://127.0.0.1:{fake_port}",
+                OPENWEATHER_API_KEY="fake",
+                AGENT_CONTEXT_CACHE_TTL=ttl,
+                AGENT_REMINDER_CACHE_TTL=ttl,
+                AGENT_LLM_CACHE_TTL=ttl,
+            )
+            port = free_port()
+            self.spawn([sys.executable, "-m", "uvicorn", "agent_service.main:app", "--host", "127.0.0.1",
+                        "--port", str(port), "--workers", str(a.agent_workers), "--log-level", "warning"], agent_env)
+            agent_url = f"http://127.0.0.1:{port}"
+            wait_until_up(f"{agent_url}/health")
+        return backend_url, agent_url
+
+    def stop(self) -> None:
+        for p in self.procs:
+            p.terminate()
+        for p in self.procs:
+            try:
+                p.wait(timeout=10)
+            except subprocess.TimeoutExpired:
+                p.kill()
+        self.tmpdir.cleanup()
+
+
+def login_users(backend_url: str, count: int) -> list:
+    """登录压测用户（第一个是 seed_demo 的演示账号），并上报一次定位供天气查询使用。"""
+    tokens = []
+    for i in range(count):
+        account = "jarvis@cuhk.com" if i == 0 else f"load-{i}@jarvis.local"
+        resp = requests.post(f"{backend_url}/auth/login", json={"account_id": account}, timeout=10)
+        resp.raise_for_status()
+        token = resp.json()["data"]["access_token"]
+        requests.post(
+            f"{backend_url}/user/location",
+            json={"latitude": 22.4196, "longitude": 114.2068, "accuracy": 10},
+            headers={"Authorization": f"Bearer {token}"},
+            timeout=10,
+        ).raise_for_status()
+        tokens.append(token)
+    return tokens
+
+
+def drive_endpoint(agent_url: str, endpoint: str, tokens: list, total: int, concurrency: int) -> dict:
+    inputs = SAMPLE_INPUTS.get(endpoint)
+
+    def one(i: int):
+        headers = {"Authorization": f"Bearer {tokens[i % len(tokens)]}"}
+        body = {"user_input": f"{inputs[i % len(inputs)]} #{i}"} if inputs else None
+        t0 = time.perf_counter()
+        try:
+            resp = requests.post(f"{agent_url}{endpoint}", json=body, headers=headers, timeout=60)
+            ok = resp.ok
+        except requests.RequestException:
+            ok = False
+        return (time.perf_counter() - t0) * 1000, ok
+
+    started = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=concurrency) as pool:
+        outcomes = list(pool.map(one, range(total)))
+    wall = time.perf_counter() - started
+
+    latencies = [ms for ms, ok in outcomes if ok]
+    errors = sum(1 for _, ok in outcomes if not ok)
+    return summarize(latencies, errors, wall)
+
+
+def print_report(result: dict) -> None:
+    print(f"commit {result['commit']}  transport={result['config']['transport']}  "
+          f"concurrency={result['config']['concurrency']}  users={result['config']['users']}")
+    print(f"{'endpoint':<22} {'req':>5} {'err':>4} {'rps':>8} {'p50':>8} {'p95':>8} {'p99':>8}")
+    for endpoint, r in result["endpoints"].items():
+        print(f"{endpoint:<22} {r['requests']:>5} {r['errors']:>4} {r['throughput_rps']:>8.1f} "
+              f"{r['p50_ms']:>8.1f} {r['p95_ms']:>8.1f} {r['p99_ms']:>8.1f}")
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--requests", type=int, default=100, help="每个端点的请求数")
+    parser.add_argument("--concurrency", type=int, default=8)
+    parser.add_argument("--users", type=int, default=4, help="轮流使用的压测账号数")
+    parser.add_argument("--endpoints", nargs="+", default=ENDPOINTS, choices=ENDPOINTS)
+    parser.add_argument("--transport", choices=["http", "inprocess"], default="http")
+    parser.add_argument("--agent-workers", type=int, default=1)
+    parser.add_argument("--agent-caches", action="store_true", help="开启 agent_service 的按用户缓存")
+    parser.add_argument("--backend-url", help="使用已运行的后端（需已有 jarvis@cuhk.com 等数据）")
+    parser.add_argument("--agent-url", help="使用已运行的 agent_service")
+    parser.add_argument("--output", help="结果 JSON 路径，默认 benchmarks/results/<commit>.json")
+    add_fault_arguments(parser)
+    args = parser.parse_args()
+
+    stack = Stack(args)
+    try:
+        backend_url, agent_url = stack.start()
+        tokens = login_users(backend_url, args.users)
+        endpoints = {}
+        for endpoint in args.endpoints:
+            # 少量预热，避免把首个请求的导入/连接建立计入统计
+            drive_endpoint(agent_url, endpoint, tokens, min(5, args.requests), 1)
+            endpoints[endpoint] = drive_endpoint(agent_url, endpoint, tokens, args.requests, args.concurrency)
+    finally:
+        stack.stop()
+
+    result = {
+        "commit": git_commit(),
+        "created_at": datetime.now(timezone.utc).isoformat(),
+        "config": {
+            "requests": args.requests,
+            "concurrency": args.concurrency,
+            "users": args.users,
+            "transport": args.transport,
+            "agent_workers": args.agent_workers,
+            "agent_caches": args.agent_caches,
+            "llm_latency_ms": args.llm_latency_ms,
+            "llm_error_rate": args.llm_error_rate,
+            "weather_latency_ms": args.weather_latency_ms,
+            "weather_error_rate": args.weather_error_rate,
+        },
+        "endpoints": endpoints,
+    }
+    output = Path(args.output) if args.output else RESULTS_DIR / f"{result['commit']}.json"
+    output.parent.mkdir(parents=True, exist_ok=True)
+    output.write_text(json.dumps(result, ensure_ascii=False, indent=2))
+    print_report(result)
+    print(f"\n结果已写入 {output}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,146 @@
+"""
+实时变更通道：写入后重新加载列表 vs 订阅 /changes 按通知更新
+----------------------------------------------------------
+在临时数据库上启动 uvicorn（jarvis_backend.asgi），演示账号在一个月内有 --events 个事件。
+对 --mutations 次写入（交替切换完成状态与修改标题）比较两种客户端：
+  - reload: 每次写入后像现在的前端一样重新加载 GET /events（一个月）与 GET /calendar-types
+  - push:   --listeners 个 SSE 连接订阅 /changes（模拟同一用户的多个设备 / 标签页），
+            收到通知后只获取变更的事件 GET /events/<id>
+输出每次写入后客户端读取的字节数与耗时，以及通知从发起写入到各连接收到的延迟。
+
+运行（在 backend 目录下）：
+  python benchmarks/realtime_changes.py --events 300 --mutations 100 --listeners 4
+"""
+
+import argparse
+import json
+import os
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+from datetime import date, timedelta
+from pathlib import Path
+
+import requests
+
+BACKEND_DIR = Path(__file__).resolve().parent.parent
+sys.path.insert(0, str(BACKEND_DIR))
+sys.path.insert(0, str(Path(__file__).resolve().parent))
+
+from asgi_reads import login, seed  # noqa: E402
+from common import free_port, percentile, wait_until_up  # noqa: E402
+
+
+class Listener(threading.Thread):
+    """一个 SSE 连接：记录收到每条通知的时间"""
+
+    def __init__(self, base: str, token: str):
+        super().__init__(daemon=True)
+        self.url = f"{base}/changes"
+        self.headers = {"Authorization": f"Bearer {token}"}
+        self.ready = threading.Event()
+        self.received = []  # (perf_counter 时间, 通知)
+        self.bytes = 0
+
+    def run(self) -> None:
+        try:
+            with requests.get(self.url, headers=self.headers, stream=True, timeout=300) as resp:
+                for line in resp.iter_lines():
+                    self.bytes += len(line) + 1
+                    if not line.startswith(b"data: "):
+                        continue
+                    message = json.loads(line[6:])
+                    if message["type"] == "ready":
+                        self.ready.set()
+                    else:
+                        self.received.append((time.perf_counter(), message))
+        except requests.RequestException:
+            pass  # 测量结束时服务器关闭
+
+
+def mutate(session: requests.Session, base: str, event_id: str, i: int) -> None:
+    if i % 2:
+        resp = session.patch(f"{base}/events/{event_id}/complete", json={"completed": i % 4 == 1}, timeout=30)
+    else:
+        resp = session.put(f"{base}/events/{event_id}", json={"title": f"renamed {i}"}, timeout=30)
+    resp.raise_for_status()
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--events", type=int, default=300, help="演示账号额外生成的事件数（分布在 30 天内）")
+    parser.add_argument("--mutations", type=int, default=100)
+    parser.add_argument("--listeners", type=int, default=4, help="订阅 /changes 的 SSE 连接数")
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        env = dict(os.environ, JARVIS_DB_PATH=os.path.join(tmp, "changes.sqlite3"),
+                   JARVIS_MEDIA_ROOT=os.path.join(tmp, "media"))
+        seed(env, args.events)
+        port = free_port()
+        proc = subprocess.Popen(
+            [sys.executable, "-m", "uvicorn", "jarvis_backend.asgi:application", "--host", "127.0.0.1",
+             "--port", str(port), "--log-level", "warning", "--timeout-graceful-shutdown", "1"],
+            cwd=BACKEND_DIR, env=env, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL,
+        )
+        base = f"http://127.0.0.1:{port}/api/v1"
+        try:
+            wait_until_up(f"{base}/time")
+            token = login(base)
+            session = requests.Session()
+            session.headers["Authorization"] = f"Bearer {token}"
+            month = {"start_date": date.today().isoformat(),
+                     "end_date": (date.today() + timedelta(days=30)).isoformat()}
+            ids = [e["id"] for e in session.get(f"{base}/events", params=month, timeout=30).json()["data"]["events"]
+                   if not e.get("occurrence_date")]
+
+            # reload：写入后重新加载两个列表
+            reload_ms, reload_bytes = [], 0
+            for i in range(args.mutations):
+                mutate(session, base, ids[i % len(ids)], i)
+                started = time.perf_counter()
+                reload_bytes += len(session.get(f"{base}/events", params=month, timeout=30).content)
+                reload_bytes += len(session.get(f"{base}/calendar-types", timeout=30).content)
+                reload_ms.append((time.perf_counter() - started) * 1000)
+
+            # push：订阅后写入，收到通知再获取单个事件
+            listeners = [Listener(base, token) for _ in range(args.listeners)]
+            for listener in listeners:
+                listener.start()
+            for listener in listeners:
+                listener.ready.wait(10)
+            sent = {}
+            push_ms, push_bytes = [], 0
+            for i in range(args.mutations):
+                event_id = ids[i % len(ids)]
+                sent[i] = time.perf_counter()
+                mutate(session, base, event_id, i)
+                started = time.perf_counter()
+                push_bytes += len(session.get(f"{base}/events/{event_id}", timeout=30).content)
+                push_ms.append((time.perf_counter() - started) * 1000)
+            time.sleep(1)
+            stream_bytes = listeners[0].bytes
+        finally:
+            proc.terminate()
+            proc.wait(timeout=10)
+
+    # 第 i 次写入对应每个连接收到的第 i 条通知
+    latencies = sorted((at - sent[i]) * 1000 for listener in listeners
+                       for i, (at, _) in enumerate(listener.received[:args.mutations]))
+    delivered = min(len(listener.received) for listener in listeners)
+    reload_ms.sort()
+    push_ms.sort()
+    print(f"{args.events} extra events in 30 days, {args.mutations} mutations, {args.listeners} SSE listeners")
+    print(f"{'client':<8}{'bytes/write':>13}{'read p50 ms':>13}{'read p99 ms':>13}")
+    print(f"{'reload':<8}{reload_bytes / args.mutations:>13.0f}{percentile(reload_ms, 0.5):>13.1f}"
+          f"{percentile(reload_ms, 0.99):>13.1f}")
+    print(f"{'push':<8}{(push_bytes + stream_bytes) / args.mutations:>13.0f}{percentile(push_ms, 0.5):>13.1f}"
+          f"{percentile(push_ms, 0.99):>13.1f}")
+    print(f"notifications delivered per listener: {delivered}/{args.mutations}, latency from write start: "
+          f"p50 {percentile(latencies, 0.5):.1f} ms, p99 {percentile(latencies, 0.99):.1f} ms")
+
+
+if __name__ == "__main__":
+    main()
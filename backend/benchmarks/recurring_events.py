@@ -0,0 +1,145 @@
+"""
+重复事件：一年的逐日物化行 vs 一行重复规则
+-------------------------------------------
+在临时数据库中创建两个日程完全相同的用户：
+  - materialized：每个例行事件按一年的每次发生各存一行（没有重复规则时的做法）
+  - recurring：每个例行事件只存一行 recurrence 规则，已完成的各次记录在 event_occurrences
+两人都另有 --single-events 个单次事件，今天之前的发生有一半标记为已完成。
+经由 Django 测试客户端测量 GET /events（一周 / 一月 / 一年窗口）、/agent/info（默认 30 天）与
+/agent/reminder-context 的延迟，并输出两种表示的行数。
+
+运行（在 backend 目录下）：
+  python benchmarks/recurring_events.py --iterations 200
+"""
+
+import argparse
+import os
+import random
+import sys
+import tempfile
+import time
+from datetime import date, time as dt_time, timedelta
+from pathlib import Path
+
+BACKEND_DIR = Path(__file__).resolve().parent.parent
+sys.path.insert(0, str(BACKEND_DIR))
+sys.path.insert(0, str(Path(__file__).resolve().parent))
+
+from common import summarize  # noqa: E402
+
+# (标题, 规则, 开始时间, 结束时间)
+ROUTINES = [
+    ("Gym", "FREQ=DAILY", dt_time(7), dt_time(8)),
+    ("Lecture", "FREQ=WEEKLY;BYDAY=MO,WE,FR", dt_time(10), dt_time(12)),
+    ("Lab", "FREQ=WEEKLY;BYDAY=TU,TH", dt_time(14), dt_time(17)),
+    ("Group meeting", "FREQ=WEEKLY;INTERVAL=2;BYDAY=TU", dt_time(19), dt_time(20)),
+    ("Reading", "FREQ=DAILY;INTERVAL=2", dt_time(21), dt_time(22)),
+    ("Rent", "FREQ=MONTHLY", None, None),
+]
+
+
+def seed_user(user, start: date, days: int, singles: int, materialize: bool, rng: random.Random) -> int:
+    """写入一个用户的日程，返回该用户在 events + event_occurrences 中的行数"""
+    from django.utils import timezone
+    from api import recurrence
+    from api.models import CalendarType, Event, EventOccurrence
+
+    general = CalendarType.objects.get(user=user, type_id="general")
+    end = start + timedelta(days=days - 1)
+    today = date.today()
+    events, occurrences = [], []
+    for title, rule, start_time, end_time in ROUTINES:
+        timed = dict(is_all_day=start_time is None, start_time=start_time, end_time=end_time)
+        dates = list(recurrence.occurrence_dates(recurrence.parse_rule(rule), start, start, end))
+        done = [d for d in dates if d < today and rng.random() < 0.5]
+        if materialize:
+            events.extend(
+                Event(user=user, calendar_type=general, title=title, date=d, completed=d in done,
+                      completed_at=timezone.now() if d in done else None, **timed)
+                for d in dates
+            )
+        else:
+            series = Event(user=user, calendar_type=general, title=title, date=start,
+                           recurrence=f"{rule};UNTIL={end:%Y%m%d}", **timed)
+            # bulk_create 不调用 save()，这里与 save() 一样计算系列结束日期
+            series.recurrence_end = recurrence.series_end(series.recurrence, start)
+            events.append(series)
+            occurrences.extend(
+                EventOccurrence(event=series, date=d, completed=True, completed_at=timezone.now()) for d in done
+            )
+    for _ in range(singles):
+        day = start + timedelta(days=rng.randrange(days))
+        hour = rng.randrange(8, 21)
+        events.append(Event(user=user, calendar_type=general, title="Task", date=day, is_all_day=False,
+                            start_time=dt_time(hour), end_time=dt_time(hour + 1), completed=day < today))
+    Event.objects.bulk_create(events, batch_size=1000)
+    EventOccurrence.objects.bulk_create(occurrences, batch_size=1000)
+    return len(events) + len(occurrences)
+
+
+def measure(client, token: str, path: str, iterations: int) -> dict:
+    samples = []
+    started = time.perf_counter()
+    for _ in range(iterations):
+        t = time.perf_counter()
+        resp = client.get(path, HTTP_AUTHORIZATION=f"Bearer {token}")
+        samples.append((time.perf_counter() - t) * 1000)
+        assert resp.status_code == 200, resp.content
+    return summarize(samples, 0, time.perf_counter() - started)
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--days", type=int, default=365, help="例行事件覆盖的天数（从今天往前半年开始）")
+    parser.add_argument("--single-events", type=int, default=500)
+    parser.add_argument("--iterations", type=int, default=200, help="每项测量的请求数")
+    parser.add_argument("--seed", type=int, default=7)
+    args = parser.parse_args()
+
+    tmp = tempfile.TemporaryDirectory()
+    os.environ["JARVIS_DB_PATH"] = os.path.join(tmp.name, "recurring.sqlite3")
+    os.environ["JARVIS_MEDIA_ROOT"] = os.path.join(tmp.name, "media")
+    os.environ.setdefault("DJANGO_SETTINGS_MODULE", "jarvis_backend.settings")
+
+    import django
+    django.setup()
+    from django.core.management import call_command
+    from django.test import Client
+    from api import sharding
+    from api.models import User
+
+    call_command("migrate", verbosity=0)
+    client = Client()
+    start = date.today() - timedelta(days=args.days // 2)
+    week, month = date.today(), date.today() + timedelta(days=30)
+    year_end = start + timedelta(days=args.days - 1)
+    paths = {
+        "events (week)": f"/api/v1/events?start_date={week}&end_date={week + timedelta(days=6)}",
+        "events (month)": f"/api/v1/events?start_date={week}&end_date={month}",
+        "events (year)": f"/api/v1/events?start_date={start}&end_date={year_end}",
+        "agent/info": "/api/v1/agent/info",
+        "reminder-context": "/api/v1/agent/reminder-context",
+    }
+
+    results, rows = {}, {}
+    for mode in ("materialized", "recurring"):
+        resp = client.post("/api/v1/auth/login", {"account_id": f"bench-{mode}@jarvis.local"},
+                           content_type="application/json")
+        token = resp.json()["data"]["access_token"]
+        user = User.objects.get(account_id=f"bench-{mode}@jarvis.local")
+        with sharding.use_user_db(user):
+            rows[mode] = seed_user(user, start, args.days, args.single_events, mode == "materialized",
+                                   random.Random(args.seed))
+        results[mode] = {name: measure(client, token, path, args.iterations) for name, path in paths.items()}
+
+    print(f"rows: materialized {rows['materialized']}, recurring {rows['recurring']} "
+          f"({len(ROUTINES)} routines over {args.days} days + {args.single_events} single events)")
+    print(f"{'mode':<14}{'request':<18}{'req/s':>9}{'p50 ms':>9}{'p95 ms':>9}{'p99 ms':>9}")
+    for mode, suite in results.items():
+        for name, s in suite.items():
+            print(f"{mode:<14}{name:<18}{s['throughput_rps']:>9.1f}{s['p50_ms']:>9.2f}"
+                  f"{s['p95_ms']:>9.2f}{s['p99_ms']:>9.2f}")
+
+
+if __name__ == "__main__":
+    main()
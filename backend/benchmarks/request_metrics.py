@@ -0,0 +1,109 @@
+"""
+请求指标中间件的开销
+--------------------
+在临时数据库中为一个用户写入 --events 个事件（一个月内），用 Django 测试客户端轮流以四种配置请求同一组端点
+（events 一个月、calendar-types、agent/info、events/<id>、PATCH complete）：
+  - off:       JARVIS_METRICS=0（不加载中间件）
+  - sample 0:  只记录延迟、状态码与响应大小
+  - sample 0.1 / sample 1: 另外按比例记录查询数、耗时与 SQL
+各配置交替执行多轮以抵消漂移，输出每个请求的平均 / p50 / p99 延迟及相对 off 的开销，
+并输出一次 /api/v1/_metrics 的大小与生成耗时。
+
+运行（在 backend 目录下）：
+  python benchmarks/request_metrics.py --events 300 --rounds 30
+"""
+
+import argparse
+import os
+import statistics
+import sys
+import tempfile
+import time
+from datetime import date, timedelta
+from pathlib import Path
+
+BACKEND_DIR = Path(__file__).resolve().parent.parent
+sys.path.insert(0, str(BACKEND_DIR))
+sys.path.insert(0, str(Path(__file__).resolve().parent))
+
+from common import percentile  # noqa: E402
+
+MODES = [("off", None), ("sample 0", 0.0), ("sample 0.1", 0.1), ("sample 1", 1.0)]
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--events", type=int, default=300)
+    parser.add_argument("--rounds", type=int, default=30, help="每种配置执行整组请求的轮数")
+    args = parser.parse_args()
+
+    tmp = tempfile.TemporaryDirectory()
+    os.environ["JARVIS_DB_PATH"] = os.path.join(tmp.name, "metrics.sqlite3")
+    os.environ["JARVIS_MEDIA_ROOT"] = os.path.join(tmp.name, "media")
+    os.environ.setdefault("DJANGO_SETTINGS_MODULE", "jarvis_backend.settings")
+
+    import django
+    django.setup()
+    from django.core.management import call_command
+    from django.test import Client
+    from django.test.utils import override_settings
+    from api import metrics, sharding
+    from api.models import CalendarType, Event, User
+
+    call_command("migrate", verbosity=0)
+    account = "bench-metrics@jarvis.local"
+    login = Client().post("/api/v1/auth/login", {"account_id": account}, content_type="application/json")
+    token = login.json()["data"]["access_token"]
+    user = User.objects.get(account_id=account)
+    today = date.today()
+    with sharding.use_user_db(user):
+        general = CalendarType.objects.get(user=user, type_id="general")
+        Event.objects.bulk_create([
+            Event(user=user, calendar_type=general, title=f"Event {i}", date=today + timedelta(days=i % 30))
+            for i in range(args.events)
+        ])
+        event_id = Event.objects.filter(user=user).values_list("id", flat=True).first()
+    month = f"start_date={today}&end_date={today + timedelta(days=30)}"
+    requests = [
+        ("get", f"/api/v1/events?{month}", None),
+        ("get", "/api/v1/calendar-types", None),
+        ("get", "/api/v1/agent/info", None),
+        ("get", f"/api/v1/events/{event_id}", None),
+        ("patch", f"/api/v1/events/{event_id}/complete", {"completed": True}),
+    ]
+
+    # 测试客户端在第一次请求时按当时的设置加载中间件，每种配置用各自的客户端
+    clients = {}
+    for name, rate in MODES:
+        with override_settings(METRICS_ENABLED=rate is not None, METRICS_SAMPLE_RATE=rate or 0.0):
+            client = Client(HTTP_AUTHORIZATION=f"Bearer {token}")
+            client.get("/api/v1/time")
+        clients[name] = client
+
+    samples = {name: [] for name, _ in MODES}
+    for _ in range(args.rounds):
+        for name, rate in MODES:
+            with override_settings(METRICS_SAMPLE_RATE=rate or 0.0, METRICS_SLOW_REQUEST_MS=1e9):
+                for method, path, body in requests:
+                    started = time.perf_counter()
+                    resp = getattr(clients[name], method)(path, body, content_type="application/json")
+                    samples[name].append((time.perf_counter() - started) * 1000)
+                    assert resp.status_code == 200, resp.content
+
+    started = time.perf_counter()
+    text = metrics.render()
+    render_ms = (time.perf_counter() - started) * 1000
+
+    base = statistics.fmean(samples["off"])
+    print(f"{args.events} events, {len(requests)} endpoints x {args.rounds} rounds per mode")
+    print(f"{'mode':<12}{'mean ms':>9}{'p50 ms':>9}{'p99 ms':>9}{'overhead':>10}")
+    for name, _ in MODES:
+        values = sorted(samples[name])
+        mean = statistics.fmean(values)
+        print(f"{name:<12}{mean:>9.2f}{percentile(values, 0.5):>9.2f}{percentile(values, 0.99):>9.2f}"
+              f"{(mean / base - 1) * 100:>9.1f}%")
+    print(f"/_metrics: {len(text.splitlines())} lines, {len(text)} bytes, rendered in {render_ms:.2f} ms")
+
+
+if __name__ == "__main__":
+    main()
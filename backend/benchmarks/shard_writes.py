@@ -0,0 +1,178 @@
+"""
+按用户分片的并发写入基准：单库 vs N 个分片
+-------------------------------------------
+每种分片数（JARVIS_SHARDS）在独立子进程中运行，使用新的临时数据库（production 配置）。
+启动 --processes 个进程、每个进程 --threads 个线程，在 --seconds 秒内为随机用户反复执行
+与接口相同的写操作：
+  - 在事务中创建事件（event_create，只写用户所在的分片）
+  - 每 --location-every 次写入上报一次位置（store_user_locations，同时写分片与主库的 users 表）
+每个操作前激活用户的分片（与 TokenAuthentication 相同），结束时调用 close_old_connections()。
+不分片时所有写入在同一个写锁上排队；分片后不同分片的写入并行提交。
+
+运行（在 backend 目录下）：
+  python benchmarks/shard_writes.py --shards 0 4 --processes 4 --threads 8 --seconds 10
+"""
+
+import argparse
+import json
+import multiprocessing
+import os
+import random
+import subprocess
+import sys
+import tempfile
+import time
+from datetime import date
+from pathlib import Path
+
+BACKEND_DIR = Path(__file__).resolve().parent.parent
+sys.path.insert(0, str(BACKEND_DIR))
+sys.path.insert(0, str(Path(__file__).resolve().parent))
+
+from common import summarize  # noqa: E402
+
+USERS = 64
+
+
+def setup_django():
+    os.environ.setdefault("DJANGO_SETTINGS_MODULE", "jarvis_backend.settings")
+    import django
+    django.setup()
+
+
+def seed() -> None:
+    from django.core.management import call_command
+    from api import sharding
+    from api.models import User
+    from api.views import create_default_calendar_types
+
+    call_command("migrate", verbosity=0)
+    for u in range(USERS):
+        account_id = f"bench-{u}@jarvis.local"
+        shard, alias = sharding.assign_shard(account_id)
+        sharding.ensure_shard(alias)
+        user = User.objects.create(account_id=account_id, shard=shard)
+        create_default_calendar_types(user)
+
+
+def worker(seconds: float, threads: int, location_every: int, seed_value: int, queue) -> None:
+    """一个进程：threads 个线程并发写入，结果放入 queue"""
+    setup_django()
+    import threading
+    from django.db import OperationalError, close_old_connections
+    from django.utils import timezone
+    from api import sharding
+    from api.models import CalendarType, Event, User
+    from api.views import store_user_locations
+
+    users = list(User.objects.all())
+    close_old_connections()
+    today = date.today()
+    deadline = time.monotonic() + seconds
+    lock = threading.Lock()
+    results = {"write_ms": [], "errors": 0, "locked": 0}
+
+    def write(user, rng, n):
+        with sharding.use_user_db(user):
+            with sharding.atomic():
+                general = CalendarType.objects.get(user=user, type_id="general")
+                Event.objects.create(user=user, calendar_type=general, title="bench write", date=today)
+            if location_every and n % location_every == 0:
+                store_user_locations(user, [{
+                    "latitude": 22.3 + rng.random() / 100, "longitude": 114.2 + rng.random() / 100,
+                    "accuracy": 10.0, "timestamp": timezone.now(),
+                }])
+
+    def run(index):
+        rng = random.Random(seed_value * 1000 + index)
+        writes = []
+        errors = locked = 0
+        n = 0
+        while time.monotonic() < deadline:
+            n += 1
+            started = time.perf_counter()
+            try:
+                write(rng.choice(users), rng, n)
+                writes.append((time.perf_counter() - started) * 1000)
+            except OperationalError as e:
+                if "locked" in str(e):
+                    locked += 1
+                errors += 1
+            finally:
+                close_old_connections()
+        with lock:
+            results["write_ms"] += writes
+            results["errors"] += errors
+            results["locked"] += locked
+
+    pool = [threading.Thread(target=run, args=(i,)) for i in range(threads)]
+    for t in pool:
+        t.start()
+    for t in pool:
+        t.join()
+    queue.put(results)
+
+
+def run_shards(args) -> dict:
+    """子进程入口：在当前 JARVIS_SHARDS 下建库、压测并输出 JSON"""
+    setup_django()
+    seed()
+    from django.db import connections
+    connections.close_all()
+
+    ctx = multiprocessing.get_context("fork")
+    queue = ctx.Queue()
+    procs = [ctx.Process(target=worker, args=(args.seconds, args.threads, args.location_every, i, queue))
+             for i in range(args.processes)]
+    started = time.perf_counter()
+    for p in procs:
+        p.start()
+    parts = [queue.get() for _ in procs]
+    for p in procs:
+        p.join()
+    wall = time.perf_counter() - started
+
+    writes = [ms for part in parts for ms in part["write_ms"]]
+    return {
+        "writes": summarize(writes, sum(p["errors"] for p in parts), wall),
+        "locked_errors": sum(p["locked"] for p in parts),
+    }
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--shards", type=int, nargs="+", default=[0, 4], help="要比较的分片数（0 = 不分片）")
+    parser.add_argument("--processes", type=int, default=4)
+    parser.add_argument("--threads", type=int, default=8, help="每个进程的线程数")
+    parser.add_argument("--seconds", type=float, default=10)
+    parser.add_argument("--location-every", type=int, default=5, help="每 N 次写入上报一次位置（0 = 不上报）")
+    parser.add_argument("--child", action="store_true", help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.child:
+        print(json.dumps(run_shards(args)))
+        return
+
+    rows = {}
+    for shards in args.shards:
+        with tempfile.TemporaryDirectory() as tmp:
+            env = dict(os.environ, JARVIS_DB_PROFILE="production", JARVIS_SHARDS=str(shards),
+                       JARVIS_DB_PATH=os.path.join(tmp, "bench.sqlite3"),
+                       JARVIS_SHARD_DIR=os.path.join(tmp, "shards"),
+                       JARVIS_MEDIA_ROOT=os.path.join(tmp, "media"),
+                       JARVIS_PREVIEW_WORKERS="0", JARVIS_FILE_DELETION_WORKERS="0")
+            child = [sys.executable, __file__, "--child", *sys.argv[1:]]
+            out = subprocess.run(child, env=env, cwd=BACKEND_DIR, check=True, capture_output=True, text=True).stdout
+            rows[shards] = json.loads(out.strip().splitlines()[-1])
+
+    print(f"{args.processes} processes x {args.threads} threads, {args.seconds:.0f}s, {USERS} users, "
+          f"location every {args.location_every} writes")
+    print(f"{'shards':<8}{'writes/s':>10}{'p50 ms':>10}{'p95 ms':>10}{'p99 ms':>10}{'errors':>8}{'locked':>8}")
+    for shards, row in rows.items():
+        s = row["writes"]
+        print(f"{shards:<8}{s['throughput_rps']:>10.1f}{s['p50_ms']:>10.1f}{s['p95_ms']:>10.1f}"
+              f"{s['p99_ms']:>10.1f}{s['errors']:>8}{row['locked_errors']:>8}")
+
+
+if __name__ == "__main__":
+    main()
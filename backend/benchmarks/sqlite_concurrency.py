@@ -0,0 +1,193 @@
+"""
+SQLite 并发读写基准：basic vs production 数据库配置
+-------------------------------------------------
+两种配置（JARVIS_DB_PROFILE）分别在独立子进程中运行，各自使用新的临时数据库：
+  - basic:      Django 自带 sqlite3 后端，回滚日志，每个操作后关闭连接（CONN_MAX_AGE=0）
+  - production: jarvis_backend.sqlite 后端，WAL + PRAGMA 调优，持久连接，写操作经文件锁排队
+
+每个配置启动 --processes 个进程（模拟多个 gunicorn worker），每个进程 --threads 个线程，
+在 --seconds 秒内反复执行与接口相同的 ORM 操作：
+  - 读（--read-ratio）：某个用户的事件列表（events_list 的查询）
+  - 写：在事务中创建事件并写入位置（event_create + store_user_locations）
+每个操作结束时调用 close_old_connections()，与请求结束时 Django 的处理一致。
+统计吞吐、延迟分位数以及 database is locked 错误数。
+
+运行（在 backend 目录下）：
+  python benchmarks/sqlite_concurrency.py --processes 4 --threads 8 --seconds 10
+"""
+
+import argparse
+import json
+import multiprocessing
+import os
+import random
+import subprocess
+import sys
+import tempfile
+import time
+from datetime import date, timedelta
+from pathlib import Path
+
+BACKEND_DIR = Path(__file__).resolve().parent.parent
+sys.path.insert(0, str(BACKEND_DIR))
+sys.path.insert(0, str(Path(__file__).resolve().parent))
+
+from common import summarize  # noqa: E402
+
+USERS = 20
+
+
+def setup_django():
+    os.environ.setdefault("DJANGO_SETTINGS_MODULE", "jarvis_backend.settings")
+    import django
+    django.setup()
+
+
+def seed(events_per_user: int) -> None:
+    from django.core.management import call_command
+    from api.models import CalendarType, Event, User
+    from api.views import create_default_calendar_types
+
+    call_command("migrate", verbosity=0)
+    today = date.today()
+    for u in range(USERS):
+        user = User.objects.create(account_id=f"bench-{u}@jarvis.local")
+        create_default_calendar_types(user)
+        general = CalendarType.objects.get(user=user, type_id="general")
+        Event.objects.bulk_create([
+            Event(user=user, calendar_type=general, title=f"event {i}", date=today + timedelta(days=i % 30))
+            for i in range(events_per_user)
+        ])
+
+
+def worker(seconds: float, threads: int, read_ratio: float, seed_value: int, queue) -> None:
+    """一个进程：threads 个线程并发读写，结果放入 queue"""
+    setup_django()
+    import threading
+    from django.db import OperationalError, close_old_connections, transaction
+    from django.utils import timezone
+    from api.models import CalendarType, Event, User
+    from api.views import store_user_locations
+
+    users = list(User.objects.all())
+    close_old_connections()
+    today = date.today()
+    deadline = time.monotonic() + seconds
+    lock = threading.Lock()
+    results = {"read_ms": [], "write_ms": [], "read_errors": 0, "write_errors": 0, "locked": 0}
+
+    def read(user):
+        list(Event.objects.filter(user=user, date__gte=today, date__lte=today + timedelta(days=7))
+             .select_related("calendar_type", "attachment__blob").prefetch_related("links"))
+
+    def write(user, rng):
+        with transaction.atomic():
+            general = CalendarType.objects.get(user=user, type_id="general")
+            Event.objects.create(user=user, calendar_type=general, title="bench write", date=today)
+        store_user_locations(user, [{
+            "latitude": 22.3 + rng.random() / 100, "longitude": 114.2 + rng.random() / 100,
+            "accuracy": 10.0, "timestamp": timezone.now(),
+        }])
+
+    def run(index):
+        rng = random.Random(seed_value * 1000 + index)
+        reads, writes = [], []
+        read_errors = write_errors = locked = 0
+        while time.monotonic() < deadline:
+            user = rng.choice(users)
+            is_read = rng.random() < read_ratio
+            started = time.perf_counter()
+            try:
+                read(user) if is_read else write(user, rng)
+                (reads if is_read else writes).append((time.perf_counter() - started) * 1000)
+            except OperationalError as e:
+                if "locked" in str(e):
+                    locked += 1
+                if is_read:
+                    read_errors += 1
+                else:
+                    write_errors += 1
+            finally:
+                close_old_connections()
+        with lock:
+            results["read_ms"] += reads
+            results["write_ms"] += writes
+            results["read_errors"] += read_errors
+            results["write_errors"] += write_errors
+            results["locked"] += locked
+
+    pool = [threading.Thread(target=run, args=(i,)) for i in range(threads)]
+    for t in pool:
+        t.start()
+    for t in pool:
+        t.join()
+    queue.put(results)
+
+
+def run_profile(args) -> dict:
+    """子进程入口：在当前 JARVIS_DB_PROFILE 下建库、压测并输出 JSON"""
+    setup_django()
+    seed(args.events_per_user)
+    from django.db import connections
+    connections.close_all()
+
+    ctx = multiprocessing.get_context("fork")
+    queue = ctx.Queue()
+    procs = [ctx.Process(target=worker, args=(args.seconds, args.threads, args.read_ratio, i, queue))
+             for i in range(args.processes)]
+    started = time.perf_counter()
+    for p in procs:
+        p.start()
+    parts = [queue.get() for _ in procs]
+    for p in procs:
+        p.join()
+    wall = time.perf_counter() - started
+
+    reads = [ms for part in parts for ms in part["read_ms"]]
+    writes = [ms for part in parts for ms in part["write_ms"]]
+    return {
+        "reads": summarize(reads, sum(p["read_errors"] for p in parts), wall),
+        "writes": summarize(writes, sum(p["write_errors"] for p in parts), wall),
+        "locked_errors": sum(p["locked"] for p in parts),
+    }
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--profiles", nargs="+", default=["basic", "production"])
+    parser.add_argument("--processes", type=int, default=4)
+    parser.add_argument("--threads", type=int, default=8, help="每个进程的线程数")
+    parser.add_argument("--seconds", type=float, default=10)
+    parser.add_argument("--read-ratio", type=float, default=0.8)
+    parser.add_argument("--events-per-user", type=int, default=200)
+    parser.add_argument("--child", action="store_true", help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.child:
+        print(json.dumps(run_profile(args)))
+        return
+
+    rows = {}
+    for profile in args.profiles:
+        with tempfile.TemporaryDirectory() as tmp:
+            env = dict(os.environ, JARVIS_DB_PROFILE=profile,
+                       JARVIS_DB_PATH=os.path.join(tmp, "bench.sqlite3"),
+                       JARVIS_MEDIA_ROOT=os.path.join(tmp, "media"),
+                       JARVIS_PREVIEW_WORKERS="0", JARVIS_FILE_DELETION_WORKERS="0")
+            child = [sys.executable, __file__, "--child", *sys.argv[1:]]
+            out = subprocess.run(child, env=env, cwd=BACKEND_DIR, check=True, capture_output=True, text=True).stdout
+            rows[profile] = json.loads(out.strip().splitlines()[-1])
+
+    print(f"{args.processes} processes x {args.threads} threads, {args.seconds:.0f}s, "
+          f"{args.read_ratio:.0%} reads")
+    print(f"{'profile':<12}{'kind':<8}{'ops/s':>10}{'p50 ms':>10}{'p95 ms':>10}{'p99 ms':>10}{'errors':>8}")
+    for profile, row in rows.items():
+        for kind in ("reads", "writes"):
+            s = row[kind]
+            print(f"{profile:<12}{kind:<8}{s['throughput_rps']:>10.1f}{s['p50_ms']:>10.1f}"
+                  f"{s['p95_ms']:>10.1f}{s['p99_ms']:>10.1f}{s['errors']:>8}")
+        print(f"{profile:<12}{'locked':<8}{row['locked_errors']:>10}")
+
+
+if __name__ == "__main__":
+    main()
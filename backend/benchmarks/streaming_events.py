@@ -0,0 +1,141 @@
+"""
+流式 JSON：大范围 /events 与 /agent/info 的内存峰值与首字节时间
+-------------------------------------------------------------
+在临时数据库中为一个用户写入 --events 个事件（分布在 --years 年内，部分带链接，另有一个每天重复的例行事件），
+对整个范围的 GET /events 与 GET /agent/info 分别用 ?stream=false（一次性序列化）和 ?stream=true 请求：
+  - 首字节时间（视图返回 + 第一块内容）与读完全部响应的时间
+  - tracemalloc 统计的 Python 内存峰值（单独一轮测量，tracemalloc 本身会拖慢请求）
+并核对两种方式的响应体（除 server_time 外）完全相同。
+
+运行（在 backend 目录下）：
+  python benchmarks/streaming_events.py --events 10000,50000,100000
+"""
+
+import argparse
+import json
+import os
+import random
+import sys
+import tempfile
+import time
+import tracemalloc
+from datetime import date, time as dt_time, timedelta
+from pathlib import Path
+
+BACKEND_DIR = Path(__file__).resolve().parent.parent
+sys.path.insert(0, str(BACKEND_DIR))
+
+
+def seed(user, count: int, start: date, days: int, rng: random.Random) -> None:
+    from api.models import CalendarType, Event, EventLink
+
+    general = CalendarType.objects.get(user=user, type_id="general")
+    Event(user=user, calendar_type=general, title="Gym", date=start, is_all_day=False,
+          start_time=dt_time(7), end_time=dt_time(8), recurrence="FREQ=DAILY").save()
+    for offset in range(0, count, 5000):
+        events, links = [], []
+        for i in range(offset, min(count, offset + 5000)):
+            hour = rng.randrange(8, 21)
+            event = Event(user=user, calendar_type=general, title=f"Event {i}", location="Room 101",
+                          date=start + timedelta(days=rng.randrange(days)), is_all_day=False,
+                          start_time=dt_time(hour), end_time=dt_time(hour + 1))
+            events.append(event)
+            if rng.random() < 0.2:
+                links.append(EventLink(event=event, url=f"https://example.com/{i}"))
+        Event.objects.bulk_create(events)
+        EventLink.objects.bulk_create(links)
+
+
+def fetch(client, token: str, path: str) -> tuple:
+    """(首字节 ms, 总耗时 ms, 响应体)"""
+    started = time.perf_counter()
+    resp = client.get(path, HTTP_AUTHORIZATION=f"Bearer {token}")
+    assert resp.status_code == 200
+    if resp.streaming:
+        parts = iter(resp.streaming_content)
+        first = next(parts)
+        first_ms = (time.perf_counter() - started) * 1000
+        body = first + b"".join(parts)
+    else:
+        body = resp.content
+        first_ms = (time.perf_counter() - started) * 1000
+    resp.close()
+    return first_ms, (time.perf_counter() - started) * 1000, body
+
+
+def peak_mb(client, token: str, path: str) -> float:
+    """读取响应时只计长度、不保留内容，峰值只反映服务端生成响应的内存"""
+    tracemalloc.start()
+    try:
+        resp = client.get(path, HTTP_AUTHORIZATION=f"Bearer {token}")
+        if resp.streaming:
+            sum(len(part) for part in resp.streaming_content)
+        resp.close()
+        return tracemalloc.get_traced_memory()[1] / 1024 / 1024
+    finally:
+        tracemalloc.stop()
+
+
+def comparable(body: bytes) -> dict:
+    payload = json.loads(body)
+    payload.pop("server_time")
+    if isinstance(payload["data"], dict):
+        payload["data"].pop("server_time", None)
+    return payload
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--events", default="10000,50000,100000", help="每个用户的事件数，逗号分隔")
+    parser.add_argument("--years", type=int, default=3)
+    parser.add_argument("--seed", type=int, default=7)
+    args = parser.parse_args()
+
+    tmp = tempfile.TemporaryDirectory()
+    os.environ["JARVIS_DB_PATH"] = os.path.join(tmp.name, "streaming.sqlite3")
+    os.environ["JARVIS_MEDIA_ROOT"] = os.path.join(tmp.name, "media")
+    os.environ.setdefault("DJANGO_SETTINGS_MODULE", "jarvis_backend.settings")
+
+    import django
+    django.setup()
+    from django.core.management import call_command
+    from django.test import Client
+    from api import sharding
+    from api.models import User
+
+    call_command("migrate", verbosity=0)
+    client = Client()
+    start = date.today() - timedelta(days=365 * args.years // 2)
+    end = start + timedelta(days=365 * args.years - 1)
+    paths = {
+        "events": f"/api/v1/events?start_date={start}&end_date={end}",
+        "agent/info": f"/api/v1/agent/info?start_date={start}&end_date={end}",
+    }
+
+    rows = []
+    for count in (int(n) for n in args.events.split(",")):
+        account = f"bench-stream-{count}@jarvis.local"
+        resp = client.post("/api/v1/auth/login", {"account_id": account}, content_type="application/json")
+        token = resp.json()["data"]["access_token"]
+        user = User.objects.get(account_id=account)
+        with sharding.use_user_db(user):
+            seed(user, count, start, 365 * args.years, random.Random(args.seed))
+        for name, path in paths.items():
+            bodies = {}
+            for mode in ("false", "true"):
+                full = f"{path}&stream={mode}"
+                first_ms, total_ms, body = fetch(client, token, full)
+                bodies[mode] = body
+                rows.append((count, name, "stream" if mode == "true" else "buffered", first_ms, total_ms,
+                             peak_mb(client, token, full), len(body)))
+            assert comparable(bodies["false"]) == comparable(bodies["true"]), f"{name}: bodies differ"
+
+    print(f"range {start} .. {end}, one daily recurring event + N single events (20% with a link)")
+    print(f"{'events':>7}  {'endpoint':<11}{'mode':<10}{'first byte ms':>14}{'total ms':>10}{'peak MB':>9}{'body MB':>9}")
+    for count, name, mode, first_ms, total_ms, peak, size in rows:
+        print(f"{count:>7}  {name:<11}{mode:<10}{first_ms:>14.1f}{total_ms:>10.1f}{peak:>9.1f}"
+              f"{size / 1024 / 1024:>9.1f}")
+
+
+if __name__ == "__main__":
+    main()
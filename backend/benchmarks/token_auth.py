@@ -0,0 +1,143 @@
+"""
+登录与鉴权延迟：access_tokens 表中有大量历史 token 时
+---------------------------------------------------
+在临时数据库中创建 --users 个用户，并直接写入 --tokens 条历史 token（其中 --expired-ratio 为已过期，
+模拟旧版本每次登录都新建 token、从不清理的情况），然后经由 Django 测试客户端测量：
+  - login (device)：带 device_id 的重复登录（复用同一设备的 token，不写库）
+  - login (legacy)：不带 device_id 的登录（每次新建一行）
+  - login (new user)：新用户首次登录（创建用户与默认日历类型）
+  - auth：带 Bearer token 的 GET /user（TokenAuthentication 按唯一索引查找 token）
+再执行 purge_tokens，记录删除耗时，并在清理后重复测量。
+
+运行（在 backend 目录下）：
+  python benchmarks/token_auth.py --tokens 2000000 --iterations 300
+"""
+
+import argparse
+import os
+import random
+import sys
+import tempfile
+import time
+import uuid
+from datetime import timedelta
+from pathlib import Path
+
+BACKEND_DIR = Path(__file__).resolve().parent.parent
+sys.path.insert(0, str(BACKEND_DIR))
+sys.path.insert(0, str(Path(__file__).resolve().parent))
+
+from common import summarize  # noqa: E402
+
+INSERT_BATCH = 50_000
+
+
+def fill_tokens(user_ids: list, count: int, expired_ratio: float, rng: random.Random) -> None:
+    """直接用 executemany 写入历史 token（不经过 ORM，几百万行也只需几十秒）"""
+    from django.db import connection, transaction
+    from django.utils import timezone
+
+    now = timezone.now().replace(tzinfo=None)
+    sql = ("INSERT INTO access_tokens (id, user_id, token, device_id, created_at, expires_at, is_active) "
+           "VALUES (%s, %s, %s, '', %s, %s, %s)")
+    written = 0
+    while written < count:
+        rows = []
+        for _ in range(min(INSERT_BATCH, count - written)):
+            expired = rng.random() < expired_ratio
+            created = now - timedelta(days=rng.uniform(8, 365) if expired else rng.uniform(0, 6))
+            rows.append((uuid.uuid4().hex, rng.choice(user_ids).hex, str(uuid.uuid4()), created.isoformat(" "),
+                         (created + timedelta(days=7)).isoformat(" "), not expired or rng.random() < 0.5))
+        with transaction.atomic(), connection.cursor() as cursor:
+            cursor.executemany(sql, rows)
+        written += len(rows)
+
+
+def measure(iterations: int, fn) -> dict:
+    samples = []
+    started = time.perf_counter()
+    for i in range(iterations):
+        t = time.perf_counter()
+        fn(i)
+        samples.append((time.perf_counter() - t) * 1000)
+    return summarize(samples, 0, time.perf_counter() - started)
+
+
+def run_suite(client, account_ids: list, iterations: int, tag: str) -> dict:
+    def login(i, device=True):
+        body = {"account_id": account_ids[i % len(account_ids)]}
+        if device:
+            body["device_id"] = f"bench-device-{i % len(account_ids)}"
+        resp = client.post("/api/v1/auth/login", body, content_type="application/json")
+        assert resp.status_code == 200, resp.content
+        return resp.json()["data"]["access_token"]
+
+    tokens = [login(i) for i in range(len(account_ids))]
+
+    def auth(i):
+        resp = client.get("/api/v1/user", HTTP_AUTHORIZATION=f"Bearer {tokens[i % len(tokens)]}")
+        assert resp.status_code == 200, resp.content
+
+    def new_user(i):
+        resp = client.post("/api/v1/auth/login", {"account_id": f"bench-new-{tag}-{i}@jarvis.local"},
+                           content_type="application/json")
+        assert resp.status_code == 200 and resp.json()["data"]["is_new_user"], resp.content
+
+    return {
+        "login (device)": measure(iterations, login),
+        "login (legacy)": measure(iterations, lambda i: login(i, device=False)),
+        "login (new user)": measure(iterations, new_user),
+        "auth": measure(iterations, auth),
+    }
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--users", type=int, default=100)
+    parser.add_argument("--tokens", type=int, default=2_000_000, help="预先写入的历史 token 数")
+    parser.add_argument("--expired-ratio", type=float, default=0.9)
+    parser.add_argument("--iterations", type=int, default=300, help="每项测量的请求数")
+    parser.add_argument("--seed", type=int, default=7)
+    args = parser.parse_args()
+
+    tmp = tempfile.TemporaryDirectory()
+    os.environ["JARVIS_DB_PATH"] = os.path.join(tmp.name, "tokens.sqlite3")
+    os.environ["JARVIS_MEDIA_ROOT"] = os.path.join(tmp.name, "media")
+    os.environ.setdefault("DJANGO_SETTINGS_MODULE", "jarvis_backend.settings")
+
+    import django
+    django.setup()
+    from django.core.management import call_command
+    from django.test import Client
+    from api.authentication import purge_tokens
+    from api.models import AccessToken, User
+
+    call_command("migrate", verbosity=0)
+    client = Client()
+    account_ids = [f"bench-{u}@jarvis.local" for u in range(args.users)]
+    for account_id in account_ids:
+        client.post("/api/v1/auth/login", {"account_id": account_id}, content_type="application/json")
+
+    started = time.perf_counter()
+    fill_tokens(list(User.objects.values_list("pk", flat=True)), args.tokens, args.expired_ratio,
+                random.Random(args.seed))
+    print(f"inserted {args.tokens} tokens in {time.perf_counter() - started:.1f}s")
+
+    results = {"before purge": run_suite(client, account_ids, args.iterations, "a")}
+    rows = AccessToken.objects.count()
+    started = time.perf_counter()
+    purged = purge_tokens()
+    purge_s = time.perf_counter() - started
+    results["after purge"] = run_suite(client, account_ids, args.iterations, "b")
+
+    print(f"purge_tokens: deleted {purged} of {rows} rows in {purge_s:.1f}s, "
+          f"{AccessToken.objects.count()} left")
+    print(f"{'phase':<14}{'operation':<18}{'ops/s':>9}{'p50 ms':>9}{'p95 ms':>9}{'p99 ms':>9}")
+    for phase, suite in results.items():
+        for name, s in suite.items():
+            print(f"{phase:<14}{name:<18}{s['throughput_rps']:>9.1f}{s['p50_ms']:>9.2f}"
+                  f"{s['p95_ms']:>9.2f}{s['p99_ms']:>9.2f}")
+
+
+if __name__ == "__main__":
+    main()
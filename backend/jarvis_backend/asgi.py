@@ -12,5 +12,14 @@ import os
 from django.core.asgi import get_asgi_application
 
 os.environ.setdefault("DJANGO_SETTINGS_MODULE", "jarvis_backend.settings")
+# ASGI 下读多的端点使用异步 ORM 实现（api/async_views.py），设为 0 可关闭
+os.environ.setdefault("JARVIS_ASYNC_VIEWS", "1")
+# 同步代码在 sync_to_async 的线程池中执行，持久连接会在每个线程各留一个连接（及写锁文件描述符），ASGI 下默认不保留
+os.environ.setdefault("JARVIS_DB_CONN_MAX_AGE", "0")
 
-application = get_asgi_application()
+django_application = get_asgi_application()
+
+# WebSocket 连接（实时变更通道）由 api.realtime 处理，其余交给 Django；须在 Django 初始化之后导入
+from api.realtime import asgi_router  # noqa: E402
+
+application = asgi_router(django_application)
@@ -2,8 +2,12 @@
 Django settings for jarvis_backend project.
 """
 
+import copy
+import os
 from pathlib import Path
 
+from corsheaders.defaults import default_headers
+
 # Build paths inside the project like this: BASE_DIR / 'subdir'.
 BASE_DIR = Path(__file__).resolve().parent.parent
 
@@ -31,6 +35,7 @@ INSTALLED_APPS = [
 ]
 
 MIDDLEWARE = [
+    'api.metrics.RequestMetricsMiddleware',
     'corsheaders.middleware.CorsMiddleware',
     'django.middleware.security.SecurityMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
@@ -39,6 +44,8 @@ MIDDLEWARE = [
     'django.contrib.auth.middleware.AuthenticationMiddleware',
     'django.contrib.messages.middleware.MessageMiddleware',
     'django.middleware.clickjacking.XFrameOptionsMiddleware',
+    'api.replicas.ReplicaStickinessMiddleware',
+    'api.sharding.ShardMiddleware',
 ]
 
 ROOT_URLCONF = 'jarvis_backend.urls'
@@ -60,13 +67,102 @@ TEMPLATES = [
 
 WSGI_APPLICATION = 'jarvis_backend.wsgi.application'
 
+# 读多的端点（events/agent_info等GET）是否使用异步视图，asgi.py 默认开启
+ASYNC_READ_VIEWS = os.getenv('JARVIS_ASYNC_VIEWS', '0') == '1'
+
 # Database - Using SQLite
-DATABASES = {
-    'default': {
-        'ENGINE': 'django.db.backends.sqlite3',
-        'NAME': BASE_DIR / 'db.sqlite3',
+# JARVIS_DB_PATH 可指定其他数据库文件（基准测试/压测使用独立的库）
+# JARVIS_DB_PROFILE=basic（默认，开发、测试）：Django 自带 sqlite3 后端的默认配置（回滚日志、每个请求新建连接），
+# 不改动已有数据库文件的日志模式；=production（部署时显式设置）：jarvis_backend.sqlite 后端，WAL + 调优的 PRAGMA、
+# 持久连接，写操作经数据库文件旁的文件锁排队（跨线程、跨进程，等待以 busy_timeout 为上限）；
+# 持久连接默认 600 秒，asgi.py 默认设为 0（JARVIS_DB_CONN_MAX_AGE）。两者对比见 benchmarks/sqlite_concurrency.py
+DB_PROFILE = os.getenv('JARVIS_DB_PROFILE', 'basic')
+DB_PATH = os.getenv('JARVIS_DB_PATH') or BASE_DIR / 'db.sqlite3'
+
+if DB_PROFILE == 'basic':
+    DATABASES = {
+        'default': {
+            'ENGINE': 'django.db.backends.sqlite3',
+            'NAME': DB_PATH,
+            # 后台线程（预览图、文件删除）与请求并发写库：事务开始即获取写锁，遇到锁等待而不是
+            # 在读锁升级为写锁时直接报 database is locked
+            'OPTIONS': {
+                'transaction_mode': 'IMMEDIATE',
+            },
+        }
     }
-}
+else:
+    DATABASES = {
+        'default': {
+            'ENGINE': 'jarvis_backend.sqlite',
+            'NAME': DB_PATH,
+            'CONN_MAX_AGE': int(os.getenv('JARVIS_DB_CONN_MAX_AGE', '600')),
+            'CONN_HEALTH_CHECKS': True,
+            'OPTIONS': {
+                'transaction_mode': 'IMMEDIATE',
+                'pragmas': {
+                    'journal_mode': 'WAL',
+                    'synchronous': 'NORMAL',  # WAL 下只在检查点 fsync，断电最多丢失最近提交的事务，不会损坏
+                    'busy_timeout': 20000,  # 毫秒；等待写锁的上限，写锁之外的访问者（sqlite3 命令行、其他工具）同样按此等待
+                    'mmap_size': 256 * 1024 * 1024,
+                    'cache_size': -16000,  # 负数为 KiB，每个连接约 16MB 页缓存
+                    'temp_store': 'MEMORY',
+                },
+                'writer_lock': True,
+            },
+        }
+    }
+
+# 只读副本：JARVIS_DB_REPLICAS 为逗号分隔的副本数据库文件路径（由 `manage.py sync_replicas` 或外部复制工具维护），
+# 依次注册为 replica1、replica2…。读多的 GET 端点从副本读取（见 api/replicas.py），写入始终走 default；
+# 副本落后主库超过 REPLICA_MAX_LAG_SECONDS 时不再使用，用户写入后同样时长内的读取留在主库（读己之写）
+DATABASE_REPLICAS = []
+for _index, _path in enumerate(_p.strip() for _p in os.getenv('JARVIS_DB_REPLICAS', '').split(',') if _p.strip()):
+    _alias = f'replica{_index + 1}'
+    _options = {'init_command': 'PRAGMA query_only = 1'}
+    if 'pragmas' in DATABASES['default']['OPTIONS']:
+        _options['pragmas'] = {
+            k: v for k, v in DATABASES['default']['OPTIONS']['pragmas'].items()
+            if k in ('busy_timeout', 'mmap_size', 'cache_size', 'temp_store')
+        }
+    DATABASES[_alias] = {**DATABASES['default'], 'NAME': _path, 'OPTIONS': _options, 'TEST': {'MIRROR': 'default'}}
+    DATABASE_REPLICAS.append(_alias)
+
+# 按用户分片：JARVIS_SHARDS=N（N>0）时每个用户的事件、日历类型、附件记录、位置等存放在
+# SHARD_DIR/shard<i>.sqlite3（按 account_id 哈希分配，见 api/sharding.py），users、access_tokens 等仍在 default。
+# 分片数只能增加，增加后运行 `manage.py rebalance_shards`
+SHARD_COUNT = int(os.getenv('JARVIS_SHARDS', '0'))
+SHARD_DIR = Path(os.getenv('JARVIS_SHARD_DIR') or Path(DB_PATH).parent / 'shards')
+if SHARD_COUNT:
+    os.makedirs(SHARD_DIR, exist_ok=True)
+for _index in range(SHARD_COUNT):
+    _options = copy.deepcopy(DATABASES['default']['OPTIONS'])
+    # 分片表对 users、file_blobs 的外键指向其他数据库，分片内不检查外键约束
+    _options['init_command'] = 'PRAGMA foreign_keys = OFF'
+    DATABASES[f'shard{_index}'] = {**DATABASES['default'], 'NAME': SHARD_DIR / f'shard{_index}.sqlite3', 'OPTIONS': _options}
+
+DATABASE_ROUTERS = (
+    (['api.sharding.ShardRouter'] if SHARD_COUNT else [])
+    + (['api.replicas.ReplicaRouter'] if DATABASE_REPLICAS else [])
+)
+REPLICA_MAX_LAG_SECONDS = float(os.getenv('JARVIS_REPLICA_MAX_LAG_SECONDS', '5'))
+REPLICA_STICKY_SECONDS = REPLICA_MAX_LAG_SECONDS
+REPLICA_LAG_CHECK_SECONDS = 1
+
+# 访问令牌：有效期（秒）；同一设备重复登录时，剩余有效期超过 ACCESS_TOKEN_REUSE_MIN_SECONDS 的 token 直接复用，
+# 否则原地轮换。过期或已注销的 token 由 `manage.py purge_tokens` 按批删除（每批一条 DELETE）
+ACCESS_TOKEN_TTL_SECONDS = 7 * 24 * 3600
+ACCESS_TOKEN_REUSE_MIN_SECONDS = ACCESS_TOKEN_TTL_SECONDS // 2
+ACCESS_TOKEN_PURGE_BATCH_SIZE = 5000
+
+# 访问令牌格式：opaque（默认，随机字符串，每个请求查询 access_tokens）或 signed（HMAC 签名，校验只在内存中完成，
+# 见 api/signed_tokens.py）。两种格式的 token 始终都能通过鉴权，切换格式不影响已签发的 token。
+# JARVIS_TOKEN_KEYS="k2:secret2,k1:secret1"：第一个用于签发，其余只用于校验（轮换期间保留旧密钥直到其 token 过期）
+ACCESS_TOKEN_FORMAT = os.getenv('JARVIS_TOKEN_FORMAT', 'opaque')
+SIGNED_TOKEN_KEYS = [
+    tuple(_item.strip().split(':', 1)) for _item in os.getenv('JARVIS_TOKEN_KEYS', '').split(',') if _item.strip()
+] or [('k1', SECRET_KEY)]
+SIGNED_TOKEN_REVOCATION_REFRESH_SECONDS = 5
 
 # Password validation
 AUTH_PASSWORD_VALIDATORS = [
@@ -95,7 +191,85 @@ STATIC_URL = 'static/'
 
 # Media files (Uploads)
 MEDIA_URL = '/media/'
-MEDIA_ROOT = BASE_DIR / 'media'
+MEDIA_ROOT = Path(os.getenv('JARVIS_MEDIA_ROOT') or BASE_DIR / 'media')
+
+# 附件大小上限；上传数据边接收边计算 sha256 并写入临时文件（见 api/attachments.py）
+ATTACHMENT_MAX_BYTES = 10 * 1024 * 1024
+FILE_UPLOAD_HANDLERS = ['api.attachments.HashingUploadHandler']
+
+# 附件下载：签名链接有效期（秒）、浏览器缓存时间（秒）、流式发送的块大小；
+# JARVIS_SENDFILE=nginx 时用 X-Accel-Redirect（需在 nginx 中把 ATTACHMENT_ACCEL_REDIRECT_PREFIX 配为指向
+# MEDIA_ROOT 的 internal location），=apache 时用 X-Sendfile，留空则由 Django 流式发送
+ATTACHMENT_LINK_MAX_AGE = 3600
+ATTACHMENT_CACHE_MAX_AGE = 3600
+ATTACHMENT_STREAM_BLOCK_SIZE = 64 * 1024
+ATTACHMENT_SENDFILE_BACKEND = os.getenv('JARVIS_SENDFILE', '')
+ATTACHMENT_ACCEL_REDIRECT_PREFIX = '/protected-media/'
+
+# 附件预览图：后台线程数（0 表示不生成）、长边像素、WebP 质量、浏览器缓存时间（秒，内容不变可长期缓存）
+PREVIEW_WORKERS = int(os.getenv('JARVIS_PREVIEW_WORKERS', '2'))
+PREVIEW_MAX_EDGE = 480
+PREVIEW_QUALITY = 80
+PREVIEW_CACHE_MAX_AGE = 365 * 24 * 3600
+
+# 附件清理：物理文件先写入删除队列（file_deletions），由后台线程删除（0 表示只由 gc_attachments 命令处理）；
+# 未关联任何事件的附件、MEDIA_ROOT 中没有记录的文件超过宽限期（小时）后由 gc_attachments 回收
+FILE_DELETION_WORKERS = int(os.getenv('JARVIS_FILE_DELETION_WORKERS', '1'))
+ATTACHMENT_ORPHAN_GRACE_HOURS = 24
+
+# 分块续传：未完成文件的存放目录（与 MEDIA_ROOT 位于同一文件系统，完成时重命名即可，不复制数据）、
+# 会话闲置过期时间（小时）、单次 PUT 读取请求体的缓冲大小
+UPLOAD_SESSION_DIR = Path(os.getenv('JARVIS_UPLOAD_SESSION_DIR') or MEDIA_ROOT.parent / 'upload_sessions')
+UPLOAD_SESSION_TTL_HOURS = 24
+UPLOAD_CHUNK_BUFFER_BYTES = 256 * 1024
+
+# 位置上报：批量上限、降采样阈值（距离米 / 时间秒）、每个用户保留的位置条数
+LOCATION_BATCH_MAX_POINTS = 500
+LOCATION_DISTANCE_EPSILON_M = float(os.getenv('JARVIS_LOCATION_DISTANCE_EPSILON_M', '20'))
+LOCATION_TIME_EPSILON_S = float(os.getenv('JARVIS_LOCATION_TIME_EPSILON_S', '30'))
+LOCATION_RETENTION = 2
+
+# 离线通勤估算：缓存格子精度（坐标小数位，3 位约 100 米）与每级缓存的条目上限
+COMMUTE_CELL_DECIMALS = 3
+COMMUTE_CACHE_SIZE = 4096
+
+# 重复事件：events_list 未给出日期范围时，在今天前后各这么多天内展开（重复事件只在请求的窗口内展开）
+RECURRENCE_WINDOW_DAYS = int(os.getenv('JARVIS_RECURRENCE_WINDOW_DAYS', '90'))
+
+# 流式 JSON（events_list / agent_info）：日期范围达到 STREAM_MIN_DAYS 天（或不限日期）时分块输出，
+# 每块 STREAM_CHUNK_SIZE 个事件；?stream=true / false 可显式指定
+STREAM_MIN_DAYS = int(os.getenv('JARVIS_STREAM_MIN_DAYS', '180'))
+STREAM_CHUNK_SIZE = int(os.getenv('JARVIS_STREAM_CHUNK_SIZE', '500'))
+
+# 实时变更通道（/api/v1/changes，SSE 与 WebSocket，仅 ASGI）：发布 / 订阅的实现（默认只在本进程内分发，
+# 多进程部署需换成共享的实现，见 api/realtime.py）、每个连接最多积压的通知数（超过后改发 resync）、
+# 心跳间隔、单个连接的最长时间（到期后客户端重连并重新鉴权）与 SSE 的重连间隔
+REALTIME_BACKEND = os.getenv('JARVIS_REALTIME_BACKEND', 'api.realtime.InProcessBroker')
+REALTIME_QUEUE_SIZE = int(os.getenv('JARVIS_REALTIME_QUEUE_SIZE', '100'))
+REALTIME_HEARTBEAT_SECONDS = int(os.getenv('JARVIS_REALTIME_HEARTBEAT_SECONDS', '25'))
+REALTIME_MAX_CONNECTION_SECONDS = int(os.getenv('JARVIS_REALTIME_MAX_CONNECTION_SECONDS', '3600'))
+REALTIME_RETRY_MS = 3000
+
+# 请求指标（api/metrics.py，/api/v1/_metrics）：设 JARVIS_METRICS=0 关闭中间件；
+# 每个请求都记录延迟、状态码与响应大小，按 METRICS_SAMPLE_RATE 抽样的请求再记录查询数、查询耗时与 SQL；
+# 超过 METRICS_SLOW_REQUEST_MS 毫秒的请求写 WARNING 日志（抽样到的附带最多 METRICS_SLOW_SQL_LIMIT 条不同的 SQL）。
+# 抓取 /api/v1/_metrics 需带 Authorization: Bearer <JARVIS_METRICS_TOKEN>，未设置时该端点关闭
+METRICS_ENABLED = os.getenv('JARVIS_METRICS', '1') == '1'
+METRICS_SAMPLE_RATE = float(os.getenv('JARVIS_METRICS_SAMPLE_RATE', '1.0'))
+METRICS_SLOW_REQUEST_MS = float(os.getenv('JARVIS_METRICS_SLOW_REQUEST_MS', '500'))
+METRICS_SLOW_SQL_LIMIT = 20
+METRICS_SLOW_SQL_CHARS = 500
+METRICS_TOKEN = os.getenv('JARVIS_METRICS_TOKEN', '')
+
+# 没有结束时间的定时事件在冲突检测中按这么长计算（分钟）
+EVENT_DEFAULT_DURATION_MINUTES = 60
+
+# 空闲时段（/schedule/free-slots）：未给出 day_start / day_end 时每天可安排的时间，开始时间取整的分钟数，
+# 以及一次请求最多覆盖的天数
+FREE_SLOTS_DAY_START = os.getenv('JARVIS_FREE_SLOTS_DAY_START', '08:00')
+FREE_SLOTS_DAY_END = os.getenv('JARVIS_FREE_SLOTS_DAY_END', '22:00')
+FREE_SLOTS_ROUND_MINUTES = 15
+FREE_SLOTS_MAX_DAYS = int(os.getenv('JARVIS_FREE_SLOTS_MAX_DAYS', '92'))
 
 # Default primary key field type
 DEFAULT_AUTO_FIELD = 'django.db.models.BigAutoField'
@@ -103,6 +277,8 @@ DEFAULT_AUTO_FIELD = 'django.db.models.BigAutoField'
 # CORS settings - Allow frontend to connect
 CORS_ALLOW_ALL_ORIGINS = True
 CORS_ALLOW_CREDENTIALS = True
+# 分块续传的 PUT 需要携带 Content-Range
+CORS_ALLOW_HEADERS = (*default_headers, 'content-range')
 
 # REST Framework settings
 REST_FRAMEWORK = {
@@ -0,0 +1,239 @@
+"""
+SQLite 数据库后端（生产配置，ENGINE = 'jarvis_backend.sqlite'）
+
+在 Django 自带的 sqlite3 后端上增加两个 OPTIONS：
+  - pragmas：连接建立时依次执行的 PRAGMA（WAL、synchronous=NORMAL、busy_timeout、mmap_size、cache_size 等）
+  - writer_lock：写锁。写事务开始前、以及自动提交模式下的写语句执行前，获取数据库文件旁
+    `<NAME>.writer.lock` 的排他文件锁：本进程的线程按到达顺序阻塞排队，队首线程再用 fcntl.flock 与其他进程互斥，
+    写操作依次执行，等待写锁的连接不再各自进入 SQLite 的 busy handler，也不轮询。
+    等待时间以 pragmas 中的 busy_timeout 为上限，超时与 SQLite 一样抛出 OperationalError（database is locked），
+    锁顺序出错或持锁的进程卡住时请求失败而不是永远挂起。
+    只读语句（SELECT、只读的 WITH 和 PRAGMA，见 is_read_only）不加锁，WAL 模式下读写互不阻塞。
+"""
+import os
+import re
+import threading
+import time
+from collections import deque
+
+from django.db import OperationalError
+from django.db.backends.sqlite3 import base
+
+try:
+    import fcntl
+except ImportError:  # pragma: no cover - Windows 没有 flock，只在进程内排队
+    fcntl = None
+
+# 只读语句不需要写锁：SELECT / EXPLAIN、主语句不是写操作的 WITH（SQLite 的 CTE 内只能是 SELECT）、
+# 不带赋值且没有副作用的 PRAGMA。判断不了的语句一律加锁
+_READ_ONLY_PREFIXES = ('SELECT', 'EXPLAIN')
+_QUOTED = re.compile(r"'(?:[^']|'')*'|\"(?:[^\"]|\"\")*\"|`[^`]*`|\[[^\]]*\]")
+_WRITE_KEYWORD = re.compile(r'\b(?:INSERT|UPDATE|DELETE|REPLACE)\b', re.IGNORECASE)
+_WRITING_PRAGMAS = ('WAL_CHECKPOINT', 'OPTIMIZE', 'INCREMENTAL_VACUUM')
+
+
+def is_read_only(sql):
+    """语句是否只读（sqlite3_stmt_readonly 的保守近似）"""
+    sql = sql.lstrip()
+    head = sql[:7].upper()
+    if head.startswith(_READ_ONLY_PREFIXES):
+        return True
+    if head.startswith('WITH'):
+        return not _WRITE_KEYWORD.search(_QUOTED.sub('', sql))
+    if head.startswith('PRAGMA'):
+        name = sql[6:].lstrip().split('(', 1)[0].split('.')[-1].strip().upper()
+        return '=' not in sql and name not in _WRITING_PRAGMAS
+    return False
+
+
+class _ProcessLock:
+    """
+    一个锁文件在本进程内的状态，同一路径的 WriterLock 共用。
+    本进程的线程按到达顺序排队（Condition 阻塞等待，不轮询），队首线程再获取文件锁（fcntl.flock，
+    与其他进程互斥）。flock 不支持超时，需要等待时由后台线程阻塞获取；等待的线程超时放弃后，
+    后台线程转交给下一个持有者，没有持有者时拿到文件锁立即释放
+    """
+
+    def __init__(self, path):
+        self.path = path
+        self._cond = threading.Condition()
+        self._queue = deque()
+        self._held = False
+        self._fd = None
+        self._pending = None  # 后台线程正在获取文件锁时为其完成事件
+
+    def acquire(self, timeout):
+        deadline = None if timeout is None else time.monotonic() + timeout
+        with self._cond:
+            ticket = object()
+            self._queue.append(ticket)
+            if not self._cond.wait_for(lambda: not self._held and self._queue[0] is ticket, timeout):
+                self._queue.remove(ticket)
+                self._cond.notify_all()
+                return False
+            self._queue.popleft()
+            self._held = True
+            if fcntl is None:
+                return True
+            if self._fd is None:
+                self._fd = os.open(self.path, os.O_RDWR | os.O_CREAT, 0o600)
+            pending = self._pending
+        if pending is None:
+            try:
+                fcntl.flock(self._fd, fcntl.LOCK_EX | fcntl.LOCK_NB)
+                return True
+            except BlockingIOError:
+                pending = self._pending = threading.Event()
+                threading.Thread(target=self._flock_blocking, args=(pending,), daemon=True).start()
+        pending.wait(None if deadline is None else max(deadline - time.monotonic(), 0))
+        with self._cond:
+            if pending.is_set():
+                self._pending = None
+                return True
+            self._held = False
+            self._cond.notify_all()
+        return False
+
+    def _flock_blocking(self, done):
+        fcntl.flock(self._fd, fcntl.LOCK_EX)
+        with self._cond:
+            done.set()
+            if not self._held:
+                # 等待的线程已超时放弃，且还没有新的持有者
+                self._pending = None
+                fcntl.flock(self._fd, fcntl.LOCK_UN)
+
+    def release(self):
+        if fcntl is not None:
+            fcntl.flock(self._fd, fcntl.LOCK_UN)
+        with self._cond:
+            self._held = False
+            self._cond.notify_all()
+
+    def _forget_fd(self):
+        """fork 后子进程不能沿用父进程打开的锁文件（共享同一个打开的文件描述，flock 互不排斥）"""
+        if self._fd is not None:
+            os.close(self._fd)
+        self.__init__(self.path)
+
+
+_process_locks = {}
+_process_locks_guard = threading.Lock()
+
+
+def _process_lock(path):
+    with _process_locks_guard:
+        lock = _process_locks.get(path)
+        if lock is None:
+            lock = _process_locks[path] = _ProcessLock(path)
+        return lock
+
+
+def _reset_after_fork():
+    global _process_locks_guard
+    _process_locks_guard = threading.Lock()
+    for lock in _process_locks.values():
+        lock._forget_fd()
+
+
+if hasattr(os, 'register_at_fork'):
+    os.register_at_fork(after_in_child=_reset_after_fork)
+
+
+class WriterLock:
+    """
+    一个数据库文件的写锁，每个连接持有自己的实例；同一路径的实例共用本进程的 _ProcessLock，
+    线程之间按先来先得排队，进程之间经文件锁互斥。
+    timeout 为最长等待秒数，超时抛出 OperationalError；None 时一直等待（只用于迁移锁等一次性操作）。
+    """
+
+    def __init__(self, path, timeout=None):
+        self.path = path
+        self.timeout = timeout
+        self.held = False
+        self._lock = _process_lock(path)
+
+    def acquire(self):
+        if self.held:
+            return
+        if not self._lock.acquire(self.timeout):
+            raise OperationalError(f'database is locked: waited {self.timeout:g}s for {self.path}')
+        self.held = True
+
+    def release(self):
+        if not self.held:
+            return
+        self.held = False
+        self._lock.release()
+
+    def close(self):
+        self.release()
+
+
+class DatabaseWrapper(base.DatabaseWrapper):
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.writer_lock = None
+        self.execute_wrappers.append(self._serialize_autocommit_write)
+
+    def get_connection_params(self):
+        kwargs = super().get_connection_params()
+        self.pragmas = kwargs.pop('pragmas', {})
+        self.use_writer_lock = kwargs.pop('writer_lock', False) and not self.is_in_memory_db()
+        return kwargs
+
+    def get_new_connection(self, conn_params):
+        conn = super().get_new_connection(conn_params)
+        for name, value in self.pragmas.items():
+            conn.execute(f'PRAGMA {name} = {value}')
+        if self.use_writer_lock:
+            busy_timeout = self.pragmas.get('busy_timeout')
+            self.writer_lock = WriterLock(
+                f'{self.settings_dict["NAME"]}.writer.lock',
+                timeout=None if busy_timeout is None else int(busy_timeout) / 1000,
+            )
+        return conn
+
+    def _start_transaction_under_autocommit(self):
+        if self.writer_lock is not None:
+            self.writer_lock.acquire()
+        try:
+            super()._start_transaction_under_autocommit()
+        except Exception:
+            self._release_writer_lock()
+            raise
+
+    def _commit(self):
+        try:
+            super()._commit()
+        finally:
+            self._release_writer_lock()
+
+    def _rollback(self):
+        try:
+            super()._rollback()
+        finally:
+            self._release_writer_lock()
+
+    def _close(self):
+        try:
+            super()._close()
+        finally:
+            if self.writer_lock is not None:
+                self.writer_lock.close()
+                self.writer_lock = None
+
+    def _release_writer_lock(self):
+        if self.writer_lock is not None:
+            self.writer_lock.release()
+
+    def _serialize_autocommit_write(self, execute, sql, params, many, context):
+        """事务之外的单条写语句（QuerySet.update()、save() 等）同样在写锁内执行"""
+        lock = self.writer_lock
+        if lock is None or lock.held or is_read_only(sql):
+            return execute(sql, params, many, context)
+        lock.acquire()
+        try:
+            return execute(sql, params, many, context)
+        finally:
+            lock.release()
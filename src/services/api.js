@@ -27,6 +27,30 @@ export const setAccessToken = (token) => {
  */
 export const getAccessToken = () => accessToken;
 
+/**
+ * 本浏览器的设备标识（首次使用时生成），登录时发送给后端，同一设备复用/轮换同一个 token
+ */
+const getDeviceId = () => {
+  let deviceId = localStorage.getItem('jarvis_device_id');
+  if (!deviceId) {
+    deviceId = crypto.randomUUID ? crypto.randomUUID() : `${Date.now().toString(36)}-${Math.random().toString(36).slice(2)}`;
+    localStorage.setItem('jarvis_device_id', deviceId);
+  }
+  return deviceId;
+};
+
+/**
+ * 调用 agent_service 时使用的请求头
+ * agent_service 会把当前用户的 token 转发给后端，并按用户隔离缓存
+ */
+export const agentServiceHeaders = () => {
+  const headers = { 'Content-Type': 'application/json' };
+  if (accessToken) {
+    headers['Authorization'] = `Bearer ${accessToken}`;
+  }
+  return headers;
+};
+
 /**
  * 通用请求方法
  */
@@ -102,7 +126,7 @@ export const authAPI = {
   login: async (accountId) => {
     const result = await request('/auth/login', {
       method: 'POST',
-      body: JSON.stringify({ account_id: accountId }),
+      body: JSON.stringify({ account_id: accountId, device_id: getDeviceId() }),
     });
     
     if (result.success && result.data.access_token) {
@@ -161,6 +185,15 @@ export const userAPI = {
     method: 'POST',
     body: JSON.stringify({ latitude, longitude, accuracy }),
   }),
+
+  /**
+   * 批量上报定位轨迹
+   * @param {Array<{latitude: number, longitude: number, accuracy?: number, timestamp: string}>} points
+   */
+  updateLocationBatch: (points) => request('/user/location/batch', {
+    method: 'POST',
+    body: JSON.stringify({ points }),
+  }),
 };
 
 // ==================== CALENDAR TYPES ====================
@@ -243,18 +276,19 @@ export const eventsAPI = {
   }),
   
   /**
-   * 删除事件
+   * 删除事件（重复事件带 occurrenceDate 时只取消这一次）
    */
-  delete: (eventId) => request(`/events/${eventId}`, {
-    method: 'DELETE',
-  }),
+  delete: (eventId, occurrenceDate = null) => request(
+    `/events/${eventId}${occurrenceDate ? `?occurrence_date=${occurrenceDate}` : ''}`,
+    { method: 'DELETE' }
+  ),
   
   /**
-   * 切换完成状态
+   * 切换完成状态（重复事件需带上该次的 occurrence_date）
    */
-  toggleComplete: (eventId, completed) => request(`/events/${eventId}/complete`, {
+  toggleComplete: (eventId, completed, occurrenceDate = null) => request(`/events/${eventId}/complete`, {
     method: 'PATCH',
-    body: JSON.stringify({ completed }),
+    body: JSON.stringify(occurrenceDate ? { completed, occurrence_date: occurrenceDate } : { completed }),
   }),
   
   /**
@@ -281,6 +315,36 @@ export const filesAPI = {
    * 上传文件
    */
   upload: (file) => uploadRequest('/files/upload', file),
+
+  /**
+   * 分块续传上传（适合大文件和不稳定的网络）
+   * 中断后再次调用并传入 uploadId 即可从服务器记录的 offset 处继续
+   * @param {File} file
+   * @param {{uploadId?: string, chunkSize?: number, onProgress?: (sent: number, total: number) => void}} options
+   */
+  uploadResumable: async (file, { uploadId = null, chunkSize = 1024 * 1024, onProgress = null } = {}) => {
+    let session = uploadId
+      ? (await request(`/files/uploads/${uploadId}`)).data
+      : (await request('/files/uploads', {
+          method: 'POST',
+          body: JSON.stringify({ name: file.name, size: file.size, mime_type: file.type }),
+        })).data;
+
+    while (session.offset < file.size) {
+      const end = Math.min(session.offset + chunkSize, file.size);
+      session = (await request(`/files/uploads/${session.upload_id}`, {
+        method: 'PUT',
+        headers: {
+          'Content-Type': 'application/octet-stream',
+          'Content-Range': `bytes ${session.offset}-${end - 1}/${file.size}`,
+        },
+        body: file.slice(session.offset, end),
+      })).data;
+      if (onProgress) onProgress(session.offset, file.size);
+    }
+
+    return request(`/files/uploads/${session.upload_id}/complete`, { method: 'POST' });
+  },
   
   /**
    * 删除文件
@@ -377,6 +441,35 @@ export const agentAPI = {
   },
 };
 
+// ==================== CHANGES ====================
+
+export const changesAPI = {
+  /**
+   * 订阅实时变更（GET /changes，SSE）
+   * onMessage 收到每条已解析的通知；通道不可用时（WSGI 部署返回 501、token 失效返回 401）调用 onUnavailable
+   * 返回取消订阅的函数
+   */
+  subscribe: (onMessage, onUnavailable) => {
+    if (!accessToken || typeof EventSource === 'undefined') {
+      onUnavailable?.();
+      return () => {};
+    }
+    const source = new EventSource(`${API_BASE_URL}/changes?access_token=${encodeURIComponent(accessToken)}`);
+    source.onmessage = (e) => {
+      try {
+        onMessage(JSON.parse(e.data));
+      } catch (err) {
+        console.error('Bad change notification:', err);
+      }
+    };
+    source.onerror = () => {
+      // 连接断开时浏览器会自动重连（readyState 为 CONNECTING）；非 SSE 响应时连接关闭且不再重试
+      if (source.readyState === EventSource.CLOSED) onUnavailable?.();
+    };
+    return () => source.close();
+  },
+};
+
 // 导出所有API
 export default {
   auth: authAPI,
@@ -388,6 +481,7 @@ export default {
   reminders: remindersAPI,
   commute: commuteAPI,
   agent: agentAPI,
+  changes: changesAPI,
   setAccessToken,
   getAccessToken,
 };